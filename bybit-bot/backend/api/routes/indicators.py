@@ -2,9 +2,9 @@ from fastapi import APIRouter, Query
 from typing import List, Dict, Any, Union, Optional
 from backend.core.data.db_loader import get_ema_data_multi_timeframe
 from backend.config.timeframes_config import TIMEFRAMES_CONFIG
+from backend.core.storage import read_connection
 import logging
 import traceback
-import sqlite3
 from pathlib import Path
 import os
 
@@ -67,7 +67,7 @@ def get_ema_data(
             table = f"candles_{align_to}"
             base_timestamps = set()
             try:
-                with sqlite3.connect(DB_PATH) as conn:
+                with read_connection(DB_PATH) as conn:
                     cursor = conn.cursor()
                     cursor.execute(
                         f"SELECT timestamp FROM {table} WHERE symbol = ? AND timestamp BETWEEN ? AND ? ORDER BY timestamp",
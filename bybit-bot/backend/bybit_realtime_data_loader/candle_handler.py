@@ -2,93 +2,152 @@
 Модуль для обработки и сохранения свечей в базу данных (таблицы candles_<interval> через sqlite), с обновлением по symbol+timestamp.
 Участвует как обработчик и хранилище поступающих real-time свечей.
 Использует: sqlite, данные свечей. Предоставляет: функции сохранения и обновления свечей в БД.
+
+handle_candle вызывается из потока WebSocket и только ставит свечу в очередь
+отложенной записи (write_behind.py); поток-писатель сохраняет накопившиеся
+свечи одной транзакцией, публикует их в кольцевые буферы и передаёт каждую
+записанную свечу в стадию stage (pipeline.py). Пересчёт индикаторов
+и ресемплинг идут в потоках стадии и не задерживают следующую пачку записи:
+без stage обработчик on_persisted получает собственную стадию persisted
+(PIPELINE_PERSISTED_WORKERS / _QUEUE / _POLICY).
+
+В конвейере Manager handle_candle — стадия parse, очередь записи — стадия
+persist, stage — стадия indicators, publish — стадия публикации. Время
+приёма свечи (received_at, time.monotonic) передаётся дальше со свечой.
 """
 
-import sqlite3
 import logging
-from typing import Dict
+import math
+from typing import Callable, Dict, List, Optional
 from backend.config.timeframes_config import TIMEFRAMES_CONFIG
-from backend.core.dim.ezdim import EzDIM
+from backend.bybit_realtime_data_loader.pipeline import Stage, stage_config
+from backend.bybit_realtime_data_loader.ring_feed import publish as ring_publish
+from backend.bybit_realtime_data_loader.write_behind import WriteBehindQueue
+from backend.core.indicators.dirty_ranges import mark_dirty
+from backend.core.storage import write_connection
+from backend.core.storage.schema import candle_upsert_sql
 
 
 logger = logging.getLogger(__name__)
 DB_PATH = "db/market_data.sqlite"
+VALUE_KEYS = ("open", "high", "low", "close", "volume")
+CANDLE_COLUMNS = ["symbol", "timestamp", *VALUE_KEYS]
+
+
+def _candle_key(candle: Dict):
+    return candle["symbol"], candle["interval"], candle["start"]
+
+
+def _series_key(candle: Dict):
+    return candle["symbol"], candle["interval"]
 
 
 class CandleHandler:
-    def __init__(self, db_path: str = DB_PATH):
+    def __init__(
+        self,
+        db_path: str = DB_PATH,
+        on_persisted: Optional[Callable[[Dict], None]] = None,
+        publish: Optional[Callable[[str, str, int, Dict], None]] = None,
+        stage: Optional[Stage] = None,
+    ):
         self.db_path = db_path
+        # Записанные свечи уходят из потока-писателя в стадию: внешнюю
+        # (indicators у Manager) или собственную с обработчиком on_persisted
+        self._own_stage = stage is None and on_persisted is not None
+        if self._own_stage:
+            stage = Stage(
+                "persisted", on_persisted, key=_series_key, **stage_config("persisted")
+            )
+        self.stage = stage
+        # publish(symbol, timeframe, ts, values); по умолчанию ring_feed.publish
+        self.publish = publish or ring_publish
+        self.queue = WriteBehindQueue(
+            self._persist,
+            key=_candle_key,
+            after_flush=self._after_persist,
+            name="candle-writer",
+        )
 
     def handle_candle(self, data: Dict):
         """
-        Обрабатывает подтверждённую свечу от Bybit:
-        сохраняет или обновляет в таблице candles_<timeframe>
+        Принимает подтверждённую свечу от Bybit и ставит её в очередь
+        записи в таблицу candles_<timeframe>
         """
         try:
-            symbol = data["symbol"]
             interval = data["interval"]
-            timestamp = int(
-                data["start"] // 1000
-            )  # start of candle, приводим к секундам
-            table = f"candles_{interval}"
-
             if interval not in TIMEFRAMES_CONFIG:
                 logger.warning(f"⏭ Неизвестный интервал: {interval}")
                 return
 
-            # Создаем DataFrame для валидации
-            import pandas as pd
-
-            df = pd.DataFrame(
-                [
-                    {
-                        "timestamp": timestamp,
-                        "open": float(data["open"]),
-                        "high": float(data["high"]),
-                        "low": float(data["low"]),
-                        "close": float(data["close"]),
-                        "volume": float(data["volume"]),
-                    }
-                ]
-            )
+            candle = {
+                "symbol": data["symbol"],
+                "interval": interval,
+                "start": int(data["start"]),
+                **{key: float(data[key]) for key in VALUE_KEYS},
+                "confirm": True,
+                "received_at": data.get("received_at"),
+            }
+            # Валидация перед сохранением: OHLCV должны быть числами
+            if not all(math.isfinite(candle[key]) for key in VALUE_KEYS):
+                logger.warning(
+                    f"⚠️ Свеча {candle['symbol']} {interval} @ {candle['start'] // 1000} "
+                    f"с NaN/inf пропущена"
+                )
+                return
 
-            # Валидация данных перед сохранением
-            EzDIM.preflight(
-                df,
-                required_cols=["timestamp", "open", "high", "low", "close"],
-                min_rows=1,
-                tf_sec=TIMEFRAMES_CONFIG[interval]["interval_sec"],
-            )
+            self.queue.put(candle)
+
+        except Exception as e:
+            logger.exception(f"Ошибка приёма свечи: {e}")
 
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-
-                query = f"""
-                INSERT INTO {table} (symbol, timestamp, open, high, low, close, volume)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-                ON CONFLICT(symbol, timestamp) DO UPDATE SET
-                    open=excluded.open,
-                    high=excluded.high,
-                    low=excluded.low,
-                    close=excluded.close,
-                    volume=excluded.volume
-                """
-
-                cursor.execute(
+    def _persist(self, candles: List[Dict]):
+        """Записывает пачку свечей одной транзакцией"""
+        by_interval: Dict[str, List[Dict]] = {}
+        for candle in candles:
+            by_interval.setdefault(candle["interval"], []).append(candle)
+
+        with write_connection(self.db_path) as conn:
+            for interval, rows in by_interval.items():
+                # Обновление по (symbol, timestamp) для обычной и компактной раскладки
+                query = candle_upsert_sql(conn, f"candles_{interval}", CANDLE_COLUMNS)
+                conn.executemany(
                     query,
-                    (
-                        symbol,
-                        timestamp,
-                        float(data["open"]),
-                        float(data["high"]),
-                        float(data["low"]),
-                        float(data["close"]),
-                        float(data["volume"]),
-                    ),
+                    [
+                        (row["symbol"], row["start"] // 1000, *(row[k] for k in VALUE_KEYS))
+                        for row in rows
+                    ],
                 )
-                conn.commit()
+                # Журнал изменений: индикаторы пересчитает trigger или воркер журнала.
+                # Один диапазон на (symbol, interval) пачки, а не запись на свечу
+                spans: Dict[str, List[int]] = {}
+                for row in rows:
+                    timestamp = row["start"] // 1000
+                    span = spans.setdefault(row["symbol"], [timestamp, timestamp])
+                    span[0], span[1] = min(span[0], timestamp), max(span[1], timestamp)
+                for symbol, (start_ts, end_ts) in spans.items():
+                    mark_dirty(conn, symbol, interval, start_ts, end_ts)
+
+    def _after_persist(self, candles: List[Dict]):
+        """Публикация записанных свечей и передача в стадию обработки"""
+        logger.info(f"💾 Записано свечей: {len(candles)}")
+        for candle in candles:
+            timestamp = candle["start"] // 1000
+            # Последние свечи для API — в кольцевом буфере
+            self.publish(
+                candle["symbol"],
+                candle["interval"],
+                timestamp,
+                {key: candle[key] for key in VALUE_KEYS},
+            )
+            if self.stage is not None:
+                self.stage.put(candle)
 
-            logger.info(f"💾 Обновлена свеча {symbol} {interval} @ {timestamp}")
+    def metrics(self) -> Dict:
+        """Глубина очереди, задержки записи и счётчики"""
+        return self.queue.metrics.snapshot()
 
-        except Exception as e:
-            logger.exception(f"Ошибка сохранения свечи: {e}")
+    def close(self):
+        """Дописывает очередь и дообрабатывает собственную стадию"""
+        self.queue.close()
+        if self._own_stage:
+            self.stage.close()
@@ -0,0 +1,253 @@
+"""
+gap_repair.py
+
+Дозагрузка свечей, пропущенных realtime-потоком (разрыв WebSocket,
+переподключение, потерянное сообщение), без полного прохода sync_all.py.
+
+Для каждой пары (symbol, interval) хранится время последней подтверждённой
+свечи (при первой свече пары — MAX(timestamp) из БД). Пропуск
+обнаруживается:
+- скачком: следующая подтверждённая свеча дальше, чем через один интервал
+- при переподключении (on_reconnect, KlineStream) и сторожем раз в
+  GAP_REPAIR_WATCH_SEC секунд: закрылась свеча, которая так и не пришла
+  (pybit переподключается сам и сигнала не даёт — его разрывы видит сторож)
+
+Пропуск загружается через REST (RestClient) в стадии repair конвейера,
+записывается в candles_<tf> (upsert, журнал dirty_ranges) и передаётся
+в on_repaired — Manager ставит ограниченный пересчёт индикаторов
+(IndicatorTrigger.recompute_range) в стадию indicators того же ряда,
+а в режиме derive_timeframes пересобирает из дозагруженных 1m свечей
+корзины старших таймфреймов.
+Пропуск длиннее GAP_REPAIR_MAX_CANDLES обрезается до последних свечей:
+старшую часть догружает data_extended_backfill. Неудачная загрузка
+повторяется на следующем шаге сторожа.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from backend.config.timeframes_config import TIMEFRAMES_CONFIG
+from backend.core.data.async_backfill import INTERVAL_MAP, PAGE_LIMIT
+from backend.core.data.resampler import bucket_start
+from backend.core.data.rest_client import RestClient
+from backend.core.indicators.dirty_ranges import mark_dirty
+from backend.core.storage import read_connection, write_connection
+from backend.core.storage.schema import candle_upsert_sql
+
+logger = logging.getLogger(__name__)
+
+MAX_REPAIR_CANDLES = int(os.getenv("GAP_REPAIR_MAX_CANDLES", "5000"))
+WATCH_INTERVAL = int(os.getenv("GAP_REPAIR_WATCH_SEC", "30"))
+# Подтверждённая свеча приходит через несколько секунд после закрытия
+CLOSE_GRACE = int(os.getenv("GAP_REPAIR_GRACE_SEC", "15"))
+VALUE_KEYS = ("open", "high", "low", "close", "volume")
+CANDLE_COLUMNS = ["symbol", "timestamp", *VALUE_KEYS]
+
+Series = Tuple[str, str]
+
+
+class GapRepair:
+    """
+    Args:
+        schedule: ставит пропуск (symbol, interval, start, end) в стадию repair
+        on_repaired: (symbol, interval, start, end) — свечи записаны
+        db_path: файл БД
+        session: клиент с get_kline (по умолчанию RestClient на BYBIT_REST_URL)
+        max_candles: предел свечей одной дозагрузки
+        watch_interval: период сторожа, секунд (0 — без сторожа)
+    """
+
+    def __init__(
+        self,
+        schedule: Callable[[Tuple[str, str, int, int]], None],
+        on_repaired: Optional[Callable[[str, str, int, int], None]] = None,
+        db_path: Optional[str] = None,
+        session=None,
+        max_candles: int = MAX_REPAIR_CANDLES,
+        watch_interval: float = WATCH_INTERVAL,
+    ):
+        self.schedule = schedule
+        self.on_repaired = on_repaired
+        self.db_path = db_path
+        self._own_session = session is None
+        self.session = session or RestClient()
+        self.max_candles = max_candles
+        self._lock = threading.Lock()
+        # (symbol, interval) → последняя подтверждённая или дозагруженная свеча
+        self._last: Dict[Series, int] = {}
+        # (symbol, interval) → конец последнего поставленного пропуска
+        self._requested: Dict[Series, int] = {}
+        self._retry: List[Tuple[str, str, int, int]] = []
+        self.stats = {"gaps": 0, "repaired": 0, "candles": 0, "failed": 0, "truncated": 0}
+        self._stop = threading.Event()
+        self._thread = None
+        if watch_interval:
+            self._thread = threading.Thread(
+                target=self._watch, args=(watch_interval,), name="gap-watch", daemon=True
+            )
+            self._thread.start()
+
+    def _db_last(self, symbol: str, interval: str) -> Optional[int]:
+        try:
+            with read_connection(self.db_path) as conn:
+                return conn.execute(
+                    f"SELECT MAX(timestamp) FROM candles_{interval} WHERE symbol = ?",
+                    (symbol,),
+                ).fetchone()[0]
+        except Exception as e:
+            logger.warning(f"⚠️ [gap_repair] Нет последней свечи {symbol} {interval}: {e}")
+            return None
+
+    def _request(self, symbol: str, interval: str, start: int, end: int):
+        """
+        Часть пропуска, которая ещё не поставлена, или None (под блокировкой;
+        schedule вызывается после неё — put стадии может ждать)
+        """
+        key = (symbol, interval)
+        start = max(start, self._requested.get(key, start - 1) + 1)
+        if start > end:
+            return None
+        self._requested[key] = end
+        self.stats["gaps"] += 1
+        return symbol, interval, start, end
+
+    def observe(self, candle: Dict):
+        """Подтверждённая свеча от WS (по порядку внутри ряда)"""
+        symbol, interval = candle["symbol"], candle["interval"]
+        if interval not in TIMEFRAMES_CONFIG:
+            return
+        step = TIMEFRAMES_CONFIG[interval]["interval_sec"]
+        ts = int(candle["start"]) // 1000
+        key = (symbol, interval)
+
+        if key not in self._last:
+            # Первая свеча ряда: продолжение того, что уже лежит в БД
+            last = self._db_last(symbol, interval)
+            with self._lock:
+                self._last.setdefault(key, last if last is not None else ts)
+
+        item = None
+        with self._lock:
+            last = self._last[key]
+            if ts > last + step:
+                logger.warning(
+                    f"🕳 [gap_repair] {symbol} {interval}: пропуск {last + step} → {ts - step}"
+                )
+                item = self._request(symbol, interval, last + step, ts - step)
+            self._last[key] = max(last, ts)
+        if item:
+            self.schedule(item)
+
+    def on_reconnect(self):
+        """Соединение восстановлено: свечи, закрывшиеся за время разрыва"""
+        logger.info("🔁 [gap_repair] Переподключение: проверка пропусков")
+        self.check(grace=0)
+
+    def check(self, now: Optional[int] = None, grace: int = CLOSE_GRACE):
+        """Ставит свечи, которые уже закрылись, но не пришли по WS"""
+        now = int(time.time()) if now is None else now
+        with self._lock:
+            items, self._retry = self._retry, []
+            for (symbol, interval), last in self._last.items():
+                step = TIMEFRAMES_CONFIG[interval]["interval_sec"]
+                # Начало последней свечи, закрывшейся не позже now - grace
+                # (недели выравниваются по понедельнику)
+                closed = int(bucket_start(now - grace, step)) - step
+                if closed > last:
+                    items.append(self._request(symbol, interval, last + step, closed))
+        for item in items:
+            if item:
+                self.schedule(item)
+
+    def repair(self, item: Tuple[str, str, int, int]):
+        """Стадия repair: загрузка пропуска через REST и запись"""
+        symbol, interval, start, end = item
+        step = TIMEFRAMES_CONFIG[interval]["interval_sec"]
+        if (end - start) // step + 1 > self.max_candles:
+            self.stats["truncated"] += 1
+            logger.warning(
+                f"✂️ [gap_repair] {symbol} {interval}: пропуск {start} → {end} длиннее "
+                f"{self.max_candles} свечей, дозагружаются последние"
+            )
+            start = end - (self.max_candles - 1) * step
+        try:
+            candles = self._fetch(symbol, interval, start, end)
+            if candles:
+                self._write(symbol, interval, candles)
+        except Exception as e:
+            self.stats["failed"] += 1
+            logger.error(f"❌ [gap_repair] {symbol} {interval} {start} → {end}: {e}")
+            with self._lock:
+                self._retry.append(item)
+            return
+
+        self.stats["repaired"] += 1
+        self.stats["candles"] += len(candles)
+        logger.info(
+            f"🩹 [gap_repair] {symbol} {interval}: дозагружено {len(candles)} свечей "
+            f"{start} → {end}"
+        )
+        if candles:
+            with self._lock:
+                key = (symbol, interval)
+                self._last[key] = max(self._last.get(key, 0), candles[-1]["timestamp"])
+            if self.on_repaired is not None:
+                self.on_repaired(symbol, interval, candles[0]["timestamp"], candles[-1]["timestamp"])
+
+    def _fetch(self, symbol: str, interval: str, start: int, end: int) -> List[Dict]:
+        """Свечи [start, end] по возрастанию; страницы идут от end к start"""
+        step = TIMEFRAMES_CONFIG[interval]["interval_sec"]
+        candles: Dict[int, Dict] = {}
+        page_end = end
+        while page_end >= start:
+            body = self.session.get_kline(
+                category="linear",
+                symbol=symbol,
+                interval=INTERVAL_MAP[interval],
+                start=start * 1000,
+                end=page_end * 1000,
+                limit=PAGE_LIMIT,
+            )
+            rows = body["result"].get("list", [])
+            oldest = None
+            for row in rows:
+                ts = int(row[0]) // 1000
+                if start <= ts <= end:
+                    candles[ts] = {
+                        "timestamp": ts,
+                        **{key: float(value) for key, value in zip(VALUE_KEYS, row[1:6])},
+                    }
+                oldest = ts if oldest is None else min(oldest, ts)
+            if len(rows) < PAGE_LIMIT or oldest is None:
+                break
+            page_end = oldest - step
+        return [candles[ts] for ts in sorted(candles)]
+
+    def _write(self, symbol: str, interval: str, candles: List[Dict]):
+        table = f"candles_{interval}"
+        # Свечи и запись журнала — одна транзакция (commit при выходе)
+        with write_connection(self.db_path) as conn:
+            conn.executemany(
+                candle_upsert_sql(conn, table, CANDLE_COLUMNS),
+                [
+                    (symbol, candle["timestamp"], *(candle[key] for key in VALUE_KEYS))
+                    for candle in candles
+                ],
+            )
+            # Журнал изменений: если пересчёт не состоится, его сделает воркер журнала
+            mark_dirty(conn, symbol, interval, candles[0]["timestamp"], candles[-1]["timestamp"])
+
+    def close(self):
+        self._stop.set()
+        if self._own_session:
+            self.session.close()
+
+    def _watch(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.check()
+            except Exception as e:
+                logger.exception(f"❌ [gap_repair] Ошибка проверки пропусков: {e}")
@@ -1,35 +1,346 @@
 """
 indicator_trigger.py
 
-Минимальный триггер для пересчёта EMA по новой свече.
-Просто вызывает calc_ema() на переданном timestamp.
+Минимальный триггер для пересчёта индикаторов по новой свече.
+Если есть состояние на предыдущей свече — обновляет все периоды EMA
+одним шагом рекурренты (ema_state), а остальные индикаторы реестра (RSI, ...)
+их правилом step(), иначе пересчитывает окно свечи (compute_range_update,
+как calc_ema, но без записи на время расчёта).
+Состояние не-EMA индикаторов держится в памяти и восстанавливается
+по той же загрузке свечей, что использует calc_ema (окно прогрева берётся
+из кольцевого буфера, если он его покрывает). Перед шагом кэш состояния
+сверяется с EMA предыдущей свечи в БД: историю могли переписать воркер
+журнала, EzDIM или CLI calc_ema — тогда состояние берётся из БД.
+Расчёт идёт на соединении пула чтения (WAL: запись свечей не ждёт);
+общий писатель (write_connection) берётся только на запись готовых
+значений и состояния. Свечи одного ряда обрабатывает один поток стадии
+indicators, поэтому между расчётом и записью ряд не меняется триггером.
+Новые значения публикуются
+в кольцевой буфер (ring_feed.py) — напрямую или через стадию publish
+конвейера (параметр publish).
 """
 
 import logging
+import math
 import sqlite3
+from typing import Callable, Dict, Optional
 
+import numpy as np
+
+from backend.config.timeframes_config import TIMEFRAMES_CONFIG
 from backend.core.indicators.calc_ema import (
-    calc_ema,
     EMA_PERIODS,
     DB_PATH,
+    compute_range_update,
+    write_range_update,
+)
+from backend.core.indicators.dirty_ranges import clear_dirty, ensure_dirty_table
+from backend.core.indicators.ema_checkpoints import ensure_checkpoint_table
+from backend.core.storage import read_connection, write_connection
+from backend.core.storage.indicator_store import (
+    load_indicator_frame,
+    write_indicator_row,
+)
+from backend.core.storage.ring_buffer import BASE_COLUMNS, get_ring_reader
+from backend.bybit_realtime_data_loader.ring_feed import (
+    publish as ring_publish,
+    ring_columns,
+)
+from backend.core.indicators.ema_state import (
+    ensure_ema_state_table,
+    load_ema_state,
+    save_ema_state,
+    read_ema_row,
+    step_ema_state,
+)
+from backend.core.indicators.registry import (
+    CONFIGURED_INDICATORS,
+    INDICATORS,
+    compute_indicators,
+    existing_specs,
+    required_inputs,
+    spec_columns,
+    step_indicators,
 )
 
 logger = logging.getLogger(__name__)
 
 
 class IndicatorTrigger:
-    def __init__(self):
+    def __init__(self, publish: Optional[Callable[[str, str, int, Dict], None]] = None):
         self.ema_periods = EMA_PERIODS
+        # publish(symbol, timeframe, ts, values); по умолчанию ring_feed.publish
+        self.publish = publish or ring_publish
+        # Остальные настроенные индикаторы реестра: [(name, period), ...]
+        self.indicator_specs = [
+            spec for spec in CONFIGURED_INDICATORS if spec[0] != "ema"
+        ]
+        # Кэш состояния: (symbol, timeframe) -> {period: (timestamp, value)}
+        self._state = {}
+        # Состояние не-EMA индикаторов: (symbol, timeframe) -> (timestamp, {spec: state})
+        self._indicator_state = {}
+        # Индикаторы, колонки которых есть в таблице: timeframe -> [spec, ...]
+        self._table_specs = {}
+        self._tables_ready = False
+        logger.info(
+            f"🚀 IndicatorTrigger инициализирован: EMA периоды = {self.ema_periods}, "
+            f"индикаторы = {self.indicator_specs}"
+        )
+
+    def _ensure_tables(self):
+        """Служебные таблицы создаются писателем: соединения пула чтения — query_only"""
+        if not self._tables_ready:
+            with write_connection(DB_PATH) as conn:
+                ensure_ema_state_table(conn)
+                ensure_checkpoint_table(conn)
+                ensure_dirty_table(conn)
+            self._tables_ready = True
+
+    def _get_state(self, conn: sqlite3.Connection, symbol: str, timeframe: str):
+        key = (symbol, timeframe)
+        if key not in self._state:
+            self._state[key] = load_ema_state(
+                conn, symbol, timeframe, self.ema_periods
+            )
+        return self._state[key]
+
+    def _validated_state(
+        self, conn: sqlite3.Connection, symbol: str, timeframe: str, prev_ts: int
+    ):
+        """
+        Состояние на свече prev_ts, сверенное с EMA этой свечи в БД.
+        При расхождении состояние (и состояние остальных индикаторов)
+        перестраивается из БД; без валидных EMA в БД — пустое.
+        Только чтение: новое состояние сохранит запись следующей свечи.
+        """
+        state = self._get_state(conn, symbol, timeframe)
+        stored = read_ema_row(conn, symbol, timeframe, self.ema_periods, prev_ts)
+        if len(stored) != len(self.ema_periods):
+            return {}
+        if all(
+            state.get(p, (None,))[0] == prev_ts
+            and math.isclose(state[p][1], stored[p], rel_tol=1e-9)
+            for p in self.ema_periods
+        ):
+            return state
         logger.info(
-            f"🚀 IndicatorTrigger инициализирован: EMA периоды = {self.ema_periods}"
+            f"♻️ Состояние EMA {symbol} {timeframe} @ {prev_ts} расходится с БД — перестройка"
         )
+        self._reseed_state(conn, symbol, timeframe, prev_ts)
+        return self._state[(symbol, timeframe)]
+
+    def _get_table_specs(self, conn: sqlite3.Connection, timeframe: str):
+        if timeframe not in self._table_specs:
+            self._table_specs[timeframe] = existing_specs(
+                conn, f"candles_{timeframe}", self.indicator_specs
+            )
+        return self._table_specs[timeframe]
+
+    def _columns(self, conn: sqlite3.Connection, timeframe: str):
+        """Колонки полного пересчёта: EMA и индикаторы, которые есть в таблице"""
+        return spec_columns(
+            [("ema", p) for p in self.ema_periods] + self._get_table_specs(conn, timeframe)
+        )
+
+    def _try_streaming_update(self, symbol: str, timeframe: str, ts: int, candle) -> bool:
+        """
+        O(1)-обновление индикаторов из состояния предыдущей свечи.
+        Состояние сверяется на соединении чтения, писатель берётся
+        только на запись строки и состояния.
+
+        Returns:
+            True если индикаторы обновлены, False если нужен полный пересчёт
+        """
+        try:
+            values = {
+                key: float(candle[key]) for key in ("open", "high", "low", "close")
+            }
+        except (KeyError, TypeError, ValueError):
+            return False
+
+        tf_sec = TIMEFRAMES_CONFIG[timeframe]["interval_sec"]
+        with read_connection(DB_PATH) as conn:
+            state = self._validated_state(conn, symbol, timeframe, ts - tf_sec)
+            specs = self._get_table_specs(conn, timeframe)
+        new_values = step_ema_state(
+            state, self.ema_periods, ts, values["close"], tf_sec
+        )
+        if new_values is None:
+            return False
+
+        # Остальные индикаторы: состояние должно быть на предыдущей свече
+        extra_states, extra_values = {}, {}
+        if specs:
+            prev = self._indicator_state.get((symbol, timeframe))
+            if prev is None or prev[0] != ts - tf_sec:
+                return False
+            stepped = step_indicators(prev[1], values)
+            if stepped is None:
+                return False
+            extra_states, extra_values = stepped
+
+        row = {f"ema{p}": new_values[p] for p in self.ema_periods}
+        row.update(extra_values)
+        with write_connection(DB_PATH) as conn:
+            if not write_indicator_row(conn, symbol, timeframe, ts, row):
+                logger.warning(f"⚠️ Свеча {symbol} {timeframe} @ {ts} не найдена в БД")
+                return False
+            save_ema_state(conn, symbol, timeframe, ts, new_values)
+            # Свеча пересчитана — её запись в журнале изменений больше не нужна
+            clear_dirty(conn, symbol, timeframe, ts, ts)
+
+        self._state[(symbol, timeframe)] = {
+            p: (ts, v) for p, v in new_values.items()
+        }
+        if specs:
+            self._indicator_state[(symbol, timeframe)] = (ts, extra_states)
+        self.publish(symbol, timeframe, ts, row)
+        return True
+
+    def _reseed_state(
+        self, conn: sqlite3.Connection, symbol: str, timeframe: str, ts: int
+    ) -> Dict[int, float]:
+        """
+        Обновляет состояние из значений EMA в БД и состояние остальных
+        индикаторов. Только чтение.
+
+        Returns:
+            EMA свечи ts — для сохранения в ema_state (_save_state)
+        """
+        values = read_ema_row(conn, symbol, timeframe, self.ema_periods, ts)
+        self._state[(symbol, timeframe)] = {p: (ts, v) for p, v in values.items()}
+
+        # Состояние остальных индикаторов по той же загрузке, что у calc_ema
+        specs = self._get_table_specs(conn, timeframe)
+        self._indicator_state.pop((symbol, timeframe), None)
+        if not specs:
+            return values
+
+        tf_sec = TIMEFRAMES_CONFIG[timeframe]["interval_sec"]
+        max_warmup = max(
+            INDICATORS[name].warmup(period)
+            for name, period in [("ema", p) for p in self.ema_periods] + specs
+        )
+        inputs = required_inputs(specs)
+        window_start = ts - (max_warmup + 1) * tf_sec
+
+        # Свечи прогрева — из кольцевого буфера, если он покрывает окно
+        ring = get_ring_reader(symbol, timeframe)
+        window = ring.window(window_start, ts, inputs, tf_sec) if ring else None
+        if window is not None:
+            rows = window.to_numpy(dtype=np.float64)
+        else:
+            rows = conn.execute(
+                f"""
+                SELECT timestamp, {", ".join(inputs)} FROM candles_{timeframe}
+                WHERE symbol = ? AND timestamp >= ? AND timestamp <= ?
+                ORDER BY timestamp
+                """,
+                (symbol, window_start, ts),
+            ).fetchall()
+        if not len(rows) or rows[-1][0] != ts:
+            return values
+
+        data = np.array(rows, dtype=np.float64)
+        _, states = compute_indicators(
+            {col: data[:, i + 1] for i, col in enumerate(inputs)}, specs
+        )
+        if all(state is not None for state in states.values()):
+            self._indicator_state[(symbol, timeframe)] = (ts, states)
+        return values
+
+    def _save_state(self, symbol: str, timeframe: str, ts: int, values: Dict[int, float]):
+        if values:
+            with write_connection(DB_PATH) as conn:
+                save_ema_state(conn, symbol, timeframe, ts, values)
+
+    def _recompute(self, symbol: str, timeframe: str, start_ts: int, end_ts: int) -> int:
+        """
+        Полный пересчёт свечей [start_ts, end_ts]: окно считается на соединении
+        чтения (compute_range_update), писатель берётся только на запись
+
+        Returns:
+            int: количество обновлённых значений
+        """
+        with read_connection(DB_PATH) as conn:
+            update = compute_range_update(
+                symbol, timeframe, start_ts, end_ts, self._columns(conn, timeframe), conn
+            )
+        with write_connection(DB_PATH) as conn:
+            updated = 0 if update is None else write_range_update(conn, symbol, timeframe, update)
+            clear_dirty(conn, symbol, timeframe, start_ts, end_ts)
+        return updated
+
+    def _publish_row(
+        self, conn: sqlite3.Connection, symbol: str, timeframe: str, ts: int
+    ):
+        """Кладёт записанные значения свечи в кольцевой буфер"""
+        columns = ring_columns()[len(BASE_COLUMNS) :]
+        frame = load_indicator_frame(conn, symbol, timeframe, [], columns, ts, ts)
+        if len(frame):
+            self.publish(symbol, timeframe, ts, frame.iloc[-1][columns].to_dict())
+
+    def recompute_range(self, symbol: str, timeframe: str, start_ts: int, end_ts: int) -> int:
+        """
+        Пересчёт после дозагрузки пропуска (gap_repair.py): свечи [start_ts, end_ts]
+        и прогрев после них, не дальше — как в recompute_dirty_ranges.
+        Состояние ряда переставляется на последнюю пересчитанную свечу,
+        новые значения публикуются в кольцевой буфер.
+
+        Returns:
+            int: количество обновлённых значений
+        """
+        tf_sec = TIMEFRAMES_CONFIG[timeframe]["interval_sec"]
+        max_warmup = max(
+            INDICATORS[name].warmup(period)
+            for name, period in [("ema", p) for p in self.ema_periods] + self.indicator_specs
+        )
+        logger.info(
+            f"🧮 Пересчёт индикаторов после пропуска: {symbol} {timeframe} {start_ts} → {end_ts}"
+        )
+        try:
+            self._ensure_tables()
+            # Границы по фактическим свечам: start_ts может быть началом
+            # корзины, которой нет (пересборка старших таймфреймов)
+            with read_connection(DB_PATH) as conn:
+                first_ts, last_ts = conn.execute(
+                    f"SELECT MIN(timestamp), MAX(timestamp) FROM candles_{timeframe} "
+                    "WHERE symbol = ? AND timestamp >= ? AND timestamp <= ?",
+                    (symbol, start_ts, end_ts + max_warmup * tf_sec),
+                ).fetchone()
+            if first_ts is None:
+                return 0
+            start_ts = first_ts
+            updated = self._recompute(symbol, timeframe, start_ts, last_ts)
+
+            # Вместе с OHLCV: дозагруженных свечей в буфере ещё нет
+            columns = ring_columns()[1:]
+            with read_connection(DB_PATH) as conn:
+                values = self._reseed_state(conn, symbol, timeframe, last_ts)
+                frame = load_indicator_frame(
+                    conn,
+                    symbol,
+                    timeframe,
+                    columns[: len(BASE_COLUMNS) - 1],
+                    columns[len(BASE_COLUMNS) - 1 :],
+                    start_ts,
+                    last_ts,
+                )
+            self._save_state(symbol, timeframe, last_ts, values)
+            for ts, row in zip(frame["timestamp"], frame[columns].to_dict("records")):
+                self.publish(symbol, timeframe, int(ts), row)
+            return updated
+        except Exception as e:
+            logger.error(f"❌ Ошибка пересчёта {symbol} {timeframe} {start_ts} → {end_ts}: {e}")
+            logger.exception("Детали ошибки:")
+            return 0
 
     def trigger_candle(self, candle: dict):
         """
         Пересчёт EMA для одной свечи.
 
         Args:
-            candle: Словарь с данными свечи (symbol, interval, start)
+            candle: Словарь с данными свечи (symbol, interval, start, close)
         """
         # Извлекаем данные из словаря свечи
         symbol = candle["symbol"]
@@ -38,12 +349,21 @@ class IndicatorTrigger:
 
         logger.info(f"🚀 Пересчёт EMA для {symbol} {timeframe} @ {ts}")
         try:
-            with sqlite3.connect(str(DB_PATH)) as conn:
-                updated = calc_ema(symbol, timeframe, self.ema_periods, ts, ts, conn)
-                if updated > 0:
-                    logger.info(f"✅ EMA обновлено для {symbol} {timeframe} @ {ts}")
-                else:
-                    logger.info(f"ℹ️ EMA уже актуально для {symbol} {timeframe} @ {ts}")
+            self._ensure_tables()
+            if self._try_streaming_update(symbol, timeframe, ts, candle):
+                logger.info(f"⚡ Индикаторы обновлены из состояния: {symbol} {timeframe} @ {ts}")
+                return
+
+            # Нет состояния на предыдущей свече → полный пересчёт
+            updated = self._recompute(symbol, timeframe, ts, ts)
+            with read_connection(DB_PATH) as conn:
+                values = self._reseed_state(conn, symbol, timeframe, ts)
+                self._publish_row(conn, symbol, timeframe, ts)
+            self._save_state(symbol, timeframe, ts, values)
+            if updated > 0:
+                logger.info(f"✅ EMA обновлено для {symbol} {timeframe} @ {ts}")
+            else:
+                logger.info(f"ℹ️ EMA уже актуально для {symbol} {timeframe} @ {ts}")
         except Exception as e:
             logger.error(f"❌ Ошибка пересчёта EMA {symbol} {timeframe} @ {ts}: {e}")
             logger.exception("Детали ошибки:")
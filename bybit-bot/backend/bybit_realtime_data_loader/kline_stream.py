@@ -0,0 +1,123 @@
+"""
+kline_stream.py
+
+Минимальный клиент публичного WebSocket Bybit (топики kline.<interval>.<symbol>)
+для произвольного адреса — например, локального мок-сервера
+(backend/tools/mock_exchange.py). pybit строит адрес только из домена
+биржи, поэтому при BYBIT_WS_URL, отличном от адреса Bybit, WSClient
+подключается через этот клиент.
+
+Интерфейс совпадает с используемой частью pybit WebSocket:
+kline_stream(symbol, interval, callback) и exit(). Поток соединения
+переподключается после разрыва и заново подписывается на все топики;
+heartbeat {"op": "ping"} — раз в PING_INTERVAL секунд. После переподключения
+вызывается on_reconnect (дозагрузка пропущенных свечей, gap_repair.py).
+"""
+
+import json
+import logging
+import threading
+from typing import Callable, Dict, Optional
+
+import websocket
+
+from backend.config.exchange_config import BYBIT_WS_URL
+
+logger = logging.getLogger(__name__)
+
+PING_INTERVAL = 20
+RECONNECT_DELAY = 1.0
+READ_TIMEOUT = 1.0
+
+
+class KlineStream:
+    def __init__(
+        self,
+        url: str = BYBIT_WS_URL,
+        ping_interval: float = PING_INTERVAL,
+        reconnect_delay: float = RECONNECT_DELAY,
+    ):
+        self.url = url
+        self.ping_interval = ping_interval
+        self.reconnect_delay = reconnect_delay
+        self.reconnects = 0
+        self.on_reconnect: Optional[Callable[[], None]] = None
+        self._callbacks: Dict[str, Callable[[dict], None]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._app: Optional[websocket.WebSocketApp] = None
+        self._connected = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def kline_stream(self, symbol: str, interval, callback: Callable[[dict], None]):
+        topic = f"kline.{interval}.{symbol}"
+        with self._lock:
+            self._callbacks[topic] = callback
+            if self._connected.is_set():
+                self._send({"op": "subscribe", "args": [topic]})
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="kline-stream", daemon=True
+                )
+                self._thread.start()
+
+    def exit(self):
+        self._stop.set()
+        if self._app is not None:
+            self._app.close(timeout=READ_TIMEOUT)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _send(self, payload: dict):
+        try:
+            self._app.send(json.dumps(payload))
+        except Exception as e:
+            logger.warning(f"⚠️ [kline_stream] Отправка не удалась: {e}")
+
+    def _on_open(self, app):
+        with self._lock:
+            topics = list(self._callbacks)
+            self._connected.set()
+        logger.info(f"📡 [kline_stream] Подключено к {self.url}, топиков: {len(topics)}")
+        self._send({"op": "subscribe", "args": topics})
+        if self.reconnects and self.on_reconnect is not None:
+            try:
+                self.on_reconnect()
+            except Exception as e:
+                logger.exception(f"❌ [kline_stream] Ошибка on_reconnect: {e}")
+
+    def _on_message(self, app, raw: str):
+        message = json.loads(raw)
+        callback = self._callbacks.get(message.get("topic", ""))
+        if callback is not None:
+            callback(message)
+
+    def _on_close(self, app, status, reason):
+        self._connected.clear()
+
+    def _on_error(self, app, error):
+        logger.warning(f"⚠️ [kline_stream] {error}")
+
+    def _ping(self):
+        while not self._stop.wait(self.ping_interval):
+            if self._connected.is_set():
+                self._send({"op": "ping"})
+
+    def _run(self):
+        threading.Thread(target=self._ping, name="kline-stream-ping", daemon=True).start()
+        while not self._stop.is_set():
+            self._app = websocket.WebSocketApp(
+                self.url,
+                on_open=self._on_open,
+                on_message=self._on_message,
+                on_close=self._on_close,
+                on_error=self._on_error,
+            )
+            # ping_timeout — период пробуждения цикла чтения: после exit()
+            # поток завершается, не дожидаясь следующего сообщения
+            self._app.run_forever(ping_timeout=READ_TIMEOUT)
+            self._connected.clear()
+            if self._stop.wait(self.reconnect_delay):
+                break
+            self.reconnects += 1
+            logger.info(f"🔁 [kline_stream] Переподключение #{self.reconnects}")
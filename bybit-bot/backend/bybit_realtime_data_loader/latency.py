@@ -0,0 +1,65 @@
+"""
+latency.py
+
+Гистограмма задержек с фиксированными границами корзин (миллисекунды).
+
+В отличие от скользящего окна write_behind._percentiles гистограмма
+считает все значения с момента запуска и показывает распределение
+целиком: хвост видно даже тогда, когда p99 окна его уже не содержит.
+Перцентили оцениваются по верхней границе корзины (не выше max).
+"""
+
+import bisect
+import threading
+from typing import Dict, Optional
+
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class LatencyHistogram:
+    def __init__(self, bounds=BUCKETS_MS):
+        self.bounds = tuple(bounds)
+        self._counts = [0] * (len(self.bounds) + 1)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, ms: float):
+        with self._lock:
+            self._counts[bisect.bisect_left(self.bounds, ms)] += 1
+            self.count += 1
+            self.total += ms
+            self.max = max(self.max, ms)
+
+    def _quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self._counts):
+            seen += n
+            if seen >= rank:
+                # Граница корзины, но не больше максимума (последняя корзина открыта)
+                if i == len(self.bounds):
+                    break
+                return min(self.bounds[i], round(self.max, 3))
+        return round(self.max, 3)
+
+    def snapshot(self) -> Dict:
+        """count, mean, p50/p90/p99, max и непустые корзины {"≤границы": n}"""
+        with self._lock:
+            buckets = {
+                (f"≤{self.bounds[i]}" if i < len(self.bounds) else f">{self.bounds[-1]}"): n
+                for i, n in enumerate(self._counts)
+                if n
+            }
+            return {
+                "count": self.count,
+                "mean": round(self.total / self.count, 3) if self.count else None,
+                "p50": self._quantile(0.5),
+                "p90": self._quantile(0.9),
+                "p99": self._quantile(0.99),
+                "max": round(self.max, 3),
+                "buckets": buckets,
+            }
@@ -3,28 +3,240 @@ manager.py
 
 Основной координатор realtime-загрузчика данных.
 Инициализирует WebSocket-клиент, обработчик свечей и триггеры расчётов.
+
+В режиме derive_timeframes подписка идёт только на 1m, а свечи старших
+таймфреймов строятся локально ресемплером после каждой закрытой минуты.
+Свечи и индикаторы публикуются в кольцевые буферы (ring_feed.py) для API.
+
+Обработка свечи — конвейер стадий с ограниченными очередями (pipeline.py):
+
+    receive  поток WS: отметка received_at и put в parse
+    parse    CandleHandler.handle_candle: проверка, put в очередь записи
+    persist  поток-писатель CandleHandler (write_behind.py): пачки, commit
+    indicators  IndicatorTrigger и ресемплинг; потоки делят свечи по
+             (symbol, interval) — свечи ряда идут по порядку в одном потоке;
+             закрытые ресемплером свечи старших таймфреймов возвращаются
+             в эту же стадию под ключом своего ряда
+    publish  кольцевые буферы (ring_feed.py)
+    repair   дозагрузка пропусков через REST (gap_repair.py): пропуск виден
+             по скачку между свечами parse, при переподключении и сторожу;
+             после записи — ограниченный пересчёт индикаторов ряда
+             в стадии indicators (в режиме derive — и пересборка корзин
+             старших таймфреймов из дозагруженных 1m)
+
+Медленный пересчёт индикаторов не задерживает приём сообщений WS и запись
+свечей. Потоки, размер очереди и политика переполнения стадий —
+PIPELINE_<STAGE>_WORKERS / _QUEUE / _POLICY. Гистограммы задержек стадий
+и сквозная задержка от приёма свечи до записи индикаторов — metrics(),
+в лог раз в PIPELINE_METRICS_SEC секунд.
 """
 
+import logging
+import time
+
+from backend.config.timeframes_config import TIMEFRAMES_CONFIG
 from backend.bybit_realtime_data_loader.ws_client import WSClient
 from backend.bybit_realtime_data_loader.candle_handler import CandleHandler
+from backend.bybit_realtime_data_loader.gap_repair import GapRepair
 from backend.bybit_realtime_data_loader.indicator_trigger import IndicatorTrigger
+from backend.bybit_realtime_data_loader.pipeline import PipelineMetrics, Stage, stage_config
+from backend.bybit_realtime_data_loader.ring_feed import publish
+from backend.core.data.resampler import BASE_SEC, bucket_start, resample_history, update_buckets
+from backend.core.storage import write_connection
+
+logger = logging.getLogger(__name__)
+
+INDICATOR_WORKERS = 2
+
+
+def _series_key(candle: dict):
+    return candle["symbol"], candle["interval"]
 
 
 class Manager:
-    def __init__(self, symbols, intervals):
+    def __init__(
+        self,
+        symbols,
+        intervals,
+        derive_timeframes=None,
+        ws_factory=None,
+        db_path=None,
+        rest_session=None,
+    ):
         self.symbols = symbols
         self.intervals = intervals
-        self.candle_handler = CandleHandler()
-        self.indicator_trigger = IndicatorTrigger()
+        # Фабрика WS-соединения (мок-сервер, тесты); None — default_ws_factory
+        self.ws_factory = ws_factory
+        # Таймфреймы, которые строятся из 1m вместо отдельных WS-потоков
+        self.derive_timeframes = derive_timeframes or []
+        self.ws = None
+
+        # Стадии создаются от конца конвейера к началу
+        self.publish_stage = Stage(
+            "publish", self._publish, key=lambda item: item[:2], **stage_config("publish")
+        )
+        self.indicator_stage = Stage(
+            "indicators",
+            self._after_candle,
+            key=_series_key,
+            **stage_config("indicators", workers=INDICATOR_WORKERS),
+        )
+        self.indicator_trigger = IndicatorTrigger(publish=self._enqueue_publish)
+        # Поток-писатель только передаёт записанные свечи в стадию indicators
+        handler_args = {"stage": self.indicator_stage, "publish": self._enqueue_publish}
+        self.candle_handler = (
+            CandleHandler(db_path, **handler_args) if db_path else CandleHandler(**handler_args)
+        )
+        self.repair_stage = Stage(
+            "repair", self._repair, key=lambda item: item[:2], **stage_config("repair")
+        )
+        # rest_session — клиент с get_kline (мок-сервер); None — RestClient
+        self.gap_repair = GapRepair(
+            schedule=self.repair_stage.put,
+            on_repaired=self._queue_recompute,
+            db_path=db_path,
+            session=rest_session,
+        )
+        self.parse_stage = Stage(
+            "parse", self._parse, key=_series_key, **stage_config("parse")
+        )
+        self.pipeline_metrics = PipelineMetrics(
+            {
+                "parse": self.parse_stage,
+                "persist": self.candle_handler.queue,
+                "indicators": self.indicator_stage,
+                "publish": self.publish_stage,
+                "repair": self.repair_stage,
+            }
+        )
 
     def _on_candle(self, candle: dict):
+        """Поток WS: только отметка времени и передача в parse"""
+        received = time.monotonic()
+        candle["received_at"] = received
+        self.parse_stage.put(candle)
+        # Время, которое поток WS провёл в put (обратное давление parse)
+        self.pipeline_metrics.record("receive", (time.monotonic() - received) * 1000)
+
+    def _parse(self, candle: dict):
         self.candle_handler.handle_candle(candle)
+        # Свечи ряда приходят сюда по порядку: скачок — пропуск
+        self.gap_repair.observe(candle)
+
+    def _repair(self, item):
+        self.gap_repair.repair(item)
+
+    def _queue_recompute(self, symbol: str, interval: str, start_ts: int, end_ts: int):
+        """Пересчёт после дозагрузки — в поток indicators того же ряда"""
+        self.indicator_stage.put(
+            {"symbol": symbol, "interval": interval, "recompute": (start_ts, end_ts)}
+        )
+
+    def _enqueue_publish(self, symbol: str, timeframe: str, ts: int, values: dict):
+        self.publish_stage.put((symbol, timeframe, ts, values))
+
+    def _publish(self, item):
+        publish(*item)
+
+    def _after_candle(self, candle: dict):
+        """Свеча записана в БД: индикаторы и старшие таймфреймы"""
+        if "recompute" in candle:
+            self.indicator_trigger.recompute_range(
+                candle["symbol"], candle["interval"], *candle["recompute"]
+            )
+            if self.derive_timeframes and candle["interval"] == "1m":
+                self._derive_range(candle["symbol"], *candle["recompute"])
+            return
+
         self.indicator_trigger.trigger_candle(candle)
 
+        if self.derive_timeframes and candle.get("interval") == "1m":
+            self._derive_from_minute(candle)
+
+        received = candle.get("received_at")
+        if received is not None:
+            self.pipeline_metrics.record(
+                "receive_to_indicators", (time.monotonic() - received) * 1000
+            )
+
+    def metrics(self) -> dict:
+        """Метрики стадий и сквозные гистограммы задержек"""
+        return self.pipeline_metrics.snapshot()
+
+    def _derive_from_minute(self, candle: dict):
+        """
+        Обновляет корзины старших таймфреймов; закрывшиеся свечи уходят
+        в стадию indicators своего ряда (symbol, timeframe)
+        """
+        try:
+            with write_connection(self.candle_handler.db_path) as conn:
+                closed = update_buckets(
+                    conn,
+                    candle["symbol"],
+                    int(candle["start"]) // 1000,
+                    self.derive_timeframes,
+                )
+        except Exception as e:
+            logger.exception(f"Ошибка построения старших таймфреймов: {e}")
+            return
+
+        for derived in closed:
+            logger.info(
+                f"🧱 Закрыта свеча {derived['symbol']} {derived['interval']} @ {derived['start'] // 1000}"
+            )
+            self._enqueue_publish(
+                derived["symbol"],
+                derived["interval"],
+                derived["start"] // 1000,
+                {key: derived[key] for key in ("open", "high", "low", "close", "volume")},
+            )
+            self.indicator_stage.put(derived)
+
+    def _derive_range(self, symbol: str, start_ts: int, end_ts: int):
+        """
+        Дозагруженные 1m свечи [start_ts, end_ts]: пересборка закрытых корзин
+        старших таймфреймов, которые их охватывают, и пересчёт их индикаторов
+        """
+        for timeframe in self.derive_timeframes:
+            tf_sec = TIMEFRAMES_CONFIG[timeframe]["interval_sec"]
+            lo = int(bucket_start(start_ts, tf_sec))
+            hi = int(bucket_start(end_ts, tf_sec)) + tf_sec - BASE_SEC
+            try:
+                with write_connection(self.candle_handler.db_path) as conn:
+                    written = resample_history(conn, symbol, timeframe, lo, hi)
+            except Exception as e:
+                logger.exception(f"Ошибка пересборки {symbol} {timeframe} {lo} → {hi}: {e}")
+                continue
+            if written:
+                self._queue_recompute(symbol, timeframe, lo, hi)
+
     def run(self):
-        ws = WSClient(
+        self.ws = WSClient(
             symbols=self.symbols,
             intervals=self.intervals,
             callback=self._on_candle,
+            ws_factory=self.ws_factory,
+            on_reconnect=self.gap_repair.on_reconnect,
         )
-        ws.run_forever()
+        try:
+            self.ws.run_forever()
+        finally:
+            self.close()
+
+    def stop(self):
+        """Завершает run из другого потока"""
+        if self.ws is not None:
+            self.ws.stop()
+
+    def close(self):
+        """Дообрабатывает стадии по порядку: каждая дописывает следующую"""
+        self.parse_stage.close()
+        self.repair_stage.close()
+        self.gap_repair.close()
+        self.candle_handler.close()
+        self.indicator_stage.close()
+        self.publish_stage.close()
+        self.pipeline_metrics.close()
+        logger.info(f"📈 Очередь записи: {self.candle_handler.metrics()}")
+        logger.info(f"📈 [pipeline] {self.pipeline_metrics.summary()}")
+        logger.info(f"🩹 [gap_repair] {self.gap_repair.stats}")
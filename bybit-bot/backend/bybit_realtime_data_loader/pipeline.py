@@ -0,0 +1,249 @@
+"""
+pipeline.py
+
+Стадии realtime-конвейера: ограниченная очередь и пул потоков-обработчиков.
+
+    receive (поток WS) → parse → persist (write_behind.py) → indicators → publish
+
+Стадия (Stage) принимает элементы через put и обрабатывает их handler'ом
+в workers потоках. Передача дальше — явная: handler сам кладёт результат
+в следующую стадию (связывает стадии Manager).
+
+- key: при нескольких потоках элементы делятся по hash(key(item)) между
+  очередями потоков — элементы одного ключа (symbol, interval)
+  обрабатываются одним потоком в порядке поступления; без key все потоки
+  берут из общей очереди
+- policy при заполненной очереди:
+    block       — put ждёт (обратное давление на предыдущую стадию);
+                  поток самой стадии не ждёт (он же разбирает очередь) —
+                  элемент обрабатывается сразу в этом потоке
+    drop_oldest — вытесняется самый старый элемент очереди
+    drop_new    — отбрасывается новый элемент
+- метрики стадии (StageMetrics.snapshot): гистограммы ожидания в очереди
+  (wait) и обработки (service), обработано / отброшено / ошибок, глубина
+
+Число потоков, размер очереди и политика задаются параметрами или
+переменными окружения PIPELINE_<STAGE>_WORKERS / _QUEUE / _POLICY
+(stage_config).
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Callable, Dict, Hashable, Optional
+
+from backend.bybit_realtime_data_loader.latency import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ("block", "drop_oldest", "drop_new")
+IDLE_POLL = 0.5
+METRICS_LOG_INTERVAL = int(os.getenv("PIPELINE_METRICS_SEC", "60"))
+
+
+def stage_config(name: str, workers: int = 1, maxsize: int = 10_000, policy: str = "block") -> Dict:
+    """Параметры стадии с переопределением из окружения (PIPELINE_<NAME>_...)"""
+    prefix = f"PIPELINE_{name.upper()}"
+    return {
+        "workers": int(os.getenv(f"{prefix}_WORKERS", workers)),
+        "maxsize": int(os.getenv(f"{prefix}_QUEUE", maxsize)),
+        "policy": os.getenv(f"{prefix}_POLICY", policy),
+    }
+
+
+class StageMetrics:
+    """Счётчики и гистограммы стадии (обновляются из нескольких потоков)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.dropped = 0
+        self.failures = 0
+        self.max_depth = 0
+        self.wait = LatencyHistogram()
+        self.service = LatencyHistogram()
+
+    def on_enqueue(self, depth: int):
+        with self._lock:
+            self.max_depth = max(self.max_depth, depth)
+
+    def on_drop(self):
+        with self._lock:
+            self.dropped += 1
+
+    def on_done(self, wait_ms: float, service_ms: float, ok: bool):
+        with self._lock:
+            self.processed += 1
+            self.failures += int(not ok)
+        self.wait.record(wait_ms)
+        self.service.record(service_ms)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            counters = {
+                "processed": self.processed,
+                "dropped": self.dropped,
+                "failures": self.failures,
+                "max_depth": self.max_depth,
+            }
+        return {**counters, "wait": self.wait.snapshot(), "service": self.service.snapshot()}
+
+
+class Stage:
+    """
+    Стадия конвейера.
+
+    Args:
+        name: имя (потоки, логи, метрики)
+        handler: обработка одного элемента; исключение логируется и считается
+        workers: потоков-обработчиков
+        maxsize: размер очереди (на поток при key)
+        policy: block / drop_oldest / drop_new
+        key: ключ разбиения элементов между потоками
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[object], None],
+        workers: int = 1,
+        maxsize: int = 10_000,
+        policy: str = "block",
+        key: Optional[Callable[[object], Hashable]] = None,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Неизвестная политика стадии {name}: {policy}")
+        self.name = name
+        self.handler = handler
+        self.policy = policy
+        self.key = key if workers > 1 else None
+        self.metrics = StageMetrics()
+        queues = workers if self.key else 1
+        self._queues = [queue.Queue(maxsize=maxsize) for _ in range(queues)]
+        self._stop = threading.Event()
+        self._threads = [
+            threading.Thread(
+                target=self._run,
+                args=(self._queues[i % queues],),
+                name=f"{name}-{i}",
+                daemon=True,
+            )
+            for i in range(max(1, workers))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def depth(self) -> int:
+        return sum(q.qsize() for q in self._queues)
+
+    def put(self, item):
+        """Кладёт элемент в очередь по политике стадии"""
+        q = self._queues[hash(self.key(item)) % len(self._queues)] if self.key else self._queues[0]
+        entry = (time.monotonic(), item)
+        if self.policy == "block":
+            if threading.current_thread() not in self._threads:
+                q.put(entry)
+            else:
+                try:
+                    q.put_nowait(entry)
+                except queue.Full:
+                    self._handle(entry)
+                    return
+        else:
+            while True:
+                try:
+                    q.put_nowait(entry)
+                    break
+                except queue.Full:
+                    self.metrics.on_drop()
+                    if self.policy == "drop_new":
+                        return
+                    try:
+                        q.get_nowait()
+                    except queue.Empty:
+                        pass
+        self.metrics.on_enqueue(q.qsize())
+
+    def close(self, timeout: Optional[float] = 10.0):
+        """Дообрабатывает очередь и останавливает потоки"""
+        self._stop.set()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        left = self.depth()
+        if left:
+            logger.error(f"❌ [{self.name}] Остановка: {left} элементов не обработано")
+
+    def _run(self, q: "queue.Queue"):
+        while True:
+            try:
+                enqueued, item = q.get(timeout=IDLE_POLL)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return
+                continue
+            self._handle((enqueued, item))
+
+    def _handle(self, entry):
+        enqueued, item = entry
+        started = time.monotonic()
+        ok = True
+        try:
+            self.handler(item)
+        except Exception as e:
+            ok = False
+            logger.exception(f"❌ [{self.name}] Ошибка обработки: {e}")
+        finished = time.monotonic()
+        self.metrics.on_done((started - enqueued) * 1000, (finished - started) * 1000, ok)
+
+
+class PipelineMetrics:
+    """
+    Метрики стадий конвейера и сквозные задержки.
+
+    stages — стадии и объекты с metrics.snapshot() (очередь записи);
+    record(name, ms) — сквозные гистограммы (например, от приёма свечи
+    до записи индикаторов). Раз в PIPELINE_METRICS_SEC секунд — в лог.
+    """
+
+    def __init__(self, stages: Dict[str, object], log_interval: float = METRICS_LOG_INTERVAL):
+        self.stages = stages
+        self.log_interval = log_interval
+        self._latency: Dict[str, LatencyHistogram] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="pipeline-metrics", daemon=True)
+        self._thread.start()
+
+    def record(self, name: str, ms: float):
+        with self._lock:
+            histogram = self._latency.setdefault(name, LatencyHistogram())
+        histogram.record(ms)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            latency = dict(self._latency)
+        return {
+            "stages": {name: stage.metrics.snapshot() for name, stage in self.stages.items()},
+            "latency": {name: histogram.snapshot() for name, histogram in latency.items()},
+        }
+
+    def summary(self) -> str:
+        """Одна строка: p50/p99 обработки каждой стадии и сквозные p50/p99"""
+        snapshot = self.snapshot()
+        parts = []
+        for name, stage in snapshot["stages"].items():
+            service = stage.get("service") or stage.get("flush_hist")
+            parts.append(f"{name} p50={service['p50']} p99={service['p99']}")
+        for name, histogram in snapshot["latency"].items():
+            parts.append(f"{name} p50={histogram['p50']} p99={histogram['p99']}")
+        return ", ".join(parts)
+
+    def close(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.log_interval):
+            logger.info(f"📈 [pipeline] {self.summary()}")
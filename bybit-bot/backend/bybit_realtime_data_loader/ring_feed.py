@@ -0,0 +1,65 @@
+"""
+ring_feed.py
+
+Публикация realtime-свечей и их индикаторов в кольцевые буферы
+(backend/core/storage/ring_buffer.py), из которых читают API и пересчёт.
+
+Буфер (symbol, timeframe) создаётся при первой свече (и при первой свече
+после сброса invalidate_ring другим процессом) и заполняется последними
+свечами из БД. Ошибка буфера не мешает записи в SQLite:
+она логируется, а читатели в этом случае идут в БД.
+"""
+
+import logging
+from typing import Dict, List
+
+from backend.config.timeframes_config import TIMEFRAMES_CONFIG
+from backend.core.indicators.calc_ema import DB_PATH, EMA_PERIODS
+from backend.core.indicators.registry import CONFIGURED_INDICATORS, spec_columns
+from backend.core.storage import read_connection
+from backend.core.storage.indicator_store import load_indicator_frame
+from backend.core.storage.ring_buffer import (
+    BASE_COLUMNS,
+    get_ring_writer,
+    seed_ring,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def ring_columns() -> List[str]:
+    """OHLCV и все настроенные индикаторы"""
+    indicators = [f"ema{p}" for p in EMA_PERIODS] + spec_columns(
+        [spec for spec in CONFIGURED_INDICATORS if spec[0] != "ema"]
+    )
+    return BASE_COLUMNS + indicators
+
+
+def publish(symbol: str, timeframe: str, ts: int, values: Dict[str, float]):
+    """Кладёт значения свечи ts в буфер (OHLCV и/или индикаторы)"""
+    if timeframe not in TIMEFRAMES_CONFIG:
+        return
+    try:
+        columns = ring_columns()
+        ring, created = get_ring_writer(symbol, timeframe, columns)
+        if created:
+            _seed(ring, symbol, timeframe, ts, columns)
+        ring.put(ts, values)
+    except Exception as e:
+        logger.warning(f"⚠️ Кольцевой буфер {symbol} {timeframe}: {e}")
+
+
+def _seed(ring, symbol: str, timeframe: str, ts: int, columns: List[str]):
+    tf_sec = TIMEFRAMES_CONFIG[timeframe]["interval_sec"]
+    with read_connection(DB_PATH) as conn:
+        frame = load_indicator_frame(
+            conn,
+            symbol,
+            timeframe,
+            columns[1:len(BASE_COLUMNS)],
+            columns[len(BASE_COLUMNS):],
+            ts - ring.capacity * tf_sec,
+            ts,
+        )
+    seeded = seed_ring(ring, frame)
+    logger.info(f"🧮 Кольцевой буфер {symbol} {timeframe}: {seeded} свечей из БД")
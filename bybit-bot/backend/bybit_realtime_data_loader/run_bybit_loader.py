@@ -1,5 +1,8 @@
 """
 Запуск realtime загрузчика свечей с Bybit.
+
+--derive: подписка только на 1m, остальные таймфреймы строятся локально
+(backend/core/data/resampler.py).
 """
 
 import logging
@@ -9,6 +12,7 @@ print("🚀 Bybit real-time loader started...")
 
 from backend.bybit_realtime_data_loader.manager import Manager
 from backend.config.timeframes_config import TIMEFRAMES_CONFIG
+from backend.core.data.resampler import derivable_timeframes
 
 
 def convert_tf(tf: str) -> str:
@@ -27,7 +31,24 @@ def convert_tf(tf: str) -> str:
 
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Realtime загрузчик свечей Bybit")
+    parser.add_argument(
+        "--derive",
+        action="store_true",
+        help="Строить старшие таймфреймы из 1m вместо отдельных подписок",
+    )
+    args = parser.parse_args()
+
     symbols = ["BTCUSDT"]
-    intervals = [convert_tf(tf) for tf in TIMEFRAMES_CONFIG if convert_tf(tf)]
-    manager = Manager(symbols=symbols, intervals=intervals)
+    if args.derive:
+        intervals = [convert_tf("1m")]
+        derive_timeframes = derivable_timeframes()
+    else:
+        intervals = [convert_tf(tf) for tf in TIMEFRAMES_CONFIG if convert_tf(tf)]
+        derive_timeframes = []
+    manager = Manager(
+        symbols=symbols, intervals=intervals, derive_timeframes=derive_timeframes
+    )
     manager.run()
@@ -0,0 +1,276 @@
+"""
+write_behind.py
+
+Очередь отложенной записи (write-behind) для realtime-свечей.
+
+Callback WebSocket только кладёт свечу в очередь. Отдельный поток-писатель
+забирает накопившиеся элементы и записывает их одной транзакцией:
+пачка закрывается через flush_interval после первого элемента или при
+max_batch элементах. Повторы одного ключа (symbol, interval, timestamp)
+внутри пачки схлопываются — записывается последняя версия.
+
+Если запись пачки не удалась, она остаётся в ожидании и повторяется
+со следующими элементами (более новые версии ключа заменяют старые).
+После WRITE_BEHIND_RETRIES неудачных попыток пачка пишется по частям
+(делением пополам до отдельных элементов): элемент, который не пишется
+и один, логируется и откладывается в dead_letters, остальные записываются —
+одна плохая свеча не задерживает все следующие.
+Переполнение очереди (max_depth) блокирует put — обратное давление
+вместо неограниченного роста памяти.
+
+Метрики (WriteBehindMetrics.snapshot): глубина очереди, число записей
+и схлопываний, длительность транзакции (flush_ms) и задержка от put
+до commit (lag_ms) — p50/p99/max по последним пачкам, и гистограммы
+тех же задержек за всё время (latency.py). Поток-писатель пишет их в лог
+раз в WRITE_BEHIND_METRICS_SEC секунд.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Hashable, List, Optional
+
+from backend.bybit_realtime_data_loader.latency import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = int(os.getenv("WRITE_BEHIND_FLUSH_MS", "50")) / 1000
+MAX_BATCH = int(os.getenv("WRITE_BEHIND_MAX_BATCH", "500"))
+MAX_DEPTH = int(os.getenv("WRITE_BEHIND_MAX_DEPTH", "100000"))
+METRICS_LOG_INTERVAL = int(os.getenv("WRITE_BEHIND_METRICS_SEC", "60"))
+BATCH_RETRIES = int(os.getenv("WRITE_BEHIND_RETRIES", "3"))
+DEAD_LETTERS = 1000
+RETRY_DELAY = 1.0
+STOP_RETRIES = 3
+IDLE_POLL = 0.5
+LATENCY_WINDOW = 1024
+
+
+def _percentiles(values) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"p50": None, "p99": None, "max": None}
+    ordered = sorted(values)
+    last = len(ordered) - 1
+    return {
+        "p50": round(ordered[last // 2], 3),
+        "p99": round(ordered[int(last * 0.99)], 3),
+        "max": round(ordered[last], 3),
+    }
+
+
+class WriteBehindMetrics:
+    """Счётчики и задержки очереди (обновляются из двух потоков под блокировкой)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.depth = 0
+        self.max_depth = 0
+        self.enqueued = 0
+        self.written = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.failures = 0
+        self.dropped = 0
+        self._flush_ms = deque(maxlen=LATENCY_WINDOW)
+        self._lag_ms = deque(maxlen=LATENCY_WINDOW)
+        self.flush_hist = LatencyHistogram()
+        self.lag_hist = LatencyHistogram()
+
+    def on_enqueue(self, depth: int):
+        with self._lock:
+            self.enqueued += 1
+            self.depth = depth
+            self.max_depth = max(self.max_depth, depth)
+
+    def on_coalesce(self):
+        with self._lock:
+            self.coalesced += 1
+
+    def on_flush(self, rows: int, flush_ms: float, lags_ms: List[float], depth: int):
+        with self._lock:
+            self.flushes += 1
+            self.written += rows
+            self.depth = depth
+            self._flush_ms.append(flush_ms)
+            self._lag_ms.extend(lags_ms)
+        self.flush_hist.record(flush_ms)
+        for lag in lags_ms:
+            self.lag_hist.record(lag)
+
+    def on_failure(self):
+        with self._lock:
+            self.failures += 1
+
+    def on_drop(self):
+        with self._lock:
+            self.dropped += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "depth": self.depth,
+                "max_depth": self.max_depth,
+                "enqueued": self.enqueued,
+                "written": self.written,
+                "coalesced": self.coalesced,
+                "flushes": self.flushes,
+                "failures": self.failures,
+                "dropped": self.dropped,
+                "flush_ms": _percentiles(self._flush_ms),
+                "lag_ms": _percentiles(self._lag_ms),
+                "flush_hist": self.flush_hist.snapshot(),
+                "lag_hist": self.lag_hist.snapshot(),
+            }
+
+
+class WriteBehindQueue:
+    """
+    Очередь с потоком-писателем.
+
+    Args:
+        flush: записывает пачку элементов одной транзакцией (исключение → повтор)
+        key: ключ схлопывания элемента
+        after_flush: вызывается после успешной записи (публикация, триггеры);
+            его ошибки логируются и не приводят к повтору записи
+        flush_interval: секунд от первого элемента пачки до записи
+        max_batch: элементов в пачке
+        max_depth: размер очереди, после которого put блокируется
+    """
+
+    def __init__(
+        self,
+        flush: Callable[[List], None],
+        key: Callable[[object], Hashable],
+        after_flush: Optional[Callable[[List], None]] = None,
+        flush_interval: float = FLUSH_INTERVAL,
+        max_batch: int = MAX_BATCH,
+        max_depth: int = MAX_DEPTH,
+        name: str = "write-behind",
+    ):
+        self.flush = flush
+        self.key = key
+        self.after_flush = after_flush
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.name = name
+        self.metrics = WriteBehindMetrics()
+        # Элементы, которые не записались и поодиночке (последние DEAD_LETTERS)
+        self.dead_letters: deque = deque(maxlen=DEAD_LETTERS)
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_depth)
+        self._stop = threading.Event()
+        self._last_log = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def put(self, item):
+        """Кладёт элемент в очередь (блокируется, если очередь заполнена)"""
+        self._queue.put((time.monotonic(), item))
+        self.metrics.on_enqueue(self._queue.qsize())
+
+    def close(self, timeout: Optional[float] = 10.0):
+        """Дописывает очередь и останавливает поток"""
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def _collect(self, pending: Dict):
+        """Добирает элементы в pending до max_batch или до истечения flush_interval"""
+        deadline = time.monotonic() + self.flush_interval if pending else None
+        while len(pending) < self.max_batch:
+            if deadline is None:
+                timeout = IDLE_POLL
+            else:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    return
+            try:
+                enqueued, item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                return
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+
+            key = self.key(item)
+            if key in pending:
+                # Новая версия ключа; время ожидания считается от первой
+                pending[key] = (pending[key][0], item)
+                self.metrics.on_coalesce()
+            else:
+                pending[key] = (enqueued, item)
+
+    def _write(self, pending: Dict) -> bool:
+        items = [item for _, item in pending.values()]
+        started = time.monotonic()
+        try:
+            self.flush(items)
+        except Exception as e:
+            self.metrics.on_failure()
+            logger.exception(f"❌ [{self.name}] Ошибка записи пачки из {len(items)}: {e}")
+            return False
+        committed = time.monotonic()
+        self.metrics.on_flush(
+            len(items),
+            (committed - started) * 1000,
+            [(committed - enqueued) * 1000 for enqueued, _ in pending.values()],
+            self._queue.qsize(),
+        )
+        if self.after_flush is not None:
+            try:
+                self.after_flush(items)
+            except Exception as e:
+                logger.exception(f"❌ [{self.name}] Ошибка обработки после записи: {e}")
+        return True
+
+    def _write_split(self, pending: Dict):
+        """
+        Пачка, не записанная за BATCH_RETRIES попыток: половины пишутся
+        по отдельности, не записанная половина делится дальше; элемент,
+        который не пишется и один, откладывается в dead_letters
+        """
+        if len(pending) == 1:
+            if not self._write(pending):
+                item = next(iter(pending.values()))[1]
+                self.dead_letters.append(item)
+                self.metrics.on_drop()
+                logger.error(f"🗑 [{self.name}] Элемент {self.key(item)} не записан и отброшен")
+            return
+        keys = list(pending)
+        middle = len(keys) // 2
+        for part in (keys[:middle], keys[middle:]):
+            half = {key: pending[key] for key in part}
+            if not self._write(half):
+                self._write_split(half)
+
+    def _log_metrics(self):
+        now = time.monotonic()
+        if now - self._last_log < METRICS_LOG_INTERVAL:
+            return
+        self._last_log = now
+        logger.info(f"📈 [{self.name}] {self.metrics.snapshot()}")
+
+    def _run(self):
+        pending: Dict = {}
+        failures = 0
+        while True:
+            self._collect(pending)
+            if pending:
+                if self._write(pending):
+                    pending, failures = {}, 0
+                else:
+                    failures += 1
+                    # При остановке повторов меньше: очередь дописывается по частям
+                    limit = STOP_RETRIES if self._stop.is_set() else BATCH_RETRIES
+                    if failures >= limit:
+                        logger.warning(
+                            f"✂️ [{self.name}] Пачка из {len(pending)} не записана за "
+                            f"{failures} попыток — запись по частям"
+                        )
+                        self._write_split(pending)
+                        pending, failures = {}, 0
+                    else:
+                        time.sleep(RETRY_DELAY)
+            elif self._stop.is_set() and self._queue.empty():
+                return
+            self._log_metrics()
@@ -4,13 +4,21 @@ ws_client.py
 Подключение к WebSocket Bybit и обработка real-time свечей.
 Фильтрует только закрытые свечи (confirm: true) и вызывает callback.
 Поддерживает как одиночные свечи (data: {}) так и массивы (data: []) — например, при snapshot.
+
+Соединение создаётся фабрикой ws_factory (по умолчанию default_ws_factory):
+pybit WebSocket для адреса Bybit, KlineStream для другого BYBIT_WS_URL
+(локальный мок-сервер). Объект соединения должен поддерживать
+kline_stream(symbol, interval, callback) и exit(); on_reconnect передаётся
+соединению, у которого есть такой атрибут (KlineStream). pybit
+переподключается без сигнала — его разрывы видит сторож gap_repair.py.
 """
 
-from typing import Callable, List
-from pybit.unified_trading import WebSocket
-import time
+from typing import Callable, List, Optional
+import threading
 import logging
 
+from backend.config.exchange_config import BYBIT_WS_URL, BYBIT_WS_URL_DEFAULT
+
 logger = logging.getLogger(__name__)
 
 
@@ -41,6 +49,21 @@ def normalize_interval(raw_interval: str) -> str:
     return mapping.get(str(raw_interval), str(raw_interval))
 
 
+def default_ws_factory(testnet: bool = False):
+    """Соединение с публичным WebSocket (linear) по BYBIT_WS_URL"""
+    if BYBIT_WS_URL != BYBIT_WS_URL_DEFAULT:
+        from backend.bybit_realtime_data_loader.kline_stream import KlineStream
+
+        return KlineStream(BYBIT_WS_URL)
+
+    from pybit.unified_trading import WebSocket
+
+    return WebSocket(
+        testnet=testnet,
+        channel_type="linear",  # для фьючерсов
+    )
+
+
 class WSClient:
     def __init__(
         self,
@@ -48,19 +71,23 @@ class WSClient:
         intervals: List[str],
         callback: Callable[[dict], None],
         testnet: bool = False,
+        ws_factory: Optional[Callable[[], object]] = None,
+        on_reconnect: Optional[Callable[[], None]] = None,
     ):
         self.symbols = symbols
         self.intervals = intervals
         self.callback = callback
         self.testnet = testnet
+        self.ws_factory = ws_factory or (lambda: default_ws_factory(self.testnet))
+        self.on_reconnect = on_reconnect
         self.ws = None
+        self._stop = threading.Event()
 
     def connect(self):
         logger.info("⏳ Подключаемся к WebSocket Bybit...")
-        self.ws = WebSocket(
-            testnet=self.testnet,
-            channel_type="linear",  # для фьючерсов
-        )
+        self.ws = self.ws_factory()
+        if self.on_reconnect is not None and hasattr(self.ws, "on_reconnect"):
+            self.ws.on_reconnect = self.on_reconnect
 
         for symbol in self.symbols:
             for interval in self.intervals:
@@ -114,7 +141,18 @@ class WSClient:
     def run_forever(self):
         self.connect()
         try:
-            while True:
-                time.sleep(1)
+            while not self._stop.wait(1):
+                pass
         except KeyboardInterrupt:
             logger.info("⏹ Остановлено пользователем")
+        finally:
+            self.close()
+
+    def stop(self):
+        """Завершает run_forever из другого потока"""
+        self._stop.set()
+
+    def close(self):
+        if self.ws is not None:
+            self.ws.exit()
+            self.ws = None
@@ -0,0 +1,13 @@
+# config/exchange_config.py
+#
+# Адреса API биржи. Переопределяются переменными окружения — например,
+# для локального мок-сервера (backend/tools/mock_exchange.py):
+#   BYBIT_REST_URL=http://127.0.0.1:8801 BYBIT_WS_URL=ws://127.0.0.1:8802
+
+import os
+
+BYBIT_REST_URL_DEFAULT = "https://api.bybit.com"
+BYBIT_WS_URL_DEFAULT = "wss://stream.bybit.com/v5/public/linear"
+
+BYBIT_REST_URL = os.getenv("BYBIT_REST_URL", BYBIT_REST_URL_DEFAULT).rstrip("/")
+BYBIT_WS_URL = os.getenv("BYBIT_WS_URL", BYBIT_WS_URL_DEFAULT)
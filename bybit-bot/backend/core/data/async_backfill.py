@@ -0,0 +1,348 @@
+"""
+async_backfill.py
+
+Асинхронная дозагрузка истории свечей через REST Bybit (/v5/market/kline).
+
+- plan_windows: все пропуски всех таймфреймов заранее режутся на окна
+  по PAGE_LIMIT свечей (максимум страницы kline — 1000); окна таймфреймов
+  чередуются, поэтому таймфреймы загружаются одновременно
+- воркеры (concurrency) берут окна из общей очереди; перед каждым
+  запросом — токен из общего TokenBucket (лимит Bybit — 600 запросов
+  за 5 секунд на IP, по умолчанию берётся меньше, с запасом для realtime)
+- ответы 403/429 и retCode 10006/10018 (лимит частоты) останавливают
+  выдачу токенов всем воркерам на время отката; сетевые ошибки, 5xx
+  и retCode 10000/10016 повторяются с экспоненциальной задержкой
+- страница записывается сразу после получения: отдельная задача-писатель
+  вызывает write(window, candles) в потоке, запросы не ждут SQLite;
+  пустые страницы тоже передаются — окно отмечается в журнале
+  (checkpoints.py), и повторный запуск его не запрашивает
+- окно, которое не удалось загрузить, не теряется молча: оно попадает
+  в отчёт (failed) и остаётся пропуском до следующего запуска
+
+Клиент httpx.AsyncClient можно передать снаружи (моки, тесты); адрес —
+параметр base_url или BYBIT_REST_URL (config/exchange_config.py).
+"""
+
+import asyncio
+import os
+import random
+import time
+from itertools import chain, zip_longest
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import httpx
+
+from backend.config.exchange_config import BYBIT_REST_URL
+from backend.config.timeframes_config import TIMEFRAMES_CONFIG
+from backend.core.data.rest_client import KLINE_PATH
+
+PAGE_LIMIT = 1000
+
+RATE = float(os.getenv("BACKFILL_RATE", "50"))  # запросов в секунду
+BURST = int(os.getenv("BACKFILL_BURST", "20"))
+CONCURRENCY = int(os.getenv("BACKFILL_CONCURRENCY", "8"))
+MAX_RETRIES = int(os.getenv("BACKFILL_MAX_RETRIES", "5"))
+REQUEST_TIMEOUT = float(os.getenv("BACKFILL_TIMEOUT_SEC", "10"))
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+
+# retCode Bybit: частота запросов / временная ошибка сервера
+RATE_LIMIT_CODES = {10006, 10018}
+RETRYABLE_CODES = {10000, 10016}
+
+INTERVAL_MAP = {
+    "1m": "1",
+    "5m": "5",
+    "30m": "30",
+    "1h": "60",
+    "4h": "240",
+    "6h": "360",
+    "12h": "720",
+    "1d": "D",
+    "1w": "W",
+}
+
+
+class Window(NamedTuple):
+    """Окно одной страницы: свечи таймфрейма tf с start по end включительно"""
+
+    tf: str
+    start: int
+    end: int
+
+
+class BackfillError(Exception):
+    """Окно не загружено (ошибка API без повтора или исчерпаны попытки)"""
+
+
+class _Retry(Exception):
+    def __init__(self, message: str, rate_limited: bool = False, delay: float = 0.0):
+        super().__init__(message)
+        self.rate_limited = rate_limited
+        self.delay = delay
+
+
+class TokenBucket:
+    """
+    Ведро токенов: rate токенов в секунду, не больше capacity подряд.
+
+    pause(seconds) обнуляет ведро и не выдаёт токены до конца паузы —
+    так ответ «слишком часто» одного воркера тормозит всех.
+    """
+
+    def __init__(self, rate: float = RATE, capacity: int = BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    async def acquire(self):
+        # Ожидающие обслуживаются по очереди блокировки
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    self._updated = time.monotonic()
+                    continue
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def plan_windows(gaps: Dict[str, List[Tuple[int, int]]]) -> List[Window]:
+    """Окна страниц для пропусков {tf: [(start, end), ...]}, таймфреймы вперемешку"""
+    per_tf = []
+    for tf, ranges in gaps.items():
+        step = TIMEFRAMES_CONFIG[tf]["interval_sec"]
+        windows = []
+        for start, end in ranges:
+            current = start
+            # Окна смыкаются посекундно: в каждом ровно PAGE_LIMIT свечей
+            # при любом выравнивании start (неделя Bybit начинается в понедельник)
+            while current <= end:
+                window_end = min(end, current + PAGE_LIMIT * step - 1)
+                windows.append(Window(tf, current, window_end))
+                current = window_end + 1
+        per_tf.append(windows)
+    return [w for w in chain.from_iterable(zip_longest(*per_tf)) if w is not None]
+
+
+def _backoff(attempt: int) -> float:
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt) * random.uniform(0.5, 1.0)
+
+
+def _parse_kline(rows: list, window: Window) -> List[Dict]:
+    candles = []
+    for row in rows:
+        ts = int(row[0]) // 1000
+        if window.start <= ts <= window.end:
+            candles.append(
+                {
+                    "timestamp": ts,
+                    "open": float(row[1]),
+                    "high": float(row[2]),
+                    "low": float(row[3]),
+                    "close": float(row[4]),
+                    "volume": float(row[5]),
+                }
+            )
+    # Bybit отдаёт страницу от новых свечей к старым
+    candles.sort(key=lambda c: c["timestamp"])
+    return candles
+
+
+async def _request_page(
+    client: httpx.AsyncClient, symbol: str, category: str, window: Window
+) -> List[Dict]:
+    try:
+        response = await client.get(
+            KLINE_PATH,
+            params={
+                "category": category,
+                "symbol": symbol,
+                "interval": INTERVAL_MAP[window.tf],
+                "start": window.start * 1000,
+                "end": window.end * 1000,
+                "limit": PAGE_LIMIT,
+            },
+        )
+    except httpx.TransportError as e:
+        raise _Retry(f"{type(e).__name__}: {e}")
+
+    if response.status_code in (403, 429):
+        retry_after = response.headers.get("Retry-After")
+        delay = float(retry_after) if retry_after and retry_after.isdigit() else 0.0
+        raise _Retry(f"HTTP {response.status_code}", rate_limited=True, delay=delay)
+    if response.status_code >= 500:
+        raise _Retry(f"HTTP {response.status_code}")
+    if response.status_code != 200:
+        raise BackfillError(f"HTTP {response.status_code}: {response.text[:200]}")
+
+    try:
+        body = response.json()
+    except ValueError as e:
+        # Обрезанный или не-JSON ответ (прокси, обрыв) — повтор
+        raise _Retry(f"некорректный JSON: {e}")
+    if not isinstance(body, dict):
+        raise BackfillError(f"неожиданный ответ: {response.text[:200]}")
+    code = body.get("retCode")
+    if code in RATE_LIMIT_CODES:
+        raise _Retry(f"retCode {code}: {body.get('retMsg')}", rate_limited=True)
+    if code in RETRYABLE_CODES:
+        raise _Retry(f"retCode {code}: {body.get('retMsg')}")
+    if code != 0:
+        raise BackfillError(f"retCode {code}: {body.get('retMsg')}")
+    result = body.get("result")
+    if not isinstance(result, dict) or not isinstance(result.get("list", []), list):
+        raise BackfillError(f"нет result.list в ответе: {response.text[:200]}")
+    try:
+        return _parse_kline(result.get("list", []), window)
+    except (IndexError, TypeError, ValueError) as e:
+        raise BackfillError(f"некорректная свеча в ответе: {e}")
+
+
+async def fetch_page(
+    client: httpx.AsyncClient,
+    bucket: TokenBucket,
+    symbol: str,
+    window: Window,
+    category: str = "linear",
+    stats: Optional[Dict] = None,
+) -> List[Dict]:
+    """Одна страница kline с повторами; BackfillError — если окно не загружено"""
+    for attempt in range(MAX_RETRIES + 1):
+        await bucket.acquire()
+        try:
+            return await _request_page(client, symbol, category, window)
+        except _Retry as e:
+            if attempt == MAX_RETRIES:
+                raise BackfillError(f"{e} (попыток: {attempt + 1})")
+            delay = max(e.delay, _backoff(attempt))
+            if e.rate_limited:
+                bucket.pause(delay)
+            if stats is not None:
+                stats["retries"] += 1
+                stats["rate_limited"] += int(e.rate_limited)
+            await asyncio.sleep(delay)
+    raise BackfillError("исчерпаны попытки")
+
+
+async def run_backfill(
+    symbol: str,
+    gaps: Dict[str, List[Tuple[int, int]]],
+    write: Callable[[Window, List[Dict]], None],
+    base_url: str = BYBIT_REST_URL,
+    client: Optional[httpx.AsyncClient] = None,
+    bucket: Optional[TokenBucket] = None,
+    concurrency: int = CONCURRENCY,
+    category: str = "linear",
+) -> Dict:
+    """
+    Загружает пропуски всех таймфреймов одновременно.
+
+    Args:
+        symbol: символ
+        gaps: {tf: [(start, end), ...]} — секунды, включительно
+        write: запись страницы write(window, candles), в том числе пустой;
+            вызывается по одной странице за раз в отдельном потоке
+        base_url: адрес REST API (без client)
+        client: готовый httpx.AsyncClient (не закрывается)
+        bucket: общий TokenBucket (по умолчанию RATE/BURST)
+        concurrency: одновременных запросов
+
+    Returns:
+        dict: windows, pages, candles {tf: n}, retries, rate_limited,
+        failed [(tf, start, end, ошибка)], elapsed
+    """
+    windows = plan_windows(gaps)
+    stats = {
+        "windows": len(windows),
+        "pages": 0,
+        "candles": {tf: 0 for tf in gaps},
+        "retries": 0,
+        "rate_limited": 0,
+        "failed": [],
+        "elapsed": 0.0,
+    }
+    if not windows:
+        return stats
+
+    started = time.perf_counter()
+    bucket = bucket or TokenBucket()
+    todo: asyncio.Queue = asyncio.Queue()
+    for window in windows:
+        todo.put_nowait(window)
+    # Ограниченная очередь: если SQLite не успевает, запросы ждут
+    pages: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+
+    async def worker(http: httpx.AsyncClient):
+        while True:
+            try:
+                window = todo.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                candles = await fetch_page(http, bucket, symbol, window, category, stats)
+            except BackfillError as e:
+                stats["failed"].append((*window, str(e)))
+                print(f"[backfill] ❌ {window.tf} {window.start} → {window.end}: {e}")
+                continue
+            except Exception as e:
+                # Неожиданная ошибка не должна останавливать воркер и оставлять окна
+                stats["failed"].append((*window, f"{type(e).__name__}: {e}"))
+                print(
+                    f"[backfill] ❌ {window.tf} {window.start} → {window.end}: "
+                    f"{type(e).__name__}: {e}"
+                )
+                continue
+            stats["pages"] += 1
+            await pages.put((window, candles))
+
+    async def writer():
+        while True:
+            item = await pages.get()
+            if item is None:
+                return
+            window, candles = item
+            try:
+                await asyncio.to_thread(write, window, candles)
+            except Exception as e:
+                stats["failed"].append((*window, f"запись: {e}"))
+                print(f"[backfill] ❌ запись {window.tf} {window.start} → {window.end}: {e}")
+                continue
+            stats["candles"][window.tf] += len(candles)
+
+    own_client = client is None
+    http = client or httpx.AsyncClient(
+        base_url=base_url,
+        timeout=REQUEST_TIMEOUT,
+        limits=httpx.Limits(max_connections=concurrency),
+    )
+    writer_task = asyncio.create_task(writer())
+    try:
+        await asyncio.gather(*(worker(http) for _ in range(min(concurrency, len(windows)))))
+    finally:
+        await pages.put(None)
+        await writer_task
+        if own_client:
+            await http.aclose()
+
+    stats["elapsed"] = time.perf_counter() - started
+    print(
+        f"[backfill] ✅ {symbol}: {stats['pages']}/{stats['windows']} страниц, "
+        f"{sum(stats['candles'].values())} свечей за {stats['elapsed']:.1f} с "
+        f"(повторов {stats['retries']}, ошибок {len(stats['failed'])})"
+    )
+    return stats
@@ -0,0 +1,109 @@
+"""
+checkpoints.py
+
+Журнал загруженных окон дозагрузки истории (backfill_checkpoints).
+
+Окно (job, symbol, timeframe, start_ts, end_ts) записывается в той же
+транзакции, что и свечи страницы — после сбоя журнал и таблица свечей
+согласованы. Пустые страницы (история до листинга, дыры биржи) тоже
+отмечаются: повторный запуск их не запрашивает.
+
+Повторный запуск вычитает загруженные окна из пропусков
+(subtract_completed) и продолжает с места остановки. Журнал относится
+к одной загрузке: после запуска без ошибок окна таймфрейма снимаются
+(clear_checkpoints), следующая загрузка снова опирается на данные.
+
+job разделяет загрузчики: "extended" — data_extended_backfill,
+"recent" — data_backfill.
+"""
+
+import sqlite3
+import time
+from typing import List, Optional, Sequence, Tuple
+
+CHECKPOINT_TABLE = "backfill_checkpoints"
+
+
+def ensure_checkpoint_table(conn: sqlite3.Connection):
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE} (
+            job          TEXT    NOT NULL,
+            symbol       TEXT    NOT NULL,
+            timeframe    TEXT    NOT NULL,
+            start_ts     INTEGER NOT NULL,
+            end_ts       INTEGER NOT NULL,
+            candles      INTEGER NOT NULL,
+            completed_at INTEGER NOT NULL,
+            PRIMARY KEY (job, symbol, timeframe, start_ts)
+        ) WITHOUT ROWID
+        """
+    )
+
+
+def mark_window_done(
+    conn: sqlite3.Connection,
+    job: str,
+    symbol: str,
+    timeframe: str,
+    start_ts: int,
+    end_ts: int,
+    candles: int,
+):
+    """Отмечает окно загруженным (в текущей транзакции вызывающего кода)"""
+    ensure_checkpoint_table(conn)
+    conn.execute(
+        f"""
+        INSERT OR REPLACE INTO {CHECKPOINT_TABLE}
+        (job, symbol, timeframe, start_ts, end_ts, candles, completed_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        (job, symbol, timeframe, int(start_ts), int(end_ts), candles, int(time.time())),
+    )
+
+
+def completed_windows(
+    conn: sqlite3.Connection, job: str, symbol: str, timeframe: str
+) -> List[Tuple[int, int]]:
+    """Загруженные окна по возрастанию start_ts"""
+    ensure_checkpoint_table(conn)
+    return conn.execute(
+        f"SELECT start_ts, end_ts FROM {CHECKPOINT_TABLE} "
+        "WHERE job = ? AND symbol = ? AND timeframe = ? ORDER BY start_ts",
+        (job, symbol, timeframe),
+    ).fetchall()
+
+
+def subtract_completed(
+    ranges: Sequence[Tuple[int, int]], completed: Sequence[Tuple[int, int]]
+) -> List[Tuple[int, int]]:
+    """Части диапазонов (секунды, включительно), не покрытые загруженными окнами"""
+    completed = sorted(completed)
+    remaining = []
+    for start, end in ranges:
+        current = start
+        for done_start, done_end in completed:
+            if done_end < current or done_start > end:
+                continue
+            if done_start > current:
+                remaining.append((current, done_start - 1))
+            current = max(current, done_end + 1)
+            if current > end:
+                break
+        if current <= end:
+            remaining.append((current, end))
+    return remaining
+
+
+def clear_checkpoints(
+    conn: sqlite3.Connection, job: str, symbol: str, timeframe: Optional[str] = None
+) -> int:
+    """Снимает окна загрузки (всех таймфреймов, если timeframe не указан)"""
+    ensure_checkpoint_table(conn)
+    sql = f"DELETE FROM {CHECKPOINT_TABLE} WHERE job = ? AND symbol = ?"
+    params: list = [job, symbol]
+    if timeframe is not None:
+        sql += " AND timeframe = ?"
+        params.append(timeframe)
+    with conn:
+        return conn.execute(sql, params).rowcount
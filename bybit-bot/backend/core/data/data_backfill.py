@@ -1,22 +1,34 @@
 """
 data_backfill.py
 
-Загружает до 200 исторических свечей для BTCUSDT с Bybit (realnet)
+Загружает до 200 исторических свечей для BTCUSDT с Bybit (realnet;
+адрес — BYBIT_REST_URL, клиент можно передать в main)
 Сохраняет в таблицы: candles_1m, candles_5m, ..., candles_1w
+
+Загруженные таймфреймы отмечаются в журнале (core/data/checkpoints.py):
+после сбоя повторный запуск догружает только недостающий хвост.
 """
 
 from pathlib import Path
 import sys
+import time
 
 BASE_DIR = Path(__file__).resolve().parents[2]  # .../backend
 if str(BASE_DIR) not in sys.path:
     sys.path.append(str(BASE_DIR))
 
 from config.timeframes_config import TIMEFRAMES_CONFIG
+from backend.core.data.checkpoints import (
+    clear_checkpoints,
+    completed_windows,
+    mark_window_done,
+    subtract_completed,
+)
 from backend.core.dim.ezdim import EzDIM
+from backend.core.indicators.dirty_ranges import mark_dirty
+from backend.core.storage import enable_wal, invalidate_ring, open_connection
 
-import sqlite3
-from pybit.unified_trading import HTTP
+from backend.core.data.rest_client import RestClient
 
 # 📁 Универсальные пути
 BASE_DIR = Path(__file__).resolve().parents[2]  # .../backend
@@ -28,6 +40,8 @@ DB_PATH = PROJECT_ROOT / "db" / "market_data.sqlite"
 
 # 🔧 Настройки
 SYMBOL = "BTCUSDT"
+JOB = "recent"  # журнал загруженных окон (checkpoints.py)
+PAGE_LIMIT = 200
 INTERVAL_MAP = {
     "1m": "1",
     "5m": "5",
@@ -40,78 +54,127 @@ INTERVAL_MAP = {
     "1w": "W",
 }
 
-# 🟢 Старт API-сессии
-session = HTTP(testnet=False)  # realnet
-conn = sqlite3.connect(DB_PATH)
-cursor = conn.cursor()
-
-for tf in TIMEFRAMES_CONFIG.keys():
-    if tf not in INTERVAL_MAP:
-        print(f"⚠️ Таймфрейм {tf} не поддерживается в INTERVAL_MAP, пропущен")
-        continue
-
-    interval = INTERVAL_MAP[tf]
-    print(f"📥 Загрузка {tf}...")
-    try:
-        response = session.get_kline(
-            category="linear", symbol=SYMBOL, interval=interval, limit=200
-        )
-        candles = response["result"]["list"]
-        table = f"candles_{tf}"
-
-        # Формируем DataFrame для валидации
-        df_data = []
-        for c in candles:
-            ts_ms = int(c[0])
-            ts = ts_ms // 1000
-            ts_ns = ts_ms * 1_000_000
-
-            open_, high, low, close, volume = map(float, c[1:6])
-            df_data.append(
-                {
-                    "timestamp": ts,
-                    "timestamp_ns": ts_ns,
-                    "timestamp_ms": ts_ms,
-                    "open": open_,
-                    "high": high,
-                    "low": low,
-                    "close": close,
-                    "volume": volume,
-                }
-            )
 
-        import pandas as pd
-
-        df = pd.DataFrame(df_data)
-
-        # Валидация данных перед сохранением
-        EzDIM.preflight(
-            df,
-            required_cols=["timestamp", "open", "high", "low", "close"],
-            min_rows=1,
-            tf_sec=TIMEFRAMES_CONFIG[tf]["interval_sec"],
-        )
-
-        for c in candles:
-            ts_ms = int(c[0])
-            ts = ts_ms // 1000
-            ts_ns = ts_ms * 1_000_000
-
-            open_, high, low, close, volume = map(float, c[1:6])
-            cursor.execute(
-                f"""
-                INSERT OR IGNORE INTO {table}
-                (symbol, timestamp, timestamp_ns, timestamp_ms, open, high, low, close, volume)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-                (SYMBOL, ts, ts_ns, ts_ms, open_, high, low, close, volume),
+def main(session=None, db_path=DB_PATH):
+    """
+    Args:
+        session: клиент с get_kline (по умолчанию RestClient на BYBIT_REST_URL)
+        db_path: файл БД
+    """
+    own_session = session is None
+    session = session or RestClient()
+    conn = open_connection(db_path)
+    enable_wal(conn)
+    cursor = conn.cursor()
+    failed = False
+
+    for tf in TIMEFRAMES_CONFIG.keys():
+        if tf not in INTERVAL_MAP:
+            print(f"⚠️ Таймфрейм {tf} не поддерживается в INTERVAL_MAP, пропущен")
+            continue
+
+        interval = INTERVAL_MAP[tf]
+        step = TIMEFRAMES_CONFIG[tf]["interval_sec"]
+        now = int(time.time())
+        # Последние PAGE_LIMIT свечей без текущей: что уже загружено прерванным запуском
+        done = completed_windows(conn, JOB, SYMBOL, tf)
+        remaining = subtract_completed([(now - (PAGE_LIMIT - 1) * step, now - step)], done)
+        if not remaining:
+            print(f"⏩ {tf} уже загружен (журнал)")
+            continue
+
+        print(f"📥 Загрузка {tf}...")
+        try:
+            params = {}
+            if done:
+                params = {"start": remaining[0][0] * 1000, "end": now * 1000}
+            response = session.get_kline(
+                category="linear", symbol=SYMBOL, interval=interval, limit=PAGE_LIMIT, **params
+            )
+            candles = response["result"]["list"]
+            table = f"candles_{tf}"
+
+            # Формируем DataFrame для валидации
+            df_data = []
+            for c in candles:
+                ts_ms = int(c[0])
+                ts = ts_ms // 1000
+                ts_ns = ts_ms * 1_000_000
+
+                open_, high, low, close, volume = map(float, c[1:6])
+                df_data.append(
+                    {
+                        "timestamp": ts,
+                        "timestamp_ns": ts_ns,
+                        "timestamp_ms": ts_ms,
+                        "open": open_,
+                        "high": high,
+                        "low": low,
+                        "close": close,
+                        "volume": volume,
+                    }
+                )
+
+            import pandas as pd
+
+            df = pd.DataFrame(df_data)
+
+            # Валидация данных перед сохранением
+            EzDIM.preflight(
+                df,
+                required_cols=["timestamp", "open", "high", "low", "close"],
+                min_rows=1,
+                tf_sec=TIMEFRAMES_CONFIG[tf]["interval_sec"],
             )
 
-        conn.commit()
-        print(f"✅ {len(candles)} свечей записано в {table}")
-
-    except Exception as e:
-        print(f"⚠️ Ошибка загрузки {tf}: {e}")
-
-conn.close()
-print("🏁 Готово.")
+            inserted_ts = []
+            for c in candles:
+                ts_ms = int(c[0])
+                ts = ts_ms // 1000
+                ts_ns = ts_ms * 1_000_000
+
+                open_, high, low, close, volume = map(float, c[1:6])
+                # total_changes учитывает и вставки через триггер компактного представления
+                changes = conn.total_changes
+                cursor.execute(
+                    f"""
+                    INSERT OR IGNORE INTO {table}
+                    (symbol, timestamp, timestamp_ns, timestamp_ms, open, high, low, close, volume)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                    (SYMBOL, ts, ts_ns, ts_ms, open_, high, low, close, volume),
+                )
+                if conn.total_changes > changes:
+                    inserted_ts.append(ts)
+
+            # Журнал изменений: новые свечи пересчитает воркер журнала одним проходом
+            if inserted_ts:
+                mark_dirty(conn, SYMBOL, tf, min(inserted_ts), max(inserted_ts))
+            # Отметка окна — в той же транзакции, что и свечи
+            if df_data:
+                page_ts = [row["timestamp"] for row in df_data]
+                mark_window_done(
+                    conn, JOB, SYMBOL, tf, min(page_ts), max(page_ts), len(page_ts)
+                )
+            conn.commit()
+            if inserted_ts:
+                invalidate_ring(SYMBOL, tf, min(inserted_ts), max(inserted_ts))
+            print(f"✅ {len(candles)} свечей записано в {table}")
+
+        except Exception as e:
+            conn.rollback()
+            failed = True
+            print(f"⚠️ Ошибка загрузки {tf}: {e}")
+
+    # Запуск завершён без ошибок — журнал больше не нужен
+    if not failed:
+        clear_checkpoints(conn, JOB, SYMBOL)
+
+    conn.close()
+    if own_session:
+        session.close()
+    print("🏁 Готово.")
+
+
+if __name__ == "__main__":
+    main()
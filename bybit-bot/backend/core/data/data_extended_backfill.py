@@ -1,9 +1,9 @@
+import asyncio
 import sys
 import os
 import sqlite3
 import time
 from pathlib import Path
-from pybit.unified_trading import HTTP
 from dotenv import load_dotenv
 
 # === Добавляем корень проекта bybit-bot в sys.path ===
@@ -13,92 +13,58 @@ sys.path.insert(0, str(PROJECT_ROOT))
 
 # === ВАЖНО: импорт из backend.config ===
 from backend.config.timeframes_config import TIMEFRAMES_CONFIG
+from backend.core.data.async_backfill import INTERVAL_MAP, run_backfill
+from backend.core.data.checkpoints import (
+    clear_checkpoints,
+    completed_windows,
+    mark_window_done,
+    subtract_completed,
+)
 from backend.core.dim.ezdim import EzDIM
+from backend.core.indicators.dirty_ranges import mark_dirty
+from backend.core.storage import candle_table_ddl, invalidate_ring, write_connection
+from backend.core.storage.coverage import (
+    bulk_coverage,
+    cover_timestamps,
+    coverage_stats,
+    ensure_coverage,
+    missing_ranges,
+)
 
 # === 🔐 Загрузка переменных окружения ===
 load_dotenv()
 
 SYMBOL = os.getenv("SYMBOL", "BTCUSDT")
+JOB = "extended"  # журнал загруженных окон (checkpoints.py)
 DB_PATH = os.getenv(
     "DB_PATH", str(PROJECT_ROOT / "backend" / "db" / "market_data.sqlite")
 )
 
-# === 🌐 Настройка таймфреймов для Bybit API ===
-
-INTERVAL_MAP = {
-    "1m": "1",
-    "5m": "5",
-    "30m": "30",
-    "1h": "60",
-    "4h": "240",
-    "6h": "360",
-    "12h": "720",
-    "1d": "D",
-    "1w": "W",
-}
-
-session = HTTP(testnet=False)
-
 # === Получение меток ===
 
 
-def get_earliest_db_timestamp(tf):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    try:
-        cursor.execute(
-            f"SELECT MIN(timestamp) FROM candles_{tf} WHERE symbol = ?", (SYMBOL,)
-        )
-        row = cursor.fetchone()
-        earliest_db = row[0] if row and row[0] else None
-        print(f"[DEBUG] earliest_db for {tf} = {earliest_db}")
-        return earliest_db
-    except sqlite3.OperationalError:
-        return None
-    finally:
-        conn.close()
-
+def find_missing_ranges(tf, required_start, now):
+    """
+    Пропуски от required_start по индексу покрытия (core/storage/coverage.py).
 
-def get_sorted_timestamps(tf):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    Пропуск в начале и внутренние пропуски; хвост после последней свечи
+    догружает realtime. Пустая история — один пропуск до now.
+    """
     try:
-        cursor.execute(
-            f"SELECT timestamp FROM candles_{tf} WHERE symbol = ? ORDER BY timestamp",
-            (SYMBOL,),
-        )
-        return [row[0] for row in cursor.fetchall()]
+        with write_connection(DB_PATH) as conn:
+            if not ensure_coverage(conn, tf):
+                return [(required_start, now)]
+            stats = coverage_stats(conn, SYMBOL, tf)
+            if stats["latest"] is None:
+                return [(required_start, now)]
+            print(f"[DEBUG] earliest_db for {tf} = {stats['earliest']}")
+            return missing_ranges(conn, SYMBOL, tf, required_start, stats["latest"])
     except sqlite3.OperationalError:
         return []
-    finally:
-        conn.close()
-
-
-def find_missing_ranges(tf, required_start):
-    timestamps = get_sorted_timestamps(tf)
-    if len(timestamps) < 2:
-        return []
-
-    interval = TIMEFRAMES_CONFIG[tf]["interval_sec"]
-    ranges = []
-
-    prev = timestamps[0]
-    for current in timestamps[1:]:
-        if current > prev + interval:
-            gap_start = prev + interval
-            # Если gap_start уходит дальше allowed, корректируем
-            if gap_start < required_start:
-                gap_start = required_start
-            if gap_start <= current - interval:
-                ranges.append((gap_start, current - interval))
-        prev = current
-
-    return ranges
 
 
 def get_missing_gaps(tf):
     now = int(time.time())
-    interval = TIMEFRAMES_CONFIG[tf]["interval_sec"]
     history = TIMEFRAMES_CONFIG[tf].get("allowed_history")
     if history:
         required_start = now - history
@@ -108,20 +74,9 @@ def get_missing_gaps(tf):
         required_start = now - default_years * 365 * 86400
         print(f"⚠️ allowed_history не указан для {tf}, используем {default_years} лет")
 
-    gaps = []
-
-    earliest_db = get_earliest_db_timestamp(tf)
-    if not earliest_db or earliest_db > required_start:
-        gap_start = required_start
-        gap_end = earliest_db - interval if earliest_db else now
-        if gap_start <= gap_end:
-            gaps.append((gap_start, gap_end))
-            print(f"🔍 Пропуск в начале: {gap_start} → {gap_end}")
-
-    internal = find_missing_ranges(tf, required_start)
-    if internal:
-        print(f"🔍 Найдено внутренних пропусков: {len(internal)}")
-        gaps += internal
+    gaps = find_missing_ranges(tf, required_start, now)
+    if gaps:
+        print(f"🔍 Найдено пропусков: {len(gaps)} (первый: {gaps[0][0]} → {gaps[0][1]})")
 
     # 🛡 Гарантируем, что все end в секундах, не миллисекундах
     gaps = [(start, end if end < 1e12 else end // 1000) for start, end in gaps]
@@ -131,79 +86,63 @@ def get_missing_gaps(tf):
 # === Работа с API и БД ===
 
 
-def fetch_candles_batch(tf, start_ts, end_ts):
-    interval = INTERVAL_MAP[tf]
-    step = TIMEFRAMES_CONFIG[tf]["interval_sec"] * 200
-    all_candles = []
-    current = start_ts
-
-    while current <= end_ts:
-        # Удалены debug print-ы
-        try:
-            res = session.get_kline(
-                category="linear",
-                symbol=SYMBOL,
-                interval=interval,
-                start=current * 1000,
-                end=(min(end_ts, current + step)) * 1000,
-                limit=200,
-            )
-            candles = res["result"].get("list", [])
-            batch = [
-                {
-                    "timestamp": int(c[0]) // 1000,
-                    "open": float(c[1]),
-                    "high": float(c[2]),
-                    "low": float(c[3]),
-                    "close": float(c[4]),
-                    "volume": float(c[5]),
-                }
-                for c in candles
-            ]
-            all_candles.extend(batch)
-        except Exception as e:
-            print(f"⚠️ API ошибка: {e}")
-        current += step
-        time.sleep(0.05)
-
-    # Создаем DataFrame для валидации
-    import pandas as pd
-
-    df = pd.DataFrame(all_candles)
-
-    # Валидация данных перед возвратом
-    if not df.empty:
+def write_page(window, candles):
+    """
+    Проверка и запись страницы (вызывается писателем async_backfill).
+
+    Свечи и отметка окна в журнале — одна транзакция.
+    """
+    if candles:
+        import pandas as pd
+
         EzDIM.preflight(
-            df,
+            pd.DataFrame(candles),
             required_cols=["timestamp", "open", "high", "low", "close"],
             min_rows=1,
-            tf_sec=TIMEFRAMES_CONFIG[tf]["interval_sec"],
+            tf_sec=TIMEFRAMES_CONFIG[window.tf]["interval_sec"],
         )
+    inserted = False
+    with write_connection(DB_PATH) as conn:
+        if candles:
+            inserted = _insert_candles(conn, window.tf, f"candles_{window.tf}", candles)
+        mark_window_done(
+            conn, JOB, SYMBOL, window.tf, window.start, window.end, len(candles)
+        )
+    if inserted:
+        _invalidate_ring(window.tf, candles)
+
 
-    return all_candles
+def resume_gaps(tf, gaps):
+    """Вычитает окна, загруженные прерванным запуском"""
+    with write_connection(DB_PATH) as conn:
+        completed = completed_windows(conn, JOB, SYMBOL, tf)
+    if not completed:
+        return gaps
+    remaining = subtract_completed(gaps, completed)
+    print(f"⏩ Продолжение по журналу: {len(completed)} окон уже загружено")
+    return remaining
 
 
 def insert_candles_bulk(tf, candles):
     if not candles:
         return
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
     table = f"candles_{tf}"
-    cursor.execute(
-        f"""
-        CREATE TABLE IF NOT EXISTS {table} (
-            symbol TEXT NOT NULL,
-            timestamp INTEGER PRIMARY KEY,
-            timestamp_ns INTEGER NOT NULL,
-            timestamp_ms INTEGER NOT NULL,
-            open REAL,
-            high REAL,
-            low REAL,
-            close REAL,
-            volume REAL
-        )
-    """
-    )
+    with write_connection(DB_PATH) as conn:
+        inserted = _insert_candles(conn, tf, table, candles)
+    if inserted:
+        _invalidate_ring(tf, candles)
+
+
+def _invalidate_ring(tf, candles):
+    """Свечи зафиксированы — буфер realtime-загрузчика перечитает БД"""
+    timestamps = [c["timestamp"] for c in candles]
+    invalidate_ring(SYMBOL, tf, min(timestamps), max(timestamps))
+
+
+def _insert_candles(conn, tf, table, candles):
+    """Вставка пакета свечей; True если вставлена хотя бы одна"""
+    cursor = conn.cursor()
+    cursor.execute(candle_table_ddl(table))
     data = []
     for c in candles:
         ts = c["timestamp"]
@@ -220,42 +159,64 @@ def insert_candles_bulk(tf, candles):
                 c["volume"],
             )
         )
-    cursor.executemany(
-        f"""
-        INSERT OR IGNORE INTO {table}
-        (symbol, timestamp, timestamp_ns, timestamp_ms, open, high, low, close, volume)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """,
-        data,
-    )
-    conn.commit()
-    conn.close()
+    timestamps = [row[1] for row in data]
+    # Индекс покрытия — участками пакета, а не триггером на каждую строку
+    with bulk_coverage(conn):
+        # total_changes учитывает и вставки через триггер компактного представления
+        changes = cursor.connection.total_changes
+        cursor.executemany(
+            f"""
+            INSERT OR IGNORE INTO {table}
+            (symbol, timestamp, timestamp_ns, timestamp_ms, open, high, low, close, volume)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+            data,
+        )
+        inserted = cursor.connection.total_changes > changes
+        cover_timestamps(conn, SYMBOL, tf, timestamps)
+    # Журнал изменений: вставленный диапазон пересчитает воркер журнала
+    if inserted:
+        mark_dirty(conn, SYMBOL, tf, min(timestamps), max(timestamps))
+    return inserted
 
 
 # === Главный алгоритм ===
 
 
-def main():
+def main(client=None):
+    """client: httpx.AsyncClient для async_backfill (по умолчанию BYBIT_REST_URL)"""
     print(f"🎯 Символ: {SYMBOL}")
     print(f"💾 БД: {DB_PATH}")
 
+    # Все окна всех таймфреймов планируются заранее и грузятся одновременно
+    gaps = {}
     for tf in TIMEFRAMES_CONFIG:
+        if tf not in INTERVAL_MAP:
+            print(f"⚠️ Таймфрейм {tf} не поддерживается в INTERVAL_MAP, пропущен")
+            continue
         print(f"\n📦 Обработка {tf}...")
-        gaps = get_missing_gaps(tf)
-        if not gaps:
+        tf_gaps = resume_gaps(tf, get_missing_gaps(tf))
+        if tf_gaps:
+            gaps[tf] = tf_gaps
+        else:
             print(f"✅ Пропусков нет для {tf} (БД заполнена)")
-            continue
 
-        total = 0
-        for start, end in gaps:
-            print(f"⏳ Загрузка: {start} → {end}")
-            candles = fetch_candles_batch(tf, start, end)
-            insert_candles_bulk(tf, candles)
-            if len(candles) > 0:
-                print(f"✅ Загружено: {len(candles)} свечей")
-            total += len(candles)
+    if not gaps:
+        return
 
+    report = asyncio.run(run_backfill(SYMBOL, gaps, write_page, client=client))
+    failed_tfs = {failed[0] for failed in report["failed"]}
+    for tf, total in report["candles"].items():
         print(f"🧮 Всего загружено: {total} в {tf}")
+        # Загрузка таймфрейма завершена — журнал больше не нужен
+        if tf not in failed_tfs:
+            with write_connection(DB_PATH) as conn:
+                clear_checkpoints(conn, JOB, SYMBOL, tf)
+    if report["failed"]:
+        print(
+            f"⚠️ Не загружено окон: {len(report['failed'])} — "
+            "следующий запуск продолжит по журналу"
+        )
 
 
 if __name__ == "__main__":
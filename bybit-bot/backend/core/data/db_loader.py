@@ -1,7 +1,9 @@
-import sqlite3
 import pandas as pd
 from typing import List, Dict, Optional, Any
 from backend.config.timeframes_config import TIMEFRAMES_CONFIG
+from backend.core.storage import read_connection
+from backend.core.storage.indicator_store import load_indicator_frame
+from backend.core.storage.ring_buffer import get_ring_reader
 from pathlib import Path
 import os
 import sys
@@ -58,6 +60,34 @@ def extract_ema_from_candles(
     return result
 
 
+def _load_from_ring(
+    symbol: str, timeframe: str, start: int, end: int, ema_cols: List[str]
+) -> Optional[pd.DataFrame]:
+    """
+    Окно из кольцевого буфера или None, если буфер его не покрывает
+    или не читается (снимок не удался под записью, файл пересоздаётся) —
+    тогда окно читается из SQLite
+    """
+    try:
+        ring = get_ring_reader(symbol, timeframe)
+        if ring is None:
+            return None
+        df = ring.window(
+            start,
+            end,
+            ["open", "high", "low", "close", "volume", *ema_cols],
+            TIMEFRAMES_CONFIG[timeframe]["interval_sec"],
+        )
+    except Exception as e:
+        print(f"⚠️ [db_loader] Кольцевой буфер {symbol} {timeframe} недоступен, чтение из SQLite: {e}")
+        return None
+    if df is None:
+        return None
+    df.insert(0, "symbol", symbol)
+    df.insert(2, "timestamp_ns", df["timestamp"] * 1_000_000_000)
+    return df
+
+
 def get_candles_from_db(
     symbol: str, timeframe: str, start: int, end: int
 ) -> List[dict]:
@@ -91,23 +121,32 @@ def get_candles_with_ema_from_db(
             f"Недопустимый timeframe: {timeframe}. Допустимые значения: {list(TIMEFRAMES_CONFIG.keys())}"
         )
 
-    # Динамическое имя таблицы
-    table = f"candles_{timeframe}"
-
-    # Безопасный SQL-запрос с параметрами
-    query = """
-        SELECT * FROM {}
-        WHERE symbol = ?
-        AND timestamp BETWEEN ? AND ?
-        ORDER BY timestamp ASC
-    """.format(
-        table
-    )  # Имя таблицы не может быть параметром, но timeframe уже проверен
+    # Колонки OHLCV и только запрошенные EMA (индикаторы подтягиваются лениво)
+    ohlcv_cols = [
+        "symbol",
+        "timestamp",
+        "timestamp_ns",
+        "open",
+        "high",
+        "low",
+        "close",
+        "volume",
+    ]
+    ema_cols = (
+        [f"ema{period}" for period in ema_periods]
+        if include_ema and ema_periods
+        else []
+    )
 
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            df = pd.read_sql(query, conn, params=(symbol, start, end))
-            assert isinstance(df, pd.DataFrame)
+        # Последние свечи — из кольцевого буфера realtime-загрузчика, без SQLite
+        df = _load_from_ring(symbol, timeframe, start, end, ema_cols)
+        if df is None:
+            with read_connection(DB_PATH) as conn:
+                df = load_indicator_frame(
+                    conn, symbol, timeframe, ohlcv_cols, ema_cols, start, end
+                )
+        assert isinstance(df, pd.DataFrame)
 
         print("[DEBUG] SQL df shape:", df.shape)
 
@@ -132,16 +171,6 @@ def get_candles_with_ema_from_db(
         all_data = df.to_dict(orient="records")
 
         # Разделяем OHLCV и EMA данные
-        ohlcv_cols = [
-            "symbol",
-            "timestamp",
-            "timestamp_ns",
-            "open",
-            "high",
-            "low",
-            "close",
-            "volume",
-        ]
         candles_data = []
 
         for record in all_data:
@@ -0,0 +1,239 @@
+"""
+gaps.py
+
+Поиск пропусков свечей на стороне SQLite.
+
+Пропуск начинается после свечи, у которой нет следующей (timestamp + интервал).
+Запрос идёт по первичному ключу (symbol, timestamp): для каждой свечи —
+поиск соседа по ключу, для найденных — поиск следующей существующей свечи.
+В Python возвращаются только границы пропусков, поэтому память не зависит
+от размера таблицы. (LAG(timestamp) OVER (PARTITION BY symbol ORDER BY
+timestamp) даёт тот же результат, но в SQLite 3.40 примерно вдвое медленнее:
+окно материализует каждую строку.)
+
+Архивные месяцы холодного уровня (cold_tier.py) проверяются по одному
+месяцу за раз. Если у символа есть архив, непрерывные участки Parquet
+и SQLite объединяются: SQLite может содержать и историю старше архива
+(дозагрузка после архивации), и копии архивных свечей.
+
+Пропуск — (symbol, первая отсутствующая свеча, последняя отсутствующая свеча).
+Края данных (до первой и после последней свечи) пропусками не считаются.
+
+Используется data_extended_backfill, tools/show_data_ranges,
+tools/check_missing_candles.
+"""
+
+import sqlite3
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from backend.core.storage.cold_tier import (
+    CATALOG_TABLE,
+    cold_bounds,
+    cold_months,
+    has_cold,
+    month_bounds,
+    read_cold_frame,
+)
+from backend.core.storage.compact import table_symbols
+
+Gap = Tuple[str, int, int]
+
+
+def gap_candles(start: int, end: int, tf_sec: int) -> int:
+    """Количество отсутствующих свечей в пропуске"""
+    return (end - start) // tf_sec + 1
+
+
+def _clip(
+    symbol: str, start: int, end: int, start_ts: Optional[int], end_ts: Optional[int]
+) -> Optional[Gap]:
+    if start_ts is not None:
+        start = max(start, start_ts)
+    if end_ts is not None:
+        end = min(end, end_ts)
+    return (symbol, start, end) if start <= end else None
+
+
+def _cold_gaps(
+    conn: sqlite3.Connection,
+    table: str,
+    symbol: str,
+    tf_sec: int,
+    start_ts: Optional[int],
+    end_ts: Optional[int],
+) -> Iterator[Gap]:
+    """Пропуски холодного уровня"""
+    last = None
+    if start_ts is not None:
+        # Последняя свеча месяца перед диапазоном — сосед первой свечи в нём
+        before = [
+            month
+            for month in cold_months(conn, table, symbol, None, start_ts - 1)
+            if month[2] < start_ts
+        ]
+        if before:
+            last = before[-1][2]
+
+    for month_start, _, _, _, _ in cold_months(conn, table, symbol, start_ts, end_ts):
+        frame = read_cold_frame(
+            conn, table, symbol, ["timestamp"], month_start, month_bounds(month_start)[1] - 1
+        )
+        ts = frame["timestamp"].to_numpy(dtype=np.int64)
+        if last is not None:
+            ts = np.concatenate(([last], ts[ts > last]))
+        if not len(ts):
+            continue
+        for i in np.flatnonzero(np.diff(ts) > tf_sec):
+            gap = _clip(symbol, int(ts[i]) + tf_sec, int(ts[i + 1]) - tf_sec, start_ts, end_ts)
+            if gap:
+                yield gap
+        last = int(ts[-1])
+
+
+def _sqlite_gaps(
+    conn: sqlite3.Connection,
+    table: str,
+    symbol: str,
+    tf_sec: int,
+    start_ts: Optional[int],
+    end_ts: Optional[int],
+) -> Iterator[Gap]:
+    """Пропуски в SQLite"""
+    params = {"symbol": symbol, "step": tf_sec}
+    where = ["a.symbol = :symbol"]
+
+    if start_ts is not None:
+        # Предыдущая свеча перед диапазоном — по ключу, без прохода по истории
+        row = conn.execute(
+            f"SELECT MAX(timestamp) FROM {table} WHERE symbol = ? AND timestamp < ?",
+            (symbol, start_ts),
+        ).fetchone()
+        where.append("a.timestamp >= :start")
+        params["start"] = row[0] if row[0] is not None else start_ts
+    if end_ts is not None:
+        where.append("a.timestamp <= :end")
+        params["end"] = end_ts
+
+    # Свечи без следующей свечи: PK-поиск соседа на каждую строку,
+    # конец пропуска — поиск следующей свечи только для найденных
+    cursor = conn.execute(
+        f"""
+        SELECT
+            a.timestamp + :step,
+            (SELECT MIN(b.timestamp) FROM {table} b
+             WHERE b.symbol = :symbol AND b.timestamp > a.timestamp) - :step
+        FROM {table} a
+        WHERE {" AND ".join(where)}
+          AND NOT EXISTS (
+              SELECT 1 FROM {table} b
+              WHERE b.symbol = :symbol AND b.timestamp = a.timestamp + :step
+          )
+        """,
+        params,
+    )
+    for start, end in cursor:
+        if end is None:
+            # Последняя свеча символа
+            continue
+        gap = _clip(symbol, start, end, start_ts, end_ts)
+        if gap:
+            yield gap
+
+
+def _runs(
+    first: Optional[int],
+    last: Optional[int],
+    gaps: Iterator[Gap],
+    tf_sec: int,
+    start_ts: Optional[int],
+    end_ts: Optional[int],
+) -> List[Tuple[int, int]]:
+    """Непрерывные участки источника в окне: [first, last] без его пропусков"""
+    if first is None:
+        return []
+    low = first if start_ts is None else max(first, start_ts)
+    high = last if end_ts is None else min(last, end_ts)
+    runs, current = [], low
+    for _, gap_start, gap_end in gaps:
+        if gap_start - tf_sec >= current:
+            runs.append((current, gap_start - tf_sec))
+        current = gap_end + tf_sec
+    if current <= high:
+        runs.append((current, high))
+    return runs
+
+
+def _union_gaps(symbol: str, runs: List[Tuple[int, int]], tf_sec: int) -> Iterator[Gap]:
+    """Пропуски между объединёнными участками нескольких источников"""
+    end = None
+    for run_start, run_end in sorted(runs):
+        if end is not None and run_start > end + tf_sec:
+            yield (symbol, end + tf_sec, run_start - tf_sec)
+        end = run_end if end is None else max(end, run_end)
+
+
+def gap_symbols(
+    conn: sqlite3.Connection, table: str, include_cold: bool = True
+) -> List[str]:
+    """Символы таблицы свечей, включая символы с архивными месяцами"""
+    symbols = table_symbols(conn, table)
+    if include_cold and has_cold(conn, table):
+        cold_symbols = conn.execute(
+            f"SELECT DISTINCT symbol FROM {CATALOG_TABLE} WHERE table_name = ?", (table,)
+        ).fetchall()
+        symbols = sorted(set(symbols).union(row[0] for row in cold_symbols))
+    return symbols
+
+
+def iter_gaps(
+    conn: sqlite3.Connection,
+    table: str,
+    tf_sec: int,
+    symbol: Optional[str] = None,
+    start_ts: Optional[int] = None,
+    end_ts: Optional[int] = None,
+    include_cold: bool = True,
+) -> Iterator[Gap]:
+    """
+    Пропуски таблицы свечей по возрастанию (symbol, start).
+
+    Args:
+        conn: соединение
+        table: candles_<tf>
+        tf_sec: интервал таймфрейма
+        symbol: символ (по умолчанию все)
+        start_ts, end_ts: пропуски, пересекающие диапазон, обрезаются по нему
+        include_cold: учитывать архивные месяцы в Parquet
+
+    Yields:
+        (symbol, первая отсутствующая свеча, последняя отсутствующая свеча)
+    """
+    symbols = [symbol] if symbol is not None else gap_symbols(conn, table, include_cold)
+    for name in symbols:
+        if not (include_cold and has_cold(conn, table, name)):
+            yield from _sqlite_gaps(conn, table, name, tf_sec, start_ts, end_ts)
+            continue
+
+        hot_first, hot_last = conn.execute(
+            f"SELECT MIN(timestamp), MAX(timestamp) FROM {table} WHERE symbol = ?",
+            (name,),
+        ).fetchone()
+        cold_first, cold_last, _ = cold_bounds(conn, table, name)
+        runs = _runs(
+            hot_first,
+            hot_last,
+            _sqlite_gaps(conn, table, name, tf_sec, start_ts, end_ts),
+            tf_sec,
+            start_ts,
+            end_ts,
+        ) + _runs(
+            cold_first,
+            cold_last,
+            _cold_gaps(conn, table, name, tf_sec, start_ts, end_ts),
+            tf_sec,
+            start_ts,
+            end_ts,
+        )
+        yield from _union_gaps(name, runs, tf_sec)
@@ -0,0 +1,282 @@
+"""
+resampler.py
+
+Построение свечей старших таймфреймов (5m, 30m, 1h, ..., 1w) из сохранённых 1m свечей.
+
+Режимы:
+- инкрементальный: update_buckets(conn, symbol, ts_1m) — после закрытия 1m свечи
+  записывает корзины старших таймфреймов, которые этой минутой закрылись,
+  и возвращает их (для пересчёта индикаторов); открытые корзины не пишутся
+- пакетный: resample_history(conn, symbol, timeframe, ...) — векторная агрегация
+  истории 1m через NumPy (reduceat) и запись одним executemany
+
+Корзины выравниваются по UTC, недели — по понедельнику (как у Bybit):
+    week_start = ts - (ts - 345600) % 604800   # 345600 = 1970-01-05 00:00 UTC
+Любой таймфрейм из TIMEFRAMES_CONFIG с interval_sec, кратным минуте, можно
+строить локально — в том числе отсутствующие на бирже (2h, 3d).
+Изменённые свечи записываются в журнал dirty_ranges.
+
+Использование:
+    python -m backend.core.data.resampler --symbol BTCUSDT --timeframe 1h
+"""
+
+import sqlite3
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from backend.config.timeframes_config import TIMEFRAMES_CONFIG
+from backend.core.indicators.dirty_ranges import mark_dirty
+from backend.core.storage.schema import candle_upsert_sql
+
+PROJECT_ROOT = Path(__file__).resolve().parents[3]
+DB_PATH = PROJECT_ROOT / "db" / "market_data.sqlite"
+
+BASE_TIMEFRAME = "1m"
+BASE_SEC = 60
+WEEK_SEC = 604800
+WEEK_ANCHOR_SEC = 345600  # первый понедельник эпохи, 1970-01-05 00:00 UTC
+
+
+def derivable_timeframes() -> List[str]:
+    """Таймфреймы, которые строятся из 1m"""
+    return [
+        tf
+        for tf, config in TIMEFRAMES_CONFIG.items()
+        if tf != BASE_TIMEFRAME
+        and config["interval_sec"] > BASE_SEC
+        and config["interval_sec"] % BASE_SEC == 0
+    ]
+
+
+def bucket_start(ts, tf_sec: int):
+    """Начало корзины таймфрейма (работает и для скаляров, и для np.ndarray)"""
+    if tf_sec == WEEK_SEC:
+        return ts - (ts - WEEK_ANCHOR_SEC) % WEEK_SEC
+    return ts - ts % tf_sec
+
+
+def _upsert_candles(
+    conn: sqlite3.Connection, symbol: str, timeframe: str, rows: List[tuple]
+):
+    """Сохраняет свечи (timestamp, open, high, low, close, volume) по symbol+timestamp"""
+    table = f"candles_{timeframe}"
+    conn.executemany(
+        candle_upsert_sql(
+            conn,
+            table,
+            [
+                "symbol",
+                "timestamp",
+                "timestamp_ns",
+                "timestamp_ms",
+                "open",
+                "high",
+                "low",
+                "close",
+                "volume",
+            ],
+        ),
+        [
+            (symbol, ts, ts * 1_000_000_000, ts * 1000, o, h, l, c, v)
+            for ts, o, h, l, c, v in rows
+        ],
+    )
+
+
+def _aggregate_bucket(
+    conn: sqlite3.Connection, symbol: str, start: int, end: int
+) -> Optional[tuple]:
+    """(open, high, low, close, volume, count, first_ts) корзины [start, end) из 1m"""
+    row = conn.execute(
+        f"""
+        SELECT
+            (SELECT open FROM candles_{BASE_TIMEFRAME}
+             WHERE symbol = :s AND timestamp >= :b AND timestamp < :e
+             ORDER BY timestamp LIMIT 1),
+            MAX(high),
+            MIN(low),
+            (SELECT close FROM candles_{BASE_TIMEFRAME}
+             WHERE symbol = :s AND timestamp >= :b AND timestamp < :e
+             ORDER BY timestamp DESC LIMIT 1),
+            SUM(volume),
+            COUNT(*),
+            MIN(timestamp)
+        FROM candles_{BASE_TIMEFRAME}
+        WHERE symbol = :s AND timestamp >= :b AND timestamp < :e
+        """,
+        {"s": symbol, "b": start, "e": end},
+    ).fetchone()
+    if not row or not row[5]:
+        return None
+    return row
+
+
+def update_buckets(
+    conn: sqlite3.Connection,
+    symbol: str,
+    ts_1m: int,
+    timeframes: Optional[List[str]] = None,
+) -> List[Dict]:
+    """
+    Инкрементальное обновление после закрытия 1m свечи ts_1m.
+
+    Записываются только закрытые корзины: открытая корзина в candles_<tf>
+    не попадает. Корзина закрывается своей последней минутой, а если та
+    не пришла — первой минутой после конца корзины (тогда корзина пишется,
+    только если её ещё нет в таблице). Идемпотентно — повторная доставка
+    свечи ничего не ломает.
+
+    Returns:
+        Свечи, закрывшиеся этой минутой, в формате WS-свечи Bybit:
+        [{"symbol", "interval", "start" (ms), "open", "high", "low", "close",
+          "volume", "confirm": True}, ...]
+    """
+    timeframes = timeframes or derivable_timeframes()
+    closed = []
+
+    with conn:
+        for timeframe in timeframes:
+            tf_sec = TIMEFRAMES_CONFIG[timeframe]["interval_sec"]
+            start = int(bucket_start(ts_1m, tf_sec))
+            if ts_1m + BASE_SEC < start + tf_sec:
+                # Корзина ещё открыта: закрываем предыдущую, если её последняя
+                # минута не пришла и корзина не записана
+                start -= tf_sec
+                written = conn.execute(
+                    f"SELECT 1 FROM candles_{timeframe} WHERE symbol = ? AND timestamp = ?",
+                    (symbol, start),
+                ).fetchone()
+                if written:
+                    continue
+            end = start + tf_sec
+
+            row = _aggregate_bucket(conn, symbol, start, end)
+            if row is None:
+                continue
+            open_, high, low, close, volume, count, first_ts = row
+            # Без первой минуты корзина неполная (1m история обрезана) —
+            # не перезаписываем свечу, загруженную с биржи
+            if first_ts != start:
+                continue
+
+            _upsert_candles(conn, symbol, timeframe, [(start, open_, high, low, close, volume)])
+            mark_dirty(conn, symbol, timeframe, start, start)
+            if count < tf_sec // BASE_SEC:
+                print(
+                    f"[resampler] ⚠️ {symbol} {timeframe} @ {start}: "
+                    f"{count} из {tf_sec // BASE_SEC} минутных свечей"
+                )
+            closed.append(
+                {
+                    "symbol": symbol,
+                    "interval": timeframe,
+                    "start": start * 1000,
+                    "open": open_,
+                    "high": high,
+                    "low": low,
+                    "close": close,
+                    "volume": volume,
+                    "confirm": True,
+                }
+            )
+
+    return closed
+
+
+def resample_history(
+    conn: sqlite3.Connection,
+    symbol: str,
+    timeframe: str,
+    start_ts: Optional[int] = None,
+    end_ts: Optional[int] = None,
+) -> int:
+    """
+    Пакетная сборка свечей таймфрейма из 1m истории.
+
+    Диапазон расширяется до границ корзин. Не записываются корзины без первой
+    минуты (начало 1m истории) и незавершённая последняя корзина
+    (её минуты ещё не закрылись).
+
+    Returns:
+        int: количество записанных свечей
+    """
+    tf_sec = TIMEFRAMES_CONFIG[timeframe]["interval_sec"]
+    query = f"""
+        SELECT timestamp, open, high, low, close, volume FROM candles_{BASE_TIMEFRAME}
+        WHERE symbol = ? AND timestamp >= ? AND timestamp <= ?
+        ORDER BY timestamp
+    """
+    lo = int(bucket_start(start_ts, tf_sec)) if start_ts is not None else 0
+    hi = end_ts if end_ts is not None else 2**62
+    rows = conn.execute(query, (symbol, lo, hi)).fetchall()
+    if not rows:
+        print(f"[resampler] ❌ Нет 1m данных для {symbol}")
+        return 0
+
+    data = np.array(rows, dtype=np.float64)
+    ts = data[:, 0].astype(np.int64)
+    buckets = bucket_start(ts, tf_sec)
+
+    # Индексы начала каждой корзины (данные отсортированы по времени)
+    first = np.flatnonzero(np.concatenate([[True], buckets[1:] != buckets[:-1]]))
+    last = np.concatenate([first[1:] - 1, [len(ts) - 1]])
+
+    result = np.column_stack(
+        [
+            buckets[first],
+            data[first, 1],
+            np.maximum.reduceat(data[:, 2], first),
+            np.minimum.reduceat(data[:, 3], first),
+            data[last, 4],
+            np.add.reduceat(data[:, 5], first),
+        ]
+    )
+
+    # Последняя корзина закрыта, только если закрылась её последняя минута
+    if ts[-1] + BASE_SEC < buckets[-1] + tf_sec:
+        result = result[:-1]
+    # Первая корзина без первой минуты — начало 1m истории, она неполная
+    if len(result) and ts[0] != buckets[0]:
+        result = result[1:]
+    if len(result) == 0:
+        return 0
+
+    out = [
+        (int(row[0]), *map(float, row[1:]))
+        for row in result
+    ]
+    with conn:
+        _upsert_candles(conn, symbol, timeframe, out)
+        mark_dirty(conn, symbol, timeframe, out[0][0], out[-1][0])
+
+    print(
+        f"[resampler] ✅ {symbol} {timeframe}: {len(out)} свечей из {len(ts)} 1m"
+    )
+    return len(out)
+
+
+def main():
+    """CLI"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Сборка старших таймфреймов из 1m")
+    parser.add_argument("--symbol", default="BTCUSDT")
+    parser.add_argument(
+        "--timeframe", nargs="+", help="Таймфреймы (по умолчанию все, кроме 1m)"
+    )
+    parser.add_argument("--start", type=int, help="Начало диапазона (timestamp, сек)")
+    parser.add_argument("--end", type=int, help="Конец диапазона (timestamp, сек)")
+    args = parser.parse_args()
+
+    timeframes = args.timeframe or derivable_timeframes()
+    total = 0
+    with sqlite3.connect(str(DB_PATH)) as conn:
+        for timeframe in timeframes:
+            total += resample_history(conn, args.symbol, timeframe, args.start, args.end)
+    print(f"\n✅ Завершено. Всего записано {total} свечей.")
+
+
+if __name__ == "__main__":
+    main()
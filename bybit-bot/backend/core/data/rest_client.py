@@ -0,0 +1,48 @@
+"""
+rest_client.py
+
+Синхронный клиент публичного REST API Bybit (свечи) поверх httpx.
+
+get_kline принимает те же параметры и возвращает тот же ответ, что
+pybit HTTP.get_kline, но адрес задаётся явно (BYBIT_REST_URL) — загрузку
+можно направить на локальный мок-сервер. Клиент httpx.Client можно
+передать снаружи.
+"""
+
+from typing import Dict, Optional
+
+import httpx
+
+from backend.config.exchange_config import BYBIT_REST_URL
+
+KLINE_PATH = "/v5/market/kline"
+REQUEST_TIMEOUT = 10.0
+
+
+class RestError(Exception):
+    """Ошибка API (retCode != 0 или HTTP-статус не 200)"""
+
+
+class RestClient:
+    def __init__(
+        self,
+        base_url: str = BYBIT_REST_URL,
+        client: Optional[httpx.Client] = None,
+        timeout: float = REQUEST_TIMEOUT,
+    ):
+        self._own_client = client is None
+        self.client = client or httpx.Client(base_url=base_url, timeout=timeout)
+
+    def get_kline(self, **params) -> Dict:
+        """GET /v5/market/kline; ответ Bybit целиком (result.list — от новых к старым)"""
+        response = self.client.get(KLINE_PATH, params=params)
+        if response.status_code != 200:
+            raise RestError(f"HTTP {response.status_code}: {response.text[:200]}")
+        body = response.json()
+        if body.get("retCode") != 0:
+            raise RestError(f"retCode {body.get('retCode')}: {body.get('retMsg')}")
+        return body
+
+    def close(self):
+        if self._own_client:
+            self.client.close()
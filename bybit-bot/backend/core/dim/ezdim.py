@@ -1,3 +1,6 @@
+from backend.core.indicators.registry import column_warmup
+
+
 class EzDIM:
     """
     Easy Data Integrity Manager - простой менеджер целостности данных
@@ -117,9 +120,6 @@ class EzDIM:
         if stats_key not in EzDIM.stats:
             EzDIM.stats[stats_key] = {}
 
-        # EMA периоды для обработки
-        ema_periods = [20, 50, 100, 200, 500]
-
         for col in check_cols:
             if col not in df.columns:
                 if not silent:
@@ -129,23 +129,16 @@ class EzDIM:
                 has_problems = True
                 continue
 
-            # Проверяем, является ли это EMA колонкой
-            is_ema_col = False
-            ema_period = None
-
-            for period in ema_periods:
-                if col == f"ema{period}":
-                    is_ema_col = True
-                    ema_period = period
-                    break
+            # Прогрев колонки из реестра индикаторов (None — колонка вне реестра)
+            warmup = column_warmup(col)
 
-            if is_ema_col and ema_period:
-                # Для EMA колонок: первые period-1 строк оставляем NaN, остальные NaN заменяем на -1
+            if warmup:
+                # Для индикаторов: первые warmup-1 строк оставляем NaN, остальные NaN заменяем на -1
                 if df_cleaned[col].isna().any():
-                    # Первые period-1 строк оставить NaN
-                    if len(df_cleaned) >= ema_period:
-                        df_cleaned.loc[ema_period - 1 :, col] = df_cleaned.loc[
-                            ema_period - 1 :, col
+                    # Первые warmup-1 строк оставить NaN
+                    if len(df_cleaned) >= warmup:
+                        df_cleaned.loc[warmup - 1 :, col] = df_cleaned.loc[
+                            warmup - 1 :, col
                         ].fillna(-1)
                     else:
                         # Если данных меньше чем period, все NaN заменяем на -1
@@ -153,7 +146,7 @@ class EzDIM:
 
                     df_cleaned[col] = df_cleaned[col].astype(float)
             else:
-                # Для не-EMA колонок: все NaN заменяем на -1 (старая логика)
+                # Для колонок вне реестра: все NaN заменяем на -1 (старая логика)
                 if df_cleaned[col].isna().any():
                     df_cleaned[col] = df_cleaned[col].fillna(-1).astype(float)
 
@@ -191,7 +184,7 @@ class EzDIM:
             df: DataFrame с колонкой timestamp и индикаторными колонками
             indicator_cols: список колонок индикаторов, где ищем дыры
             tf_sec: шаг таймфрейма в секундах
-            period_map: dict { "ema20": 20, "ema50": 50, ... }
+            period_map: dict { "ema20": 20, "rsi14": 15, ... } — прогрев колонки в свечах
             symbol: символ торговой пары
             timeframe: временной интервал
 
@@ -304,7 +297,7 @@ class EzDIM:
             df: DataFrame с колонкой timestamp и индикаторными колонками
             indicator_cols: список колонок индикаторов, где ищем дыры
             tf_sec: шаг таймфрейма в секундах
-            period_map: dict { "ema20": 20, "ema50": 50, ... }
+            period_map: dict { "ema20": 20, "rsi14": 15, ... } — прогрев колонки в свечах
             symbol: символ торговой пары
             timeframe: временной интервал
             conn: соединение с БД (обязательно для исправления дыр)
@@ -363,46 +356,99 @@ class EzDIM:
 
         print(f"[ezDIM find_and_fix_gaps] 🔧 Найдено {len(gaps)} дыр, исправляем...")
 
+        total_fixed = EzDIM.fix_gaps(gaps, tf_sec, symbol, timeframe, conn)
+
+        print(
+            f"[ezDIM find_and_fix_gaps] ✅ Всего исправлено {total_fixed} строк для {symbol} {timeframe}"
+        )
+        return total_fixed
+
+    @staticmethod
+    def plan_repair_windows(gaps, tf_sec):
+        """
+        Объединяет дыры всех индикаторных колонок в минимальные окна пересчёта.
+
+        Каждой дыре нужен контекст прогрева (как в calc_ema: period + длина дыры
+        свечей до начала, period — прогрев колонки). Дыры сливаются в одно окно, если пересекаются,
+        соседствуют или контекст следующей дыры заходит в текущее окно —
+        тогда одна загрузка покрывает обе.
+
+        Args:
+            gaps: список дыр [{"col", "start_ts", "end_ts", "period"}, ...]
+            tf_sec: шаг таймфрейма в секундах
+
+        Returns:
+            Список окон, отсортированный по времени:
+            [{"start_ts", "end_ts", "context_start_ts", "columns": [...], "gaps": [...]}, ...]
+        """
+        windows = []
+        for gap in sorted(gaps, key=lambda g: (g["start_ts"], g["end_ts"])):
+            gap_len = int((gap["end_ts"] - gap["start_ts"]) / tf_sec) + 1
+            context_start_ts = gap["start_ts"] - (gap["period"] + gap_len) * tf_sec
+
+            if windows and context_start_ts <= windows[-1]["end_ts"] + tf_sec:
+                window = windows[-1]
+                window["end_ts"] = max(window["end_ts"], gap["end_ts"])
+                window["context_start_ts"] = min(
+                    window["context_start_ts"], context_start_ts
+                )
+                window["columns"].add(gap["col"])
+                window["gaps"].append(gap)
+            else:
+                windows.append(
+                    {
+                        "start_ts": gap["start_ts"],
+                        "end_ts": gap["end_ts"],
+                        "context_start_ts": context_start_ts,
+                        "columns": {gap["col"]},
+                        "gaps": [gap],
+                    }
+                )
+
+        for window in windows:
+            window["columns"] = sorted(window["columns"])
+        return windows
+
+    @staticmethod
+    def fix_gaps(gaps, tf_sec, symbol, timeframe, conn):
+        """
+        Чинит найденные дыры: строит окна через plan_repair_windows
+        и пересчитывает каждое окно один раз для всех затронутых колонок.
+
+        Returns:
+            int: общее количество исправленных значений
+        """
         # Локальный импорт для избежания циклических зависимостей
         from backend.core.indicators.calc_ema import recalculate_range
 
-        total_fixed = 0
-
-        # Исправляем каждую дыру
-        for gap in gaps:
-            col = gap["col"]
-            start_ts = gap["start_ts"]
-            end_ts = gap["end_ts"]
-            period = gap["period"]
+        windows = EzDIM.plan_repair_windows(gaps, tf_sec)
+        print(
+            f"[ezDIM fix_gaps] 🧩 {len(gaps)} дыр → {len(windows)} окон пересчёта для {symbol} {timeframe}"
+        )
 
+        total_fixed = 0
+        for window in windows:
+            cols = ", ".join(window["columns"])
             print(
-                f"[ezDIM find_and_fix_gaps] Исправляю {col} {start_ts} → {end_ts}, период={period}"
+                f"[ezDIM fix_gaps] Исправляю окно {window['start_ts']} → {window['end_ts']} ({cols})"
             )
-
             try:
-                fixed_rows = recalculate_range(
+                fixed = recalculate_range(
                     symbol=symbol,
                     timeframe=timeframe,
-                    start_ts=start_ts,
-                    end_ts=end_ts,
-                    ema_periods=[period],
+                    start_ts=window["start_ts"],
+                    end_ts=window["end_ts"],
+                    columns=window["columns"],
                     conn=conn,
+                    context_start_ts=window["context_start_ts"],
+                    gaps=window["gaps"],
                 )
-                total_fixed += fixed_rows
-
-                if fixed_rows > 0:
-                    print(
-                        f"[ezDIM find_and_fix_gaps] ✅ Исправлено {fixed_rows} строк для {col}"
-                    )
-                else:
-                    print(f"[ezDIM find_and_fix_gaps] ⚠️ Не удалось исправить {col}")
-
+                total_fixed += fixed
+                if fixed <= 0:
+                    print(f"[ezDIM fix_gaps] ⚠️ Не удалось исправить окно ({cols})")
             except Exception as e:
-                print(f"[ezDIM find_and_fix_gaps] ❌ Ошибка при исправлении {col}: {e}")
+                print(f"[ezDIM fix_gaps] ❌ Ошибка при исправлении окна ({cols}): {e}")
 
-        print(
-            f"[ezDIM find_and_fix_gaps] ✅ Всего исправлено {total_fixed} строк для {symbol} {timeframe}"
-        )
         return total_fixed
 
     @staticmethod
@@ -450,12 +496,29 @@ class EzDIM:
 
 # CLI-блок для запуска как скрипта
 if __name__ == "__main__":
+    import argparse
     import sqlite3
     import pandas as pd
     from backend.config.timeframes_config import TIMEFRAMES_CONFIG
-    from backend.core.indicators.calc_ema import calc_ema, EMA_PERIODS, DB_PATH
-
-    print("🔍 EzDIM CLI: Поиск и исправление дыр в EMA индикаторах")
+    from backend.core.indicators.calc_ema import DB_PATH
+    from backend.core.indicators.registry import (
+        CONFIGURED_INDICATORS,
+        existing_specs,
+        spec_columns,
+    )
+    from backend.core.storage.indicator_store import load_indicator_frame
+    from backend.core.storage.ring_buffer import invalidate_ring
+
+    parser = argparse.ArgumentParser(description="EzDIM: поиск и исправление дыр")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Число процессов для параллельного скана (1 — последовательно)",
+    )
+    args = parser.parse_args()
+
+    print("🔍 EzDIM CLI: Поиск и исправление дыр в индикаторах")
     print("=" * 60)
 
     # Подключаемся к БД
@@ -478,9 +541,20 @@ if __name__ == "__main__":
         conn.close()
         exit(1)
 
-    # Создаем mapping периодов для EMA колонок
-    ema_period_map = {f"ema{period}": period for period in EMA_PERIODS}
-    ema_cols = list(ema_period_map.keys())
+    # Параллельный режим: пары (symbol, timeframe) в пуле процессов, запись — из одного
+    if args.workers > 1:
+        from backend.core.dim.parallel_scan import run_parallel_scan
+
+        conn.close()
+        summary = run_parallel_scan(
+            DB_PATH, symbols, list(TIMEFRAMES_CONFIG.keys()), args.workers
+        )
+        EzDIM.report_gaps()
+        print("\n" + "=" * 60)
+        print(f"🔧 Всего найдено дыр: {summary['gaps']}")
+        print(f"✅ Всего исправлено значений: {summary['fixed']}")
+        print("=" * 60)
+        exit(0)
 
     total_gaps_found = 0
     total_gaps_fixed = 0
@@ -495,13 +569,15 @@ if __name__ == "__main__":
 
             print(f"  📈 Таймфрейм: {timeframe}")
 
+            # Колонки настроенных индикаторов, которые есть в таблице, и их прогрев
+            indicator_cols = spec_columns(
+                existing_specs(conn, table_name, CONFIGURED_INDICATORS)
+            )
+            period_map = {col: column_warmup(col) for col in indicator_cols}
+
             try:
                 # Загружаем данные свечей
-                df = pd.read_sql_query(
-                    f"SELECT * FROM {table_name} WHERE symbol = ? ORDER BY timestamp",
-                    conn,
-                    params=(symbol,),
-                )
+                df = load_indicator_frame(conn, symbol, timeframe, [], indicator_cols)
 
                 if df.empty:
                     print(f"    ⚠️ Нет данных для {symbol} {timeframe}")
@@ -509,50 +585,38 @@ if __name__ == "__main__":
 
                 print(f"    📊 Загружено свечей: {len(df)}")
 
-                # Ищем дыры в EMA индикаторах
+                # Ищем дыры в индикаторах
                 gaps = EzDIM.find_gaps_for_indicators(
                     df=df,
-                    indicator_cols=ema_cols,
+                    indicator_cols=indicator_cols,
                     tf_sec=tf_sec,
-                    period_map=ema_period_map,
+                    period_map=period_map,
                     symbol=symbol,
                     timeframe=timeframe,
                 )
 
                 if not gaps:
-                    print(f"    ✅ Дыр в EMA не найдено")
+                    print(f"    ✅ Дыр в индикаторах не найдено")
                     continue
 
                 print(f"    🔧 Найдено дыр: {len(gaps)}")
                 total_gaps_found += len(gaps)
 
-                # Исправляем каждую дыру
-                for gap in gaps:
-                    col = gap["col"]
-                    start_ts = gap["start_ts"]
-                    end_ts = gap["end_ts"]
-                    period = gap["period"]
-
-                    print(f"      🔧 Исправляем {col}: {start_ts} → {end_ts}")
-
-                    try:
-                        fixed_rows = calc_ema(
-                            symbol=symbol,
-                            timeframe=timeframe,
-                            ema_periods=[period],
-                            start_ts=start_ts,
-                            end_ts=end_ts,
-                            conn=conn,
-                        )
-
-                        if fixed_rows > 0:
-                            print(f"      ✅ Исправлено строк: {fixed_rows}")
-                            total_gaps_fixed += fixed_rows
-                        else:
-                            print(f"      ⚠️ Не удалось исправить {col}")
-
-                    except Exception as e:
-                        print(f"      ❌ Ошибка при исправлении {col}: {e}")
+                # Исправляем дыры окнами: одно окно — одна загрузка и один пересчёт
+                fixed_rows = EzDIM.fix_gaps(gaps, tf_sec, symbol, timeframe, conn)
+                conn.commit()
+                if fixed_rows > 0:
+                    # Буфер realtime-загрузчика перечитает исправленные значения из БД
+                    invalidate_ring(
+                        symbol,
+                        timeframe,
+                        min(gap["start_ts"] for gap in gaps),
+                        max(gap["end_ts"] for gap in gaps),
+                    )
+                    print(f"      ✅ Исправлено значений: {fixed_rows}")
+                    total_gaps_fixed += fixed_rows
+                else:
+                    print(f"      ⚠️ Не удалось исправить дыры")
 
             except Exception as e:
                 print(f"    ❌ Ошибка обработки {symbol} {timeframe}: {e}")
@@ -568,7 +632,7 @@ if __name__ == "__main__":
     print(f"✅ Всего исправлено строк: {total_gaps_fixed}")
 
     if total_gaps_found == 0:
-        print("🎉 Все EMA индикаторы в порядке!")
+        print("🎉 Все индикаторы в порядке!")
     else:
         print(f"🔧 Обработано {total_gaps_found} дыр")
 
@@ -0,0 +1,194 @@
+"""
+Параллельный полный скан EzDIM по символам и таймфреймам
+
+Пары (symbol, timeframe) распределяются по пулу процессов:
+- каждый воркер открывает своё соединение только на чтение, загружает колонки
+  индикаторов, ищет дыры, планирует окна (EzDIM.plan_repair_windows) и считает
+  их через compute_range_update — без записи в БД
+- запись выполняет только родительский процесс одним соединением
+  (write_range_update), по мере готовности задач — блокировок SQLite между
+  писателями нет
+
+В конце выводится время каждой задачи и ускорение относительно
+последовательного выполнения. Последовательное время оценивается по CPU-времени
+воркеров (wall-время задач на занятых ядрах перекрывается и завышает оценку)
+плюс время записи.
+
+Использование:
+    python -m backend.core.dim.ezdim --workers 8
+"""
+
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List
+
+
+from backend.config.timeframes_config import TIMEFRAMES_CONFIG
+from backend.core.dim.ezdim import EzDIM
+from backend.core.indicators.calc_ema import compute_range_update, write_range_update
+from backend.core.indicators.ema_checkpoints import ensure_checkpoint_table
+from backend.core.storage.ring_buffer import invalidate_ring
+from backend.core.indicators.registry import (
+    CONFIGURED_INDICATORS,
+    column_warmup,
+    existing_specs,
+    spec_columns,
+)
+from backend.core.storage import apply_pragmas, get_writer
+from backend.core.storage.indicator_store import load_indicator_frame
+
+BUSY_TIMEOUT_SEC = 60
+
+
+def _scan_job(db_path: str, symbol: str, timeframe: str) -> dict:
+    """
+    Задача воркера: поиск дыр и расчёт окон пересчёта для одной пары.
+
+    Returns:
+        dict: {"symbol", "timeframe", "gaps", "updates", "gap_stats",
+               "elapsed", "cpu", "error"}
+    """
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    result = {
+        "symbol": symbol,
+        "timeframe": timeframe,
+        "gaps": 0,
+        "updates": [],
+        "gap_stats": {},
+        "error": None,
+    }
+    table = f"candles_{timeframe}"
+    tf_sec = TIMEFRAMES_CONFIG[timeframe]["interval_sec"]
+
+    conn = sqlite3.connect(
+        f"file:{db_path}?mode=ro", uri=True, timeout=BUSY_TIMEOUT_SEC
+    )
+    try:
+        apply_pragmas(conn, read_only=True)
+        indicator_cols = spec_columns(
+            existing_specs(conn, table, CONFIGURED_INDICATORS)
+        )
+        if not indicator_cols:
+            return result
+
+        df = load_indicator_frame(conn, symbol, timeframe, [], indicator_cols)
+        if df.empty:
+            return result
+
+        period_map = {col: column_warmup(col) for col in indicator_cols}
+        gaps = EzDIM.find_gaps_for_indicators(
+            df, indicator_cols, tf_sec, period_map, symbol, timeframe
+        )
+        result["gaps"] = len(gaps)
+        result["gap_stats"] = EzDIM.gap_stats.pop(f"{symbol}_{timeframe}", {})
+
+        for window in EzDIM.plan_repair_windows(gaps, tf_sec):
+            update = compute_range_update(
+                symbol,
+                timeframe,
+                window["start_ts"],
+                window["end_ts"],
+                window["columns"],
+                conn,
+                context_start_ts=window["context_start_ts"],
+                gaps=window["gaps"],
+            )
+            if update is not None:
+                result["updates"].append(update)
+    except Exception as e:
+        result["error"] = str(e)
+    finally:
+        conn.close()
+        result["elapsed"] = time.perf_counter() - started
+        result["cpu"] = time.process_time() - cpu_started
+    return result
+
+
+def run_parallel_scan(
+    db_path, symbols: List[str], timeframes: List[str], workers: int = None
+) -> dict:
+    """
+    Полный скан с починкой дыр в пуле процессов и единственным писателем.
+
+    Args:
+        db_path: путь к БД
+        symbols: символы
+        timeframes: таймфреймы
+        workers: число процессов (по умолчанию — число ядер)
+
+    Returns:
+        dict: {"gaps": найдено дыр, "fixed": исправлено значений, "speedup": ускорение}
+    """
+    db_path = str(db_path)
+    workers = workers or os.cpu_count() or 1
+
+    # Писатель: единственное соединение на запись (WAL — воркеры читают параллельно)
+    writer = get_writer(db_path)
+    with writer.connection() as conn:
+        ensure_checkpoint_table(conn)
+        existing_tables = {
+            row[0]
+            for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type IN ('table', 'view')"
+            )
+        }
+    jobs = [
+        (symbol, timeframe)
+        for symbol in symbols
+        for timeframe in timeframes
+        if f"candles_{timeframe}" in existing_tables
+    ]
+    print(
+        f"[ezDIM parallel] 🚀 {len(jobs)} задач (symbol × timeframe) на {workers} процессах"
+    )
+
+    started = time.perf_counter()
+    total_gaps = 0
+    total_fixed = 0
+    serial = 0.0
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_scan_job, db_path, symbol, timeframe)
+            for symbol, timeframe in jobs
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            symbol, timeframe = result["symbol"], result["timeframe"]
+            if result["error"]:
+                print(f"[ezDIM parallel] ❌ {symbol} {timeframe}: {result['error']}")
+
+            # Последовательная запись результатов воркера
+            write_started = time.perf_counter()
+            fixed = 0
+            for update in result["updates"]:
+                try:
+                    with writer.connection() as conn:
+                        fixed += write_range_update(conn, symbol, timeframe, update)
+                    invalidate_ring(symbol, timeframe, update["start_ts"], update["end_ts"])
+                except Exception as e:
+                    print(f"[ezDIM parallel] ❌ Ошибка записи {symbol} {timeframe}: {e}")
+            write_elapsed = time.perf_counter() - write_started
+
+            if result["gap_stats"]:
+                EzDIM.gap_stats[f"{symbol}_{timeframe}"] = result["gap_stats"]
+            total_gaps += result["gaps"]
+            total_fixed += fixed
+
+            serial += result["cpu"] + write_elapsed
+            print(
+                f"[ezDIM parallel] ⏱ {symbol} {timeframe}: дыр {result['gaps']}, "
+                f"исправлено {fixed}, расчёт {result['elapsed']:.2f} с "
+                f"(CPU {result['cpu']:.2f} с), запись {write_elapsed:.2f} с"
+            )
+
+    wall = time.perf_counter() - started
+    speedup = serial / wall if wall > 0 else 1.0
+    print(
+        f"[ezDIM parallel] 🏁 Готово за {wall:.2f} с (последовательно ≈ {serial:.2f} с), "
+        f"ускорение ×{speedup:.1f}"
+    )
+    return {"gaps": total_gaps, "fixed": total_fixed, "speedup": speedup}
@@ -1,11 +1,12 @@
 import os
 import sqlite3
 import pandas as pd
-import pandas_ta as ta
 from pathlib import Path
 from typing import List
 
 from backend.config.timeframes_config import TIMEFRAMES_CONFIG
+from backend.core.indicators.kernels import ema_multi
+from backend.core.indicators.bulk_writer import write_indicators_bulk
 
 
 PROJECT_ROOT = Path(__file__).resolve().parents[3]
@@ -21,10 +22,12 @@ if not EMA_PERIODS:
 
 
 def calculate_ema(df: pd.DataFrame, periods: List[int]) -> pd.DataFrame:
-    for period in periods:
-        col = f"ema{period}"
-        if col in df.columns:
-            df[col] = ta.ema(df["close"], length=period)
+    periods = [p for p in periods if f"ema{p}" in df.columns]
+    if not periods:
+        return df
+    ema_values = ema_multi(df["close"].to_numpy(), periods)
+    for col_idx, period in enumerate(periods):
+        df[f"ema{period}"] = ema_values[:, col_idx]
     return df
 
 
@@ -56,14 +59,14 @@ def run_ema_incremental(symbol: str, timeframe: str):
         df = calculate_ema(df, EMA_PERIODS)
 
         update_cols = [f"ema{p}" for p in EMA_PERIODS if f"ema{p}" in df.columns]
-        with conn:
-            for _, row in df.iterrows():
-                values = [row[c] for c in update_cols]
-                set_clause = ", ".join([f"{col} = ?" for col in update_cols])
-                conn.execute(
-                    f"UPDATE {table} SET {set_clause} WHERE symbol = ? AND timestamp = ?",
-                    values + [symbol, row["timestamp"]],
-                )
+        write_indicators_bulk(
+            conn,
+            symbol,
+            timeframe,
+            df["timestamp"].to_numpy(),
+            update_cols,
+            df[update_cols].to_numpy(dtype=float),
+        )
 
         print(f"   ✅ EMA обновлены: {symbol} {timeframe}")
 
@@ -0,0 +1,155 @@
+"""
+Пакетная запись индикаторов в БД
+
+write_indicators_bulk(...) записывает все колонки индикаторов для набора свечей
+одним UPDATE ... FROM на чанк вместо UPDATE на каждую строку и каждый период:
+1. Чанк значений заливается через executemany во временную таблицу
+2. Один UPDATE candles_<tf> ... FROM temp-таблицы по (symbol, timestamp)
+Все чанки пишутся в текущую транзакцию соединения (BEGIN, если её нет):
+функция не фиксирует изменения — commit за вызывающим кодом, вместе
+с остальной записью (журнал, контрольные точки). NaN записываются как NULL.
+
+Для SQLite < 3.33 (нет UPDATE ... FROM) используется executemany с UPDATE по строке.
+Если таймфрейм переведён в узкое хранилище (indicators_<tf>), значения пишутся
+туда: меняются только ключи индикаторов, строки свечей не трогаются.
+Строки архивных месяцев (холодный уровень, cold_tier.py) не записываются.
+После записи выводится пропускная способность (строк/с) для отслеживания регрессий.
+"""
+
+import sqlite3
+import time
+from typing import List, Sequence
+
+import numpy as np
+
+from backend.core.storage.cold_tier import cold_months
+from backend.core.storage.indicator_store import has_store, write_store_values
+
+DEFAULT_CHUNK_SIZE = 50_000
+WRITEBACK_TABLE = "_indicator_writeback"
+
+_HAS_UPDATE_FROM = sqlite3.sqlite_version_info >= (3, 33, 0)
+
+
+def _to_rows(timestamps: np.ndarray, values: np.ndarray) -> List[tuple]:
+    """Формирует строки (timestamp, v1, v2, ...) с NaN → None"""
+    cells = values.astype(object)
+    cells[np.isnan(values)] = None
+    return [
+        (int(ts), *row) for ts, row in zip(timestamps.tolist(), cells.tolist())
+    ]
+
+
+def write_indicators_bulk(
+    conn: sqlite3.Connection,
+    symbol: str,
+    timeframe: str,
+    timestamps: Sequence[int],
+    columns: List[str],
+    values: np.ndarray,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    silent: bool = False,
+) -> int:
+    """
+    Записывает значения индикаторов в candles_<timeframe>
+    (в транзакции вызывающего кода, без commit).
+
+    Args:
+        conn: соединение с БД
+        symbol: символ торговой пары
+        timeframe: таймфрейм
+        timestamps: timestamps строк (длина N)
+        columns: колонки индикаторов (например ["ema20", "ema50"])
+        values: массив значений формы (N, len(columns)), NaN → NULL
+        chunk_size: строк в одном UPDATE
+        silent: не выводить статистику
+
+    Returns:
+        int: количество обновлённых строк
+    """
+    table = f"candles_{timeframe}"
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64).reshape(len(timestamps), -1)
+
+    if len(timestamps) == 0 or not columns:
+        return 0
+    if values.shape[1] != len(columns):
+        raise ValueError(
+            f"Число колонок {len(columns)} не совпадает с формой значений {values.shape}"
+        )
+
+    # Архивные месяцы (Parquet) неизменяемы: их строк в SQLite нет
+    for _, min_ts, max_ts, _, _ in cold_months(
+        conn, table, symbol, int(timestamps.min()), int(timestamps.max())
+    ):
+        keep = (timestamps < min_ts) | (timestamps > max_ts)
+        timestamps, values = timestamps[keep], values[keep]
+    if len(timestamps) == 0:
+        return 0
+
+    started = time.perf_counter()
+    updated = 0
+    # DDL временной таблицы не открывает транзакцию неявно
+    if not conn.in_transaction:
+        conn.execute("BEGIN")
+
+    if has_store(conn, timeframe):
+        table = f"indicators_{timeframe}"
+        updated = write_store_values(
+            conn, symbol, timeframe, timestamps, columns, values, chunk_size
+        )
+    elif _HAS_UPDATE_FROM:
+        conn.execute(f"DROP TABLE IF EXISTS temp.{WRITEBACK_TABLE}")
+        conn.execute(
+            f"""
+            CREATE TEMP TABLE {WRITEBACK_TABLE} (
+                timestamp INTEGER PRIMARY KEY,
+                {", ".join(f"{col} REAL" for col in columns)}
+            )
+            """
+        )
+        placeholders = ", ".join("?" for _ in range(len(columns) + 1))
+        set_clause = ", ".join(f"{col} = w.{col}" for col in columns)
+        try:
+            for start in range(0, len(timestamps), chunk_size):
+                rows = _to_rows(
+                    timestamps[start : start + chunk_size],
+                    values[start : start + chunk_size],
+                )
+                conn.execute(f"DELETE FROM temp.{WRITEBACK_TABLE}")
+                conn.executemany(
+                    f"INSERT OR REPLACE INTO temp.{WRITEBACK_TABLE} VALUES ({placeholders})",
+                    rows,
+                )
+                cursor = conn.execute(
+                    f"""
+                    UPDATE {table} SET {set_clause}
+                    FROM temp.{WRITEBACK_TABLE} AS w
+                    WHERE {table}.symbol = ? AND {table}.timestamp = w.timestamp
+                    """,
+                    (symbol,),
+                )
+                updated += cursor.rowcount
+        finally:
+            conn.execute(f"DROP TABLE IF EXISTS temp.{WRITEBACK_TABLE}")
+    else:
+        set_clause = ", ".join(f"{col} = ?" for col in columns)
+        for start in range(0, len(timestamps), chunk_size):
+            rows = _to_rows(
+                timestamps[start : start + chunk_size],
+                values[start : start + chunk_size],
+            )
+            cursor = conn.executemany(
+                f"UPDATE {table} SET {set_clause} WHERE symbol = ? AND timestamp = ?",
+                [(*row[1:], symbol, row[0]) for row in rows],
+            )
+            updated += cursor.rowcount
+
+    elapsed = time.perf_counter() - started
+    if not silent:
+        rate = updated / elapsed if elapsed > 0 else float("inf")
+        print(
+            f"[bulk_writer] ✅ {table} {symbol}: {updated} строк × {len(columns)} колонок "
+            f"за {elapsed:.3f} с ({rate:,.0f} строк/с)"
+        )
+    return updated
@@ -3,27 +3,53 @@
 
 Единая точка входа: calc_ema(...)
 Вызовы извне (sync_all, indicator_trigger, realtime, EzDIM) идут только сюда.
+По той же загрузке свечей считаются и остальные индикаторы реестра
+(registry.py: RSI и др. из config/<name>_periods.txt).
 
 Логика:
 1. Загружаем свечи + контекст
 2. Валидируем (validate_for_indicator)
    - если ок → считаем EMA step-by-step
    - если не ок → ставим -1
-3. Записываем в БД (NaN для первых n-1 свечей, значения или -1 далее)
+3. Записываем в БД одним пакетом (NaN для первых n-1 свечей, значения или -1 далее)
 4. Запускаем postflight
    - если всё ок → конец
-   - если есть -1 или дыры → запускаем find_and_fix_gaps, который снова вызовет calc_ema
+   - если есть -1 или дыры → запускаем find_and_fix_gaps, который чинит их через recalculate_range
 """
 
 import sqlite3
+import numpy as np
 import pandas as pd
-import pandas_ta as ta
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 
 from backend.config.timeframes_config import TIMEFRAMES_CONFIG
 from backend.core.validation.data_integrity import validate_for_indicator
 from backend.core.dim.ezdim import EzDIM
+from backend.core.indicators.kernels import ema_multi
+from backend.core.indicators.bulk_writer import write_indicators_bulk
+from backend.core.indicators.ema_checkpoints import (
+    load_nearest_checkpoints,
+    save_checkpoints,
+)
+from backend.core.indicators.registry import (
+    CONFIGURED_INDICATORS,
+    INDICATORS,
+    IndicatorSpec,
+    column_warmup,
+    compute_indicators,
+    existing_specs,
+    required_inputs,
+    spec_columns,
+    spec_for_column,
+)
+from backend.core.storage.cold_tier import cold_bounds
+from backend.core.storage.indicator_store import (
+    has_store,
+    load_indicator_frame,
+    mark_store_range,
+)
+from backend.core.storage.ring_buffer import invalidate_ring
 
 PROJECT_ROOT = Path(__file__).resolve().parents[3]
 DB_PATH = PROJECT_ROOT / "db" / "market_data.sqlite"
@@ -43,27 +69,42 @@ def calc_ema(
     start_ts: int,
     end_ts: int,
     conn: sqlite3.Connection,
+    indicators: Optional[List[IndicatorSpec]] = None,
 ) -> int:
     """
     Универсальный пересчёт EMA step-by-step.
+
+    Вместе с EMA по той же загрузке свечей считаются остальные индикаторы
+    реестра (indicators; по умолчанию — все настроенные не-EMA индикаторы,
+    колонки которых есть в таблице).
     """
 
     table = f"candles_{timeframe}"
     tf_sec = TIMEFRAMES_CONFIG[timeframe]["interval_sec"]
-    max_period = max(ema_periods)
+
+    if indicators is None:
+        indicators = existing_specs(
+            conn,
+            table,
+            [spec for spec in CONFIGURED_INDICATORS if spec[0] != "ema"],
+        )
+    specs = [("ema", p) for p in ema_periods] + list(indicators)
+    warmups = {spec: INDICATORS[spec[0]].warmup(spec[1]) for spec in specs}
+    max_warmup = max(warmups.values())
 
     # Загружаем свечи + контекст
     gap_len = int((end_ts - start_ts) / tf_sec) + 1
-    context_start_ts = start_ts - (max_period + gap_len) * tf_sec
-
-    df = pd.read_sql_query(
-        f"""
-        SELECT * FROM {table}
-        WHERE symbol = ? AND timestamp >= ? AND timestamp <= ?
-        ORDER BY timestamp
-        """,
+    context_start_ts = start_ts - (max_warmup + gap_len) * tf_sec
+
+    # Свечи читаются через оба уровня: SQLite и архивные месяцы в Parquet
+    df = load_indicator_frame(
         conn,
-        params=(symbol, context_start_ts, end_ts),
+        symbol,
+        timeframe,
+        ["open", "high", "low", "close", "volume"],
+        [],
+        context_start_ts,
+        end_ts,
     )
 
     if df.empty:
@@ -78,68 +119,63 @@ def calc_ema(
     gap_start_idx = gap_start_idx[0]
 
     # Контекст до start_ts
-    context_df = df.iloc[max(0, gap_start_idx - max_period) : gap_start_idx]
+    context_df = df.iloc[max(0, gap_start_idx - max_warmup) : gap_start_idx]
 
     # Валидация
-    is_valid, reason = validate_for_indicator(context_df, max_period, tf_sec)
+    is_valid, reason = validate_for_indicator(context_df, max_warmup, tf_sec)
     if not is_valid:
         print(f"[calc_ema] ❌ Валидация провалена: {reason}")
-        _mark_invalid(symbol, timeframe, ema_periods, start_ts, end_ts, conn)
+        _mark_invalid(symbol, timeframe, spec_columns(specs), start_ts, end_ts, conn)
         return 0
 
-    # Расчёт EMA напрямую от свечей
-    total_updated = 0
-    for period in ema_periods:
-        ema_col = f"ema{period}"
+    # Расчёт всех индикаторов напрямую от свечей: один проход на индикатор
+    data = {col: df[col].to_numpy(dtype=float) for col in required_inputs(specs)}
+    indicator_values, _ = compute_indicators(data, specs)
 
+    write_specs = []
+    for spec in specs:
         # Проверяем достаточность данных
-        if len(df) < period:
-            _mark_invalid(symbol, timeframe, [period], start_ts, end_ts, conn)
+        if len(df) < warmups[spec]:
+            _mark_invalid(
+                symbol, timeframe, spec_columns([spec]), start_ts, end_ts, conn
+            )
             continue
+        write_specs.append(spec)
 
-        # Рассчитываем EMA от всех свечей
-        ema_series = ta.ema(df["close"], length=period)
-
-        # Обновляем значения в БД
-        updated_rows = 0
-        with conn:
-            for idx, (timestamp, ema_value) in enumerate(
-                zip(df["timestamp"], ema_series)
-            ):
-                if pd.isna(ema_value):
-                    # NaN значения записываем как NULL
-                    cursor = conn.execute(
-                        f"UPDATE {table} SET {ema_col}=NULL WHERE symbol=? AND timestamp=?",
-                        [symbol, timestamp],
-                    )
-                else:
-                    # Числовые значения записываем как float
-                    cursor = conn.execute(
-                        f"UPDATE {table} SET {ema_col}=? WHERE symbol=? AND timestamp=?",
-                        [float(ema_value), symbol, timestamp],
-                    )
-                updated_rows += cursor.rowcount
-
-        total_updated += updated_rows
-        print(f"[calc_ema] ✅ ema{period}: рассчитано {updated_rows} строк")
+    # Записываем одним пакетом только целевой диапазон [start_ts, end_ts]:
+    # контекст до start_ts нужен лишь для прогрева и не перезаписывается
+    total_updated = 0
+    write_cols = spec_columns(write_specs)
+    if write_cols:
+        target = (df["timestamp"] >= start_ts).to_numpy()
+        updated_rows = write_indicators_bulk(
+            conn,
+            symbol,
+            timeframe,
+            df["timestamp"].to_numpy()[target],
+            write_cols,
+            np.column_stack([indicator_values[col][target] for col in write_cols]),
+        )
+        total_updated = updated_rows * len(write_cols)
+        print(
+            f"[calc_ema] ✅ {', '.join(write_cols)}: рассчитано {updated_rows} строк"
+        )
 
     # Postflight
-    ema_cols = [f"ema{p}" for p in ema_periods]
-    df_post = pd.read_sql_query(
-        f"SELECT timestamp, {','.join(ema_cols)} FROM {table} WHERE symbol=? AND timestamp>=? AND timestamp<=?",
-        conn,
-        params=(symbol, start_ts, end_ts),
+    check_cols = spec_columns(specs)
+    df_post = load_indicator_frame(
+        conn, symbol, timeframe, [], check_cols, start_ts, end_ts
     )
     df_post = EzDIM.postflight(
-        df_post, check_cols=ema_cols, symbol=symbol, timeframe=timeframe, silent=True
+        df_post, check_cols=check_cols, symbol=symbol, timeframe=timeframe, silent=True
     )
 
-    # Собираем статистику по всем EMA периодам
+    # Собираем статистику по всем колонкам индикаторов
     postflight_stats = {}
     total_nan = 0
     total_minus_one = 0
 
-    for col in ema_cols:
+    for col in check_cols:
         nan_count = df_post[col].isna().sum()
         minus_one_count = (df_post[col] == -1).sum()
         postflight_stats[col] = {"nan": nan_count, "-1": minus_one_count}
@@ -161,10 +197,10 @@ def calc_ema(
         print(f"[calc_ema] ⚠️ Постфлайт: {', '.join(problem_parts)}")
 
     print(f"[calc_ema] 🔍 Найдены дыры, запускаю find_and_fix_gaps...")
-    period_map = {f"ema{p}": p for p in ema_periods}
+    period_map = {col: column_warmup(col) for col in check_cols}
     fixed_rows = EzDIM.find_and_fix_gaps(
         df_post,
-        ema_cols,
+        check_cols,
         tf_sec,
         period_map,
         symbol,
@@ -180,21 +216,327 @@ def calc_ema(
 def _mark_invalid(
     symbol: str,
     timeframe: str,
-    ema_periods: List[int],
+    columns: List[str],
     start_ts: int,
     end_ts: int,
     conn: sqlite3.Connection,
 ):
-    """Помечает EMA -1 в диапазоне, если расчёт невозможен"""
+    """Помечает индикаторы -1 в диапазоне, если расчёт невозможен (без commit)"""
+    table = f"candles_{timeframe}"
+    if has_store(conn, timeframe):
+        mark_store_range(conn, symbol, timeframe, columns, start_ts, end_ts)
+    else:
+        set_clause = ", ".join(f"{col}=-1" for col in columns)
+        conn.execute(
+            f"UPDATE {table} SET {set_clause} WHERE symbol=? AND timestamp>=? AND timestamp<=?",
+            [symbol, start_ts, end_ts],
+        )
+    print(f"[calc_ema] ⚠️ Помечено -1 для {columns} {symbol} {timeframe}")
+
+
+def recalculate_range(
+    symbol: str,
+    timeframe: str,
+    start_ts: int,
+    end_ts: int,
+    columns: List[str],
+    conn: sqlite3.Connection,
+    context_start_ts: Optional[int] = None,
+    gaps: Optional[List[dict]] = None,
+) -> int:
+    """
+    Пересчёт окна индикаторов без postflight (используется EzDIM для починки дыр).
+    Считает окно через compute_range_update и сразу записывает через write_range_update.
+
+    Returns:
+        int: количество исправленных значений (ячеек)
+    """
+    update = compute_range_update(
+        symbol, timeframe, start_ts, end_ts, columns, conn, context_start_ts, gaps
+    )
+    if update is None:
+        return 0
+    return write_range_update(conn, symbol, timeframe, update)
+
+
+def write_range_update(
+    conn: sqlite3.Connection, symbol: str, timeframe: str, update: dict
+) -> int:
+    """
+    Записывает результат compute_range_update: значения окна одним пакетом
+    и новые контрольные точки EMA.
+
+    Returns:
+        int: количество исправленных значений (ячеек)
+    """
+    write_indicators_bulk(
+        conn,
+        symbol,
+        timeframe,
+        update["timestamps"],
+        update["columns"],
+        update["values"],
+    )
+    if update["checkpoints"] is not None:
+        save_checkpoints(conn, symbol, timeframe, *update["checkpoints"])
+    print(
+        f"[recalculate_range] ✅ {symbol} {timeframe} {update['start_ts']} → {update['end_ts']}: "
+        f"исправлено {update['fixed']} значений ({', '.join(update['columns'])})"
+    )
+    return update["fixed"]
+
+
+def compute_range_update(
+    symbol: str,
+    timeframe: str,
+    start_ts: int,
+    end_ts: int,
+    columns: List[str],
+    conn: sqlite3.Connection,
+    context_start_ts: Optional[int] = None,
+    gaps: Optional[List[dict]] = None,
+) -> Optional[dict]:
+    """
+    Расчёт окна индикаторов без записи в БД: соединению достаточно прав на чтение,
+    поэтому окна можно считать в параллельных процессах, а писать из одного.
+
+    Свечи [context_start_ts, end_ts] загружаются одним запросом, все индикаторы
+    считаются по этой загрузке (EMA — одним проходом ядра) для записи одним пакетом.
+    Перезаписываются только ячейки внутри дыр (gaps), остальные значения окна
+    остаются как были.
+
+    Если для периода EMA есть контрольная точка перед окном (ema_checkpoints),
+    EMA продолжается от неё: загрузка начинается с точки (не раньше, чем
+    нужно для проверки контекста), результат совпадает с пересчётом всей истории.
+    Попутно возвращаются новые контрольные точки внутри окна.
+
+    Args:
+        symbol: символ торговой пары
+        timeframe: таймфрейм
+        start_ts, end_ts: границы окна
+        columns: колонки индикаторов, которые есть в окне (ema20, rsi14, ...)
+        conn: соединение с БД
+        context_start_ts: начало загрузки с прогревом
+            (по умолчанию как в calc_ema: прогрев + длина окна свечей до start_ts)
+        gaps: дыры окна [{"col", "start_ts", "end_ts", "period"}, ...],
+            period — прогрев колонки в свечах
+            (по умолчанию всё окно — дыра для всех колонок)
+
+    Returns:
+        dict для write_range_update: {"start_ts", "end_ts", "timestamps", "columns",
+        "values", "fixed", "invalid", "checkpoints"} или None, если писать нечего;
+        invalid — ячейки, помеченные -1 (нет контекста)
+    """
     table = f"candles_{timeframe}"
-    for period in ema_periods:
-        ema_col = f"ema{period}"
-        with conn:
-            conn.execute(
-                f"UPDATE {table} SET {ema_col}=-1 WHERE symbol=? AND timestamp>=? AND timestamp<=?",
-                [symbol, start_ts, end_ts],
+    tf_sec = TIMEFRAMES_CONFIG[timeframe]["interval_sec"]
+    specs = list(dict.fromkeys(spec_for_column(col) for col in columns))
+    if None in specs:
+        raise ValueError(f"Неизвестные колонки индикаторов: {columns}")
+    ema_periods = [period for name, period in specs if name == "ema"]
+    other_specs = [spec for spec in specs if spec[0] != "ema"]
+
+    if context_start_ts is None:
+        max_warmup = max(column_warmup(col) for col in columns)
+        gap_len = int((end_ts - start_ts) / tf_sec) + 1
+        context_start_ts = start_ts - (max_warmup + gap_len) * tf_sec
+    if gaps is None:
+        gaps = [
+            {"col": col, "start_ts": start_ts, "end_ts": end_ts, "period": column_warmup(col)}
+            for col in columns
+        ]
+
+    # Рекурсивным не-EMA индикаторам нужна история для сходимости
+    if other_specs:
+        context_start_ts = min(
+            context_start_ts,
+            start_ts - max(INDICATORS[n].context(p) for n, p in other_specs) * tf_sec,
+        )
+
+    # Контрольные точки EMA перед окном: при полном покрытии прогрев не нужен
+    checkpoints = (
+        load_nearest_checkpoints(conn, symbol, timeframe, ema_periods, start_ts)
+        if ema_periods
+        else {}
+    )
+    if checkpoints:
+        gap_specs = {spec_for_column(gap["col"]) for gap in gaps}
+        context_needed = start_ts - max(gap["period"] for gap in gaps) * tf_sec
+        if all(name == "ema" and period in checkpoints for name, period in gap_specs):
+            context_start_ts = context_needed
+        context_start_ts = min(
+            context_start_ts, *(ts for ts, _ in checkpoints.values())
+        )
+
+    df = load_indicator_frame(
+        conn,
+        symbol,
+        timeframe,
+        ["open", "high", "low", "close"],
+        columns,
+        context_start_ts,
+        end_ts,
+    )
+    if df.empty:
+        print(f"[recalculate_range] ❌ Нет данных для {symbol} {timeframe}")
+        return None
+
+    timestamps = df["timestamp"].to_numpy()
+
+    # Свеча до загруженного диапазона: если её нет, окно начинается с начала истории
+    cold_start = cold_bounds(conn, table, symbol)[0]
+    has_history_before = (
+        cold_start is not None and cold_start < int(timestamps[0])
+    ) or (
+        conn.execute(
+            f"SELECT 1 FROM {table} WHERE symbol = ? AND timestamp < ? LIMIT 1",
+            (symbol, int(timestamps[0])),
+        ).fetchone()
+        is not None
+    )
+    context_ok = _gap_context_checker(df, tf_sec, has_history_before)
+
+    # Маски ячеек: пересчитываемые и помечаемые -1
+    hole_mask = np.zeros((len(df), len(columns)), dtype=bool)
+    invalid_mask = np.zeros_like(hole_mask)
+    for gap in gaps:
+        if gap["col"] not in columns:
+            continue
+        col_idx = columns.index(gap["col"])
+        gap_rows = (timestamps >= gap["start_ts"]) & (timestamps <= gap["end_ts"])
+        if not gap_rows.any():
+            continue
+
+        is_valid, reason = context_ok(gap_rows, gap["period"])
+        if is_valid:
+            hole_mask[:, col_idx] |= gap_rows
+        else:
+            print(
+                f"[recalculate_range] ❌ {gap['col']} {gap['start_ts']} → {gap['end_ts']}: {reason}"
+            )
+            invalid_mask[:, col_idx] |= gap_rows
+
+    rows = (hole_mask | invalid_mask).any(axis=1)
+    if not rows.any():
+        return None
+
+    values = df[columns].to_numpy(dtype=float, copy=True)
+    fixed = 0
+    checkpoint_values = None
+    if hole_mask.any():
+        computed = {}
+        if ema_periods:
+            ema_values, anchored = _ema_from_checkpoints(
+                df["close"].to_numpy(dtype=float),
+                timestamps,
+                ema_periods,
+                checkpoints,
+                has_history_before,
             )
-    print(f"[calc_ema] ⚠️ Помечено -1 для {ema_periods} {symbol} {timeframe}")
+            computed.update(
+                {f"ema{p}": ema_values[:, j] for j, p in enumerate(ema_periods)}
+            )
+
+            # Значения от начала истории или от чистой точки — это EMA полной истории
+            if anchored.any():
+                anchored_periods = [p for p, a in zip(ema_periods, anchored) if a]
+                checkpoint_values = (
+                    timestamps,
+                    anchored_periods,
+                    ema_values[:, anchored],
+                )
+        if other_specs:
+            data = {
+                col: df[col].to_numpy(dtype=float)
+                for col in required_inputs(other_specs)
+            }
+            computed.update(compute_indicators(data, other_specs)[0])
+
+        new_values = np.column_stack([computed[col] for col in columns])
+        values[hole_mask] = new_values[hole_mask]
+        fixed = int((hole_mask & ~np.isnan(new_values)).sum())
+    invalid = invalid_mask & ~hole_mask
+    values[invalid] = -1
+
+    return {
+        "start_ts": start_ts,
+        "end_ts": end_ts,
+        "timestamps": timestamps[rows],
+        "columns": columns,
+        "values": values[rows],
+        "fixed": fixed,
+        "invalid": int(invalid.sum()),
+        "checkpoints": checkpoint_values,
+    }
+
+
+def _ema_from_checkpoints(
+    close: np.ndarray,
+    timestamps: np.ndarray,
+    ema_periods: List[int],
+    checkpoints: dict,
+    has_history_before: bool,
+):
+    """
+    EMA окна: периоды с контрольной точкой в окне продолжаются от неё,
+    остальные считаются с SMA-прогревом от начала окна.
+
+    Returns:
+        (значения (N, len(ema_periods)), маска периодов с EMA полной истории)
+    """
+    ema_values = ema_multi(close, ema_periods)
+    anchored = np.full(len(ema_periods), not has_history_before)
+
+    # Группируем периоды по строке контрольной точки: один проход ядра на группу
+    groups = {}
+    for col_idx, period in enumerate(ema_periods):
+        if period not in checkpoints:
+            continue
+        ts, value = checkpoints[period]
+        row = np.searchsorted(timestamps, ts)
+        if row < len(timestamps) and timestamps[row] == ts:
+            groups.setdefault(int(row), []).append((col_idx, value))
+
+    for row, items in groups.items():
+        cols = [col_idx for col_idx, _ in items]
+        seeds = [value for _, value in items]
+        ema_values[: row + 1, cols] = np.nan
+        ema_values[row, cols] = seeds
+        ema_values[row + 1 :, cols] = ema_multi(
+            close[row + 1 :], [ema_periods[c] for c in cols], seeds=seeds
+        )
+        anchored[cols] = True
+
+    return ema_values, anchored
+
+
+def _gap_context_checker(df: pd.DataFrame, tf_sec: int, has_history_before: bool):
+    """
+    Возвращает проверку контекста дыры: period свечей до начала дыры и сама дыра
+    должны быть непрерывны и с корректными OHLC (как validate_for_indicator в calc_ema).
+    Проверка векторная: O(1) на дыру после одного прохода по окну.
+    """
+    timestamps = df["timestamp"].to_numpy()
+    ohlc = df[["open", "high", "low", "close"]].to_numpy(dtype=float)
+    bad_cum = np.cumsum(np.isnan(ohlc).any(axis=1) | (ohlc <= 0).any(axis=1))
+    step_break = np.concatenate([[False], np.diff(timestamps) > 1.1 * tf_sec])
+    break_cum = np.cumsum(step_break)
+
+    def check(gap_rows: np.ndarray, period: int):
+        idx = np.flatnonzero(gap_rows)
+        first, last = int(idx[0]), int(idx[-1])
+        lo = first - period
+        if lo < 0:
+            if has_history_before:
+                return False, f"Недостаточно данных: {first} < {period}"
+            lo = 0  # начало истории: первые period-1 значений и так NaN
+        bad = bad_cum[last] - (bad_cum[lo - 1] if lo > 0 else 0)
+        if bad:
+            return False, "Некорректные OHLC данные"
+        if break_cum[last] - break_cum[lo]:
+            return False, "Обнаружены пропуски в данных"
+        return True, "OK"
+
+    return check
 
 
 def main():
@@ -213,6 +555,8 @@ def main():
         updated = calc_ema(
             args.symbol, args.timeframe, args.periods, args.start, args.end, conn
         )
+    # Буфер realtime-загрузчика перечитает пересчитанные значения из БД
+    invalidate_ring(args.symbol, args.timeframe, args.start, args.end)
     print(f"\n✅ Завершено. Всего обновлено {updated} строк.")
 
 
@@ -8,12 +8,13 @@
 import os
 import sqlite3
 import pandas as pd
-import pandas_ta as ta
 from pathlib import Path
 from typing import List
 
 from backend.config.timeframes_config import TIMEFRAMES_CONFIG
 from backend.core.validation.data_integrity import validate_for_indicator
+from backend.core.indicators.kernels import ema_multi
+from backend.core.indicators.bulk_writer import write_indicators_bulk
 
 
 PROJECT_ROOT = Path(__file__).resolve().parents[3]
@@ -30,29 +31,45 @@ if not EMA_PERIODS:
 
 def calculate_ema(df: pd.DataFrame, periods: List[int], tf_sec: int) -> pd.DataFrame:
     """Расчёт EMA для указанных периодов с улучшенной валидацией"""
+    # Группируем периоды по набору строк без EMA: у каждой группы
+    # одна выборка close и один проход ядра на все её периоды
+    groups = {}
     for period in periods:
         col = f"ema{period}"
         if col not in df.columns:
             continue
 
-        df_null = df[df[col].isnull()].copy()
-        if df_null.empty:
+        null_mask = df[col].isnull().to_numpy()
+        if not null_mask.any():
             continue
-
-        # Улучшенная валидация с проверкой непрерывности
-        is_valid, reason = validate_for_indicator(df_null, period, tf_sec)
-        if not is_valid:
-            print(f"⚠ EMA{period}: {reason} — пишем -1")
-            df.loc[df_null.index, col] = -1
+        groups.setdefault(null_mask.tobytes(), (null_mask, []))[1].append(period)
+
+    for null_mask, group_periods in groups.values():
+        df_null = df[null_mask]
+
+        valid_periods = []
+        for period in group_periods:
+            # Улучшенная валидация с проверкой непрерывности
+            is_valid, reason = validate_for_indicator(df_null, period, tf_sec)
+            if not is_valid:
+                print(f"⚠ EMA{period}: {reason} — пишем -1")
+                df.loc[df_null.index, f"ema{period}"] = -1
+            else:
+                valid_periods.append(period)
+
+        if not valid_periods:
             continue
 
         # Рассчитываем EMA только для валидных данных
-        ema_series = ta.ema(df_null["close"], length=period)
-        if ema_series.dropna().shape[0] < period:
-            print(f"⚠ EMA{period}: нестабильная EMA — пишем -1")
-            df.loc[df_null.index, col] = -1
-        else:
-            df.loc[df_null.index, col] = ema_series
+        ema_values = ema_multi(df_null["close"].to_numpy(), valid_periods)
+        for col_idx, period in enumerate(valid_periods):
+            col = f"ema{period}"
+            ema_series = ema_values[:, col_idx]
+            if (~pd.isna(ema_series)).sum() < period:
+                print(f"⚠ EMA{period}: нестабильная EMA — пишем -1")
+                df.loc[df_null.index, col] = -1
+            else:
+                df.loc[df_null.index, col] = ema_series
     return df
 
 
@@ -139,14 +156,14 @@ def run_ema_incremental(symbol: str, timeframe: str):
         ]
 
         if update_cols:
-            with conn:
-                for _, row in df_to_update.iterrows():
-                    values = [row[c] for c in update_cols]
-                    set_clause = ", ".join([f"{col} = ?" for col in update_cols])
-                    conn.execute(
-                        f"UPDATE {table} SET {set_clause} WHERE symbol = ? AND timestamp = ?",
-                        values + [symbol, row["timestamp"]],
-                    )
+            write_indicators_bulk(
+                conn,
+                symbol,
+                timeframe,
+                df_to_update["timestamp"].to_numpy(),
+                update_cols,
+                df_to_update[update_cols].to_numpy(dtype=float),
+            )
 
             print(
                 f"   ✅ EMA обновлены: {symbol} {timeframe} ({len(df_to_update)} строк)"
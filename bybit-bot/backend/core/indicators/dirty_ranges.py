@@ -0,0 +1,259 @@
+"""
+Журнал изменённых диапазонов свечей (dirty ranges)
+
+Каждый путь записи свечей (realtime CandleHandler, data_backfill,
+data_extended_backfill, duplicate_cleaner) не запускает пересчёт индикаторов сам,
+а записывает изменённый диапазон (symbol, timeframe, start_ts, end_ts)
+в таблицу dirty_ranges через mark_dirty(). Контрольные точки EMA начиная
+с start_ts при этом сбрасываются.
+
+recompute_dirty_ranges() забирает журнал, сливает пересекающиеся и близкие
+диапазоны (ближе прогрева индикаторов) и пересчитывает каждый слитый диапазон
+одним расчётом окна (compute_range_update, как у EzDIM) — вместо тысяч
+мелких пересчётов после backfill. Диапазон у начала истории считается
+от первой свечи. Диапазон пересчёта продлевается на прогрев после end_ts:
+свечи после заполненной дыры раньше были помечены -1. Диапазон, который
+пришлось пометить -1 (нет контекста), остаётся в журнале до следующего прохода.
+
+IndicatorTrigger сам считает свою свечу и снимает её запись через clear_dirty().
+После пересчёта пары кольцевой буфер realtime-загрузчика сбрасывается
+(invalidate_ring), если пересчитанные свечи в нём лежат.
+
+Использование:
+    python -m backend.core.indicators.dirty_ranges [--symbol BTCUSDT]
+"""
+
+import sqlite3
+import time
+from typing import Dict, List, Optional, Tuple
+
+from backend.config.timeframes_config import TIMEFRAMES_CONFIG
+from backend.core.indicators.ema_checkpoints import invalidate_checkpoints
+from backend.core.storage.ring_buffer import invalidate_ring
+
+
+DIRTY_TABLE = "dirty_ranges"
+
+
+def ensure_dirty_table(conn: sqlite3.Connection):
+    """Создаёт таблицу журнала, если её нет"""
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {DIRTY_TABLE} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            symbol TEXT NOT NULL,
+            timeframe TEXT NOT NULL,
+            start_ts INTEGER NOT NULL,
+            end_ts INTEGER NOT NULL,
+            created_at INTEGER NOT NULL
+        )
+        """
+    )
+
+
+def mark_dirty(
+    conn: sqlite3.Connection, symbol: str, timeframe: str, start_ts: int, end_ts: int
+):
+    """
+    Записывает изменённый диапазон свечей в журнал и сбрасывает
+    контрольные точки EMA начиная с start_ts.
+    Не фиксирует транзакцию: запись журнала уходит одним commit'ом
+    вызывающего кода вместе со свечами.
+    """
+    ensure_dirty_table(conn)
+    conn.execute(
+        f"""
+        INSERT INTO {DIRTY_TABLE} (symbol, timeframe, start_ts, end_ts, created_at)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        (symbol, timeframe, int(start_ts), int(end_ts), int(time.time())),
+    )
+    invalidate_checkpoints(conn, symbol, timeframe, int(start_ts))
+
+
+def clear_dirty(
+    conn: sqlite3.Connection, symbol: str, timeframe: str, start_ts: int, end_ts: int
+) -> int:
+    """
+    Снимает записи журнала, целиком лежащие внутри [start_ts, end_ts]
+    (диапазон уже пересчитан вызывающим кодом).
+
+    Returns:
+        int: количество снятых записей
+    """
+    ensure_dirty_table(conn)
+    with conn:
+        cursor = conn.execute(
+            f"""
+            DELETE FROM {DIRTY_TABLE}
+            WHERE symbol = ? AND timeframe = ? AND start_ts >= ? AND end_ts <= ?
+            """,
+            (symbol, timeframe, start_ts, end_ts),
+        )
+    return cursor.rowcount
+
+
+def merge_ranges(
+    ranges: List[Tuple[int, int]], tf_sec: int, slack: int = 0
+) -> List[Tuple[int, int]]:
+    """
+    Сливает пересекающиеся диапазоны и диапазоны, между которыми
+    не больше slack свечей.
+    """
+    merged = []
+    for start_ts, end_ts in sorted(ranges):
+        if merged and start_ts <= merged[-1][1] + (slack + 1) * tf_sec:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end_ts))
+        else:
+            merged.append((start_ts, end_ts))
+    return merged
+
+
+def claim_dirty_ranges(
+    conn: sqlite3.Connection, symbol: Optional[str] = None
+) -> Tuple[int, Dict[Tuple[str, str], List[Tuple[int, int]]]]:
+    """
+    Читает журнал до текущей последней записи.
+
+    Returns:
+        (max_id, {(symbol, timeframe): [(start_ts, end_ts), ...]});
+        записи с id <= max_id снимаются после пересчёта через release_dirty_ranges
+    """
+    ensure_dirty_table(conn)
+    max_id = conn.execute(f"SELECT MAX(id) FROM {DIRTY_TABLE}").fetchone()[0] or 0
+    query = f"SELECT symbol, timeframe, start_ts, end_ts FROM {DIRTY_TABLE} WHERE id <= ?"
+    params = [max_id]
+    if symbol:
+        query += " AND symbol = ?"
+        params.append(symbol)
+
+    grouped = {}
+    for sym, timeframe, start_ts, end_ts in conn.execute(query, params):
+        grouped.setdefault((sym, timeframe), []).append((start_ts, end_ts))
+    return max_id, grouped
+
+
+def release_dirty_ranges(
+    conn: sqlite3.Connection, max_id: int, symbol: str, timeframe: str
+):
+    """Снимает забранные записи журнала для пары (symbol, timeframe)"""
+    with conn:
+        conn.execute(
+            f"DELETE FROM {DIRTY_TABLE} WHERE id <= ? AND symbol = ? AND timeframe = ?",
+            (max_id, symbol, timeframe),
+        )
+
+
+def recompute_dirty_ranges(
+    conn: sqlite3.Connection, symbol: Optional[str] = None
+) -> int:
+    """
+    Забирает журнал, сливает диапазоны и пересчитывает каждый слитый
+    диапазон одним расчётом окна (все настроенные индикаторы).
+    Снимаются только записи диапазонов, для которых посчитаны значения.
+
+    Returns:
+        int: количество обновлённых значений
+    """
+    # Локальный импорт: mark_dirty используется в путях записи без тяжёлых зависимостей
+    from backend.core.indicators.calc_ema import (
+        EMA_PERIODS,
+        compute_range_update,
+        write_range_update,
+    )
+    from backend.core.indicators.registry import (
+        CONFIGURED_INDICATORS,
+        INDICATORS,
+        existing_specs,
+        spec_columns,
+    )
+
+    max_warmup = max(
+        INDICATORS[name].warmup(period)
+        for name, period in [("ema", p) for p in EMA_PERIODS] + CONFIGURED_INDICATORS
+    )
+
+    max_id, grouped = claim_dirty_ranges(conn, symbol)
+    if not grouped:
+        print("[dirty_ranges] ✅ Журнал пуст")
+        return 0
+
+    total_updated = 0
+    for (sym, timeframe), ranges in grouped.items():
+        if timeframe not in TIMEFRAMES_CONFIG:
+            print(f"[dirty_ranges] ⏭ Неизвестный таймфрейм {timeframe}, записи сняты")
+            release_dirty_ranges(conn, max_id, sym, timeframe)
+            continue
+
+        tf_sec = TIMEFRAMES_CONFIG[timeframe]["interval_sec"]
+        table = f"candles_{timeframe}"
+        merged = merge_ranges(ranges, tf_sec, slack=max_warmup)
+        columns = spec_columns(
+            [("ema", p) for p in EMA_PERIODS]
+            + existing_specs(
+                conn, table, [spec for spec in CONFIGURED_INDICATORS if spec[0] != "ema"]
+            )
+        )
+        print(
+            f"[dirty_ranges] 🧩 {sym} {timeframe}: {len(ranges)} диапазонов → {len(merged)} пересчётов"
+        )
+
+        recomputed = []
+        try:
+            for start_ts, end_ts in merged:
+                # Свечи после диапазона зависят от него на длину прогрева
+                first_ts, last_ts = conn.execute(
+                    f"""
+                    SELECT MIN(timestamp), MAX(timestamp) FROM {table}
+                    WHERE symbol = ? AND timestamp >= ? AND timestamp <= ?
+                    """,
+                    (sym, start_ts, end_ts + max_warmup * tf_sec),
+                ).fetchone()
+                if first_ts is None:
+                    continue
+                update = compute_range_update(
+                    sym, timeframe, first_ts, last_ts, columns, conn
+                )
+                if update is None:
+                    continue
+                total_updated += write_range_update(conn, sym, timeframe, update)
+                recomputed.append((first_ts, last_ts))
+                if update["invalid"]:
+                    # Значения не посчитаны (помечены -1): диапазон остаётся
+                    # в журнале новой записью, забранные снимаются ниже
+                    print(
+                        f"[dirty_ranges] ⚠️ {sym} {timeframe} {start_ts} → {end_ts}: "
+                        f"{update['invalid']} значений помечено -1, диапазон остаётся в журнале"
+                    )
+                    mark_dirty(conn, sym, timeframe, start_ts, end_ts)
+        except Exception as e:
+            # Несохранённый пересчёт пары отменяется: записи журнала остаются
+            conn.rollback()
+            print(f"[dirty_ranges] ❌ Ошибка пересчёта {sym} {timeframe}: {e}")
+            continue
+
+        release_dirty_ranges(conn, max_id, sym, timeframe)
+        # Пересчёт зафиксирован — буфер realtime-загрузчика перечитает БД
+        if recomputed:
+            invalidate_ring(sym, timeframe, recomputed[0][0], recomputed[-1][1])
+
+    print(f"[dirty_ranges] ✅ Обновлено {total_updated} значений")
+    return total_updated
+
+
+def main():
+    """CLI"""
+    import argparse
+
+    from backend.core.indicators.calc_ema import DB_PATH
+
+    parser = argparse.ArgumentParser(description="Пересчёт индикаторов по журналу изменений")
+    parser.add_argument("--symbol", help="Только этот символ")
+    args = parser.parse_args()
+
+    with sqlite3.connect(str(DB_PATH)) as conn:
+        recompute_dirty_ranges(conn, args.symbol)
+
+
+if __name__ == "__main__":
+    main()
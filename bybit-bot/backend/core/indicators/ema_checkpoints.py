@@ -0,0 +1,232 @@
+"""
+Контрольные точки EMA для быстрого пересчёта середины истории
+
+Для каждой тройки (symbol, timeframe, period) в таблице ema_checkpoints хранится
+значение EMA полной истории на каждой CHECKPOINT_INTERVAL-й свече
+(timestamp // interval_sec кратен CHECKPOINT_INTERVAL).
+
+Починка дыры в середине длинной серии продолжает рекурренту от ближайшей
+контрольной точки перед дырой (ema_multi(..., seeds=...)) вместо прогрева на
+max_period + длина дыры свечей: стоимость ограничена интервалом контрольных
+точек, а результат совпадает с пересчётом всей истории.
+
+Контрольная точка чистая, пока свечи до неё не менялись. Код, меняющий
+исторические свечи, должен вызывать invalidate_checkpoints(..., from_ts).
+
+Использование:
+    python -m backend.core.indicators.ema_checkpoints --symbol BTCUSDT --timeframe 1h
+"""
+
+import sqlite3
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from backend.config.timeframes_config import TIMEFRAMES_CONFIG
+from backend.core.indicators.kernels import ema_multi
+from backend.core.storage.indicator_store import load_indicator_frame
+
+
+CHECKPOINT_TABLE = "ema_checkpoints"
+CHECKPOINT_INTERVAL = 1000  # свечей между контрольными точками
+
+
+def ensure_checkpoint_table(conn: sqlite3.Connection):
+    """Создаёт таблицу контрольных точек EMA, если её нет"""
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE} (
+            symbol TEXT NOT NULL,
+            timeframe TEXT NOT NULL,
+            period INTEGER NOT NULL,
+            timestamp INTEGER NOT NULL,
+            value REAL NOT NULL,
+            PRIMARY KEY (symbol, timeframe, period, timestamp)
+        )
+        """
+    )
+
+
+def checkpoint_mask(
+    timestamps: np.ndarray, tf_sec: int, interval: int = CHECKPOINT_INTERVAL
+) -> np.ndarray:
+    """Маска свечей, на которых ставятся контрольные точки"""
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    return (timestamps // tf_sec) % interval == 0
+
+
+def load_nearest_checkpoints(
+    conn: sqlite3.Connection,
+    symbol: str,
+    timeframe: str,
+    periods: List[int],
+    before_ts: int,
+) -> Dict[int, Tuple[int, float]]:
+    """
+    Ближайшие контрольные точки строго до before_ts.
+
+    Returns:
+        {period: (timestamp, value)} — только для периодов, у которых есть точка
+    """
+    ensure_checkpoint_table(conn)
+    placeholders = ",".join("?" for _ in periods)
+    # SQLite: голые колонки при MAX() берутся из строки с максимумом
+    rows = conn.execute(
+        f"""
+        SELECT period, MAX(timestamp), value FROM {CHECKPOINT_TABLE}
+        WHERE symbol = ? AND timeframe = ? AND period IN ({placeholders})
+          AND timestamp < ?
+        GROUP BY period
+        """,
+        [symbol, timeframe, *periods, before_ts],
+    ).fetchall()
+    return {int(period): (int(ts), float(value)) for period, ts, value in rows}
+
+
+def save_checkpoints(
+    conn: sqlite3.Connection,
+    symbol: str,
+    timeframe: str,
+    timestamps: Sequence[int],
+    periods: List[int],
+    values: np.ndarray,
+) -> int:
+    """
+    Сохраняет контрольные точки из значений EMA полной истории.
+    Не фиксирует транзакцию: точки уходят одним commit'ом вызывающего
+    кода вместе со значениями индикаторов.
+
+    Args:
+        timestamps: timestamps строк (длина N)
+        periods: периоды столбцов values
+        values: массив (N, len(periods)); NaN и -1 пропускаются
+
+    Returns:
+        int: количество сохранённых точек
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64).reshape(len(timestamps), -1)
+    tf_sec = TIMEFRAMES_CONFIG[timeframe]["interval_sec"]
+
+    rows = np.flatnonzero(checkpoint_mask(timestamps, tf_sec))
+    records = [
+        (symbol, timeframe, period, int(timestamps[i]), float(values[i, j]))
+        for i in rows
+        for j, period in enumerate(periods)
+        if not np.isnan(values[i, j]) and values[i, j] != -1
+    ]
+    if not records:
+        return 0
+
+    ensure_checkpoint_table(conn)
+    conn.executemany(
+        f"""
+        INSERT OR REPLACE INTO {CHECKPOINT_TABLE}
+            (symbol, timeframe, period, timestamp, value)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        records,
+    )
+    return len(records)
+
+
+def invalidate_checkpoints(
+    conn: sqlite3.Connection, symbol: str, timeframe: str, from_ts: int
+) -> int:
+    """
+    Удаляет контрольные точки начиная с from_ts: изменение свечи
+    меняет EMA полной истории на всех последующих свечах.
+    Не фиксирует транзакцию: commit делает вызывающий код вместе
+    с изменением свечей.
+
+    Returns:
+        int: количество удалённых точек
+    """
+    ensure_checkpoint_table(conn)
+    cursor = conn.execute(
+        f"DELETE FROM {CHECKPOINT_TABLE} WHERE symbol = ? AND timeframe = ? AND timestamp >= ?",
+        (symbol, timeframe, from_ts),
+    )
+    return cursor.rowcount
+
+
+def rebuild_checkpoints(
+    symbol: str,
+    timeframe: str,
+    periods: List[int],
+    conn: sqlite3.Connection,
+    since_ts: Optional[int] = None,
+) -> int:
+    """
+    Перестраивает контрольные точки по всей истории символа.
+
+    Загружает только timestamp и close (SQLite и архивные месяцы в Parquet)
+    и считает EMA полной истории одним проходом ядра. С since_ts продолжает
+    от последней чистой точки перед since_ts вместо всей истории.
+
+    Returns:
+        int: количество сохранённых точек
+    """
+    seeds = np.full(len(periods), np.nan)
+    load_from = None
+
+    if since_ts is not None:
+        nearest = load_nearest_checkpoints(conn, symbol, timeframe, periods, since_ts)
+        if len(nearest) == len(periods) and len({ts for ts, _ in nearest.values()}) == 1:
+            load_from = next(iter(nearest.values()))[0]
+            seeds = np.array([nearest[p][1] for p in periods])
+
+    start_ts = 0 if load_from is None else load_from + 1
+    invalidate_checkpoints(conn, symbol, timeframe, start_ts)
+    # Свечи читаются через оба уровня: SQLite и архивные месяцы в Parquet
+    frame = load_indicator_frame(
+        conn, symbol, timeframe, ["close"], [], None if load_from is None else start_ts
+    )
+
+    if frame.empty:
+        return 0
+
+    values = ema_multi(frame["close"].to_numpy(dtype=np.float64), periods, seeds=seeds)
+    saved = save_checkpoints(
+        conn, symbol, timeframe, frame["timestamp"].to_numpy(dtype=np.int64), periods, values
+    )
+    print(
+        f"[ema_checkpoints] ✅ {symbol} {timeframe}: {saved} контрольных точек "
+        f"по {len(frame)} свечам"
+    )
+    return saved
+
+
+def main():
+    """CLI"""
+    import argparse
+
+    from backend.core.indicators.calc_ema import EMA_PERIODS, DB_PATH
+
+    parser = argparse.ArgumentParser(description="Перестроение контрольных точек EMA")
+    parser.add_argument("--symbol", default="BTCUSDT")
+    parser.add_argument("--timeframe", help="Конкретный таймфрейм (по умолчанию все)")
+    parser.add_argument("--since", type=int, help="Продолжить от точки перед timestamp")
+    args = parser.parse_args()
+
+    timeframes = [args.timeframe] if args.timeframe else list(TIMEFRAMES_CONFIG)
+
+    total = 0
+    with sqlite3.connect(str(DB_PATH)) as conn:
+        for timeframe in timeframes:
+            table = f"candles_{timeframe}"
+            exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = ?",
+                (table,),
+            ).fetchone()
+            if not exists:
+                print(f"⏭ Таблица {table} не существует")
+                continue
+            total += rebuild_checkpoints(
+                args.symbol, timeframe, EMA_PERIODS, conn, since_ts=args.since
+            )
+    print(f"\n✅ Завершено. Всего контрольных точек: {total}")
+
+
+if __name__ == "__main__":
+    main()
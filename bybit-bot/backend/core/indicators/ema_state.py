@@ -0,0 +1,136 @@
+"""
+Потоковое состояние EMA для realtime-пересчёта
+
+Для каждой тройки (symbol, timeframe, period) хранится последнее значение EMA
+и timestamp свечи, на которой оно посчитано (таблица ema_state).
+Новая закрытая свеча обновляет EMA одной операцией:
+
+    ema = prev + alpha * (close - prev),  alpha = 2 / (period + 1)
+
+Это та же рекуррента, что и у ta.ema (ewm(adjust=False) после SMA-сида),
+поэтому результат совпадает с полным пересчётом через calc_ema.
+Если состояния для предыдущей свечи нет — вызывающий код откатывается на calc_ema.
+"""
+
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from backend.core.storage.indicator_store import load_indicator_frame
+
+
+STATE_TABLE = "ema_state"
+
+
+def ensure_ema_state_table(conn: sqlite3.Connection):
+    """Создаёт таблицу состояния EMA, если её нет"""
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+            symbol TEXT NOT NULL,
+            timeframe TEXT NOT NULL,
+            period INTEGER NOT NULL,
+            timestamp INTEGER NOT NULL,
+            value REAL NOT NULL,
+            PRIMARY KEY (symbol, timeframe, period)
+        )
+        """
+    )
+
+
+def ema_step(prev: float, close: float, period: int) -> float:
+    """Один шаг EMA по новой цене закрытия"""
+    alpha = 2.0 / (period + 1)
+    return prev + alpha * (close - prev)
+
+
+def load_ema_state(
+    conn: sqlite3.Connection, symbol: str, timeframe: str, periods: List[int]
+) -> Dict[int, Tuple[int, float]]:
+    """
+    Загружает состояние EMA.
+
+    Returns:
+        {period: (timestamp, value)} — только для периодов, у которых есть состояние
+    """
+    placeholders = ",".join("?" for _ in periods)
+    rows = conn.execute(
+        f"""
+        SELECT period, timestamp, value FROM {STATE_TABLE}
+        WHERE symbol = ? AND timeframe = ? AND period IN ({placeholders})
+        """,
+        [symbol, timeframe, *periods],
+    ).fetchall()
+    return {int(period): (int(ts), float(value)) for period, ts, value in rows}
+
+
+def save_ema_state(
+    conn: sqlite3.Connection,
+    symbol: str,
+    timeframe: str,
+    timestamp: int,
+    values: Dict[int, float],
+):
+    """Сохраняет состояние EMA (вызывать внутри транзакции вместе с записью EMA)"""
+    conn.executemany(
+        f"""
+        INSERT INTO {STATE_TABLE} (symbol, timeframe, period, timestamp, value)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(symbol, timeframe, period) DO UPDATE SET
+            timestamp=excluded.timestamp,
+            value=excluded.value
+        """,
+        [
+            (symbol, timeframe, period, timestamp, float(value))
+            for period, value in values.items()
+        ],
+    )
+
+
+def read_ema_row(
+    conn: sqlite3.Connection,
+    symbol: str,
+    timeframe: str,
+    periods: List[int],
+    timestamp: int,
+) -> Dict[int, float]:
+    """
+    Читает EMA одной свечи в текущей раскладке таймфрейма
+    (колонки candles_<tf> или узкое хранилище indicators_<tf>).
+    Возвращает только валидные значения (не NULL и не -1).
+    """
+    cols = [f"ema{p}" for p in periods]
+    frame = load_indicator_frame(conn, symbol, timeframe, [], cols, timestamp, timestamp)
+    if not len(frame):
+        return {}
+    row = frame.iloc[-1]
+    return {
+        period: float(row[col])
+        for period, col in zip(periods, cols)
+        if not pd.isna(row[col]) and row[col] != -1
+    }
+
+
+def step_ema_state(
+    state: Dict[int, Tuple[int, float]],
+    periods: List[int],
+    timestamp: int,
+    close: float,
+    tf_sec: int,
+) -> Optional[Dict[int, float]]:
+    """
+    Считает EMA для новой свечи из состояния предыдущей.
+
+    Returns:
+        {period: value} или None, если хотя бы для одного периода
+        нет состояния на свече timestamp - tf_sec
+    """
+    prev_ts = timestamp - tf_sec
+    new_values = {}
+    for period in periods:
+        prev = state.get(period)
+        if prev is None or prev[0] != prev_ts:
+            return None
+        new_values[period] = ema_step(prev[1], close, period)
+    return new_values
@@ -0,0 +1,135 @@
+"""
+Вычислительные ядра индикаторов на NumPy
+
+ema_multi(...) считает все запрошенные периоды EMA за один проход по массиву close
+в заранее выделенный 2-D массив float64 (строки — свечи, столбцы — периоды).
+
+Совместимость с ta.ema (pandas_ta):
+- первые period-1 значений — NaN
+- значение на индексе period-1 — SMA первых period свечей (SMA-сид)
+- далее рекуррента ewm(adjust=False): y[t] = y[t-1] + alpha * (x[t] - y[t-1]),
+  alpha = 2 / (period + 1)
+
+Рекуррента разворачивается блоками в замкнутую форму
+    y[k] = r^(k+1) * (y[-1] + alpha * sum_{j<=k} x[j] * r^-(j+1)),  r = 1 - alpha
+так что блок обрабатывается векторно сразу для всех периодов.
+Размер блока ограничен так, чтобы веса r^-B не переполняли float64;
+расхождение с последовательным расчётом — на уровне 1e-14 относительной ошибки.
+
+Если для периода передан seed (значение EMA на свече перед close[0], например
+из контрольной точки ema_checkpoints), SMA-прогрев не нужен: рекуррента
+продолжается от seed, и все строки столбца валидны.
+"""
+
+from typing import Optional, Sequence
+
+import numpy as np
+
+
+# Максимальный динамический диапазон весов внутри блока (запас до переполнения float64)
+_MAX_BLOCK_RANGE = 1e200
+_MAX_BLOCK_SIZE = 4096
+
+
+def _block_size(decay: np.ndarray) -> int:
+    """Размер блока, при котором r^-B не выходит за _MAX_BLOCK_RANGE"""
+    log_r = np.log(decay.min())
+    if log_r == 0:
+        return _MAX_BLOCK_SIZE
+    size = int(np.log(_MAX_BLOCK_RANGE) / -log_r)
+    return max(1, min(size, _MAX_BLOCK_SIZE))
+
+
+def ema_multi(
+    close: Sequence[float],
+    periods: Sequence[int],
+    seeds: Optional[Sequence[float]] = None,
+) -> np.ndarray:
+    """
+    Расчёт EMA для нескольких периодов за один проход.
+
+    Args:
+        close: массив цен закрытия (без NaN)
+        periods: список периодов EMA
+        seeds: значения EMA на свече перед close[0] по периодам
+            (NaN или None → обычный SMA-прогрев)
+
+    Returns:
+        np.ndarray формы (len(close), len(periods)), dtype float64.
+        Столбец без seed целиком NaN, если свечей меньше периода.
+    """
+    x = np.ascontiguousarray(close, dtype=np.float64)
+    periods = np.asarray(periods, dtype=np.int64)
+    n = x.shape[0]
+    out = np.full((n, len(periods)), np.nan, dtype=np.float64)
+
+    if n == 0 or len(periods) == 0:
+        return out
+
+    if (periods < 1).any():
+        raise ValueError(f"Период EMA должен быть >= 1: {periods.tolist()}")
+
+    if seeds is None:
+        seeds = np.full(len(periods), np.nan)
+    seeds = np.asarray(seeds, dtype=np.float64)
+    if seeds.shape != periods.shape:
+        raise ValueError(f"Число seed {seeds.shape} не совпадает с периодами {periods.shape}")
+    seeded = ~np.isnan(seeds)
+
+    # period=1 → EMA совпадает с close
+    for j in np.flatnonzero(periods == 1):
+        out[:, j] = x
+
+    cols = np.flatnonzero((periods > 1) & ((periods <= n) | seeded))
+    if cols.size == 0:
+        return out
+
+    p = periods[cols]
+    alpha = 2.0 / (p + 1.0)
+    decay = 1.0 - alpha
+    has_seed = seeded[cols]
+    # Индекс SMA-сида; -1 для продолжения от переданного seed
+    start = np.where(has_seed, -1, p - 1)
+
+    # SMA-сид, как в pandas_ta: close[0:period].mean()
+    sma = np.array(
+        [np.nan if s else x[:k].mean() for k, s in zip(p, has_seed)]
+    )
+
+    # Вход рекурренты по столбцам: 0 до сида, seed/alpha на сиде, close после
+    # (при нулевом состоянии это даёт ровно seed на индексе сида)
+    block = _block_size(decay)
+    k = np.arange(1, block + 1, dtype=np.float64)[:, None]
+    weights = decay[None, :] ** -k  # r^-(j+1)
+    decays = decay[None, :] ** k  # r^(k+1)
+
+    state = np.where(has_seed, seeds[cols], 0.0)
+    first = max(int(start.min()), 0)
+    for b0 in range(first, n, block):
+        b1 = min(b0 + block, n)
+        size = b1 - b0
+        rows = np.arange(b0, b1)[:, None]
+
+        u = np.where(rows > start[None, :], x[b0:b1, None], 0.0)
+        seed_hit = rows == start[None, :]
+        if seed_hit.any():
+            u = np.where(seed_hit, (sma / alpha)[None, :], u)
+
+        acc = np.cumsum(u * weights[:size], axis=0)
+        y = decays[:size] * (state[None, :] + alpha[None, :] * acc)
+        out[b0:b1, cols] = y
+        state = y[-1]
+
+    # Маскируем прогрев и проставляем сид точно
+    for idx, (j, s) in enumerate(zip(cols, start)):
+        if s < 0:
+            continue
+        out[:s, j] = np.nan
+        out[s, j] = sma[idx]
+
+    return out
+
+
+def ema(close: Sequence[float], period: int) -> np.ndarray:
+    """EMA одного периода (обёртка над ema_multi)"""
+    return ema_multi(close, [period])[:, 0]
@@ -0,0 +1,362 @@
+"""
+Реестр индикаторов
+
+Каждый индикатор описывает:
+- inputs — колонки свечей, от которых он зависит
+- columns(period) — колонки в таблицах candles_<tf>
+- warmup(period) — сколько свечей нужно до первого значения
+  (первые warmup-1 значений — естественный NaN)
+- context(period) — сколько свечей истории нужно при пересчёте середины серии,
+  чтобы рекурсивное сглаживание сошлось (для окон без рекурсии = warmup)
+- compute_many(data, periods) — векторный расчёт всех периодов за один проход
+  по уже загруженным массивам; возвращает значения и состояние на последней свече
+- step(state, candle, period) — инкрементальное обновление по новой свече
+
+Встроены EMA, SMA, RSI, ATR и Bollinger. Набор включённых индикаторов берётся
+из backend/config/<name>_periods.txt (ema_periods.txt, rsi_periods.txt, ...):
+нет файла — индикатор не считается.
+
+RSI и ATR используют сглаживание Уайлдера (alpha = 1/period) с SMA-сидом —
+это EMA с периодом 2*period-1, поэтому считаются тем же ядром ema_multi.
+"""
+
+import re
+from collections import deque
+from pathlib import Path
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+from backend.core.indicators.kernels import ema_multi
+from backend.core.indicators.ema_state import ema_step
+from backend.core.storage.indicator_store import has_store
+
+PROJECT_ROOT = Path(__file__).resolve().parents[3]
+CONFIG_DIR = PROJECT_ROOT / "backend" / "config"
+
+# Спецификация индикатора: (имя, период), например ("rsi", 14)
+IndicatorSpec = Tuple[str, int]
+
+_COLUMN_RE = re.compile(r"^([a-z]+?)(\d+)(?:_([a-z]+))?$")
+
+
+class Indicator:
+    """Базовый класс индикатора"""
+
+    name = ""
+    inputs = ("close",)
+
+    def columns(self, period: int) -> List[str]:
+        return [f"{self.name}{period}"]
+
+    def warmup(self, period: int) -> int:
+        return period
+
+    def context(self, period: int) -> int:
+        return self.warmup(period)
+
+    def compute(self, data: Mapping[str, np.ndarray], period: int):
+        """
+        Returns:
+            (массив (N, len(columns)), состояние на последней свече или None)
+        """
+        raise NotImplementedError
+
+    def compute_many(self, data: Mapping[str, np.ndarray], periods: List[int]):
+        """
+        Returns:
+            ({колонка: массив N}, {period: состояние})
+        """
+        values, states = {}, {}
+        for period in periods:
+            out, state = self.compute(data, period)
+            for col, column in zip(self.columns(period), out.T):
+                values[col] = column
+            states[period] = state
+        return values, states
+
+    def step(self, state, candle: Mapping[str, float], period: int):
+        """
+        Returns:
+            (новое состояние, список значений по columns(period))
+        """
+        raise NotImplementedError
+
+
+class EMA(Indicator):
+    name = "ema"
+
+    def compute_many(self, data, periods):
+        # Все периоды EMA — один проход ядра
+        out = ema_multi(data["close"], periods)
+        values = {f"ema{p}": out[:, j] for j, p in enumerate(periods)}
+        states = {
+            p: (None if len(out) == 0 or np.isnan(out[-1, j]) else float(out[-1, j]))
+            for j, p in enumerate(periods)
+        }
+        return values, states
+
+    def compute(self, data, period):
+        values, states = self.compute_many(data, [period])
+        return values[f"ema{period}"][:, None], states[period]
+
+    def step(self, state, candle, period):
+        value = ema_step(state, candle["close"], period)
+        return value, [value]
+
+
+def _wilder(values: np.ndarray, period: int) -> np.ndarray:
+    """Сглаживание Уайлдера с SMA-сидом на индексе period-1"""
+    out = np.full(len(values), np.nan)
+    if len(values) < period:
+        return out
+    seed = values[:period].mean()
+    out[period - 1] = seed
+    out[period:] = ema_multi(values[period:], [2 * period - 1], seeds=[seed])[:, 0]
+    return out
+
+
+def _rsi_value(avg_gain: float, avg_loss: float) -> float:
+    total = avg_gain + avg_loss
+    return 50.0 if total == 0 else 100.0 * avg_gain / total
+
+
+class RSI(Indicator):
+    name = "rsi"
+
+    def warmup(self, period):
+        return period + 1
+
+    def context(self, period):
+        # Остаток сида после 10*period шагов: (1 - 1/period)^(10*period) ≈ e^-10
+        return 10 * period + 1
+
+    def compute(self, data, period):
+        close = data["close"]
+        out = np.full((len(close), 1), np.nan)
+        if len(close) < period + 1:
+            return out, None
+
+        diff = np.diff(close)
+        avg_gain = _wilder(np.clip(diff, 0, None), period)
+        avg_loss = _wilder(np.clip(-diff, 0, None), period)
+        total = avg_gain + avg_loss
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rsi = np.where(total == 0, 50.0, 100.0 * avg_gain / total)
+        out[1:, 0] = rsi
+        return out, (float(close[-1]), float(avg_gain[-1]), float(avg_loss[-1]))
+
+    def step(self, state, candle, period):
+        prev_close, avg_gain, avg_loss = state
+        diff = candle["close"] - prev_close
+        avg_gain += (max(diff, 0.0) - avg_gain) / period
+        avg_loss += (max(-diff, 0.0) - avg_loss) / period
+        return (candle["close"], avg_gain, avg_loss), [_rsi_value(avg_gain, avg_loss)]
+
+
+class ATR(Indicator):
+    name = "atr"
+    inputs = ("high", "low", "close")
+
+    def context(self, period):
+        return 10 * period
+
+    def compute(self, data, period):
+        high, low, close = data["high"], data["low"], data["close"]
+        out = np.full((len(close), 1), np.nan)
+        if len(close) < period:
+            return out, None
+
+        prev_close = np.concatenate([[np.nan], close[:-1]])
+        true_range = np.fmax(
+            high - low,
+            np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)),
+        )
+        out[:, 0] = _wilder(true_range, period)
+        return out, (float(close[-1]), float(out[-1, 0]))
+
+    def step(self, state, candle, period):
+        prev_close, atr = state
+        true_range = max(
+            candle["high"] - candle["low"],
+            abs(candle["high"] - prev_close),
+            abs(candle["low"] - prev_close),
+        )
+        atr += (true_range - atr) / period
+        return (candle["close"], atr), [atr]
+
+
+class SMA(Indicator):
+    name = "sma"
+
+    def compute(self, data, period):
+        close = data["close"]
+        out = np.full((len(close), 1), np.nan)
+        if len(close) < period:
+            return out, None
+
+        csum = np.concatenate([[0.0], np.cumsum(close)])
+        out[period - 1 :, 0] = (csum[period:] - csum[:-period]) / period
+        return out, list(close[-period:])
+
+    def step(self, state, candle, period):
+        window = deque(state, maxlen=period)
+        window.append(candle["close"])
+        return list(window), [sum(window) / period]
+
+
+class Bollinger(Indicator):
+    """Полосы Боллинджера: SMA ± 2 стандартных отклонения (ddof=0)"""
+
+    name = "bb"
+    width = 2.0
+
+    def columns(self, period):
+        return [f"bb{period}_mid", f"bb{period}_up", f"bb{period}_low"]
+
+    def compute(self, data, period):
+        close = data["close"]
+        out = np.full((len(close), 3), np.nan)
+        if len(close) < period:
+            return out, None
+
+        windows = np.lib.stride_tricks.sliding_window_view(close, period)
+        mid = windows.mean(axis=1)
+        std = windows.std(axis=1)
+        out[period - 1 :] = np.column_stack(
+            [mid, mid + self.width * std, mid - self.width * std]
+        )
+        return out, list(close[-period:])
+
+    def step(self, state, candle, period):
+        window = deque(state, maxlen=period)
+        window.append(candle["close"])
+        values = np.fromiter(window, dtype=float)
+        mid, std = values.mean(), values.std()
+        return list(window), [mid, mid + self.width * std, mid - self.width * std]
+
+
+INDICATORS: Dict[str, Indicator] = {}
+
+
+def register_indicator(indicator: Indicator) -> Indicator:
+    """Регистрирует индикатор (имя = префикс колонок)"""
+    INDICATORS[indicator.name] = indicator
+    return indicator
+
+
+for _indicator in (EMA(), SMA(), RSI(), ATR(), Bollinger()):
+    register_indicator(_indicator)
+
+
+def load_indicator_specs(config_dir: Path = CONFIG_DIR) -> List[IndicatorSpec]:
+    """Читает <name>_periods.txt для всех зарегистрированных индикаторов"""
+    specs = []
+    for name in INDICATORS:
+        path = config_dir / f"{name}_periods.txt"
+        if not path.exists():
+            continue
+        with path.open("r") as f:
+            periods = [int(line.strip()) for line in f if line.strip().isdigit()]
+        specs.extend((name, period) for period in periods)
+    return specs
+
+
+def spec_columns(specs: Iterable[IndicatorSpec]) -> List[str]:
+    """Колонки всех спецификаций в порядке перечисления"""
+    return [col for name, period in specs for col in INDICATORS[name].columns(period)]
+
+
+def spec_for_column(col: str) -> Optional[IndicatorSpec]:
+    """ema20 → ("ema", 20), bb20_up → ("bb", 20); None для неизвестных колонок"""
+    match = _COLUMN_RE.match(col)
+    if not match or match.group(1) not in INDICATORS:
+        return None
+    name, period = match.group(1), int(match.group(2))
+    if col not in INDICATORS[name].columns(period):
+        return None
+    return name, period
+
+
+def column_warmup(col: str) -> Optional[int]:
+    """Прогрев колонки в свечах; None для колонок вне реестра"""
+    spec = spec_for_column(col)
+    if spec is None:
+        return None
+    name, period = spec
+    return INDICATORS[name].warmup(period)
+
+
+def required_inputs(specs: Iterable[IndicatorSpec]) -> List[str]:
+    """Колонки свечей, нужные для расчёта спецификаций"""
+    inputs = []
+    for name, _ in specs:
+        for col in INDICATORS[name].inputs:
+            if col not in inputs:
+                inputs.append(col)
+    return inputs
+
+
+def existing_specs(conn, table: str, specs: Iterable[IndicatorSpec]) -> List[IndicatorSpec]:
+    """
+    Оставляет спецификации, все колонки которых есть в таблице.
+    В узком хранилище (indicators_<tf>) колонок нет — доступны все спецификации.
+    """
+    if has_store(conn, table[len("candles_") :]):
+        return list(specs)
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    return [
+        spec
+        for spec in specs
+        if all(col in existing for col in INDICATORS[spec[0]].columns(spec[1]))
+    ]
+
+
+def compute_indicators(
+    data: Mapping[str, np.ndarray], specs: Iterable[IndicatorSpec]
+):
+    """
+    Считает все спецификации по одной загрузке свечей.
+    Периоды одного индикатора считаются одним вызовом compute_many.
+
+    Args:
+        data: {"close": массив, "high": ..., ...} — колонки из required_inputs
+        specs: список (имя, период)
+
+    Returns:
+        ({колонка: массив N}, {(имя, период): состояние на последней свече})
+    """
+    grouped: Dict[str, List[int]] = {}
+    for name, period in specs:
+        grouped.setdefault(name, []).append(period)
+
+    arrays = {key: np.asarray(value, dtype=np.float64) for key, value in data.items()}
+    values, states = {}, {}
+    for name, periods in grouped.items():
+        group_values, group_states = INDICATORS[name].compute_many(arrays, periods)
+        values.update(group_values)
+        states.update({(name, p): s for p, s in group_states.items()})
+    return values, states
+
+
+def step_indicators(
+    states: Dict[IndicatorSpec, object], candle: Mapping[str, float]
+):
+    """
+    Инкрементальное обновление всех спецификаций по новой свече.
+
+    Returns:
+        ({(имя, период): новое состояние}, {колонка: значение})
+        или None, если для какой-то спецификации нет состояния
+    """
+    new_states, values = {}, {}
+    for (name, period), state in states.items():
+        if state is None:
+            return None
+        indicator = INDICATORS[name]
+        new_states[(name, period)], row = indicator.step(state, candle, period)
+        values.update(zip(indicator.columns(period), row))
+    return new_states, values
+
+
+CONFIGURED_INDICATORS = load_indicator_specs()
@@ -0,0 +1,90 @@
+"""
+Модуль хранения
+
+Единая точка управления соединениями SQLite: WAL, PRAGMA,
+пул чтения и одно соединение на запись. Схема таблиц свечей
+(PRIMARY KEY (symbol, timestamp) WITHOUT ROWID) и её миграция.
+Узкое хранилище индикаторов indicators_<tf> с ленивым чтением колонок.
+Холодный уровень: закрытые месяцы свечей в Parquet.
+Кольцевые буферы последних свечей в разделяемой памяти.
+Удержание истории по allowed_history с возвратом места.
+Компактная раскладка свечей: id символов и цены в шагах инструмента.
+Индекс покрытия: непрерывные участки хранимых свечей.
+"""
+
+from .cold_tier import archive_closed_months, archive_month, read_cold_frame
+from .compact import migrate_to_compact, size_report
+from .connection import (
+    DEFAULT_DB_PATH,
+    apply_pragmas,
+    close_all,
+    enable_wal,
+    get_read_pool,
+    get_writer,
+    open_connection,
+    read_connection,
+    write_connection,
+)
+from .coverage import (
+    bulk_coverage,
+    coverage_stats,
+    ensure_coverage,
+    missing_ranges,
+    rebuild_coverage,
+)
+from .indicator_store import (
+    has_store,
+    load_indicator_frame,
+    migrate_to_store,
+    write_indicator_row,
+    write_store_values,
+)
+from .retention import prune_timeframe, reclaim_space
+from .ring_buffer import CandleRing, get_ring_reader, get_ring_writer, invalidate_ring
+from .schema import (
+    candle_table_ddl,
+    candle_upsert_sql,
+    is_clustered,
+    is_compact,
+    migrate_candle_table,
+    rebuild_candle_table,
+)
+
+__all__ = [
+    "CandleRing",
+    "DEFAULT_DB_PATH",
+    "apply_pragmas",
+    "archive_closed_months",
+    "archive_month",
+    "bulk_coverage",
+    "candle_table_ddl",
+    "candle_upsert_sql",
+    "close_all",
+    "coverage_stats",
+    "enable_wal",
+    "ensure_coverage",
+    "get_read_pool",
+    "get_ring_reader",
+    "get_ring_writer",
+    "get_writer",
+    "has_store",
+    "invalidate_ring",
+    "is_clustered",
+    "is_compact",
+    "load_indicator_frame",
+    "migrate_candle_table",
+    "migrate_to_compact",
+    "migrate_to_store",
+    "missing_ranges",
+    "open_connection",
+    "prune_timeframe",
+    "read_cold_frame",
+    "read_connection",
+    "reclaim_space",
+    "rebuild_candle_table",
+    "rebuild_coverage",
+    "size_report",
+    "write_connection",
+    "write_indicator_row",
+    "write_store_values",
+]
@@ -0,0 +1,342 @@
+"""
+cold_tier.py
+
+Холодный уровень хранения свечей: закрытые месяцы candles_<tf> в Parquet.
+
+Раскладка файлов (каталог рядом с БД или COLD_TIER_PATH):
+    cold/candles_<tf>/<SYMBOL>/<YYYY-MM>.parquet
+
+Файл — один закрытый месяц одного символа, строки отсортированы по timestamp,
+колонки: timestamp, OHLCV, timestamp_ns и все индикаторы (в узкой раскладке
+значения indicators_<tf> разворачиваются в колонки). Учёт файлов — таблица
+cold_tier_catalog в той же БД.
+
+- archive_month: месяц из SQLite → Parquet, затем строки свечей и индикаторов
+  удаляются одной транзакцией (файл пишется до транзакции через rename,
+  так что сбой оставляет данные в SQLite)
+- read_cold_frame: колоночное чтение нужных колонок диапазона, файлы
+  открываются через memory map
+- load_indicator_frame (indicator_store.py) склеивает холодный и горячий
+  уровни прозрачно для вызывающего кода; при пересечении приоритет у SQLite
+
+Архивный месяц считается неизменяемым: пересчёт индикаторов в нём
+в SQLite ничего не обновляет. Поэтому archive_closed_months не переносит
+месяц, пока в журнале dirty_ranges есть диапазон, начинающийся до его
+конца: пересчёт такого диапазона меняет индикаторы и после него.
+"""
+
+import os
+import sqlite3
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from backend.core.storage.coverage import bulk_coverage
+
+CATALOG_TABLE = "cold_tier_catalog"
+PARQUET_COMPRESSION = "zstd"
+
+# Сколько закрытых месяцев остаётся в SQLite (горячий уровень)
+DEFAULT_KEEP_MONTHS = int(os.getenv("COLD_TIER_KEEP_MONTHS", "2"))
+
+
+def cold_root(conn: sqlite3.Connection) -> Path:
+    """Каталог холодного уровня: COLD_TIER_PATH или db/cold рядом с файлом БД"""
+    env = os.getenv("COLD_TIER_PATH")
+    if env:
+        return Path(env).resolve()
+    row = conn.execute("PRAGMA database_list").fetchone()
+    return Path(row[2]).resolve().parent / "cold"
+
+
+def ensure_catalog(conn: sqlite3.Connection):
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {CATALOG_TABLE} (
+            table_name  TEXT    NOT NULL,
+            symbol      TEXT    NOT NULL,
+            month_start INTEGER NOT NULL,
+            month_end   INTEGER NOT NULL,
+            min_ts      INTEGER NOT NULL,
+            max_ts      INTEGER NOT NULL,
+            rows        INTEGER NOT NULL,
+            path        TEXT    NOT NULL,
+            PRIMARY KEY (table_name, symbol, month_start)
+        ) WITHOUT ROWID
+        """
+    )
+
+
+def has_cold(conn: sqlite3.Connection, table: str, symbol: Optional[str] = None) -> bool:
+    if not conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name = ?",
+        (CATALOG_TABLE,),
+    ).fetchone():
+        return False
+    sql = f"SELECT 1 FROM {CATALOG_TABLE} WHERE table_name = ?"
+    params: list = [table]
+    if symbol is not None:
+        sql += " AND symbol = ?"
+        params.append(symbol)
+    return conn.execute(sql + " LIMIT 1", params).fetchone() is not None
+
+
+def month_bounds(ts: int) -> Tuple[int, int]:
+    """[начало месяца, начало следующего) в UTC для timestamp ts"""
+    dt = datetime.fromtimestamp(int(ts), tz=timezone.utc)
+    start = datetime(dt.year, dt.month, 1, tzinfo=timezone.utc)
+    if dt.month == 12:
+        end = datetime(dt.year + 1, 1, 1, tzinfo=timezone.utc)
+    else:
+        end = datetime(dt.year, dt.month + 1, 1, tzinfo=timezone.utc)
+    return int(start.timestamp()), int(end.timestamp())
+
+
+def cold_cutoff(now_ts: int, keep_months: int = DEFAULT_KEEP_MONTHS) -> int:
+    """Граница архивации: месяцы, закончившиеся до неё, уходят в Parquet"""
+    start, _ = month_bounds(now_ts)
+    for _ in range(max(0, keep_months)):
+        start, _ = month_bounds(start - 1)
+    return start
+
+
+def _file_path(table: str, symbol: str, month_start: int) -> str:
+    month = datetime.fromtimestamp(month_start, tz=timezone.utc).strftime("%Y-%m")
+    return f"{table}/{symbol}/{month}.parquet"
+
+
+def cold_months(
+    conn: sqlite3.Connection,
+    table: str,
+    symbol: str,
+    start_ts: Optional[int] = None,
+    end_ts: Optional[int] = None,
+) -> List[Tuple[int, int, int, int, str]]:
+    """Архивные месяцы, пересекающие диапазон: (month_start, min_ts, max_ts, rows, path)"""
+    if not has_cold(conn, table, symbol):
+        return []
+    sql = (
+        f"SELECT month_start, min_ts, max_ts, rows, path FROM {CATALOG_TABLE} "
+        "WHERE table_name = ? AND symbol = ?"
+    )
+    params: list = [table, symbol]
+    if start_ts is not None:
+        sql += " AND max_ts >= ?"
+        params.append(int(start_ts))
+    if end_ts is not None:
+        sql += " AND min_ts <= ?"
+        params.append(int(end_ts))
+    return conn.execute(sql + " ORDER BY month_start", params).fetchall()
+
+
+def cold_bounds(
+    conn: sqlite3.Connection, table: str, symbol: str
+) -> Tuple[Optional[int], Optional[int], int]:
+    """(MIN(timestamp), MAX(timestamp), число строк) холодного уровня символа"""
+    if not has_cold(conn, table, symbol):
+        return None, None, 0
+    row = conn.execute(
+        f"SELECT MIN(min_ts), MAX(max_ts), COALESCE(SUM(rows), 0) FROM {CATALOG_TABLE} "
+        "WHERE table_name = ? AND symbol = ?",
+        (table, symbol),
+    ).fetchone()
+    return row[0], row[1], int(row[2])
+
+
+def read_cold_frame(
+    conn: sqlite3.Connection,
+    table: str,
+    symbol: str,
+    columns: Sequence[str],
+    start_ts: Optional[int] = None,
+    end_ts: Optional[int] = None,
+) -> Optional[pd.DataFrame]:
+    """
+    Строки холодного уровня в диапазоне, отсортированные по timestamp.
+
+    Читаются только нужные колонки (колонки, которых нет в файле, — NaN).
+    None — если архивных месяцев в диапазоне нет.
+    """
+    months = cold_months(conn, table, symbol, start_ts, end_ts)
+    if not months:
+        return None
+
+    root = cold_root(conn)
+    wanted = ["timestamp", *[col for col in columns if col != "timestamp"]]
+    filters = []
+    if start_ts is not None:
+        filters.append(("timestamp", ">=", int(start_ts)))
+    if end_ts is not None:
+        filters.append(("timestamp", "<=", int(end_ts)))
+
+    parts = []
+    for _, _, _, _, path in months:
+        file = root / path
+        names = set(pq.read_schema(file, memory_map=True).names)
+        part = pq.read_table(
+            file,
+            columns=[col for col in wanted if col in names],
+            filters=filters or None,
+            memory_map=True,
+        )
+        parts.append(part.to_pandas())
+
+    df = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+    for col in wanted:
+        if col not in df.columns:
+            df[col] = np.nan
+    return df[wanted]
+
+
+def archive_month(
+    conn: sqlite3.Connection,
+    timeframe: str,
+    symbol: str,
+    month_start: int,
+) -> int:
+    """
+    Переносит месяц символа из SQLite в Parquet.
+
+    Уже архивированный месяц сливается с новыми строками (например,
+    после дозагрузки истории) и перезаписывается. Возвращает число
+    строк в файле (0 — нечего переносить).
+    """
+    from backend.core.storage.indicator_store import (
+        catalog_columns,
+        has_store,
+        load_indicator_frame,
+        store_table,
+    )
+
+    table = f"candles_{timeframe}"
+    _, month_end = month_bounds(month_start)
+    last_ts = month_end - 1
+
+    hot_rows = conn.execute(
+        f"SELECT COUNT(*) FROM {table} WHERE symbol = ? AND timestamp >= ? AND timestamp <= ?",
+        (symbol, month_start, last_ts),
+    ).fetchone()[0]
+    if not hot_rows:
+        return 0
+
+    narrow = has_store(conn, timeframe)
+    table_cols = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+    base_cols = [col for col in table_cols if col not in ("symbol", "timestamp")]
+    if narrow:
+        indicator_cols = catalog_columns(conn)
+    else:
+        from backend.core.indicators.registry import spec_for_column
+
+        indicator_cols = [col for col in base_cols if spec_for_column(col) is not None]
+        base_cols = [col for col in base_cols if col not in indicator_cols]
+
+    # Склейка с ранее архивированным месяцем идёт внутри load_indicator_frame
+    df = load_indicator_frame(
+        conn, symbol, timeframe, base_cols, indicator_cols, month_start, last_ts
+    )
+    if df.empty:
+        return 0
+
+    ensure_catalog(conn)
+    rel_path = _file_path(table, symbol, month_start)
+    file = cold_root(conn) / rel_path
+    file.parent.mkdir(parents=True, exist_ok=True)
+    tmp = file.with_name(file.name + ".tmp")
+    pq.write_table(
+        pa.Table.from_pandas(df, preserve_index=False),
+        tmp,
+        compression=PARQUET_COMPRESSION,
+    )
+    os.replace(tmp, file)
+
+    with conn:
+        conn.execute(
+            f"INSERT OR REPLACE INTO {CATALOG_TABLE} "
+            "(table_name, symbol, month_start, month_end, min_ts, max_ts, rows, path) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                table,
+                symbol,
+                month_start,
+                month_end,
+                int(df["timestamp"].iloc[0]),
+                int(df["timestamp"].iloc[-1]),
+                len(df),
+                rel_path,
+            ),
+        )
+        # Свечи остаются хранимыми (в Parquet): индекс покрытия не меняется
+        with bulk_coverage(conn):
+            conn.execute(
+                f"DELETE FROM {table} WHERE symbol = ? AND timestamp >= ? AND timestamp <= ?",
+                (symbol, month_start, last_ts),
+            )
+        if narrow:
+            conn.execute(
+                f"DELETE FROM {store_table(timeframe)} "
+                "WHERE symbol = ? AND timestamp >= ? AND timestamp <= ?",
+                (symbol, month_start, last_ts),
+            )
+    return len(df)
+
+
+def archive_closed_months(
+    conn: sqlite3.Connection,
+    timeframe: str,
+    cutoff_ts: int,
+    symbols: Optional[Sequence[str]] = None,
+) -> Dict[str, int]:
+    """
+    Архивирует все месяцы, закончившиеся до cutoff_ts, от самого старого.
+
+    Архивация символа останавливается на первом месяце, до конца которого
+    начинается незакрытая запись журнала dirty_ranges: индикаторы этого
+    и следующих месяцев ещё будут пересчитаны. Возвращает {symbol: строк}.
+    """
+    table = f"candles_{timeframe}"
+    if symbols is None:
+        symbols = [
+            row[0] for row in conn.execute(f"SELECT DISTINCT symbol FROM {table}")
+        ]
+
+    has_journal = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name = 'dirty_ranges'"
+    ).fetchone()
+
+    result = {}
+    for symbol in symbols:
+        row = conn.execute(
+            f"SELECT MIN(timestamp) FROM {table} WHERE symbol = ? AND timestamp < ?",
+            (symbol, cutoff_ts),
+        ).fetchone()
+        if row[0] is None:
+            continue
+
+        moved = 0
+        month_start, month_end = month_bounds(row[0])
+        while month_end <= cutoff_ts:
+            # Пересчёт диапазона меняет индикаторы и после его конца (прогрев,
+            # рекуррента EMA), поэтому блокирует и все более поздние месяцы
+            pending = has_journal and conn.execute(
+                "SELECT 1 FROM dirty_ranges WHERE symbol = ? AND timeframe = ? "
+                "AND start_ts < ? LIMIT 1",
+                (symbol, timeframe, month_end),
+            ).fetchone()
+            if pending:
+                print(
+                    f"[cold_tier] ⏭ {table} {symbol} {_file_path(table, symbol, month_start)}: "
+                    "есть непересчитанные диапазоны, архивация остановлена"
+                )
+                break
+            moved += archive_month(conn, timeframe, symbol, month_start)
+            month_start, month_end = month_bounds(month_end)
+
+        if moved:
+            print(f"[cold_tier] 🧊 {table} {symbol}: в Parquet перенесено {moved} строк")
+        result[symbol] = moved
+    return result
@@ -0,0 +1,348 @@
+"""
+compact.py
+
+Компактная раскладка свечей.
+
+    symbols (id, name, price_scale, volume_scale)
+    candle_data_<tf> (symbol_id, timestamp, open, high, low, close, volume)
+        PRIMARY KEY (symbol_id, timestamp) WITHOUT ROWID
+    candles_<tf> — представление со старыми колонками:
+        symbol              ← symbols.name
+        timestamp_ms/_ns    ← вычисляются из timestamp, не хранятся
+        open ... volume     ← целые / scale, если для символа задан шаг цены
+
+- символ хранится один раз в symbols, в строке — короткий целый id
+- с price_scale цены хранятся целым числом шагов цены (tick size биржи):
+  varint 3–4 байта вместо 8 байт REAL; volume_scale — то же для объёма
+- INSTEAD OF триггеры представления принимают INSERT / UPDATE / DELETE
+  в старых колонках: timestamp_ms/_ns при вставке игнорируются, политика
+  OR IGNORE / OR REPLACE переходит на строку candle_data_<tf>.
+  UPSERT (ON CONFLICT DO UPDATE) представление не принимает —
+  см. schema.candle_upsert_sql()
+
+Раскладка требует узкого хранилища индикаторов (indicators_<tf>):
+в candle_data_<tf> нет колонок индикаторов. Шаг цены символа задаётся
+один раз: после него все таймфреймы символа кодируются одним масштабом.
+"""
+
+import sqlite3
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from backend.core.storage.indicator_store import has_store
+from backend.core.storage.schema import (
+    CANDLE_COLUMNS,
+    compact_data_table,
+    is_compact,
+)
+
+SYMBOLS_TABLE = "symbols"
+PRICE_COLUMNS = ["open", "high", "low", "close"]
+VALUE_COLUMNS = PRICE_COLUMNS + ["volume"]
+# Допуск проверки, что значение лежит на сетке шага
+GRID_TOLERANCE = 1e-6
+
+
+def ensure_symbols(conn: sqlite3.Connection):
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {SYMBOLS_TABLE} (
+            id           INTEGER PRIMARY KEY,
+            name         TEXT NOT NULL UNIQUE,
+            price_scale  INTEGER,
+            volume_scale INTEGER
+        )
+        """
+    )
+
+
+def scale_for_step(step: Optional[float]) -> Optional[int]:
+    """Масштаб для шага (0.1 → 10); None, если 1/step не целое"""
+    if not step or step <= 0:
+        return None
+    scale = round(1 / step)
+    if scale < 1 or abs(scale * step - 1) > 1e-9:
+        return None
+    return scale
+
+
+def _scale_of(column: str) -> str:
+    return "price_scale" if column in PRICE_COLUMNS else "volume_scale"
+
+
+def _decode(column: str) -> str:
+    return f"COALESCE(d.{column} * 1.0 / s.{_scale_of(column)}, d.{column})"
+
+
+def _encode(value: str, scale: str) -> str:
+    return f"COALESCE(CAST(ROUND({value} * {scale}) AS INTEGER), {value})"
+
+
+def _create_objects(conn: sqlite3.Connection, table: str):
+    """candle_data_<tf>, представление candles_<tf> и его триггеры"""
+    data = compact_data_table(table)
+    values = ", ".join(VALUE_COLUMNS)
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {data} (
+            symbol_id INTEGER NOT NULL,
+            timestamp INTEGER NOT NULL,
+            {", ".join(VALUE_COLUMNS)},
+            PRIMARY KEY (symbol_id, timestamp)
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE VIEW {table} AS
+        SELECT
+            s.name AS symbol,
+            d.timestamp AS timestamp,
+            d.timestamp * 1000 AS timestamp_ms,
+            d.timestamp * 1000000000 AS timestamp_ns,
+            {", ".join(f"{_decode(col)} AS {col}" for col in VALUE_COLUMNS)}
+        FROM {data} AS d JOIN {SYMBOLS_TABLE} AS s ON s.id = d.symbol_id
+        """
+    )
+    # Вставка: сначала id символа (без конфликта — политика внешнего
+    # INSERT OR ... не должна пересоздать строку symbols с новым id)
+    encoded_new = ", ".join(
+        _encode(f"NEW.{col}", f"s.{_scale_of(col)}") for col in VALUE_COLUMNS
+    )
+    conn.execute(
+        f"""
+        CREATE TRIGGER {table}_ins INSTEAD OF INSERT ON {table}
+        BEGIN
+            INSERT INTO {SYMBOLS_TABLE} (name)
+            SELECT NEW.symbol WHERE NOT EXISTS (
+                SELECT 1 FROM {SYMBOLS_TABLE} WHERE name = NEW.symbol
+            );
+            INSERT INTO {data} (symbol_id, timestamp, {values})
+            SELECT s.id, NEW.timestamp, {encoded_new}
+            FROM {SYMBOLS_TABLE} AS s WHERE s.name = NEW.symbol;
+        END
+        """
+    )
+    old_id = f"(SELECT id FROM {SYMBOLS_TABLE} WHERE name = OLD.symbol)"
+    set_clause = ", ".join(
+        f"{col} = "
+        + _encode(
+            f"NEW.{col}",
+            f"(SELECT {_scale_of(col)} FROM {SYMBOLS_TABLE} WHERE name = OLD.symbol)",
+        )
+        for col in VALUE_COLUMNS
+    )
+    conn.execute(
+        f"""
+        CREATE TRIGGER {table}_upd INSTEAD OF UPDATE ON {table}
+        BEGIN
+            UPDATE {data} SET timestamp = NEW.timestamp, {set_clause}
+            WHERE symbol_id = {old_id} AND timestamp = OLD.timestamp;
+        END
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TRIGGER {table}_del INSTEAD OF DELETE ON {table}
+        BEGIN
+            DELETE FROM {data} WHERE symbol_id = {old_id} AND timestamp = OLD.timestamp;
+        END
+        """
+    )
+
+
+def _symbol_in_compact_tables(conn: sqlite3.Connection, symbol_id: int) -> bool:
+    tables = [
+        row[0]
+        for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'candle\\_data\\_%' ESCAPE '\\'"
+        )
+    ]
+    return any(
+        conn.execute(
+            f"SELECT 1 FROM {table} WHERE symbol_id = ? LIMIT 1", (symbol_id,)
+        ).fetchone()
+        for table in tables
+    )
+
+
+def _fits_scale(
+    conn: sqlite3.Connection, table: str, symbol: str, columns: Sequence[str], scale: int
+) -> bool:
+    """Все значения колонок символа лежат на сетке 1/scale"""
+    off_grid = " OR ".join(
+        f"ABS({col} * {scale} - ROUND({col} * {scale})) > {GRID_TOLERANCE}"
+        for col in columns
+    )
+    return (
+        conn.execute(
+            f"SELECT 1 FROM {table} WHERE symbol = ? AND ({off_grid}) LIMIT 1", (symbol,)
+        ).fetchone()
+        is None
+    )
+
+
+def _apply_scales(
+    conn: sqlite3.Connection,
+    table: str,
+    steps: Dict[str, Tuple[Optional[float], Optional[float]]],
+) -> bool:
+    """
+    Задаёт масштабы символов и проверяет, что данные таблицы на них ложатся.
+
+    Returns:
+        False, если уже заданный масштаб символа не подходит к данным таблицы
+        (кодирование было бы с потерями)
+    """
+    for symbol, symbol_id, price_scale, volume_scale in conn.execute(
+        f"SELECT name, id, price_scale, volume_scale FROM {SYMBOLS_TABLE} "
+        f"WHERE name IN (SELECT DISTINCT symbol FROM {table})"
+    ).fetchall():
+        for kind, columns, current, step in (
+            ("price_scale", PRICE_COLUMNS, price_scale, steps.get(symbol, (None, None))[0]),
+            ("volume_scale", ["volume"], volume_scale, steps.get(symbol, (None, None))[1]),
+        ):
+            if current is not None:
+                if not _fits_scale(conn, table, symbol, columns, current):
+                    print(f"[compact] ❌ {table} {symbol}: данные не ложатся на {kind}={current}")
+                    return False
+                continue
+            scale = scale_for_step(step)
+            if scale is None:
+                continue
+            if _symbol_in_compact_tables(conn, symbol_id):
+                print(
+                    f"[compact] ⏭ {symbol}: {kind} не задан до первой компактной таблицы, "
+                    "значения хранятся как REAL"
+                )
+                continue
+            if not _fits_scale(conn, table, symbol, columns, scale):
+                print(f"[compact] ⏭ {table} {symbol}: значения не на сетке шага {step}, REAL")
+                continue
+            conn.execute(
+                f"UPDATE {SYMBOLS_TABLE} SET {kind} = ? WHERE id = ?", (scale, symbol_id)
+            )
+            print(f"[compact] 🔢 {symbol}: {kind} = {scale} (шаг {step})")
+    return True
+
+
+def migrate_to_compact(
+    conn: sqlite3.Connection,
+    timeframe: str,
+    steps: Optional[Dict[str, Tuple[Optional[float], Optional[float]]]] = None,
+) -> int:
+    """
+    Переводит candles_<tf> в компактную раскладку одной транзакцией.
+
+    Args:
+        conn: соединение на запись
+        timeframe: таймфрейм
+        steps: {symbol: (шаг цены, шаг объёма)} для хранения целыми;
+            None / шаг None — значения остаются REAL
+
+    Returns:
+        int: строк в candle_data_<tf> (-1, если миграция не выполнена)
+    """
+    table = f"candles_{timeframe}"
+    if is_compact(conn, table):
+        print(f"[compact] ✅ {table} уже в компактной раскладке")
+        return -1
+    if not has_store(conn, timeframe):
+        print(f"[compact] ⏭ {table}: индикаторы ещё в колонках, сначала indicators_{timeframe}")
+        return -1
+    known = {name for name, _ in CANDLE_COLUMNS}
+    extra = [row[1] for row in conn.execute(f"PRAGMA table_info({table})") if row[1] not in known]
+    if extra:
+        print(f"[compact] ⏭ {table}: лишние колонки {extra}")
+        return -1
+
+    data = compact_data_table(table)
+    values = ", ".join(VALUE_COLUMNS)
+    encoded = ", ".join(_encode(f"t.{col}", f"s.{_scale_of(col)}") for col in VALUE_COLUMNS)
+    started = time.perf_counter()
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        ensure_symbols(conn)
+        conn.execute(
+            f"INSERT OR IGNORE INTO {SYMBOLS_TABLE} (name) "
+            f"SELECT DISTINCT symbol FROM {table} WHERE symbol IS NOT NULL ORDER BY symbol"
+        )
+        if not _apply_scales(conn, table, steps or {}):
+            conn.rollback()
+            return -1
+
+        conn.execute(f"DROP TABLE IF EXISTS {data}")
+        conn.execute("PRAGMA legacy_alter_table=ON")
+        conn.execute(f"ALTER TABLE {table} RENAME TO {table}_legacy")
+        _create_objects(conn, table)
+        conn.execute(
+            f"""
+            INSERT OR REPLACE INTO {data} (symbol_id, timestamp, {values})
+            SELECT s.id, t.timestamp, {encoded}
+            FROM {table}_legacy AS t JOIN {SYMBOLS_TABLE} AS s ON s.name = t.symbol
+            WHERE t.timestamp IS NOT NULL
+            ORDER BY s.id, t.timestamp
+            """
+        )
+        conn.execute(f"DROP TABLE {table}_legacy")
+        conn.execute("PRAGMA legacy_alter_table=OFF")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        conn.execute("PRAGMA legacy_alter_table=OFF")
+        raise
+
+    total = conn.execute(f"SELECT COUNT(*) FROM {data}").fetchone()[0]
+    print(
+        f"[compact] ✅ {table}: {total} строк в {data} за {time.perf_counter() - started:.2f} с"
+    )
+    return total
+
+
+def table_symbols(conn: sqlite3.Connection, table: str) -> List[str]:
+    """Символы таблицы свечей (для компактной — по symbols, без прохода по строкам)"""
+    if is_compact(conn, table):
+        sql = f"""
+            SELECT s.name FROM {SYMBOLS_TABLE} s
+            WHERE EXISTS (
+                SELECT 1 FROM {compact_data_table(table)} d WHERE d.symbol_id = s.id
+            )
+            ORDER BY s.name
+        """
+    else:
+        sql = f"SELECT DISTINCT symbol FROM {table} ORDER BY symbol"
+    return [row[0] for row in conn.execute(sql)]
+
+
+def storage_bytes(conn: sqlite3.Connection, table: str) -> Optional[int]:
+    """Байт страниц таблицы и её индексов (dbstat); None, если dbstat недоступен"""
+    name = compact_data_table(table) if is_compact(conn, table) else table
+    try:
+        row = conn.execute(
+            "SELECT SUM(pgsize) FROM dbstat WHERE name IN "
+            "(SELECT name FROM sqlite_master WHERE tbl_name = ?)",
+            (name,),
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] or 0
+
+
+def size_report(conn: sqlite3.Connection, table: str) -> Dict[str, float]:
+    """Размер, байт на строку и время полного прохода по close для таблицы свечей"""
+    rows = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    size = storage_bytes(conn, table)
+    started = time.perf_counter()
+    for symbol in table_symbols(conn, table):
+        conn.execute(
+            f"SELECT SUM(close), MAX(timestamp_ns) FROM {table} WHERE symbol = ?", (symbol,)
+        ).fetchone()
+    scan = time.perf_counter() - started
+    return {
+        "rows": rows,
+        "bytes": size,
+        "bytes_per_row": (size / rows) if size is not None and rows else None,
+        "scan_ms": scan * 1000,
+        "ns_per_row": (scan * 1e9 / rows) if rows else None,
+    }
@@ -0,0 +1,222 @@
+"""
+connection.py
+
+Единое управление соединениями SQLite.
+
+- БД переводится в WAL: читатели не блокируются записью и наоборот
+  (график не ждёт, пока пишется EMA)
+- каждое соединение настраивается PRAGMA (synchronous, cache_size, mmap_size,
+  temp_store, busy_timeout)
+- ReadPool — пул соединений на чтение для потоков FastAPI
+  (query_only, соединение выдаётся одному потоку за раз)
+- Writer — одно долгоживущее соединение на запись для загрузчиков,
+  доступ сериализуется блокировкой
+
+Пулы и писатели создаются лениво, по одному на файл БД в процессе.
+
+Использование:
+    from backend.core.storage import read_connection, write_connection
+
+    with read_connection(DB_PATH) as conn:
+        rows = conn.execute("SELECT ...").fetchall()
+
+    with write_connection(DB_PATH) as conn:
+        conn.execute("INSERT ...")   # commit при выходе, rollback при ошибке
+"""
+
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+PROJECT_ROOT = Path(__file__).resolve().parents[3]
+DEFAULT_DB_PATH = Path(
+    os.getenv("DB_PATH", PROJECT_ROOT / "db" / "market_data.sqlite")
+).resolve()
+
+BUSY_TIMEOUT_MS = 30_000
+READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "8"))
+
+# PRAGMA соединения (journal_mode хранится в файле БД, ставится отдельно)
+PRAGMAS = {
+    "synchronous": "NORMAL",  # в WAL безопасно, fsync только на checkpoint
+    "cache_size": -65536,  # 64 МБ страничного кэша на соединение
+    "mmap_size": 268435456,  # 256 МБ memory-mapped I/O
+    "temp_store": "MEMORY",
+    "busy_timeout": BUSY_TIMEOUT_MS,
+}
+
+
+def _resolve(db_path) -> str:
+    return str(Path(db_path or DEFAULT_DB_PATH).resolve())
+
+
+def apply_pragmas(conn: sqlite3.Connection, read_only: bool = False):
+    """Настраивает соединение"""
+    for name, value in PRAGMAS.items():
+        conn.execute(f"PRAGMA {name}={value}")
+    if read_only:
+        conn.execute("PRAGMA query_only=ON")
+
+
+def enable_wal(conn: sqlite3.Connection) -> str:
+    """
+    Переводит БД в WAL (режим сохраняется в файле).
+
+    Новая (пустая) БД сразу получает auto_vacuum=INCREMENTAL, чтобы место
+    после удаления старой истории возвращалось без полного VACUUM
+    (retention.py).
+
+    Returns:
+        str: текущий journal_mode
+    """
+    if conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0] == 0:
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    try:
+        return conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+    except sqlite3.OperationalError as e:
+        # БД занята другим процессом — режим поставит следующее соединение
+        print(f"[storage] ⚠️ Не удалось включить WAL: {e}")
+        return ""
+
+
+def open_connection(db_path=None, read_only: bool = False) -> sqlite3.Connection:
+    """Открывает настроенное соединение (вне пула)"""
+    path = _resolve(db_path)
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(
+        path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False
+    )
+    apply_pragmas(conn, read_only=read_only)
+    return conn
+
+
+class ReadPool:
+    """Пул соединений на чтение"""
+
+    def __init__(self, db_path=None, size: int = READ_POOL_SIZE):
+        self.db_path = _resolve(db_path)
+        self.size = size
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return open_connection(self.db_path, read_only=True)
+        # Пул исчерпан — ждём освободившееся соединение
+        return self._idle.get()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            # Читатель не должен держать снапшот WAL после возврата в пул
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class Writer:
+    """Единственное соединение на запись"""
+
+    def __init__(self, db_path=None):
+        self.db_path = _resolve(db_path)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Соединение под блокировкой: commit при выходе, rollback при ошибке"""
+        with self._lock:
+            if self._conn is None:
+                self._conn = open_connection(self.db_path)
+                enable_wal(self._conn)
+            try:
+                yield self._conn
+            except BaseException:
+                if self._conn.in_transaction:
+                    self._conn.rollback()
+                raise
+            else:
+                if self._conn.in_transaction:
+                    self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_read_pools: Dict[str, ReadPool] = {}
+_writers: Dict[str, Writer] = {}
+_registry_lock = threading.Lock()
+
+
+def get_read_pool(db_path=None) -> ReadPool:
+    """Пул чтения для файла БД (создаётся при первом обращении)"""
+    path = _resolve(db_path)
+    with _registry_lock:
+        if path not in _read_pools:
+            # WAL ставится до первого чтения, даже если писатель в другом процессе
+            if Path(path).exists():
+                conn = open_connection(path)
+                enable_wal(conn)
+                conn.close()
+            _read_pools[path] = ReadPool(path)
+        return _read_pools[path]
+
+
+def get_writer(db_path=None) -> Writer:
+    """Писатель для файла БД (создаётся при первом обращении)"""
+    path = _resolve(db_path)
+    with _registry_lock:
+        if path not in _writers:
+            _writers[path] = Writer(path)
+        return _writers[path]
+
+
+@contextmanager
+def read_connection(db_path=None) -> Iterator[sqlite3.Connection]:
+    """Соединение из пула чтения"""
+    with get_read_pool(db_path).connection() as conn:
+        yield conn
+
+
+@contextmanager
+def write_connection(db_path=None) -> Iterator[sqlite3.Connection]:
+    """Соединение писателя"""
+    with get_writer(db_path).connection() as conn:
+        yield conn
+
+
+@atexit.register
+def close_all():
+    """Закрывает все соединения процесса"""
+    with _registry_lock:
+        for pool in _read_pools.values():
+            pool.close()
+        for writer in _writers.values():
+            writer.close()
+        _read_pools.clear()
+        _writers.clear()
@@ -0,0 +1,552 @@
+"""
+coverage.py
+
+Индекс покрытия: непрерывные участки хранимых свечей по (symbol, timeframe).
+
+candle_coverage (symbol, timeframe, start_ts, end_ts) — участок, в котором
+есть все свечи start_ts, start_ts + интервал, ..., end_ts. Участки одного
+символа не пересекаются и не соприкасаются (соседние сливаются).
+Архивные месяцы Parquet (cold_tier.py) — тоже хранимые свечи.
+
+Индекс обновляется в той же транзакции, что и свечи:
+- триггеры AFTER INSERT / DELETE / UPDATE OF symbol, timestamp на таблице
+  свечей (для компактной раскладки — на candle_data_<tf>) — любой путь
+  записи, включая разовые инструменты
+- массовые пути (дозагрузка истории, удержание, архивация) отключают
+  триггеры внутри своей транзакции (bulk_coverage) и правят индекс
+  диапазонами: cover_timestamps / uncover_range. Флаг отключения живёт
+  только внутри транзакции и другим писателям не виден
+- архивация месяца (cold_tier.py) покрытие не меняет; удаление строки
+  внутри архивного месяца покрытие не снимает (строка — копия Parquet)
+- полная очистка таблицы — drop_coverage, затем построение заново
+
+Индекс готов, если триггеры стоят на текущей таблице (coverage_ready).
+Пересоздание таблицы (миграции схемы, компактная раскладка) снимает
+триггеры — ensure_coverage тогда строит индекс заново по данным.
+
+Запросы — поиск по ключу и проход только по участкам окна:
+- missing_ranges: чего нет между A и B
+- coverage_stats: первая/последняя свеча, число свечей, покрытие в %
+- coverage_runs: участки в окне
+"""
+
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from backend.config.timeframes_config import TIMEFRAMES_CONFIG
+from backend.core.storage.schema import compact_data_table, is_compact
+
+COVERAGE_TABLE = "candle_coverage"
+BYPASS_TABLE = "candle_coverage_bypass"
+TRIGGER_SUFFIXES = ("cov_ins", "cov_del", "cov_upd")
+
+
+def ensure_coverage_tables(conn: sqlite3.Connection):
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {COVERAGE_TABLE} (
+            symbol    TEXT    NOT NULL,
+            timeframe TEXT    NOT NULL,
+            start_ts  INTEGER NOT NULL,
+            end_ts    INTEGER NOT NULL,
+            PRIMARY KEY (symbol, timeframe, start_ts)
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {BYPASS_TABLE} (flag INTEGER)")
+
+
+def _step(timeframe: str) -> int:
+    return TIMEFRAMES_CONFIG[timeframe]["interval_sec"]
+
+
+def _physical(conn: sqlite3.Connection, timeframe: str) -> Tuple[str, str, str]:
+    """(таблица с триггерами, колонка символа, выражение символа по колонке)"""
+    table = f"candles_{timeframe}"
+    if is_compact(conn, table):
+        from backend.core.storage.compact import SYMBOLS_TABLE
+
+        return (
+            compact_data_table(table),
+            "symbol_id",
+            f"(SELECT name FROM {SYMBOLS_TABLE} WHERE id = {{row}}.symbol_id)",
+        )
+    return table, "symbol", "{row}.symbol"
+
+
+def _trigger_names(physical: str) -> List[str]:
+    return [f"{physical}_{suffix}" for suffix in TRIGGER_SUFFIXES]
+
+
+def _add_sql(symbol: str, timeframe: str, ts: str, step: int) -> str:
+    """Добавляет свечу ts: слияние с соседними участками (ничего, если уже покрыта)"""
+    key = f"symbol = {symbol} AND timeframe = '{timeframe}'"
+    run = f"(SELECT MAX(start_ts) FROM {COVERAGE_TABLE} WHERE {key} AND start_ts <= {ts})"
+    return f"""
+        INSERT INTO {COVERAGE_TABLE} (symbol, timeframe, start_ts, end_ts)
+        SELECT {symbol}, '{timeframe}',
+            COALESCE((SELECT start_ts FROM {COVERAGE_TABLE}
+                      WHERE {key} AND start_ts = {run} AND end_ts = {ts} - {step}), {ts}),
+            COALESCE((SELECT end_ts FROM {COVERAGE_TABLE}
+                      WHERE {key} AND start_ts = {ts} + {step}), {ts})
+        WHERE NOT EXISTS (
+            SELECT 1 FROM {COVERAGE_TABLE} WHERE {key} AND start_ts = {run} AND end_ts >= {ts}
+        )
+        ON CONFLICT (symbol, timeframe, start_ts) DO UPDATE SET end_ts = excluded.end_ts;
+        DELETE FROM {COVERAGE_TABLE} WHERE {key} AND start_ts = {ts} + {step};
+    """
+
+
+def _remove_sql(symbol: str, timeframe: str, ts: str, step: int, archived: str) -> str:
+    """Убирает свечу ts: участок укорачивается или делится на два"""
+    key = f"symbol = {symbol} AND timeframe = '{timeframe}'"
+    run = f"(SELECT MAX(start_ts) FROM {COVERAGE_TABLE} WHERE {key} AND start_ts <= {ts})"
+    return f"""
+        INSERT INTO {COVERAGE_TABLE} (symbol, timeframe, start_ts, end_ts)
+        SELECT symbol, timeframe, {ts} + {step}, end_ts FROM {COVERAGE_TABLE}
+        WHERE {key} AND start_ts = {run} AND end_ts > {ts} AND NOT {archived};
+        UPDATE {COVERAGE_TABLE} SET end_ts = {ts} - {step}
+        WHERE {key} AND start_ts = {run} AND start_ts < {ts} AND end_ts >= {ts}
+          AND NOT {archived};
+        DELETE FROM {COVERAGE_TABLE} WHERE {key} AND start_ts = {ts} AND NOT {archived};
+    """
+
+
+def _archived_sql(table: str, symbol: str, ts: str) -> str:
+    """
+    Свеча ts внутри архивного месяца символа: строка SQLite — копия
+    из Parquet (дозагрузка до повторной архивации), покрытие остаётся.
+    Триггер видит только границы месяца из каталога, не сам файл.
+    """
+    from backend.core.storage.cold_tier import CATALOG_TABLE
+
+    return f"""EXISTS (
+            SELECT 1 FROM {CATALOG_TABLE}
+            WHERE table_name = '{table}' AND symbol = {symbol}
+              AND month_start <= {ts} AND month_end > {ts}
+              AND min_ts <= {ts} AND max_ts >= {ts}
+        )"""
+
+
+def _create_triggers(conn: sqlite3.Connection, timeframe: str):
+    physical, symbol_col, symbol_expr = _physical(conn, timeframe)
+    step = _step(timeframe)
+    new_symbol = symbol_expr.format(row="NEW")
+    old_symbol = symbol_expr.format(row="OLD")
+    enabled = f"NOT EXISTS (SELECT 1 FROM {BYPASS_TABLE})"
+    ins, delete, upd = _trigger_names(physical)
+    table = f"candles_{timeframe}"
+    old_archived = _archived_sql(table, old_symbol, "OLD.timestamp")
+
+    conn.execute(
+        f"""
+        CREATE TRIGGER {ins} AFTER INSERT ON {physical}
+        WHEN {enabled}
+        BEGIN
+            {_add_sql(new_symbol, timeframe, "NEW.timestamp", step)}
+        END
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TRIGGER {delete} AFTER DELETE ON {physical}
+        WHEN {enabled}
+        BEGIN
+            {_remove_sql(old_symbol, timeframe, "OLD.timestamp", step, old_archived)}
+        END
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TRIGGER {upd} AFTER UPDATE OF {symbol_col}, timestamp ON {physical}
+        WHEN {enabled} AND (
+            OLD.{symbol_col} IS NOT NEW.{symbol_col} OR OLD.timestamp IS NOT NEW.timestamp
+        )
+        BEGIN
+            {_remove_sql(old_symbol, timeframe, "OLD.timestamp", step, old_archived)}
+            {_add_sql(new_symbol, timeframe, "NEW.timestamp", step)}
+        END
+        """
+    )
+
+
+def coverage_ready(conn: sqlite3.Connection, timeframe: str) -> bool:
+    """Индекс таймфрейма построен и поддерживается триггерами текущей таблицы"""
+    physical, _, _ = _physical(conn, timeframe)
+    names = _trigger_names(physical)
+    count = conn.execute(
+        f"SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND tbl_name = ? "
+        f"AND name IN ({', '.join('?' * len(names))})",
+        (physical, *names),
+    ).fetchone()[0]
+    return count == len(names)
+
+
+def _table_exists(conn: sqlite3.Connection, table: str) -> bool:
+    return (
+        conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = ?",
+            (table,),
+        ).fetchone()
+        is not None
+    )
+
+
+def rebuild_coverage(conn: sqlite3.Connection, timeframe: str) -> int:
+    """
+    Строит индекс таймфрейма по данным (SQLite и Parquet) и ставит триггеры.
+
+    Одна транзакция BEGIN IMMEDIATE: писатели ждут, изменений между
+    построением и установкой триггеров нет.
+
+    Returns:
+        int: число участков (-1, если таблицы нет)
+    """
+    from backend.core.data.gaps import gap_symbols, iter_gaps
+    from backend.core.storage.cold_tier import cold_bounds, ensure_catalog
+
+    table = f"candles_{timeframe}"
+    if not _table_exists(conn, table):
+        return -1
+
+    step = _step(timeframe)
+    started = time.perf_counter()
+    ensure_coverage_tables(conn)
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        physical, _, _ = _physical(conn, timeframe)
+        for name in _trigger_names(physical):
+            conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        conn.execute(f"DELETE FROM {COVERAGE_TABLE} WHERE timeframe = ?", (timeframe,))
+
+        total = 0
+        for symbol in gap_symbols(conn, table):
+            first, last = conn.execute(
+                f"SELECT MIN(timestamp), MAX(timestamp) FROM {table} WHERE symbol = ?",
+                (symbol,),
+            ).fetchone()
+            cold_first, cold_last, _ = cold_bounds(conn, table, symbol)
+            first = min(ts for ts in (first, cold_first) if ts is not None)
+            last = max(ts for ts in (last, cold_last) if ts is not None)
+
+            runs, current = [], first
+            for _, gap_start, gap_end in iter_gaps(conn, table, step, symbol):
+                runs.append((symbol, timeframe, current, gap_start - step))
+                current = gap_end + step
+            runs.append((symbol, timeframe, current, last))
+            conn.executemany(
+                f"INSERT INTO {COVERAGE_TABLE} (symbol, timeframe, start_ts, end_ts) "
+                "VALUES (?, ?, ?, ?)",
+                runs,
+            )
+            total += len(runs)
+
+        ensure_catalog(conn)
+        _create_triggers(conn, timeframe)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+    print(
+        f"[coverage] ✅ {table}: {total} непрерывных участков "
+        f"за {time.perf_counter() - started:.2f} с"
+    )
+    return total
+
+
+def ensure_coverage(conn: sqlite3.Connection, timeframe: str) -> bool:
+    """Строит индекс, если он не готов. Returns: True если индекс доступен"""
+    if coverage_ready(conn, timeframe):
+        return True
+    return rebuild_coverage(conn, timeframe) >= 0
+
+
+@contextmanager
+def bulk_coverage(conn: sqlite3.Connection) -> Iterator[None]:
+    """
+    Отключает триггеры индекса внутри текущей транзакции.
+
+    Вызывающий код сам правит индекс (cover_timestamps / uncover_range)
+    до commit. Флаг снимается до выхода из блока, поэтому другие
+    соединения его не видят.
+    """
+    ensure_coverage_tables(conn)
+    if not conn.in_transaction:
+        conn.execute("BEGIN")
+    conn.execute(f"INSERT INTO {BYPASS_TABLE} (flag) VALUES (1)")
+    try:
+        yield
+    finally:
+        conn.execute(f"DELETE FROM {BYPASS_TABLE}")
+
+
+def cover_range(
+    conn: sqlite3.Connection, symbol: str, timeframe: str, start_ts: int, end_ts: int
+):
+    """Отмечает свечи [start_ts, end_ts] как хранимые (слияние с соседями)"""
+    step = _step(timeframe)
+    lower = conn.execute(
+        f"SELECT MAX(start_ts) FROM {COVERAGE_TABLE} "
+        "WHERE symbol = ? AND timeframe = ? AND start_ts <= ?",
+        (symbol, timeframe, start_ts),
+    ).fetchone()[0]
+    runs = conn.execute(
+        f"SELECT start_ts, end_ts FROM {COVERAGE_TABLE} "
+        "WHERE symbol = ? AND timeframe = ? AND start_ts >= ? AND start_ts <= ? "
+        "AND end_ts >= ?",
+        (
+            symbol,
+            timeframe,
+            lower if lower is not None else start_ts,
+            end_ts + step,
+            start_ts - step,
+        ),
+    ).fetchall()
+    new_start = min([start_ts, *(run[0] for run in runs)])
+    new_end = max([end_ts, *(run[1] for run in runs)])
+    conn.executemany(
+        f"DELETE FROM {COVERAGE_TABLE} WHERE symbol = ? AND timeframe = ? AND start_ts = ?",
+        [(symbol, timeframe, run[0]) for run in runs],
+    )
+    conn.execute(
+        f"INSERT INTO {COVERAGE_TABLE} (symbol, timeframe, start_ts, end_ts) "
+        "VALUES (?, ?, ?, ?)",
+        (symbol, timeframe, new_start, new_end),
+    )
+
+
+def cover_timestamps(
+    conn: sqlite3.Connection, symbol: str, timeframe: str, timestamps: Iterable[int]
+):
+    """Отмечает вставленные свечи: по одному cover_range на непрерывный участок"""
+    if not coverage_ready(conn, timeframe):
+        return
+    ts = np.unique(np.fromiter(timestamps, dtype=np.int64))
+    if not len(ts):
+        return
+    breaks = np.flatnonzero(np.diff(ts) != _step(timeframe))
+    starts = np.concatenate(([0], breaks + 1))
+    ends = np.concatenate((breaks, [len(ts) - 1]))
+    for first, last in zip(starts, ends):
+        cover_range(conn, symbol, timeframe, int(ts[first]), int(ts[last]))
+
+
+def uncover_range(
+    conn: sqlite3.Connection,
+    symbol: str,
+    timeframe: str,
+    start_ts: Optional[int],
+    end_ts: Optional[int],
+):
+    """
+    Снимает покрытие с [start_ts, end_ts] (None — без границы).
+
+    Свечи архивных месяцев в диапазоне остаются покрытыми.
+    """
+    if not coverage_ready(conn, timeframe):
+        return
+    step = _step(timeframe)
+    where = ["symbol = ?", "timeframe = ?"]
+    params: list = [symbol, timeframe]
+    if start_ts is not None:
+        lower = conn.execute(
+            f"SELECT MAX(start_ts) FROM {COVERAGE_TABLE} "
+            "WHERE symbol = ? AND timeframe = ? AND start_ts <= ?",
+            (symbol, timeframe, start_ts),
+        ).fetchone()[0]
+        where += ["start_ts >= ?", "end_ts >= ?"]
+        params += [lower if lower is not None else start_ts, start_ts]
+    if end_ts is not None:
+        where.append("start_ts <= ?")
+        params.append(end_ts)
+
+    runs = conn.execute(
+        f"SELECT start_ts, end_ts FROM {COVERAGE_TABLE} WHERE {' AND '.join(where)}",
+        params,
+    ).fetchall()
+    for run_start, run_end in runs:
+        conn.execute(
+            f"DELETE FROM {COVERAGE_TABLE} WHERE symbol = ? AND timeframe = ? AND start_ts = ?",
+            (symbol, timeframe, run_start),
+        )
+        # Остатки участка — по сетке свечей участка
+        if start_ts is not None and run_start < start_ts:
+            left_end = run_start + (start_ts - 1 - run_start) // step * step
+            conn.execute(
+                f"INSERT INTO {COVERAGE_TABLE} (symbol, timeframe, start_ts, end_ts) "
+                "VALUES (?, ?, ?, ?)",
+                (symbol, timeframe, run_start, left_end),
+            )
+        if end_ts is not None and run_end > end_ts:
+            right_start = run_start + ((end_ts - run_start) // step + 1) * step
+            conn.execute(
+                f"INSERT INTO {COVERAGE_TABLE} (symbol, timeframe, start_ts, end_ts) "
+                "VALUES (?, ?, ?, ?)",
+                (symbol, timeframe, right_start, run_end),
+            )
+    _recover_cold(conn, symbol, timeframe, start_ts, end_ts)
+
+
+def _recover_cold(
+    conn: sqlite3.Connection,
+    symbol: str,
+    timeframe: str,
+    start_ts: Optional[int],
+    end_ts: Optional[int],
+):
+    """Возвращает покрытие свечам архивных месяцев внутри снятого диапазона"""
+    from backend.core.storage.cold_tier import read_cold_frame
+
+    frame = read_cold_frame(
+        conn, f"candles_{timeframe}", symbol, ["timestamp"], start_ts, end_ts
+    )
+    if frame is not None and not frame.empty:
+        cover_timestamps(conn, symbol, timeframe, frame["timestamp"].to_numpy())
+
+
+def drop_coverage(conn: sqlite3.Connection, timeframe: str):
+    """
+    Снимает триггеры и участки таймфрейма (массовая очистка таблицы).
+
+    Следующий ensure_coverage построит индекс заново — с учётом
+    архивных месяцев, которые очистка SQLite не затрагивает.
+    """
+    ensure_coverage_tables(conn)
+    physical, _, _ = _physical(conn, timeframe)
+    for name in _trigger_names(physical):
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    conn.execute(f"DELETE FROM {COVERAGE_TABLE} WHERE timeframe = ?", (timeframe,))
+
+
+def coverage_symbols(conn: sqlite3.Connection, timeframe: str) -> List[str]:
+    return [
+        row[0]
+        for row in conn.execute(
+            f"SELECT DISTINCT symbol FROM {COVERAGE_TABLE} WHERE timeframe = ? ORDER BY symbol",
+            (timeframe,),
+        )
+    ]
+
+
+def coverage_totals(
+    conn: sqlite3.Connection, timeframe: str
+) -> Tuple[int, Optional[int], Optional[int]]:
+    """(число свечей, первая, последняя) по всем символам таймфрейма"""
+    step = _step(timeframe)
+    candles, earliest, latest = conn.execute(
+        f"SELECT SUM((end_ts - start_ts) / ? + 1), MIN(start_ts), MAX(end_ts) "
+        f"FROM {COVERAGE_TABLE} WHERE timeframe = ?",
+        (step, timeframe),
+    ).fetchone()
+    return candles or 0, earliest, latest
+
+
+def coverage_runs(
+    conn: sqlite3.Connection,
+    symbol: str,
+    timeframe: str,
+    start_ts: Optional[int] = None,
+    end_ts: Optional[int] = None,
+) -> List[Tuple[int, int]]:
+    """Участки, пересекающие [start_ts, end_ts], по возрастанию (не обрезаются)"""
+    where = ["symbol = ?", "timeframe = ?"]
+    params: list = [symbol, timeframe]
+    if start_ts is not None:
+        lower = conn.execute(
+            f"SELECT MAX(start_ts) FROM {COVERAGE_TABLE} "
+            "WHERE symbol = ? AND timeframe = ? AND start_ts <= ?",
+            (symbol, timeframe, start_ts),
+        ).fetchone()[0]
+        where += ["start_ts >= ?", "end_ts >= ?"]
+        params += [lower if lower is not None else start_ts, start_ts]
+    if end_ts is not None:
+        where.append("start_ts <= ?")
+        params.append(end_ts)
+    return conn.execute(
+        f"SELECT start_ts, end_ts FROM {COVERAGE_TABLE} "
+        f"WHERE {' AND '.join(where)} ORDER BY start_ts",
+        params,
+    ).fetchall()
+
+
+def missing_ranges(
+    conn: sqlite3.Connection,
+    symbol: str,
+    timeframe: str,
+    start_ts: int,
+    end_ts: int,
+) -> List[Tuple[int, int]]:
+    """
+    Отсутствующие свечи в [start_ts, end_ts]: [(первая, последняя), ...].
+
+    Края окна до первого и после последнего участка тоже пропуски.
+    """
+    step = _step(timeframe)
+    missing = []
+    current = start_ts
+    for run_start, run_end in coverage_runs(conn, symbol, timeframe, start_ts, end_ts):
+        if run_start > current:
+            missing.append((current, min(run_start - step, end_ts)))
+        current = max(current, run_end + step)
+    if current <= end_ts:
+        missing.append((current, end_ts))
+    return [(start, end) for start, end in missing if start <= end]
+
+
+def coverage_stats(
+    conn: sqlite3.Connection,
+    symbol: str,
+    timeframe: str,
+    start_ts: Optional[int] = None,
+    end_ts: Optional[int] = None,
+) -> Dict:
+    """
+    Первая и последняя свеча, число свечей и покрытие в окне.
+
+    Без окна ожидаемое число свечей считается от первой до последней
+    хранимой свечи (как в отчётах диапазонов).
+    """
+    step = _step(timeframe)
+    runs = coverage_runs(conn, symbol, timeframe, start_ts, end_ts)
+    if not runs:
+        return {
+            "earliest": None,
+            "latest": None,
+            "candles": 0,
+            "expected": 0,
+            "missing": 0,
+            "coverage": 0.0,
+            "runs": 0,
+        }
+
+    candles = 0
+    for run_start, run_end in runs:
+        low = run_start if start_ts is None else max(run_start, start_ts)
+        high = run_end if end_ts is None else min(run_end, end_ts)
+        # Свечи сетки участка внутри [low, high]
+        first = run_start + -(-(low - run_start) // step) * step
+        last = run_start + (high - run_start) // step * step
+        if last >= first:
+            candles += (last - first) // step + 1
+
+    earliest = max(runs[0][0], start_ts) if start_ts is not None else runs[0][0]
+    latest = min(runs[-1][1], end_ts) if end_ts is not None else runs[-1][1]
+    window_start = start_ts if start_ts is not None else earliest
+    window_end = end_ts if end_ts is not None else latest
+    expected = max(0, (window_end - window_start) // step + 1)
+    return {
+        "earliest": earliest,
+        "latest": latest,
+        "candles": candles,
+        "expected": expected,
+        "missing": max(0, expected - candles),
+        "coverage": (candles / expected * 100) if expected else 0.0,
+        "runs": len(runs),
+    }
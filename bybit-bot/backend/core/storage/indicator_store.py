@@ -0,0 +1,380 @@
+"""
+indicator_store.py
+
+Узкое хранилище индикаторов отдельно от свечей.
+
+    indicators_<tf> (indicator_id, symbol, timestamp, value)
+        PRIMARY KEY (indicator_id, symbol, timestamp) WITHOUT ROWID
+    indicator_catalog (id, name)  — name = имя колонки: ema20, rsi14, bb20_up
+
+- запись индикатора меняет только страницы его ключей, строки OHLCV
+  не переписываются
+- значения одного индикатора лежат подряд: новый период EMA стоит только
+  его строк, удаление периода — одно удаление диапазона ключа,
+  без пересоздания candles_<tf>
+- NaN не хранится: нет строки = NULL; -1 хранится как значение
+- candles_<tf>_wide — представление в старой широкой раскладке
+  (коррелированные выборки по ключу) для ручных запросов
+
+Хранилище включается для таймфрейма наличием таблицы indicators_<tf>
+(migrate_to_store). Пока её нет, индикаторы живут в колонках candles_<tf>;
+load_indicator_frame и write_indicator_row работают с обеими раскладками.
+"""
+
+import sqlite3
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from backend.core.storage.cold_tier import read_cold_frame
+from backend.core.storage.schema import rebuild_candle_table
+
+STORE_PREFIX = "indicators_"
+CATALOG_TABLE = "indicator_catalog"
+WRITE_CHUNK_SIZE = 50_000
+
+
+def store_table(timeframe: str) -> str:
+    return f"{STORE_PREFIX}{timeframe}"
+
+
+def wide_view(timeframe: str) -> str:
+    return f"candles_{timeframe}_wide"
+
+
+def has_store(conn: sqlite3.Connection, timeframe: str) -> bool:
+    """Индикаторы таймфрейма хранятся в indicators_<tf>"""
+    return (
+        conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name = ?",
+            (store_table(timeframe),),
+        ).fetchone()
+        is not None
+    )
+
+
+def ensure_store(conn: sqlite3.Connection, timeframe: str):
+    """Создаёт каталог и таблицу индикаторов таймфрейма"""
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {CATALOG_TABLE} (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        )
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {store_table(timeframe)} (
+            indicator_id INTEGER NOT NULL,
+            symbol TEXT NOT NULL,
+            timestamp INTEGER NOT NULL,
+            value REAL,
+            PRIMARY KEY (indicator_id, symbol, timestamp)
+        ) WITHOUT ROWID
+        """
+    )
+
+
+def indicator_ids(
+    conn: sqlite3.Connection, columns: Iterable[str], create: bool = True
+) -> Dict[str, int]:
+    """
+    Идентификаторы индикаторов по именам колонок.
+    create=False — неизвестные имена пропускаются.
+    """
+    columns = list(columns)
+    if create:
+        conn.executemany(
+            f"INSERT OR IGNORE INTO {CATALOG_TABLE} (name) VALUES (?)",
+            [(col,) for col in columns],
+        )
+    placeholders = ",".join("?" for _ in columns)
+    rows = conn.execute(
+        f"SELECT name, id FROM {CATALOG_TABLE} WHERE name IN ({placeholders})",
+        columns,
+    ).fetchall()
+    return dict(rows)
+
+
+def catalog_columns(conn: sqlite3.Connection) -> List[str]:
+    """Все имена индикаторов из каталога"""
+    return [row[0] for row in conn.execute(f"SELECT name FROM {CATALOG_TABLE} ORDER BY id")]
+
+
+def write_store_values(
+    conn: sqlite3.Connection,
+    symbol: str,
+    timeframe: str,
+    timestamps: Sequence[int],
+    columns: List[str],
+    values: np.ndarray,
+    chunk_size: int = WRITE_CHUNK_SIZE,
+) -> int:
+    """
+    Записывает значения в indicators_<tf> в текущей транзакции
+    (commit — за вызывающим кодом): числа — INSERT OR REPLACE по ключу,
+    NaN — удаление ключа.
+
+    Returns:
+        int: количество строк свечей (timestamps)
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64).reshape(len(timestamps), -1)
+    table = store_table(timeframe)
+
+    # Без commit: запись входит в транзакцию вызывающего кода
+    if not conn.in_transaction:
+        conn.execute("BEGIN")
+    ensure_store(conn, timeframe)
+    ids = indicator_ids(conn, columns)
+    for j, col in enumerate(columns):
+        column = values[:, j]
+        present = ~np.isnan(column)
+        ts_list = timestamps.tolist()
+        upserts = [
+            (ids[col], symbol, ts, value)
+            for ts, value, keep in zip(ts_list, column.tolist(), present.tolist())
+            if keep
+        ]
+        deletes = [
+            (ids[col], symbol, ts)
+            for ts, keep in zip(ts_list, present.tolist())
+            if not keep
+        ]
+        for start in range(0, len(upserts), chunk_size):
+            conn.executemany(
+                f"INSERT OR REPLACE INTO {table} (indicator_id, symbol, timestamp, value) VALUES (?, ?, ?, ?)",
+                upserts[start : start + chunk_size],
+            )
+        for start in range(0, len(deletes), chunk_size):
+            conn.executemany(
+                f"DELETE FROM {table} WHERE indicator_id = ? AND symbol = ? AND timestamp = ?",
+                deletes[start : start + chunk_size],
+            )
+    return len(timestamps)
+
+
+def mark_store_range(
+    conn: sqlite3.Connection,
+    symbol: str,
+    timeframe: str,
+    columns: List[str],
+    start_ts: int,
+    end_ts: int,
+    value: float = -1,
+):
+    """Ставит value для индикаторов на всех свечах диапазона (одним INSERT ... SELECT на колонку)"""
+    ensure_store(conn, timeframe)
+    ids = indicator_ids(conn, columns)
+    for col in columns:
+        conn.execute(
+            f"""
+            INSERT OR REPLACE INTO {store_table(timeframe)} (indicator_id, symbol, timestamp, value)
+            SELECT ?, symbol, timestamp, ? FROM candles_{timeframe}
+            WHERE symbol = ? AND timestamp >= ? AND timestamp <= ?
+            """,
+            (ids[col], value, symbol, start_ts, end_ts),
+        )
+
+
+def delete_indicators(conn: sqlite3.Connection, timeframe: str, columns: Iterable[str]) -> int:
+    """Удаляет все значения индикаторов таймфрейма (один диапазон ключа на индикатор)"""
+    ids = indicator_ids(conn, columns, create=False)
+    deleted = 0
+    for indicator_id in ids.values():
+        cursor = conn.execute(
+            f"DELETE FROM {store_table(timeframe)} WHERE indicator_id = ?",
+            (indicator_id,),
+        )
+        deleted += cursor.rowcount
+    return deleted
+
+
+def load_indicator_frame(
+    conn: sqlite3.Connection,
+    symbol: str,
+    timeframe: str,
+    base_columns: Sequence[str],
+    indicator_columns: Sequence[str],
+    start_ts: Optional[int] = None,
+    end_ts: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    Свечи символа с колонками индикаторов, отсортированные по timestamp.
+
+    Читаются только запрошенные колонки. В узкой раскладке каждый индикатор —
+    отдельный последовательный проход по своему ключу, выравнивание по
+    timestamp свечей (свеча без значения → NaN). Отсутствующие колонки — NaN.
+    Архивные месяцы дочитываются из Parquet (cold_tier.py).
+
+    Returns:
+        DataFrame: timestamp, base_columns..., indicator_columns...
+    """
+    table = f"candles_{timeframe}"
+    where = "symbol = ?"
+    params: list = [symbol]
+    if start_ts is not None:
+        where += " AND timestamp >= ?"
+        params.append(int(start_ts))
+    if end_ts is not None:
+        where += " AND timestamp <= ?"
+        params.append(int(end_ts))
+
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    base = [col for col in base_columns if col != "timestamp" and col in existing]
+    narrow = has_store(conn, timeframe)
+    wide = [] if narrow else [col for col in indicator_columns if col in existing]
+
+    df = pd.read_sql_query(
+        f"SELECT {', '.join(['timestamp', *base, *wide])} FROM {table} "
+        f"WHERE {where} ORDER BY timestamp",
+        conn,
+        params=params,
+    )
+
+    if narrow and len(df) and indicator_columns:
+        timestamps = df["timestamp"].to_numpy(dtype=np.int64)
+        ids = indicator_ids(conn, indicator_columns, create=False)
+        for col in indicator_columns:
+            column = np.full(len(df), np.nan)
+            if col in ids:
+                rows = conn.execute(
+                    f"SELECT timestamp, value FROM {store_table(timeframe)} "
+                    f"WHERE indicator_id = ? AND {where} ORDER BY timestamp",
+                    [ids[col], *params],
+                ).fetchall()
+                if rows:
+                    data = np.array(rows, dtype=np.float64)
+                    ts = data[:, 0].astype(np.int64)
+                    pos = np.searchsorted(timestamps, ts)
+                    pos_ok = pos < len(timestamps)
+                    hit = pos_ok.copy()
+                    hit[pos_ok] = timestamps[pos[pos_ok]] == ts[pos_ok]
+                    column[pos[hit]] = data[hit, 1]
+            df[col] = column
+
+    for col in indicator_columns:
+        if col not in df.columns:
+            df[col] = np.nan
+    columns = ["timestamp", *base, *indicator_columns]
+    df = df[columns]
+
+    # Закрытые месяцы из Parquet (холодный уровень), при пересечении — SQLite
+    cold = read_cold_frame(conn, table, symbol, columns, start_ts, end_ts)
+    if cold is not None and len(cold):
+        cold = cold[~cold["timestamp"].isin(df["timestamp"])]
+        if len(df):
+            df = pd.concat([cold, df], ignore_index=True)
+            df = df.sort_values("timestamp", kind="stable", ignore_index=True)
+        else:
+            df = cold.reset_index(drop=True)
+    return df
+
+
+def write_indicator_row(
+    conn: sqlite3.Connection,
+    symbol: str,
+    timeframe: str,
+    timestamp: int,
+    values: Dict[str, float],
+) -> bool:
+    """
+    Записывает индикаторы одной свечи в текущей раскладке таймфрейма.
+
+    Returns:
+        bool: False, если свечи нет в candles_<tf>
+    """
+    table = f"candles_{timeframe}"
+    if has_store(conn, timeframe):
+        exists = conn.execute(
+            f"SELECT 1 FROM {table} WHERE symbol = ? AND timestamp = ?",
+            (symbol, timestamp),
+        ).fetchone()
+        if not exists:
+            return False
+        ids = indicator_ids(conn, values)
+        conn.executemany(
+            f"INSERT OR REPLACE INTO {store_table(timeframe)} (indicator_id, symbol, timestamp, value) VALUES (?, ?, ?, ?)",
+            [(ids[col], symbol, timestamp, value) for col, value in values.items()],
+        )
+        return True
+
+    set_clause = ", ".join(f"{col} = ?" for col in values)
+    cursor = conn.execute(
+        f"UPDATE {table} SET {set_clause} WHERE symbol = ? AND timestamp = ?",
+        [*values.values(), symbol, timestamp],
+    )
+    return cursor.rowcount > 0
+
+
+def refresh_wide_view(conn: sqlite3.Connection, timeframe: str, columns: Sequence[str]):
+    """
+    Пересоздаёт candles_<tf>_wide: свечи + колонки индикаторов.
+    Значение каждой колонки — точечная выборка по ключу хранилища,
+    поэтому читаются только запрошенные в SELECT колонки.
+    """
+    view = wide_view(timeframe)
+    ids = indicator_ids(conn, columns)
+    selects = ",\n            ".join(
+        f"(SELECT i.value FROM {store_table(timeframe)} i "
+        f"WHERE i.indicator_id = {ids[col]} AND i.symbol = c.symbol "
+        f"AND i.timestamp = c.timestamp) AS {col}"
+        for col in columns
+    )
+    conn.execute(f"DROP VIEW IF EXISTS {view}")
+    conn.execute(
+        f"""
+        CREATE VIEW {view} AS
+        SELECT c.*{"," if selects else ""}
+            {selects}
+        FROM candles_{timeframe} c
+        """
+    )
+
+
+def migrate_to_store(
+    conn: sqlite3.Connection, timeframe: str, indicator_columns: Sequence[str]
+) -> int:
+    """
+    Переносит колонки индикаторов из candles_<tf> в indicators_<tf>.
+
+    1. Создаётся хранилище — с этого момента все записи индикаторов идут в него
+    2. Значения колонок копируются (INSERT OR IGNORE: уже записанные в хранилище
+       более свежие значения не перетираются), по транзакции на колонку
+    3. Колонки удаляются из candles_<tf> последним пересозданием таблицы
+    4. Создаётся представление candles_<tf>_wide
+
+    Returns:
+        int: количество перенесённых значений
+    """
+    table = f"candles_{timeframe}"
+    existing = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+    columns = [col for col in indicator_columns if col in existing]
+
+    with conn:
+        ensure_store(conn, timeframe)
+        ids = indicator_ids(conn, columns)
+
+    moved = 0
+    for col in columns:
+        with conn:
+            cursor = conn.execute(
+                f"""
+                INSERT OR IGNORE INTO {store_table(timeframe)} (indicator_id, symbol, timestamp, value)
+                SELECT ?, symbol, timestamp, {col} FROM {table} WHERE {col} IS NOT NULL
+                """,
+                (ids[col],),
+            )
+        moved += cursor.rowcount
+        print(f"[indicator_store] 📦 {table}.{col}: {cursor.rowcount} значений")
+
+    with conn:
+        if columns:
+            rebuild_candle_table(
+                conn, table, [col for col in existing if col not in columns]
+            )
+        refresh_wide_view(conn, timeframe, indicator_columns)
+    print(f"[indicator_store] ✅ {table}: {moved} значений перенесено в {store_table(timeframe)}")
+    return moved
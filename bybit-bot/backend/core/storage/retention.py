@@ -0,0 +1,231 @@
+"""
+retention.py
+
+Удержание истории по allowed_history из TIMEFRAMES_CONFIG.
+
+- prune_timeframe: свечи старше now - allowed_history удаляются небольшими
+  пакетами, каждый пакет — своя короткая транзакция (realtime-писатель
+  не ждёт удаления миллионов строк). Вместе со свечами удаляются значения
+  indicators_<tf> и устаревшие записи журнала dirty_ranges; индекс
+  покрытия (coverage.py) правится диапазоном на пакет
+- archive=True: вместо удаления закрытые месяцы до cutoff уходят в Parquet
+  (cold_tier.py); хвост месяца, содержащего cutoff, архивируется,
+  когда месяц закроется
+- reclaim_space: PRAGMA incremental_vacuum порциями, свободные страницы
+  возвращаются файловой системе. Нужен auto_vacuum=INCREMENTAL; перевод
+  существующей БД (enable_incremental_vacuum) — один полный VACUUM
+
+Контрольные точки EMA (ema_checkpoints) не удаляются: от них EMA
+продолжается без полной истории.
+"""
+
+import sqlite3
+import time
+from typing import Optional, Tuple
+
+from backend.config.timeframes_config import TIMEFRAMES_CONFIG
+from backend.core.storage.cold_tier import archive_closed_months, month_bounds
+from backend.core.storage.coverage import bulk_coverage, uncover_range
+from backend.core.storage.indicator_store import has_store, store_table
+
+DEFAULT_BATCH_SIZE = 5_000
+DEFAULT_VACUUM_PAGES = 2_000
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+def retention_cutoff(timeframe: str, now_ts: int) -> Optional[int]:
+    """Граница удержания таймфрейма или None, если история не ограничена"""
+    history = TIMEFRAMES_CONFIG[timeframe].get("allowed_history")
+    if not history:
+        return None
+    return now_ts - history
+
+
+def _table_exists(conn: sqlite3.Connection, name: str) -> bool:
+    return (
+        conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = ?",
+            (name,),
+        ).fetchone()
+        is not None
+    )
+
+
+def _changes(conn: sqlite3.Connection, sql: str, params: list) -> int:
+    # total_changes: удаление через триггер компактного представления
+    # не отражается в rowcount
+    changes = conn.total_changes
+    conn.execute(sql, params)
+    return conn.total_changes - changes
+
+
+def _delete_batched(
+    conn: sqlite3.Connection,
+    table: str,
+    key_where: str,
+    params: list,
+    cutoff_ts: int,
+    batch_size: int,
+    pause: float,
+    coverage: Optional[Tuple[str, str]] = None,
+) -> int:
+    """
+    Удаляет строки key_where AND timestamp < cutoff_ts пакетами по ключу.
+
+    coverage=(symbol, timeframe) — таблица свечей: индекс покрытия
+    правится одним диапазоном на пакет вместо триггера на каждую строку.
+    """
+    deleted = 0
+    while True:
+        # Границы пакета по ключу: удаление диапазоном [first, bound]
+        first = conn.execute(
+            f"SELECT MIN(timestamp) FROM {table} WHERE {key_where} AND timestamp < ?",
+            [*params, cutoff_ts],
+        ).fetchone()[0]
+        if first is None:
+            return deleted
+        row = conn.execute(
+            f"""
+            SELECT timestamp FROM {table}
+            WHERE {key_where} AND timestamp < ?
+            ORDER BY timestamp LIMIT 1 OFFSET ?
+            """,
+            [*params, cutoff_ts, batch_size - 1],
+        ).fetchone()
+        bound = row[0] if row else cutoff_ts - 1
+
+        delete_sql = f"DELETE FROM {table} WHERE {key_where} AND timestamp <= ?"
+        with conn:
+            if coverage:
+                with bulk_coverage(conn):
+                    removed = _changes(conn, delete_sql, [*params, bound])
+                    uncover_range(conn, *coverage, first, bound)
+            else:
+                removed = _changes(conn, delete_sql, [*params, bound])
+        deleted += removed
+        if not row:
+            return deleted
+        if pause:
+            time.sleep(pause)
+
+
+def prune_timeframe(
+    conn: sqlite3.Connection,
+    timeframe: str,
+    now_ts: Optional[int] = None,
+    archive: bool = False,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    pause: float = 0.0,
+) -> int:
+    """
+    Убирает из SQLite свечи таймфрейма за пределами allowed_history.
+
+    Args:
+        conn: соединение на запись
+        timeframe: таймфрейм
+        now_ts: текущее время (по умолчанию time.time())
+        archive: переносить закрытые месяцы в Parquet вместо удаления
+        batch_size: строк в одной транзакции
+        pause: пауза между пакетами, секунд
+
+    Returns:
+        int: убрано строк свечей из SQLite (удалено или перенесено в Parquet)
+    """
+    table = f"candles_{timeframe}"
+    cutoff = retention_cutoff(timeframe, int(now_ts or time.time()))
+    if cutoff is None or not _table_exists(conn, table):
+        return 0
+
+    if archive:
+        # Архивация сама убирает строки из SQLite; месяцы с непересчитанными
+        # диапазонами остаются до следующего запуска, а не удаляются
+        moved = archive_closed_months(conn, timeframe, month_bounds(cutoff)[0])
+        return sum(moved.values())
+
+    narrow = has_store(conn, timeframe)
+    symbols = [
+        row[0]
+        for row in conn.execute(
+            f"SELECT DISTINCT symbol FROM {table} WHERE timestamp < ?", (cutoff,)
+        )
+    ]
+
+    deleted = 0
+    for symbol in symbols:
+        removed = _delete_batched(
+            conn,
+            table,
+            "symbol = ?",
+            [symbol],
+            cutoff,
+            batch_size,
+            pause,
+            coverage=(symbol, timeframe),
+        )
+        if narrow:
+            ids = [row[0] for row in conn.execute("SELECT id FROM indicator_catalog")]
+            for indicator_id in ids:
+                _delete_batched(
+                    conn,
+                    store_table(timeframe),
+                    "indicator_id = ? AND symbol = ?",
+                    [indicator_id, symbol],
+                    cutoff,
+                    batch_size,
+                    pause,
+                )
+        if removed:
+            print(f"[retention] 🗑 {table} {symbol}: удалено {removed} свечей до {cutoff}")
+        deleted += removed
+
+    if _table_exists(conn, "dirty_ranges"):
+        with conn:
+            conn.execute(
+                "DELETE FROM dirty_ranges WHERE timeframe = ? AND end_ts < ?",
+                (timeframe, cutoff),
+            )
+    return deleted
+
+
+def enable_incremental_vacuum(conn: sqlite3.Connection) -> bool:
+    """
+    Переводит БД в auto_vacuum=INCREMENTAL (один полный VACUUM).
+
+    Returns:
+        True если режим был изменён
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == AUTO_VACUUM_INCREMENTAL:
+        return False
+    print("[retention] 🧱 auto_vacuum=INCREMENTAL: полный VACUUM (однократно)...")
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("VACUUM")
+    return True
+
+
+def reclaim_space(
+    conn: sqlite3.Connection, pages_per_step: int = DEFAULT_VACUUM_PAGES
+) -> int:
+    """
+    Возвращает свободные страницы файловой системе порциями.
+
+    Returns:
+        int: освобождено страниц (0, если auto_vacuum не INCREMENTAL)
+    """
+    free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+        if free:
+            print(
+                f"[retention] ⚠️ {free} свободных страниц, но auto_vacuum не INCREMENTAL "
+                "(prune_history.py --enable-incremental-vacuum)"
+            )
+        return 0
+
+    reclaimed = 0
+    while free:
+        conn.execute(f"PRAGMA incremental_vacuum({pages_per_step})").fetchall()
+        left = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if left >= free:
+            break
+        reclaimed += free - left
+        free = left
+    return reclaimed
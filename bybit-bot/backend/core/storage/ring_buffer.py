@@ -0,0 +1,359 @@
+"""
+ring_buffer.py
+
+Кольцевой буфер последних свечей (symbol, timeframe) в разделяемой памяти.
+
+Файл ring/<SYMBOL>_<tf>.ring (каталог рядом с БД или RING_BUFFER_PATH)
+отображается в память через np.memmap всеми процессами:
+
+    [0, 4096)   заголовок: int64 magic, version, capacity, n_cols, seq, count,
+                pid писателя, heartbeat (unix-время), с байта 256 — JSON
+                со списком колонок
+    [4096, ...) float64 [capacity, n_cols]: timestamp, OHLCV, индикаторы
+
+- пишет один процесс (realtime-загрузчик): свеча кладётся в слот
+  count % capacity, повтор того же timestamp обновляет слот на месте
+- читатели (API, пересчёт индикаторов) работают с теми же страницами:
+  ни SQLite, ни десериализации; согласованность — seqlock
+  (нечётный seq = запись в процессе, чтение повторяется)
+- NaN — значения нет (индикатор ещё не посчитан)
+
+Буфер — кэш, источник истины остаётся SQLite: при старте писатель заполняет
+буфер из БД (seed_ring), читатель отдаёт окно только если оно целиком
+лежит в буфере без пропусков, иначе вызывающий код идёт в БД.
+
+Свежесть:
+- окно, доходящее до следующей после последней свечи буфера, отдаётся
+  только пока писатель жив (heartbeat в заголовке моложе RING_STALE_SEC):
+  буфер остановленного загрузчика не выдаётся за последние данные
+- пересчёт истории в другом процессе (воркер журнала, EzDIM, дозагрузка)
+  вызывает invalidate_ring: файл буфера удаляется, читатели идут в БД,
+  а писатель при следующей свече создаёт буфер заново из БД
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from backend.core.storage.connection import DEFAULT_DB_PATH
+
+logger = logging.getLogger(__name__)
+
+RING_MAGIC = 0x52494E47  # "RING"
+RING_VERSION = 2
+HEADER_BYTES = 4096
+COLUMNS_OFFSET = 256
+RING_CAPACITY = int(os.getenv("RING_BUFFER_CAPACITY", "1000"))
+RING_HEARTBEAT_SEC = int(os.getenv("RING_HEARTBEAT_SEC", "5"))
+RING_STALE_SEC = int(os.getenv("RING_STALE_SEC", "60"))
+
+BASE_COLUMNS = ["timestamp", "open", "high", "low", "close", "volume"]
+
+# Индексы полей заголовка
+_MAGIC, _VERSION, _CAPACITY, _NCOLS, _SEQ, _COUNT, _PID, _HEARTBEAT = range(8)
+_READ_RETRIES = 100
+
+
+def ring_root() -> Path:
+    env = os.getenv("RING_BUFFER_PATH")
+    if env:
+        return Path(env).resolve()
+    return DEFAULT_DB_PATH.parent / "ring"
+
+
+def ring_path(symbol: str, timeframe: str) -> Path:
+    return ring_root() / f"{symbol}_{timeframe}.ring"
+
+
+class CandleRing:
+    """Отображение файла буфера; mode="r+" — писатель, "r" — читатель"""
+
+    def __init__(self, path: Path, mode: str = "r"):
+        self.path = Path(path)
+        self.inode = os.stat(self.path).st_ino
+        raw = np.memmap(self.path, dtype=np.uint8, mode=mode)
+        self._header = raw[:COLUMNS_OFFSET].view(np.int64)
+        if self._header[_MAGIC] != RING_MAGIC or self._header[_VERSION] != RING_VERSION:
+            raise ValueError(f"Не кольцевой буфер: {self.path}")
+        self.capacity = int(self._header[_CAPACITY])
+        n_cols = int(self._header[_NCOLS])
+        names = bytes(raw[COLUMNS_OFFSET:HEADER_BYTES]).rstrip(b"\0")
+        self.columns: List[str] = json.loads(names.decode("utf-8"))
+        self._index = {col: i for i, col in enumerate(self.columns)}
+        self._data = raw[HEADER_BYTES:].view(np.float64).reshape(self.capacity, n_cols)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, path: Path, columns: Sequence[str], capacity: int) -> "CandleRing":
+        """Создаёт пустой буфер (tmp + rename: читатели видят старый или новый файл)"""
+        columns = list(columns)
+        if columns[: len(BASE_COLUMNS)] != BASE_COLUMNS:
+            raise ValueError(f"Первые колонки буфера должны быть {BASE_COLUMNS}")
+        names = json.dumps(columns).encode("utf-8")
+        if len(names) > HEADER_BYTES - COLUMNS_OFFSET:
+            raise ValueError("Слишком много колонок для заголовка буфера")
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        size = HEADER_BYTES + capacity * len(columns) * 8
+        raw = np.memmap(tmp, dtype=np.uint8, mode="w+", shape=(size,))
+        header = raw[:COLUMNS_OFFSET].view(np.int64)
+        header[:] = 0
+        header[[_MAGIC, _VERSION, _CAPACITY, _NCOLS, _PID, _HEARTBEAT]] = (
+            RING_MAGIC,
+            RING_VERSION,
+            capacity,
+            len(columns),
+            os.getpid(),
+            int(time.time()),
+        )
+        raw[COLUMNS_OFFSET : COLUMNS_OFFSET + len(names)] = np.frombuffer(names, np.uint8)
+        raw[HEADER_BYTES:].view(np.float64)[:] = np.nan
+        raw.flush()
+        del raw
+        os.replace(tmp, path)
+        return cls(path, mode="r+")
+
+    # --- запись ---
+
+    def heartbeat(self):
+        """Отметка писателя: буфер обновляется живым процессом"""
+        self._header[_HEARTBEAT] = int(time.time())
+
+    def put(self, ts: int, values: Dict[str, float]) -> bool:
+        """
+        Кладёт свечу или обновляет значения уже лежащей.
+
+        Колонки, которых нет в values (и в буфере), не меняются. Свеча старше
+        последней и отсутствующая в буфере игнорируется (она есть в БД).
+
+        Returns:
+            True если буфер изменён
+        """
+        with self._lock:
+            count = int(self._header[_COUNT])
+            slot = self._slot_of(ts, count)
+            if slot is None:
+                last = self._data[(count - 1) % self.capacity, 0] if count else None
+                if last is not None and ts < last:
+                    return False
+                slot, count = count % self.capacity, count + 1
+                fresh = True
+            else:
+                fresh = False
+
+            self._header[_SEQ] += 1  # нечётный: запись идёт
+            row = self._data[slot]
+            if fresh:
+                row[:] = np.nan
+                row[0] = ts
+            for col, value in values.items():
+                idx = self._index.get(col)
+                if idx is not None and idx > 0:
+                    row[idx] = np.nan if value is None else value
+            self._header[_COUNT] = count
+            self._header[_SEQ] += 1
+            return True
+
+    def _slot_of(self, ts: int, count: int) -> Optional[int]:
+        if not count:
+            return None
+        size = min(count, self.capacity)
+        first = (count - size) % self.capacity
+        order = (first + np.arange(size)) % self.capacity
+        pos = int(np.searchsorted(self._data[order, 0], ts))
+        if pos < size and self._data[order[pos], 0] == ts:
+            return int(order[pos])
+        return None
+
+    # --- чтение ---
+
+    @property
+    def writer_pid(self) -> int:
+        return int(self._header[_PID])
+
+    def writer_alive(self) -> bool:
+        """Писатель отмечался не позже RING_STALE_SEC секунд назад"""
+        return time.time() - int(self._header[_HEARTBEAT]) <= RING_STALE_SEC
+
+    def snapshot(self) -> Tuple[np.ndarray, int]:
+        """Согласованный снимок строк по возрастанию timestamp и seq снимка"""
+        for attempt in range(_READ_RETRIES):
+            if attempt:
+                # Писатель посреди записи: отдаём ему процессор
+                time.sleep(0)
+            seq = int(self._header[_SEQ])
+            if seq % 2:
+                continue
+            count = int(self._header[_COUNT])
+            size = min(count, self.capacity)
+            first = (count - size) % self.capacity
+            if first + size <= self.capacity:
+                rows = self._data[first : first + size].copy()
+            else:
+                rows = np.concatenate(
+                    (self._data[first:], self._data[: (first + size) % self.capacity])
+                )
+            if int(self._header[_SEQ]) == seq:
+                return rows, seq
+        raise RuntimeError(f"Буфер {self.path} постоянно перезаписывается")
+
+    def window(
+        self,
+        start_ts: Optional[int],
+        end_ts: Optional[int],
+        columns: Sequence[str],
+        tf_sec: int,
+    ) -> Optional[pd.DataFrame]:
+        """
+        Строки [start_ts, end_ts] с колонками timestamp + columns.
+
+        None — если окно не покрыто буфером целиком: начало раньше первой
+        свечи буфера, внутри есть пропуск или нет запрошенной колонки,
+        а также если окно доходит до следующей свечи после последней
+        в буфере, а писатель не отмечается (буфер мог отстать от БД).
+        """
+        if any(col not in self._index for col in columns):
+            return None
+        rows, _ = self.snapshot()
+        if not len(rows):
+            return None
+        ts = rows[:, 0]
+        if start_ts is not None and start_ts < ts[0]:
+            return None
+        if (end_ts is None or end_ts >= ts[-1] + tf_sec) and not self.writer_alive():
+            return None
+        lo = 0 if start_ts is None else int(np.searchsorted(ts, start_ts))
+        hi = len(ts) if end_ts is None else int(np.searchsorted(ts, end_ts, side="right"))
+        if lo == hi:
+            return None
+        # Пропуск внутри окна или между окном и соседней свечей за его краем
+        inner = ts[lo:hi]
+        if len(inner) > 1 and (np.diff(inner) != tf_sec).any():
+            return None
+        if lo > 0 and inner[0] - ts[lo - 1] != tf_sec and inner[0] - tf_sec >= start_ts:
+            return None
+        if hi < len(ts) and ts[hi] - inner[-1] != tf_sec and inner[-1] + tf_sec <= end_ts:
+            return None
+
+        picked = rows[lo:hi]
+        df = pd.DataFrame(
+            {"timestamp": picked[:, 0].astype(np.int64)}
+            | {col: picked[:, self._index[col]] for col in columns if col != "timestamp"}
+        )
+        return df
+
+
+def seed_ring(ring: CandleRing, frame: pd.DataFrame) -> int:
+    """Заполняет буфер строками frame (timestamp + колонки буфера)"""
+    columns = [col for col in ring.columns[1:] if col in frame.columns]
+    for record in frame.tail(ring.capacity).itertuples(index=False):
+        row = record._asdict()
+        ring.put(int(row["timestamp"]), {col: row[col] for col in columns})
+    return min(len(frame), ring.capacity)
+
+
+_writers: Dict[Tuple[str, str], CandleRing] = {}
+_readers: Dict[Tuple[str, str], CandleRing] = {}
+_registry_lock = threading.Lock()
+_heartbeat_thread: Optional[threading.Thread] = None
+
+
+def _same_file(path: Path, inode: int) -> bool:
+    try:
+        return os.stat(path).st_ino == inode
+    except FileNotFoundError:
+        return False
+
+
+def _heartbeat_loop():
+    while True:
+        time.sleep(RING_HEARTBEAT_SEC)
+        with _registry_lock:
+            rings = list(_writers.values())
+        for ring in rings:
+            ring.heartbeat()
+
+
+def get_ring_writer(
+    symbol: str,
+    timeframe: str,
+    columns: Sequence[str],
+    capacity: int = RING_CAPACITY,
+) -> Tuple[CandleRing, bool]:
+    """
+    Буфер писателя (один на процесс), создаётся заново при первом обращении
+    и после invalidate_ring (файл удалён другим процессом).
+
+    Returns:
+        (буфер, True если буфер создан заново и его нужно заполнить из БД)
+    """
+    global _heartbeat_thread
+    key = (symbol, timeframe)
+    path = ring_path(symbol, timeframe)
+    with _registry_lock:
+        ring = _writers.get(key)
+        if ring is not None and _same_file(path, ring.inode):
+            return ring, False
+        # Писатель всегда начинает с чистого буфера: пока процесс не работал,
+        # БД могла измениться (дозагрузка, пересчёт)
+        ring = CandleRing.create(path, columns, capacity)
+        _writers[key] = ring
+        if _heartbeat_thread is None:
+            _heartbeat_thread = threading.Thread(
+                target=_heartbeat_loop, name="ring-heartbeat", daemon=True
+            )
+            _heartbeat_thread.start()
+        return ring, True
+
+
+def get_ring_reader(symbol: str, timeframe: str) -> Optional[CandleRing]:
+    """Буфер на чтение; None, если писатель его ещё не создал"""
+    key = (symbol, timeframe)
+    path = ring_path(symbol, timeframe)
+    try:
+        inode = os.stat(path).st_ino
+    except FileNotFoundError:
+        return None
+    with _registry_lock:
+        ring = _readers.get(key)
+        if ring is None or ring.inode != inode:
+            try:
+                ring = CandleRing(path, mode="r")
+            except (ValueError, json.JSONDecodeError):
+                return None
+            _readers[key] = ring
+        return ring
+
+
+def invalidate_ring(symbol: str, timeframe: str, start_ts: int, end_ts: int) -> bool:
+    """
+    Сбрасывает буфер после изменения свечей или индикаторов [start_ts, end_ts]
+    другим процессом (вызывать после commit). Буфер, не пересекающийся
+    с диапазоном, не трогается; процесс-писатель публикует новые значения сам.
+
+    Returns:
+        True если файл буфера удалён
+    """
+    ring = get_ring_reader(symbol, timeframe)
+    if ring is None or ring.writer_pid == os.getpid():
+        return False
+    rows, _ = ring.snapshot()
+    if not len(rows) or start_ts > rows[-1, 0] or end_ts < rows[0, 0]:
+        return False
+    try:
+        os.unlink(ring.path)
+    except FileNotFoundError:
+        return False
+    logger.info(
+        f"♻️ [ring_buffer] {symbol} {timeframe}: буфер сброшен (изменения {start_ts} → {end_ts})"
+    )
+    return True
@@ -0,0 +1,296 @@
+"""
+schema.py
+
+Схема таблиц свечей candles_<tf>.
+
+Таблица кластеризована по составному ключу:
+    PRIMARY KEY (symbol, timestamp) ... WITHOUT ROWID
+Строки одного символа лежат в B-дереве подряд в порядке времени — выборка
+диапазона по symbol = ? это один последовательный проход без отдельного
+индекса и без перехода индекс → rowid. В одной таблице хранится любое число
+символов.
+
+migrate_candle_table() переводит старую таблицу (timestamp INTEGER PRIMARY KEY
+или rowid-таблица с индексом) в новую раскладку без остановки загрузчиков:
+1. Создаётся {table}_clustered с теми же колонками
+2. Триггеры на старой таблице зеркалируют INSERT/UPDATE/DELETE в новую
+3. Строки копируются пачками по rowid, каждая пачка — короткая транзакция
+4. Одна транзакция: удаление старой таблицы и переименование новой
+
+Компактная раскладка (compact.py): candles_<tf> — представление над
+candle_data_<tf>; для неё is_clustered() истинно, а вставка с обновлением
+строится через candle_upsert_sql().
+"""
+
+import sqlite3
+import time
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+# Базовые колонки свечи (имя, тип); индикаторы добавляются как REAL
+CANDLE_COLUMNS: List[Tuple[str, str]] = [
+    ("symbol", "TEXT NOT NULL"),
+    ("timestamp", "INTEGER NOT NULL"),
+    ("timestamp_ms", "INTEGER"),
+    ("timestamp_ns", "INTEGER"),
+    ("open", "REAL"),
+    ("high", "REAL"),
+    ("low", "REAL"),
+    ("close", "REAL"),
+    ("volume", "REAL"),
+]
+CANDLE_KEY = ("symbol", "timestamp")
+MIGRATION_BATCH_SIZE = 50_000
+_MIGRATION_SUFFIX = "_clustered"
+
+
+def candle_table_ddl(
+    table: str,
+    extra_columns: Iterable[str] = (),
+    columns: Optional[Sequence[Tuple[str, str]]] = None,
+    if_not_exists: bool = True,
+) -> str:
+    """
+    CREATE TABLE для кластеризованной таблицы свечей.
+
+    Args:
+        table: имя таблицы
+        extra_columns: дополнительные REAL-колонки (индикаторы)
+        columns: полный список (имя, тип) вместо CANDLE_COLUMNS + extra_columns
+        if_not_exists: добавить IF NOT EXISTS
+    """
+    if columns is None:
+        columns = list(CANDLE_COLUMNS) + [(col, "REAL") for col in extra_columns]
+    defs = ",\n    ".join(f"{name} {col_type}".rstrip() for name, col_type in columns)
+    exists = "IF NOT EXISTS " if if_not_exists else ""
+    return (
+        f"CREATE TABLE {exists}{table} (\n    {defs},\n"
+        f"    PRIMARY KEY ({', '.join(CANDLE_KEY)})\n) WITHOUT ROWID"
+    )
+
+
+def table_columns(conn: sqlite3.Connection, table: str) -> List[Tuple[str, str]]:
+    """
+    Колонки существующей таблицы как (имя, тип) для candle_table_ddl.
+    Ключевые колонки получают NOT NULL, значения по умолчанию сохраняются.
+    """
+    columns = []
+    for _, name, col_type, notnull, default, _ in conn.execute(
+        f"PRAGMA table_info({table})"
+    ):
+        col_type = col_type or "REAL"
+        if name in CANDLE_KEY or notnull:
+            col_type = f"{col_type} NOT NULL"
+        if default is not None:
+            col_type = f"{col_type} DEFAULT {default}"
+        columns.append((name, col_type))
+    return columns
+
+
+def compact_data_table(table: str) -> str:
+    """Физическая таблица компактной раскладки: candles_1m → candle_data_1m"""
+    return "candle_data_" + table[len("candles_") :]
+
+
+def is_compact(conn: sqlite3.Connection, table: str) -> bool:
+    """candles_<tf> — представление над компактной таблицей (compact.py)"""
+    rows = conn.execute(
+        "SELECT type, name FROM sqlite_master WHERE name IN (?, ?)",
+        (table, compact_data_table(table)),
+    ).fetchall()
+    return set(rows) == {("view", table), ("table", compact_data_table(table))}
+
+
+def candle_upsert_sql(conn: sqlite3.Connection, table: str, columns: Sequence[str]) -> str:
+    """
+    INSERT свечи с обновлением по (symbol, timestamp).
+
+    Обычная таблица — ON CONFLICT DO UPDATE (колонки индикаторов не трогаются).
+    Компактное представление UPSERT не поддерживает: INSERT OR REPLACE,
+    политика переходит на строку физической таблицы, где индикаторов нет.
+    """
+    cols = ", ".join(columns)
+    placeholders = ", ".join("?" for _ in columns)
+    if is_compact(conn, table):
+        return f"INSERT OR REPLACE INTO {table} ({cols}) VALUES ({placeholders})"
+    updates = ",\n    ".join(
+        f"{col}=excluded.{col}" for col in columns if col not in CANDLE_KEY
+    )
+    return (
+        f"INSERT INTO {table} ({cols}) VALUES ({placeholders})\n"
+        f"ON CONFLICT({', '.join(CANDLE_KEY)}) DO UPDATE SET\n    {updates}"
+    )
+
+
+def is_clustered(conn: sqlite3.Connection, table: str) -> bool:
+    """Таблица уже WITHOUT ROWID с ключом (symbol, timestamp)"""
+    if is_compact(conn, table):
+        return True
+    row = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type='table' AND name = ?", (table,)
+    ).fetchone()
+    if not row or "WITHOUT ROWID" not in (row[0] or "").upper():
+        return False
+    pk = sorted(
+        (info[5], info[1])
+        for info in conn.execute(f"PRAGMA table_info({table})")
+        if info[5] > 0
+    )
+    return tuple(name for _, name in pk) == CANDLE_KEY
+
+
+def rebuild_candle_table(
+    conn: sqlite3.Connection, table: str, keep_columns: Sequence[str]
+):
+    """
+    Пересоздаёт таблицу в кластеризованной раскладке, оставляя keep_columns
+    (для удаления колонок). Выполняется в текущей транзакции вызывающего кода.
+    """
+    columns = [col for col in table_columns(conn, table) if col[0] in keep_columns]
+    names = ", ".join(name for name, _ in columns)
+    tmp_table = f"{table}_tmp"
+
+    conn.execute(f"DROP TABLE IF EXISTS {tmp_table}")
+    conn.execute(candle_table_ddl(tmp_table, columns=columns, if_not_exists=False))
+    conn.execute(
+        f"INSERT OR REPLACE INTO {tmp_table} ({names}) "
+        f"SELECT {names} FROM {table} WHERE symbol IS NOT NULL AND timestamp IS NOT NULL"
+    )
+    _swap_tables(conn, table, tmp_table)
+
+
+def _swap_tables(conn: sqlite3.Connection, table: str, new_table: str):
+    """
+    Заменяет table на new_table. legacy_alter_table: представления над table
+    (candles_<tf>_wide) не перепроверяются в момент, когда table уже удалена.
+    """
+    # DDL не открывает транзакцию неявно: без BEGIN другие соединения
+    # увидели бы момент, когда таблицы нет
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    conn.execute("PRAGMA legacy_alter_table=ON")
+    try:
+        conn.execute(f"DROP TABLE {table}")
+        conn.execute(f"ALTER TABLE {new_table} RENAME TO {table}")
+    finally:
+        conn.execute("PRAGMA legacy_alter_table=OFF")
+
+
+def _create_mirror_triggers(
+    conn: sqlite3.Connection, table: str, new_table: str, names: List[str]
+):
+    cols = ", ".join(names)
+    new_values = ", ".join(f"NEW.{name}" for name in names)
+    key_match = " AND ".join(f"{key} = OLD.{key}" for key in CANDLE_KEY)
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {new_table}_ins AFTER INSERT ON {table}
+        WHEN NEW.symbol IS NOT NULL AND NEW.timestamp IS NOT NULL
+        BEGIN
+            INSERT OR REPLACE INTO {new_table} ({cols}) VALUES ({new_values});
+        END
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {new_table}_upd AFTER UPDATE ON {table}
+        BEGIN
+            DELETE FROM {new_table} WHERE {key_match};
+            INSERT OR REPLACE INTO {new_table} ({cols})
+            SELECT {new_values} WHERE NEW.symbol IS NOT NULL AND NEW.timestamp IS NOT NULL;
+        END
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {new_table}_del AFTER DELETE ON {table}
+        BEGIN
+            DELETE FROM {new_table} WHERE {key_match};
+        END
+        """
+    )
+
+
+def _drop_mirror_triggers(conn: sqlite3.Connection, new_table: str):
+    for suffix in ("ins", "upd", "del"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {new_table}_{suffix}")
+
+
+def migrate_candle_table(
+    conn: sqlite3.Connection,
+    table: str,
+    batch_size: int = MIGRATION_BATCH_SIZE,
+) -> int:
+    """
+    Онлайн-миграция таблицы свечей в раскладку PRIMARY KEY (symbol, timestamp)
+    WITHOUT ROWID.
+
+    Старая таблица остаётся рабочей до финального переименования: записи
+    других процессов во время копирования попадают в новую таблицу триггерами,
+    а ждут они только короткие транзакции пачек.
+    Строки без symbol/timestamp не переносятся. При одинаковом
+    (symbol, timestamp) остаётся строка с большим rowid.
+
+    Returns:
+        int: количество строк в новой таблице (-1, если миграция не нужна)
+    """
+    if is_clustered(conn, table):
+        print(f"[schema] ✅ {table} уже кластеризована по (symbol, timestamp)")
+        return -1
+
+    new_table = f"{table}{_MIGRATION_SUFFIX}"
+    columns = table_columns(conn, table)
+    names = [name for name, _ in columns]
+    cols = ", ".join(names)
+    started = time.perf_counter()
+
+    with conn:
+        # Остатки прерванной миграции
+        _drop_mirror_triggers(conn, new_table)
+        conn.execute(f"DROP TABLE IF EXISTS {new_table}")
+        conn.execute(candle_table_ddl(new_table, columns=columns, if_not_exists=False))
+        _create_mirror_triggers(conn, table, new_table, names)
+
+    try:
+        copied = 0
+        last_rowid = conn.execute(f"SELECT MIN(rowid) - 1 FROM {table}").fetchone()[0]
+        while last_rowid is not None:
+            with conn:
+                # Граница пачки по rowid: копирование идёт в порядке вставки
+                bound = conn.execute(
+                    f"SELECT rowid FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT 1 OFFSET ?",
+                    (last_rowid, batch_size - 1),
+                ).fetchone()
+                upper = bound[0] if bound else conn.execute(
+                    f"SELECT MAX(rowid) FROM {table}"
+                ).fetchone()[0]
+                cursor = conn.execute(
+                    f"""
+                    INSERT OR REPLACE INTO {new_table} ({cols})
+                    SELECT {cols} FROM {table}
+                    WHERE rowid > ? AND rowid <= ?
+                      AND symbol IS NOT NULL AND timestamp IS NOT NULL
+                    ORDER BY rowid
+                    """,
+                    (last_rowid, upper),
+                )
+                copied += cursor.rowcount
+            print(f"[schema] 📦 {table}: скопировано {copied} строк")
+            last_rowid = upper if bound else None
+
+        # Переключение: одна короткая транзакция
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            _drop_mirror_triggers(conn, new_table)
+            _swap_tables(conn, table, new_table)
+    except Exception:
+        with conn:
+            _drop_mirror_triggers(conn, new_table)
+            conn.execute(f"DROP TABLE IF EXISTS {new_table}")
+        raise
+
+    total = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    print(
+        f"[schema] ✅ {table}: {total} строк в раскладке (symbol, timestamp) WITHOUT ROWID "
+        f"за {time.perf_counter() - started:.2f} с"
+    )
+    return total
@@ -49,6 +49,12 @@ def main():
         BASE_DIR / "core/data/data_extended_backfill.py",
     )
 
+    # Шаг 2.1. Пересчёт индикаторов по журналу изменённых диапазонов
+    run(
+        "Шаг 2.1: Пересчёт индикаторов по журналу изменений",
+        BASE_DIR / "core/indicators/dirty_ranges.py",
+    )
+
     # Шаг 3. Проверка и пересчёт EMA через DIM
     print("🔍 Шаг 3: Проверка EMA и пересчёт дыр")
     run(
@@ -58,6 +64,18 @@ def main():
     # Шаг 4. Обновление структуры таблиц
     run("Шаг 4: Синхронизация схемы таблиц", BASE_DIR / "tools/update_db_structure.py")
 
+    # Шаг 4.1. Перевод старых таблиц на ключ (symbol, timestamp) WITHOUT ROWID
+    run(
+        "Шаг 4.1: Миграция таблиц свечей на ключ (symbol, timestamp)",
+        BASE_DIR / "tools/migrate_candle_tables.py",
+    )
+
+    # Шаг 4.2. Индикаторы — в узкое хранилище indicators_<tf>
+    run(
+        "Шаг 4.2: Перенос индикаторов в indicators_<tf>",
+        BASE_DIR / "tools/migrate_indicators_to_store.py",
+    )
+
     # Шаг 5. Логирование пропущенных свечей
     run(
         "Шаг 5: Проверка пропусков в данных",
@@ -78,6 +96,24 @@ def main():
         BASE_DIR / "tools/duplicate_cleaner.py",
     )
 
+    # Шаг 7.1. Пересчёт диапазонов, затронутых очисткой
+    run(
+        "Шаг 7.1: Пересчёт индикаторов по журналу изменений",
+        BASE_DIR / "core/indicators/dirty_ranges.py",
+    )
+
+    # Шаг 7.2. Закрытые месяцы — в Parquet (холодный уровень)
+    run(
+        "Шаг 7.2: Архивация закрытых месяцев в Parquet",
+        BASE_DIR / "tools/archive_cold_tier.py",
+    )
+
+    # Шаг 7.3. Удаление истории за пределами allowed_history
+    run(
+        "Шаг 7.3: Удержание истории (allowed_history)",
+        BASE_DIR / "tools/prune_history.py",
+    )
+
     # Шаг 8. Запуск realtime data loader
     run(
         "Шаг 8: Запуск realtime data loader",
@@ -0,0 +1,82 @@
+"""
+Пересчёт журнала изменений: диапазон от начала истории считается,
+диапазон без контекста остаётся в журнале.
+"""
+
+import sqlite3
+
+import numpy as np
+import pytest
+
+from backend.core.indicators.calc_ema import EMA_PERIODS, ema_multi
+from backend.core.indicators.dirty_ranges import (
+    DIRTY_TABLE,
+    mark_dirty,
+    recompute_dirty_ranges,
+)
+from backend.core.storage.schema import candle_table_ddl
+
+SYMBOL = "BTCUSDT"
+TIMEFRAME = "1m"
+STEP = 60
+T0 = 1_700_000_000 // STEP * STEP
+N = 2000
+
+
+def _make_db(path, holes=()):
+    closes = 60000 + np.cumsum(np.random.default_rng(1).normal(0, 50, N))
+    conn = sqlite3.connect(path)
+    conn.execute(
+        candle_table_ddl(f"candles_{TIMEFRAME}", [f"ema{p}" for p in EMA_PERIODS])
+    )
+    conn.executemany(
+        f"INSERT INTO candles_{TIMEFRAME} "
+        "(symbol, timestamp, timestamp_ms, timestamp_ns, open, high, low, close, volume) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [
+            (SYMBOL, T0 + i * STEP, (T0 + i * STEP) * 1000, (T0 + i * STEP) * 10**9,
+             c, c + 10, c - 10, c, 1.0)
+            for i, c in enumerate(closes.tolist())
+            if i not in holes
+        ],
+    )
+    conn.commit()
+    return conn, closes
+
+
+@pytest.fixture(autouse=True)
+def ring_path(tmp_path, monkeypatch):
+    monkeypatch.setenv("RING_BUFFER_PATH", str(tmp_path / "ring"))
+
+
+def test_range_from_history_start_is_computed(tmp_path):
+    conn, closes = _make_db(str(tmp_path / "market_data.sqlite"))
+    mark_dirty(conn, SYMBOL, TIMEFRAME, T0, T0 + (N - 1) * STEP)
+    conn.commit()
+
+    assert recompute_dirty_ranges(conn) > 0
+
+    cols = [f"ema{p}" for p in EMA_PERIODS]
+    got = np.array(
+        conn.execute(
+            f"SELECT {', '.join(cols)} FROM candles_{TIMEFRAME} ORDER BY timestamp"
+        ).fetchall(),
+        dtype=float,
+    )
+    assert not (got == -1).any()
+    expected = ema_multi(closes, EMA_PERIODS)
+    np.testing.assert_allclose(got, expected, rtol=1e-9)
+    assert conn.execute(f"SELECT COUNT(*) FROM {DIRTY_TABLE}").fetchone()[0] == 0
+
+
+def test_range_without_context_stays_in_journal(tmp_path):
+    conn, _ = _make_db(str(tmp_path / "market_data.sqlite"), holes=(1500,))
+    start, end = T0 + 1510 * STEP, T0 + 1520 * STEP
+    mark_dirty(conn, SYMBOL, TIMEFRAME, start, end)
+    conn.commit()
+
+    recompute_dirty_ranges(conn)
+
+    assert conn.execute(
+        f"SELECT symbol, timeframe, start_ts, end_ts FROM {DIRTY_TABLE}"
+    ).fetchall() == [(SYMBOL, TIMEFRAME, start, end)]
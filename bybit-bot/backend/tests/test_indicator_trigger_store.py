@@ -0,0 +1,108 @@
+"""
+Realtime-триггер индикаторов на БД после migrate_indicators_to_store:
+колонок ema* в candles_<tf> нет, значения читаются и пишутся
+через узкое хранилище indicators_<tf>.
+"""
+
+import sqlite3
+
+import numpy as np
+import pytest
+
+from backend.core.indicators import calc_ema as calc_ema_module
+from backend.core.indicators.ema_state import ema_step, read_ema_row
+from backend.core.indicators.registry import CONFIGURED_INDICATORS, spec_columns
+from backend.core.storage import write_connection
+from backend.core.storage.indicator_store import load_indicator_frame, migrate_to_store
+from backend.core.storage.schema import candle_table_ddl
+from backend.bybit_realtime_data_loader import indicator_trigger
+
+SYMBOL = "BTCUSDT"
+TIMEFRAME = "1m"
+STEP = 60
+T0 = 1_700_000_000 // STEP * STEP
+N = 1200
+WARMUP = 600
+
+
+@pytest.fixture
+def migrated_db(tmp_path, monkeypatch):
+    monkeypatch.setenv("RING_BUFFER_PATH", str(tmp_path / "ring"))
+    db = str(tmp_path / "market_data.sqlite")
+    monkeypatch.setattr(calc_ema_module, "DB_PATH", db)
+    monkeypatch.setattr(indicator_trigger, "DB_PATH", db)
+
+    closes = 60000 + np.cumsum(np.random.default_rng(1).normal(0, 50, N + 2))
+    columns = spec_columns(CONFIGURED_INDICATORS)
+    conn = sqlite3.connect(db)
+    conn.execute(candle_table_ddl(f"candles_{TIMEFRAME}", columns))
+    conn.executemany(
+        f"INSERT INTO candles_{TIMEFRAME} "
+        "(symbol, timestamp, timestamp_ms, timestamp_ns, open, high, low, close, volume) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [
+            (SYMBOL, ts, ts * 1000, ts * 10**9, c, c + 10, c - 10, c, 1.0)
+            for ts, c in ((T0 + i * STEP, float(closes[i])) for i in range(N + 2))
+        ],
+    )
+    conn.commit()
+    # Начало истории — прогрев самого длинного периода
+    calc_ema_module.calc_ema(
+        SYMBOL, TIMEFRAME, calc_ema_module.EMA_PERIODS, T0 + WARMUP * STEP, T0 + (N - 1) * STEP, conn
+    )
+    conn.commit()
+    migrate_to_store(conn, TIMEFRAME, columns)
+    conn.close()
+    return db, closes
+
+
+def _candle(closes, i):
+    close = float(closes[i])
+    return {
+        "symbol": SYMBOL,
+        "interval": TIMEFRAME,
+        "start": (T0 + i * STEP) * 1000,
+        "open": close,
+        "high": close + 10,
+        "low": close - 10,
+        "close": close,
+    }
+
+
+def test_trigger_candle_on_migrated_db(migrated_db):
+    db, closes = migrated_db
+    periods = calc_ema_module.EMA_PERIODS
+    with write_connection(db) as conn:
+        columns = {row[1] for row in conn.execute(f"PRAGMA table_info(candles_{TIMEFRAME})")}
+        assert not columns & {f"ema{p}" for p in periods}
+        prev = read_ema_row(conn, SYMBOL, TIMEFRAME, periods, T0 + (N - 1) * STEP)
+    assert set(prev) == set(periods)
+
+    trigger = indicator_trigger.IndicatorTrigger(publish=lambda *args: None)
+    # Первая свеча — полный пересчёт, вторая — шаг из состояния
+    trigger.trigger_candle(_candle(closes, N))
+    trigger.trigger_candle(_candle(closes, N + 1))
+
+    cols = [f"ema{p}" for p in periods]
+    with write_connection(db) as conn:
+        frame = load_indicator_frame(
+            conn, SYMBOL, TIMEFRAME, [], cols, T0 + (N - 1) * STEP, T0 + (N + 1) * STEP
+        )
+    assert len(frame) == 3
+    for p in periods:
+        expected = ema_step(frame[f"ema{p}"].iloc[0], float(closes[N]), p)
+        assert frame[f"ema{p}"].iloc[1] == pytest.approx(expected, rel=1e-9)
+        expected = ema_step(expected, float(closes[N + 1]), p)
+        assert frame[f"ema{p}"].iloc[2] == pytest.approx(expected, rel=1e-9)
+
+
+def test_read_ema_row_without_values(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "market_data.sqlite"))
+    periods = calc_ema_module.EMA_PERIODS
+    conn.execute(candle_table_ddl(f"candles_{TIMEFRAME}", [f"ema{p}" for p in periods]))
+    conn.execute(
+        f"INSERT INTO candles_{TIMEFRAME} (symbol, timestamp, close) VALUES (?, ?, ?)",
+        (SYMBOL, T0, 1.0),
+    )
+    assert read_ema_row(conn, SYMBOL, TIMEFRAME, periods, T0) == {}
+    assert read_ema_row(conn, SYMBOL, TIMEFRAME, periods, T0 + STEP) == {}
@@ -0,0 +1,74 @@
+"""
+archive_cold_tier.py
+
+Перенос закрытых месяцев candles_<tf> в Parquet (холодный уровень,
+см. backend/core/storage/cold_tier.py).
+
+В SQLite остаются текущий месяц и --keep-months закрытых месяцев перед ним.
+Чтение (db_loader, calc_ema, EzDIM) склеивает оба уровня прозрачно.
+
+Использование:
+    python backend/tools/archive_cold_tier.py [--timeframe 1h 4h] [--symbol BTCUSDT]
+                                              [--keep-months 2]
+"""
+
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parents[1]  # backend/
+PROJECT_ROOT = BASE_DIR.parent  # bybit-bot/
+DB_PATH = PROJECT_ROOT / "db" / "market_data.sqlite"
+
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from backend.config.timeframes_config import TIMEFRAMES_CONFIG
+from backend.core.storage import enable_wal, open_connection
+from backend.core.storage.cold_tier import (
+    DEFAULT_KEEP_MONTHS,
+    archive_closed_months,
+    cold_cutoff,
+    cold_root,
+)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Архивация закрытых месяцев в Parquet")
+    parser.add_argument("--timeframe", nargs="+", help="Таймфреймы (по умолчанию все)")
+    parser.add_argument("--symbol", nargs="+", help="Символы (по умолчанию все)")
+    parser.add_argument(
+        "--keep-months",
+        type=int,
+        default=DEFAULT_KEEP_MONTHS,
+        help="Закрытых месяцев в SQLite",
+    )
+    args = parser.parse_args()
+
+    conn = open_connection(DB_PATH)
+    enable_wal(conn)
+    cutoff = cold_cutoff(int(time.time()), args.keep_months)
+    print(f"📦 Холодный уровень: {cold_root(conn)}, архивируется всё до {cutoff}")
+
+    total = 0
+    try:
+        for tf in args.timeframe or list(TIMEFRAMES_CONFIG):
+            table = f"candles_{tf}"
+            exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = ?",
+                (table,),
+            ).fetchone()
+            if not exists:
+                print(f"⏭ Таблица {table} не существует")
+                continue
+            total += sum(archive_closed_months(conn, tf, cutoff, args.symbol).values())
+    finally:
+        conn.close()
+
+    print(f"\n🏁 Перенесено в Parquet {total} строк.")
+
+
+if __name__ == "__main__":
+    main()
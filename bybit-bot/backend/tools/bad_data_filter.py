@@ -16,8 +16,13 @@ DB_PATH = PROJECT_ROOT / "db" / "market_data.sqlite"
 conn = sqlite3.connect(DB_PATH)
 cursor = conn.cursor()
 
+# Таблицы и компактные представления (удаление идёт через их триггер)
 cursor.execute(
-    "SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'candles_%'"
+    """
+    SELECT name FROM sqlite_master
+    WHERE type IN ('table', 'view') AND name LIKE 'candles_%'
+      AND name NOT LIKE '%_wide'
+"""
 )
 tables = [row[0] for row in cursor.fetchall()]
 
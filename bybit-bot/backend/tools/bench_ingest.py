@@ -0,0 +1,211 @@
+"""
+bench_ingest.py
+
+Сквозной замер пропускной способности загрузки свечей на локальном
+мок-сервере (mock_exchange.py), без сети и без рабочей БД.
+
+- REST: async_backfill + data_extended_backfill.write_page (проверка,
+  запись, индекс покрытия, журнал окон) — свечей в секунду от первого
+  запроса до записи последней страницы
+- WS: KlineStream → WSClient → CandleHandler (очередь отложенной записи,
+  кольцевые буферы) — свечей в секунду от подключения до записи последней
+  свечи, метрики очереди, повторы и пропуски, внесённые сервером
+
+БД, кольцевые буферы и архив — во временном каталоге. --json печатает
+итог одной строкой JSON (сравнение запусков, CI).
+
+Использование:
+    python backend/tools/bench_ingest.py [--days 30] [--timeframes 1m 5m]
+        [--ws-candles 20000] [--ws-rate 0] [--gap-rate 0.001] [--dup-rate 0.01]
+        [--error-rate 0.01] [--json]
+"""
+
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parents[1]  # backend/
+PROJECT_ROOT = BASE_DIR.parent  # bybit-bot/
+
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+SYMBOL = "BTCUSDT"
+WS_SYMBOL = "ETHUSDT"  # отдельный символ: WS-свечи не пересекаются с REST-фазой
+WS_TIMEOUT = 120
+
+
+def _setup_env(workdir: Path):
+    """Временная БД до импорта модулей: DB_PATH читается при импорте"""
+    os.environ["DB_PATH"] = str(workdir / "market_data.sqlite")
+    os.environ["RING_BUFFER_PATH"] = str(workdir / "ring")
+    os.environ["COLD_TIER_PATH"] = str(workdir / "cold")
+    os.environ["SYMBOL"] = SYMBOL
+    return os.environ["DB_PATH"]
+
+
+def bench_rest(exchange, timeframes, days: int, concurrency: int) -> dict:
+    from backend.core.data import data_extended_backfill
+    from backend.core.data.async_backfill import TokenBucket, run_backfill
+
+    now = int(time.time())
+    gaps = {tf: [(now - days * 86400, now)] for tf in timeframes}
+    # Лимит частоты не замеряется: ведро заведомо шире мок-сервера
+    bucket = TokenBucket(rate=1_000_000, capacity=concurrency)
+    with contextlib.redirect_stdout(io.StringIO()):
+        report = asyncio.run(
+            run_backfill(
+                SYMBOL,
+                gaps,
+                data_extended_backfill.write_page,
+                base_url=exchange.rest_url,
+                bucket=bucket,
+                concurrency=concurrency,
+            )
+        )
+    candles = sum(report["candles"].values())
+    return {
+        "candles": candles,
+        "pages": report["pages"],
+        "server_errors": exchange.stats["rest_errors"],
+        "retries": report["retries"],
+        "failed": len(report["failed"]),
+        "elapsed": round(report["elapsed"], 3),
+        "candles_per_sec": round(candles / report["elapsed"], 1) if report["elapsed"] else None,
+    }
+
+
+def bench_ws(exchange, db_path: str, timeframes, candles_per_topic: int) -> dict:
+    from backend.bybit_realtime_data_loader import ring_feed
+    from backend.bybit_realtime_data_loader.candle_handler import CandleHandler
+    from backend.bybit_realtime_data_loader.kline_stream import KlineStream
+    from backend.bybit_realtime_data_loader.ws_client import WSClient
+    from backend.core.data.async_backfill import INTERVAL_MAP
+    from backend.core.storage import candle_table_ddl, write_connection
+
+    with write_connection(db_path) as conn:
+        for tf in timeframes:
+            conn.execute(candle_table_ddl(f"candles_{tf}"))
+
+    # Кольцевые буферы дозаполняются из временной БД, а не из рабочей
+    ring_feed.DB_PATH = db_path
+
+    persisted = []
+    received = []
+    handler = CandleHandler(db_path, on_persisted=lambda candle: persisted.append(time.perf_counter()))
+
+    def on_candle(candle):
+        received.append(candle["start"])
+        handler.handle_candle(candle)
+    streams = []
+
+    def factory():
+        stream = KlineStream(exchange.ws_url, reconnect_delay=0.1)
+        streams.append(stream)
+        return stream
+
+    client = WSClient(
+        [WS_SYMBOL], [INTERVAL_MAP[tf] for tf in timeframes], on_candle, ws_factory=factory
+    )
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        client.connect()
+        deadline = started + WS_TIMEOUT
+        # Сервер отправил все свечи и клиент принял все сообщения
+        while time.perf_counter() < deadline and not (
+            exchange.stats["ws_done"] >= len(timeframes)
+            and len(received) >= exchange.stats["ws_messages"]
+        ):
+            time.sleep(0.05)
+        client.close()
+        handler.close()
+
+    metrics = handler.metrics()
+    with write_connection(db_path) as conn:
+        stored = sum(
+            conn.execute(
+                f"SELECT COUNT(*) FROM candles_{tf} WHERE symbol = ?", (WS_SYMBOL,)
+            ).fetchone()[0]
+            for tf in timeframes
+        )
+    elapsed = (persisted[-1] - started) if persisted else 0.0
+    return {
+        "messages": exchange.stats["ws_messages"],
+        "received": len(received),
+        "written": metrics["written"],
+        "candles": stored,
+        "expected": len(timeframes) * candles_per_topic - len(exchange.stats["ws_gaps"]),
+        "server_gaps": len(exchange.stats["ws_gaps"]),
+        "server_duplicates": exchange.stats["ws_duplicates"],
+        "coalesced": metrics["coalesced"],
+        "reconnects": sum(stream.reconnects for stream in streams),
+        "elapsed": round(elapsed, 3),
+        "candles_per_sec": round(metrics["written"] / elapsed, 1) if elapsed else None,
+        "flush_ms": metrics["flush_ms"],
+        "lag_ms": metrics["lag_ms"],
+        "max_depth": metrics["max_depth"],
+    }
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Замер загрузки свечей на мок-сервере")
+    parser.add_argument("--timeframes", nargs="+", default=["1m", "5m"])
+    parser.add_argument("--days", type=int, default=30, help="Глубина REST-загрузки")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--ws-candles", type=int, default=20_000, help="Свечей WS на таймфрейм")
+    parser.add_argument("--ws-rate", type=float, default=0, help="Сообщений WS в секунду (0 — без ограничения)")
+    parser.add_argument("--gap-rate", type=float, default=0.0)
+    parser.add_argument("--dup-rate", type=float, default=0.0)
+    parser.add_argument("--disconnect-after", type=int, default=None)
+    parser.add_argument("--db", help="Отдавать записанные свечи из этой БД")
+    parser.add_argument("--json", action="store_true", help="Итог одной строкой JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench_ingest_") as workdir:
+        db_path = _setup_env(Path(workdir))
+        from backend.tools.mock_exchange import MockExchange, RecordedCandles, SyntheticCandles
+
+        source = RecordedCandles(args.db) if args.db else SyntheticCandles()
+        with MockExchange(
+            source,
+            error_rate=args.error_rate,
+            ws_rate=args.ws_rate,
+            ws_count=args.ws_candles,
+            gap_rate=args.gap_rate,
+            dup_rate=args.dup_rate,
+            disconnect_after=args.disconnect_after,
+        ) as exchange:
+            result = {
+                "rest": bench_rest(exchange, args.timeframes, args.days, args.concurrency),
+                "ws": bench_ws(exchange, db_path, args.timeframes, args.ws_candles),
+            }
+
+    if args.json:
+        print(json.dumps(result))
+        return
+    rest, ws = result["rest"], result["ws"]
+    print(
+        f"📥 [bench] REST: {rest['candles']} свечей, {rest['pages']} страниц за "
+        f"{rest['elapsed']} с → {rest['candles_per_sec']} свечей/с "
+        f"(повторов {rest['retries']}, ошибок {rest['failed']})"
+    )
+    print(
+        f"📡 [bench] WS: {ws['candles']}/{ws['expected']} свечей за {ws['elapsed']} с "
+        f"→ {ws['candles_per_sec']} свечей/с; повторов {ws['server_duplicates']} "
+        f"(схлопнуто {ws['coalesced']}), пропусков {ws['server_gaps']}, "
+        f"переподключений {ws['reconnects']}"
+    )
+    print(f"   lag_ms {ws['lag_ms']}  flush_ms {ws['flush_ms']}  max_depth {ws['max_depth']}")
+
+
+if __name__ == "__main__":
+    main()
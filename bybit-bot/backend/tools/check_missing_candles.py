@@ -7,23 +7,32 @@ if str(BASE_DIR) not in sys.path:
 PROJECT_ROOT = BASE_DIR.parent  # bybit-bot/
 DB_PATH = PROJECT_ROOT / "db" / "market_data.sqlite"
 
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
 import sqlite3
-import pandas as pd
-import os
 from config.timeframes_config import TIMEFRAMES_CONFIG
+from backend.core.data.gaps import iter_gaps
+
+# Проверяются последние CHECK_WINDOW свечей каждого символа
+CHECK_WINDOW = 1500
 
 
-def analyze_missing_timestamps(df, tf):
+def analyze_missing_timestamps(conn, table, tf):
     Path("logs").mkdir(parents=True, exist_ok=True)
     interval = TIMEFRAMES_CONFIG[tf]["interval_sec"]
-    df = df.sort_values("timestamp")
-    df["diff"] = df["timestamp"].diff()
-    gaps = df[df["diff"] > interval]
-    if not gaps.empty:
-        earliest_missing = int(gaps.iloc[0]["timestamp"] - interval)
-        print(f"   🔎 earliest missing = {earliest_missing}")
+    latest = conn.execute(f"SELECT MAX(timestamp) FROM {table}").fetchone()[0]
+    start = latest - (CHECK_WINDOW - 1) * interval
+
+    # Пропуски ищутся в SQLite, в Python приходят только их границы
+    first = min(
+        (gap_start for _, gap_start, _ in iter_gaps(conn, table, interval, start_ts=start)),
+        default=None,
+    )
+    if first is not None:
+        print(f"   🔎 earliest missing = {first}")
         with open("logs/earliest_missing_ts.txt", "w") as f:
-            f.write(str(earliest_missing))
+            f.write(str(first))
     else:
         print("   ✅ Пропусков нет")
 
@@ -31,16 +40,16 @@ def analyze_missing_timestamps(df, tf):
 def check_table(table):
     tf = table.replace("candles_", "")
     conn = sqlite3.connect(DB_PATH)
-    query = f"SELECT DISTINCT timestamp FROM {table} ORDER BY timestamp DESC LIMIT 1500"
-    df = pd.read_sql_query(query, conn)
-    conn.close()
-
-    if df.empty:
-        print(f"   ⚠ Таблица пуста: {table}")
-        return
-
-    print(f"🔍 Проверка {table}.")
-    analyze_missing_timestamps(df, tf)
+    try:
+        exists = conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone()
+        if not exists:
+            print(f"   ⚠ Таблица пуста: {table}")
+            return
+
+        print(f"🔍 Проверка {table}.")
+        analyze_missing_timestamps(conn, table, tf)
+    finally:
+        conn.close()
 
 
 def main():
@@ -1,4 +1,12 @@
 import sqlite3
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]  # bybit-bot/
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from backend.core.storage.coverage import drop_coverage
 
 # Путь к базе данных
 DB_PATH = "bybit-bot/db/market_data.sqlite"
@@ -22,6 +30,9 @@ def clear_tables():
     cur = conn.cursor()
     for table in CANDLES_TABLES:
         print(f"Очищаю таблицу {table}...")
+        # Индекс покрытия снимается целиком (без триггера на каждую строку)
+        # и строится заново при следующем ensure_coverage
+        drop_coverage(conn, table.replace("candles_", ""))
         cur.execute(f"DELETE FROM {table}")
     conn.commit()
     conn.close()
@@ -1,5 +1,13 @@
 import sqlite3
 import re
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from backend.core.storage.schema import is_clustered
 
 DB_PATH = "D:/_project_bybit_bot/bybit-bot/market_data.sqlite"
 
@@ -12,6 +20,10 @@ tables = [row[0] for row in cursor.fetchall() if re.match(r"candles_\w+", row[0]
 
 for table in tables:
     index_name = f"idx_{table}_symbol_timestamp"
+    if is_clustered(conn, table):
+        # Первичный ключ (symbol, timestamp) уже и есть этот индекс
+        print(f"⏭ {table}: кластеризована по (symbol, timestamp), индекс не нужен")
+        continue
     try:
         cursor.execute(
             f"""
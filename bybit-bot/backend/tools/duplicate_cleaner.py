@@ -2,18 +2,30 @@
 duplicate_cleaner.py
 
 Удаляет дубликаты свечей из таблиц candles_<tf> в базе данных,
-оставляя только самую «последнюю» запись по каждому timestamp.
+оставляя только самую «последнюю» запись по каждой паре (symbol, timestamp).
 Использует MAX(rowid), чтобы не удалять загруженные исторические свечи
 из data_extended_backfill.py
+Таблицы с ключом (symbol, timestamp) WITHOUT ROWID дубликатов иметь не могут
+и пропускаются (rowid у них нет).
+Затронутые диапазоны записываются в журнал изменений (dirty_ranges)
+для пересчёта индикаторов.
 """
 
 import sqlite3
+import sys
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parents[1]  # backend/
 PROJECT_ROOT = BASE_DIR.parent  # bybit-bot/
 DB_PATH = PROJECT_ROOT / "db" / "market_data.sqlite"
 
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from backend.core.indicators.dirty_ranges import mark_dirty
+from backend.core.storage.ring_buffer import invalidate_ring
+from backend.core.storage.schema import is_clustered
+
 
 conn = sqlite3.connect(DB_PATH)
 cursor = conn.cursor()
@@ -26,10 +38,16 @@ tables = [row[0] for row in cursor.fetchall()]
 for table in tables:
     print(f"\n🔍 Проверка таблицы: {table}")
 
+    if is_clustered(conn, table):
+        print("   ✅ Ключ (symbol, timestamp) — дубликаты невозможны")
+        continue
+
     cursor.execute(f"SELECT COUNT(*) FROM {table}")
     total = cursor.fetchone()[0]
 
-    cursor.execute(f"SELECT COUNT(DISTINCT timestamp) FROM {table}")
+    cursor.execute(
+        f"SELECT COUNT(*) FROM (SELECT 1 FROM {table} GROUP BY symbol, timestamp)"
+    )
     unique = cursor.fetchone()[0]
 
     duplicates = total - unique
@@ -39,16 +57,33 @@ for table in tables:
 
     print(f"   ⚠ Найдено дубликатов: {duplicates}")
 
+    # Диапазоны удаляемых строк по символам — для журнала изменений
+    cursor.execute(
+        f"""
+        SELECT symbol, MIN(timestamp), MAX(timestamp) FROM {table}
+        WHERE rowid NOT IN (
+            SELECT MAX(rowid) FROM {table} GROUP BY symbol, timestamp
+        )
+        GROUP BY symbol
+    """
+    )
+    dirty = cursor.fetchall()
+
     # Используем MAX(rowid), чтобы сохранить последние вставленные записи (из backfill)
     cursor.execute(
         f"""
         DELETE FROM {table}
         WHERE rowid NOT IN (
-            SELECT MAX(rowid) FROM {table} GROUP BY timestamp
+            SELECT MAX(rowid) FROM {table} GROUP BY symbol, timestamp
         )
     """
     )
+    timeframe = table[len("candles_") :]
+    for symbol, start_ts, end_ts in dirty:
+        mark_dirty(conn, symbol, timeframe, start_ts, end_ts)
     conn.commit()
+    for symbol, start_ts, end_ts in dirty:
+        invalidate_ring(symbol, timeframe, start_ts, end_ts)
 
     print(f"   🧹 Удалено: {duplicates} записей")
 
@@ -0,0 +1,62 @@
+"""
+migrate_candle_tables.py
+
+Онлайн-миграция таблиц candles_<tf> в раскладку
+PRIMARY KEY (symbol, timestamp) WITHOUT ROWID (см. backend/core/storage/schema.py).
+
+Загрузчики могут работать во время миграции: изменения старой таблицы
+зеркалируются в новую триггерами, копирование идёт короткими пачками.
+Отдельный индекс (symbol, timestamp) из create_indexes.py после миграции
+не нужен — он удаляется вместе со старой таблицей.
+
+Использование:
+    python backend/tools/migrate_candle_tables.py [--timeframe 1h] [--batch 50000]
+"""
+
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parents[1]  # backend/
+PROJECT_ROOT = BASE_DIR.parent  # bybit-bot/
+DB_PATH = PROJECT_ROOT / "db" / "market_data.sqlite"
+
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from backend.core.storage import open_connection, enable_wal
+from backend.core.storage.schema import MIGRATION_BATCH_SIZE, migrate_candle_table
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Миграция candles_<tf> на ключ (symbol, timestamp)")
+    parser.add_argument("--timeframe", nargs="+", help="Таймфреймы (по умолчанию все таблицы)")
+    parser.add_argument("--batch", type=int, default=MIGRATION_BATCH_SIZE, help="Строк в пачке")
+    args = parser.parse_args()
+
+    conn = open_connection(DB_PATH)
+    enable_wal(conn)
+    try:
+        if args.timeframe:
+            tables = [f"candles_{tf}" for tf in args.timeframe]
+        else:
+            tables = [
+                row[0]
+                for row in conn.execute(
+                    "SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'candles\\_%' ESCAPE '\\'"
+                )
+                if not row[0].endswith(("_tmp", "_clustered"))
+            ]
+
+        for table in tables:
+            print(f"\n🔄 {table}")
+            migrate_candle_table(conn, table, batch_size=args.batch)
+    finally:
+        conn.close()
+
+    print("\n🏁 Миграция завершена.")
+
+
+if __name__ == "__main__":
+    main()
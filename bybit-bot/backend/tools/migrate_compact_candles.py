@@ -0,0 +1,147 @@
+"""
+migrate_compact_candles.py
+
+Перевод candles_<tf> в компактную раскладку (backend/core/storage/compact.py)
+и отчёт об экономии: размер таблицы с индексами, байт на строку и время
+полного прохода по close до и после миграции.
+
+- символы — в таблицу symbols, в строке целый id
+- timestamp_ms / timestamp_ns — вычисляются представлением
+- --fixed-point: цены и объём целыми числами шагов инструмента
+  (tickSize / qtyStep из Bybit instruments-info); шаг задаётся один раз
+  на символ, до первой компактной таблицы
+
+Требуется узкое хранилище индикаторов (migrate_indicators_to_store.py).
+
+Использование:
+    python backend/tools/migrate_compact_candles.py [--timeframe 1m 5m]
+        [--fixed-point] [--step BTCUSDT=0.1:0.001] [--report-only]
+"""
+
+import os
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parents[1]  # backend/
+PROJECT_ROOT = BASE_DIR.parent  # bybit-bot/
+DB_PATH = PROJECT_ROOT / "db" / "market_data.sqlite"
+
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from backend.config.timeframes_config import TIMEFRAMES_CONFIG
+from backend.core.storage import enable_wal, open_connection
+from backend.core.storage.compact import migrate_to_compact, size_report
+from backend.core.storage.retention import reclaim_space
+
+
+def fetch_instrument_steps(symbols):
+    """{symbol: (tickSize, qtyStep)} из Bybit instruments-info (linear)"""
+    from pybit.unified_trading import HTTP
+
+    session = HTTP(testnet=False)
+    steps = {}
+    for symbol in symbols:
+        try:
+            info = session.get_instruments_info(category="linear", symbol=symbol)
+            item = info["result"]["list"][0]
+            steps[symbol] = (
+                float(item["priceFilter"]["tickSize"]),
+                float(item["lotSizeFilter"]["qtyStep"]),
+            )
+            print(f"🔢 {symbol}: tickSize={steps[symbol][0]} qtyStep={steps[symbol][1]}")
+        except Exception as e:
+            print(f"⚠️ {symbol}: не удалось получить шаги инструмента: {e}")
+    return steps
+
+
+def parse_steps(values):
+    """BTCUSDT=0.1:0.001 → {"BTCUSDT": (0.1, 0.001)}"""
+    steps = {}
+    for value in values or []:
+        symbol, _, spec = value.partition("=")
+        price, _, qty = spec.partition(":")
+        steps[symbol] = (float(price) if price else None, float(qty) if qty else None)
+    return steps
+
+
+def _format_report(report):
+    size = report["bytes"]
+    size_text = f"{size / 2**20:,.2f} МБ" if size is not None else "н/д"
+    per_row = report["bytes_per_row"]
+    per_row_text = f"{per_row:.1f} Б/строка" if per_row is not None else "н/д"
+    per_scan = report["ns_per_row"]
+    scan_text = f"{per_scan:.0f} нс/строка" if per_scan is not None else "н/д"
+    return f"{report['rows']:,} строк, {size_text}, {per_row_text}, проход {scan_text}"
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Компактная раскладка свечей")
+    parser.add_argument("--timeframe", nargs="+", help="Таймфреймы (по умолчанию все)")
+    parser.add_argument(
+        "--fixed-point",
+        action="store_true",
+        help="Цены и объём целыми шагами инструмента (шаги с биржи)",
+    )
+    parser.add_argument(
+        "--step", nargs="+", help="Шаги вручную: SYMBOL=PRICE_STEP[:QTY_STEP]"
+    )
+    parser.add_argument(
+        "--report-only", action="store_true", help="Только отчёт о размере"
+    )
+    args = parser.parse_args()
+
+    if not os.path.exists(DB_PATH):
+        print(f"❌ DB not found: {DB_PATH}")
+        return
+
+    conn = open_connection(DB_PATH)
+    enable_wal(conn)
+    file_before = os.path.getsize(DB_PATH)
+    try:
+        for tf in args.timeframe or list(TIMEFRAMES_CONFIG):
+            table = f"candles_{tf}"
+            exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = ?",
+                (table,),
+            ).fetchone()
+            if not exists:
+                print(f"⏭ Таблица {table} не существует")
+                continue
+
+            before = size_report(conn, table)
+            print(f"\n📊 {table} до:    {_format_report(before)}")
+            if args.report_only:
+                continue
+
+            steps = {}
+            if args.fixed_point:
+                symbols = [
+                    row[0] for row in conn.execute(f"SELECT DISTINCT symbol FROM {table}")
+                ]
+                steps = fetch_instrument_steps(symbols)
+            steps.update(parse_steps(args.step))
+
+            if migrate_to_compact(conn, tf, steps) < 0:
+                continue
+            after = size_report(conn, table)
+            print(f"📊 {table} после: {_format_report(after)}")
+            if before["bytes"] and after["bytes"] is not None:
+                print(f"   💾 Экономия: {1 - after['bytes'] / before['bytes']:.0%}")
+
+        pages = reclaim_space(conn)
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+
+    file_after = os.path.getsize(DB_PATH)
+    print(
+        f"\n🏁 Файл БД: {file_before / 2**20:,.1f} МБ → {file_after / 2**20:,.1f} МБ "
+        f"(возвращено страниц: {pages})"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+migrate_indicators_to_store.py
+
+Перенос индикаторов из колонок candles_<tf> в узкое хранилище indicators_<tf>
+(см. backend/core/storage/indicator_store.py).
+
+После переноса:
+- candles_<tf> содержит только OHLCV — это последнее пересоздание таблицы
+- смена ema_periods.txt больше не перестраивает candles_<tf>: новый период
+  досчитывает EzDIM (пустые значения = дыры), удалённый период стирает
+  update_db_structure.py одним удалением диапазона ключа
+- candles_<tf>_wide — представление со старой широкой раскладкой
+
+Использование:
+    python backend/tools/migrate_indicators_to_store.py [--timeframe 1h 4h]
+"""
+
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parents[1]  # backend/
+PROJECT_ROOT = BASE_DIR.parent  # bybit-bot/
+DB_PATH = PROJECT_ROOT / "db" / "market_data.sqlite"
+
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from backend.config.timeframes_config import TIMEFRAMES_CONFIG
+from backend.core.indicators.calc_ema import EMA_PERIODS
+from backend.core.indicators.registry import (
+    CONFIGURED_INDICATORS,
+    spec_columns,
+    spec_for_column,
+)
+from backend.core.storage import enable_wal, open_connection
+from backend.core.storage.indicator_store import migrate_to_store
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Перенос индикаторов в indicators_<tf>")
+    parser.add_argument("--timeframe", nargs="+", help="Таймфреймы (по умолчанию все)")
+    args = parser.parse_args()
+
+    configured = [f"ema{p}" for p in EMA_PERIODS] + spec_columns(
+        [spec for spec in CONFIGURED_INDICATORS if spec[0] != "ema"]
+    )
+
+    conn = open_connection(DB_PATH)
+    enable_wal(conn)
+    total = 0
+    try:
+        for tf in args.timeframe or list(TIMEFRAMES_CONFIG):
+            table = f"candles_{tf}"
+            exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name = ?", (table,)
+            ).fetchone()
+            if not exists:
+                print(f"⏭ Таблица {table} не существует")
+                continue
+
+            # Все колонки индикаторов таблицы (включая лишние — их удалит update_db_structure)
+            found = [
+                row[1]
+                for row in conn.execute(f"PRAGMA table_info({table})")
+                if spec_for_column(row[1]) is not None
+            ]
+            print(f"\n🔄 {table}: {len(found)} колонок индикаторов")
+            total += migrate_to_store(
+                conn, tf, list(dict.fromkeys(configured + found))
+            )
+    finally:
+        conn.close()
+
+    print(f"\n🏁 Перенесено {total} значений.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,469 @@
+"""
+mock_exchange.py
+
+Локальная имитация публичного API Bybit для офлайн-замеров пропускной
+способности загрузчиков.
+
+- REST GET /v5/market/kline: страницы от новых свечей к старым, limit до 1000,
+  формат ответа Bybit (retCode/result.list); error_rate — доля ответов
+  429 / retCode 10006 / 500 для проверки повторов и отката async_backfill
+- WebSocket: подписка {"op": "subscribe", "args": ["kline.<interval>.<symbol>"]},
+  ping/pong; по каждому топику отправляются подтверждённые свечи подряд
+  со скоростью ws_rate сообщений в секунду (симулированное время —
+  свеча за свечой, без ожидания интервала). gap_rate — доля пропущенных
+  свечей, dup_rate — доля повторов, disconnect_after — разрыв соединения
+  после N сообщений (проверка переподключения)
+
+Свечи — синтетические (SyntheticCandles: детерминированы по symbol, tf
+и timestamp, одинаковы в REST и WS) или записанные (RecordedCandles:
+таблицы candles_<tf> существующей БД).
+
+Загрузчики подключаются через BYBIT_REST_URL / BYBIT_WS_URL
+(config/exchange_config.py) или параметры base_url / ws_factory.
+
+Использование:
+    python backend/tools/mock_exchange.py [--rest-port 8801] [--ws-port 8802]
+        [--ws-rate 1000] [--gap-rate 0.01] [--dup-rate 0.01] [--db path]
+"""
+
+import asyncio
+import json
+import random
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+BASE_DIR = Path(__file__).resolve().parents[1]  # backend/
+PROJECT_ROOT = BASE_DIR.parent  # bybit-bot/
+
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from websockets.asyncio.server import serve
+from websockets.exceptions import ConnectionClosed
+
+from backend.config.timeframes_config import TIMEFRAMES_CONFIG
+from backend.core.data.async_backfill import INTERVAL_MAP, PAGE_LIMIT
+from backend.core.data.rest_client import KLINE_PATH
+
+# Интервал Bybit → таймфрейм проекта
+TIMEFRAME_MAP = {interval: tf for tf, interval in INTERVAL_MAP.items()}
+DEFAULT_PAGE = 200
+WS_BATCH = 100  # сообщений между паузами при высоком ws_rate
+
+
+class SyntheticCandles:
+    """Детерминированные свечи: одна и та же свеча при каждом запросе"""
+
+    def __init__(self, seed: int = 0, base_price: float = 30000.0, listing_ts: int = 0):
+        self.seed = seed
+        self.base_price = base_price
+        self.listing_ts = listing_ts  # раньше — пустые страницы
+
+    def candle(self, symbol: str, tf: str, ts: int) -> Dict:
+        rnd = random.Random(zlib.crc32(f"{self.seed}:{symbol}:{tf}:{ts}".encode()))
+        open_ = self.base_price * (1 + 0.2 * ((ts // 86400) % 30 - 15) / 15)
+        close = open_ * (1 + rnd.uniform(-0.002, 0.002))
+        return {
+            "timestamp": ts,
+            "open": round(open_, 2),
+            "high": round(max(open_, close) * (1 + rnd.uniform(0, 0.001)), 2),
+            "low": round(min(open_, close) * (1 - rnd.uniform(0, 0.001)), 2),
+            "close": round(close, 2),
+            "volume": round(rnd.uniform(1, 100), 3),
+        }
+
+    def candles(self, symbol: str, tf: str, start: int, end: int, limit: int) -> List[Dict]:
+        """Свечи [start, end] от новых к старым, не больше limit"""
+        step = TIMEFRAMES_CONFIG[tf]["interval_sec"]
+        first = max(start, self.listing_ts)
+        first += -first % step
+        last = end - end % step
+        result = []
+        ts = last
+        while ts >= first and len(result) < limit:
+            result.append(self.candle(symbol, tf, ts))
+            ts -= step
+        return result
+
+
+class RecordedCandles:
+    """Свечи из таблиц candles_<tf> существующей БД (только чтение)"""
+
+    def __init__(self, db_path: str):
+        self.db_path = str(db_path)
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+            self._local.conn = conn
+        return conn
+
+    def candles(self, symbol: str, tf: str, start: int, end: int, limit: int) -> List[Dict]:
+        # Компактная раскладка читается через представление candles_<tf>
+        rows = self._conn().execute(
+            f"SELECT timestamp, open, high, low, close, volume FROM candles_{tf} "
+            "WHERE symbol = ? AND timestamp BETWEEN ? AND ? "
+            "ORDER BY timestamp DESC LIMIT ?",
+            (symbol, start, end, limit),
+        ).fetchall()
+        keys = ("timestamp", "open", "high", "low", "close", "volume")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def candle(self, symbol: str, tf: str, ts: int) -> Optional[Dict]:
+        rows = self.candles(symbol, tf, ts, ts, 1)
+        return rows[0] if rows else None
+
+
+def _kline_row(candle: Dict) -> List[str]:
+    return [
+        str(candle["timestamp"] * 1000),
+        *(str(candle[key]) for key in ("open", "high", "low", "close", "volume")),
+        str(round(candle["close"] * candle["volume"], 4)),  # turnover
+    ]
+
+
+def _ws_kline(candle: Dict, tf: str) -> Dict:
+    step = TIMEFRAMES_CONFIG[tf]["interval_sec"]
+    start = candle["timestamp"] * 1000
+    return {
+        "start": start,
+        "end": start + step * 1000 - 1,
+        "interval": INTERVAL_MAP[tf],
+        **{key: str(candle[key]) for key in ("open", "close", "high", "low", "volume")},
+        "turnover": str(round(candle["close"] * candle["volume"], 4)),
+        "confirm": True,
+        "timestamp": start + step * 1000,
+    }
+
+
+class MockExchange:
+    """
+    REST и WebSocket сервер в фоновых потоках.
+
+    Args:
+        source: SyntheticCandles или RecordedCandles
+        host: адрес прослушивания
+        rest_port, ws_port: порты (0 — свободный)
+        error_rate: доля ошибочных REST-ответов
+        ws_rate: сообщений WS в секунду на соединение (0 — без ограничения)
+        ws_start: первая свеча WS (по умолчанию ws_count свечей до текущего времени)
+        ws_count: свечей на топик (None — без конца)
+        gap_rate, dup_rate: доля пропущенных / повторённых свечей WS
+        disconnect_after: разрыв соединения после N сообщений WS
+        seed: зерно случайных ошибок, пропусков и повторов
+    """
+
+    def __init__(
+        self,
+        source=None,
+        host: str = "127.0.0.1",
+        rest_port: int = 0,
+        ws_port: int = 0,
+        error_rate: float = 0.0,
+        ws_rate: float = 1000.0,
+        ws_start: Optional[int] = None,
+        ws_count: Optional[int] = 10_000,
+        gap_rate: float = 0.0,
+        dup_rate: float = 0.0,
+        disconnect_after: Optional[int] = None,
+        seed: int = 0,
+    ):
+        self.source = source or SyntheticCandles(seed)
+        self.host = host
+        self.error_rate = error_rate
+        self.ws_rate = ws_rate
+        self.ws_start = ws_start
+        self.ws_count = ws_count
+        self.gap_rate = gap_rate
+        self.dup_rate = dup_rate
+        self.disconnect_after = disconnect_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        # Позиция каждого топика переживает переподключение: свечи,
+        # не отправленные до разрыва, клиент должен догрузить сам
+        self._positions: Dict[str, List[int]] = {}  # topic → [первая, следующая]
+        self.stats = {
+            "rest_requests": 0,
+            "rest_errors": 0,
+            "rest_candles": 0,
+            "ws_connections": 0,
+            "ws_messages": 0,
+            "ws_gaps": [],  # (topic, timestamp) пропущенных свечей
+            "ws_duplicates": 0,
+            "ws_done": 0,  # топиков, отправивших ws_count свечей
+        }
+
+        self._http = ThreadingHTTPServer((host, rest_port), self._handler_class())
+        self._http.daemon_threads = True
+        self._loop = asyncio.new_event_loop()
+        self._ws_server = None
+        self._ws_ready = threading.Event()
+        self._ws_port = ws_port
+        self._threads: List[threading.Thread] = []
+
+    # === Запуск ===
+
+    @property
+    def rest_url(self) -> str:
+        return f"http://{self.host}:{self._http.server_address[1]}"
+
+    @property
+    def ws_url(self) -> str:
+        return f"ws://{self.host}:{self._ws_port}"
+
+    def start(self) -> "MockExchange":
+        self._threads = [
+            threading.Thread(target=self._http.serve_forever, name="mock-rest", daemon=True),
+            threading.Thread(target=self._run_ws, name="mock-ws", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        self._ws_ready.wait(5)
+        return self
+
+    def stop(self):
+        self._http.shutdown()
+        self._http.server_close()
+        if self._ws_server is not None:
+            asyncio.run_coroutine_threadsafe(self._close_ws(), self._loop).result(30)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        for thread in self._threads:
+            thread.join(timeout=5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _chance(self, rate: float) -> bool:
+        if not rate:
+            return False
+        with self._lock:
+            return self._random.random() < rate
+
+    # === REST ===
+
+    def _handler_class(self):
+        exchange = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path != KLINE_PATH:
+                    self._reply(404, {"retCode": 10001, "retMsg": "not found"})
+                    return
+                status, body = exchange.kline(
+                    {key: values[0] for key, values in parse_qs(url.query).items()}
+                )
+                self._reply(status, body)
+
+            def _reply(self, status: int, body: Dict):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
+
+    def kline(self, params: Dict[str, str]):
+        """Ответ /v5/market/kline: (HTTP-статус, тело)"""
+        with self._lock:
+            self.stats["rest_requests"] += 1
+        if self._chance(self.error_rate):
+            with self._lock:
+                self.stats["rest_errors"] += 1
+            status = self._random.choice((429, 200, 500))
+            if status == 200:
+                return 200, {"retCode": 10006, "retMsg": "Too many visits!"}
+            return status, {"retCode": -1, "retMsg": "mock error"}
+
+        tf = TIMEFRAME_MAP.get(params.get("interval", ""))
+        symbol = params.get("symbol")
+        if tf is None or not symbol:
+            return 200, {"retCode": 10001, "retMsg": "params error"}
+        limit = min(int(params.get("limit", DEFAULT_PAGE)), PAGE_LIMIT)
+        step = TIMEFRAMES_CONFIG[tf]["interval_sec"]
+        end = int(params["end"]) // 1000 if "end" in params else int(time.time())
+        start = int(params["start"]) // 1000 if "start" in params else end - limit * step
+
+        candles = self.source.candles(symbol, tf, start, end, limit)
+        with self._lock:
+            self.stats["rest_candles"] += len(candles)
+        return 200, {
+            "retCode": 0,
+            "retMsg": "OK",
+            "result": {
+                "category": params.get("category", "linear"),
+                "symbol": symbol,
+                "list": [_kline_row(candle) for candle in candles],
+            },
+            "time": int(time.time() * 1000),
+        }
+
+    # === WebSocket ===
+
+    def _run_ws(self):
+        asyncio.set_event_loop(self._loop)
+
+        async def start():
+            self._ws_server = await serve(self._serve_ws, self.host, self._ws_port)
+            self._ws_port = self._ws_server.sockets[0].getsockname()[1]
+            self._ws_ready.set()
+
+        self._loop.run_until_complete(start())
+        self._loop.run_forever()
+
+    async def _close_ws(self):
+        self._ws_server.close()
+        await self._ws_server.wait_closed()
+
+    async def _serve_ws(self, connection):
+        with self._lock:
+            self.stats["ws_connections"] += 1
+        topics: List[str] = []
+        publisher = asyncio.create_task(self._publish(connection, topics))
+        try:
+            async for raw in connection:
+                message = json.loads(raw)
+                op = message.get("op")
+                if op == "ping":
+                    await connection.send(json.dumps({"op": "pong", "success": True}))
+                elif op == "subscribe":
+                    args = [t for t in message.get("args", []) if t.startswith("kline.")]
+                    topics.extend(t for t in args if t not in topics)
+                    await connection.send(
+                        json.dumps({"op": "subscribe", "success": True, "ret_msg": ""})
+                    )
+        except ConnectionClosed:
+            pass
+        finally:
+            publisher.cancel()
+
+    def _next_candle(self, topic: str, tf: str, symbol: str):
+        """Следующая свеча топика: (свеча | None для пропуска, готово ли)"""
+        step = TIMEFRAMES_CONFIG[tf]["interval_sec"]
+        with self._lock:
+            if topic not in self._positions:
+                first = self.ws_start
+                if first is None:
+                    first = (int(time.time()) // step - (self.ws_count or 1000)) * step
+                first -= first % step
+                self._positions[topic] = [first, first]
+            first, ts = self._positions[topic]
+            if self.ws_count is not None and (ts - first) // step >= self.ws_count:
+                return None, True
+            self._positions[topic][1] = ts + step
+        if self._chance(self.gap_rate):
+            with self._lock:
+                self.stats["ws_gaps"].append((topic, ts))
+            return None, False
+        return self.source.candle(symbol, tf, ts), False
+
+    async def _publish(self, connection, topics: List[str]):
+        sent = 0
+        finished = set()
+        batch_delay = WS_BATCH / self.ws_rate if self.ws_rate else 0
+        while True:
+            active = [t for t in topics if t not in finished]
+            if not active:
+                await asyncio.sleep(0.05)
+                continue
+            for topic in active:
+                _, interval, symbol = topic.split(".")
+                tf = TIMEFRAME_MAP[interval]
+                candle, done = self._next_candle(topic, tf, symbol)
+                if done:
+                    finished.add(topic)
+                    with self._lock:
+                        self.stats["ws_done"] += 1
+                    continue
+                if candle is None:
+                    continue
+                message = json.dumps(
+                    {
+                        "topic": topic,
+                        "type": "snapshot",
+                        "ts": int(time.time() * 1000),
+                        "data": [_ws_kline(candle, tf)],
+                    }
+                )
+                repeats = 2 if self._chance(self.dup_rate) else 1
+                for _ in range(repeats):
+                    await connection.send(message)
+                sent += repeats
+                with self._lock:
+                    self.stats["ws_messages"] += repeats
+                    self.stats["ws_duplicates"] += repeats - 1
+                if self.disconnect_after and sent >= self.disconnect_after:
+                    await connection.close()
+                    return
+                if sent % WS_BATCH < repeats:
+                    # Пауза раз в WS_BATCH сообщений: точность ws_rate без
+                    # отдельного sleep на каждое сообщение
+                    await asyncio.sleep(batch_delay)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Локальный мок-сервер Bybit (REST + WS)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--rest-port", type=int, default=8801)
+    parser.add_argument("--ws-port", type=int, default=8802)
+    parser.add_argument("--db", help="Отдавать свечи из этой БД вместо синтетических")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--ws-rate", type=float, default=1000.0)
+    parser.add_argument("--ws-count", type=int, default=None, help="Свечей на топик")
+    parser.add_argument("--gap-rate", type=float, default=0.0)
+    parser.add_argument("--dup-rate", type=float, default=0.0)
+    parser.add_argument("--disconnect-after", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    source = RecordedCandles(args.db) if args.db else SyntheticCandles(args.seed)
+    exchange = MockExchange(
+        source,
+        host=args.host,
+        rest_port=args.rest_port,
+        ws_port=args.ws_port,
+        error_rate=args.error_rate,
+        ws_rate=args.ws_rate,
+        ws_count=args.ws_count,
+        gap_rate=args.gap_rate,
+        dup_rate=args.dup_rate,
+        disconnect_after=args.disconnect_after,
+        seed=args.seed,
+    ).start()
+    print(f"🧪 [mock_exchange] REST: {exchange.rest_url}  WS: {exchange.ws_url}")
+    print(f"   BYBIT_REST_URL={exchange.rest_url} BYBIT_WS_URL={exchange.ws_url}")
+    try:
+        while True:
+            time.sleep(5)
+            stats = exchange.stats
+            print(
+                f"[mock_exchange] REST {stats['rest_requests']} запросов "
+                f"({stats['rest_errors']} ошибок), WS {stats['ws_messages']} сообщений"
+            )
+    except KeyboardInterrupt:
+        pass
+    finally:
+        exchange.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+prune_history.py
+
+Удаляет свечи старше allowed_history (TIMEFRAMES_CONFIG) и возвращает
+освободившееся место (см. backend/core/storage/retention.py).
+
+Использование:
+    python backend/tools/prune_history.py [--timeframe 1m 5m] [--archive]
+                                          [--batch-size 5000] [--pause 0.05]
+                                          [--enable-incremental-vacuum]
+"""
+
+import os
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parents[1]  # backend/
+PROJECT_ROOT = BASE_DIR.parent  # bybit-bot/
+DB_PATH = PROJECT_ROOT / "db" / "market_data.sqlite"
+
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from backend.config.timeframes_config import TIMEFRAMES_CONFIG
+from backend.core.storage import enable_wal, open_connection
+from backend.core.storage.retention import (
+    DEFAULT_BATCH_SIZE,
+    enable_incremental_vacuum,
+    prune_timeframe,
+    reclaim_space,
+)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Удержание истории по allowed_history")
+    parser.add_argument("--timeframe", nargs="+", help="Таймфреймы (по умолчанию все)")
+    parser.add_argument(
+        "--archive", action="store_true", help="Сначала перенести закрытые месяцы в Parquet"
+    )
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--pause", type=float, default=0.0, help="Пауза между пакетами, с")
+    parser.add_argument(
+        "--enable-incremental-vacuum",
+        action="store_true",
+        help="Перевести БД в auto_vacuum=INCREMENTAL (полный VACUUM)",
+    )
+    args = parser.parse_args()
+
+    if not os.path.exists(DB_PATH):
+        print(f"❌ DB not found: {DB_PATH}")
+        return
+
+    conn = open_connection(DB_PATH)
+    enable_wal(conn)
+    try:
+        if args.enable_incremental_vacuum:
+            enable_incremental_vacuum(conn)
+
+        total = 0
+        for tf in args.timeframe or list(TIMEFRAMES_CONFIG):
+            total += prune_timeframe(
+                conn,
+                tf,
+                archive=args.archive,
+                batch_size=args.batch_size,
+                pause=args.pause,
+            )
+
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        pages = reclaim_space(conn)
+    finally:
+        conn.close()
+
+    print(
+        f"\n🏁 Удалено {total} свечей, освобождено {pages * page_size / 2**20:.1f} МБ."
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+rebuild_coverage.py
+
+Строит индекс покрытия свечей (candle_coverage) и ставит триггеры его
+обновления (см. backend/core/storage/coverage.py). Без --force построенный
+индекс не трогается.
+
+Использование:
+    python backend/tools/rebuild_coverage.py [--timeframe 1m 5m] [--force]
+"""
+
+import os
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parents[1]  # backend/
+PROJECT_ROOT = BASE_DIR.parent  # bybit-bot/
+DB_PATH = PROJECT_ROOT / "db" / "market_data.sqlite"
+
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from backend.config.timeframes_config import TIMEFRAMES_CONFIG
+from backend.core.storage import enable_wal, open_connection
+from backend.core.storage.coverage import coverage_ready, rebuild_coverage
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Индекс покрытия свечей")
+    parser.add_argument("--timeframe", nargs="+", help="Таймфреймы (по умолчанию все)")
+    parser.add_argument(
+        "--force", action="store_true", help="Перестроить уже построенный индекс"
+    )
+    args = parser.parse_args()
+
+    if not os.path.exists(DB_PATH):
+        print(f"❌ DB not found: {DB_PATH}")
+        return
+
+    conn = open_connection(DB_PATH)
+    enable_wal(conn)
+    try:
+        for tf in args.timeframe or list(TIMEFRAMES_CONFIG):
+            if not args.force and coverage_ready(conn, tf):
+                print(f"[coverage] ✅ candles_{tf}: индекс уже построен")
+                continue
+            if rebuild_coverage(conn, tf) < 0:
+                print(f"[coverage] ⚠ candles_{tf}: таблицы нет")
+    finally:
+        conn.close()
+
+    print("\n🏁 Готово")
+
+
+if __name__ == "__main__":
+    main()
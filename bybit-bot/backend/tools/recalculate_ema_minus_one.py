@@ -2,23 +2,30 @@
 recalculate_ema_minus_one.py
 
 Скрипт для пересчета только значений -1 в EMA колонках.
-Находит все строки с emaX = -1 и пересчитывает их с новой валидацией.
+Находит все строки с emaX = -1 для символа, группирует их в непрерывные
+серии и пересчитывает каждую серию одним проходом вместе с контекстом прогрева
+(через EzDIM.fix_gaps → recalculate_range), записывая результат пакетно.
 """
 
 import sqlite3
+import numpy as np
 import pandas as pd
 from pathlib import Path
 import sys
 
-# Добавляем backend в путь
+# Добавляем backend и корень проекта в путь
 BASE_DIR = Path(__file__).resolve().parents[1]
-if str(BASE_DIR) not in sys.path:
-    sys.path.append(str(BASE_DIR))
+PROJECT_ROOT = BASE_DIR.parent
+for path in (BASE_DIR, PROJECT_ROOT):
+    if str(path) not in sys.path:
+        sys.path.append(str(path))
 
-from config.timeframes_config import TIMEFRAMES_CONFIG
-from core.validation.data_integrity import validate_for_indicator
+from backend.config.timeframes_config import TIMEFRAMES_CONFIG
+from backend.core.dim.ezdim import EzDIM
+from backend.core.indicators.registry import existing_specs
+from backend.core.storage.indicator_store import has_store, load_indicator_frame
+from backend.core.storage.ring_buffer import invalidate_ring
 
-PROJECT_ROOT = BASE_DIR.parent
 DB_PATH = PROJECT_ROOT / "db" / "market_data.sqlite"
 
 # Загружаем периоды EMA
@@ -27,110 +34,94 @@ with EMA_FILE.open("r") as f:
     EMA_PERIODS = [int(line.strip()) for line in f if line.strip().isdigit()]
 
 
-def find_minus_one_rows(table: str, period: int) -> pd.DataFrame:
-    """Находит строки с emaX = -1"""
-    col = f"ema{period}"
-
-    with sqlite3.connect(DB_PATH) as conn:
-        query = f"""
-        SELECT * FROM {table} 
-        WHERE {col} = -1 
-        ORDER BY timestamp
-        """
-        df = pd.read_sql_query(query, conn)
+def find_minus_one_rows(
+    conn: sqlite3.Connection, table: str, symbol: str, periods: list
+) -> pd.DataFrame:
+    """Находит строки символа, где хотя бы одна из emaX = -1 (один запрос)"""
+    cols = [f"ema{p}" for p in periods]
+    timeframe = table[len("candles_") :]
+    if has_store(conn, timeframe):
+        # Узкое хранилище: проход по ключу каждого индикатора
+        df = load_indicator_frame(conn, symbol, timeframe, [], cols)
+        return df[(df[cols] == -1).any(axis=1)].reset_index(drop=True)
+    query = f"""
+    SELECT timestamp, {", ".join(cols)} FROM {table}
+    WHERE symbol = ? AND ({" OR ".join(f"{col} = -1" for col in cols)})
+    ORDER BY timestamp
+    """
+    return pd.read_sql_query(query, conn, params=(symbol,))
+
+
+def group_minus_one_runs(df: pd.DataFrame, periods: list, tf_sec: int) -> list:
+    """
+    Группирует значения -1 в непрерывные серии по каждой колонке.
+
+    Returns:
+        Список дыр в формате EzDIM: [{"col", "start_ts", "end_ts", "period"}, ...]
+    """
+    runs = []
+    timestamps = df["timestamp"].to_numpy()
+    for period in periods:
+        col = f"ema{period}"
+        ts = timestamps[(df[col] == -1).to_numpy()]
+        if len(ts) == 0:
+            continue
 
-    return df
+        # Разрыв серии там, где шаг больше одной свечи
+        breaks = np.flatnonzero(np.diff(ts) > 1.1 * tf_sec)
+        starts = np.concatenate([[0], breaks + 1])
+        ends = np.concatenate([breaks, [len(ts) - 1]])
+        for s, e in zip(starts, ends):
+            runs.append(
+                {
+                    "col": col,
+                    "start_ts": int(ts[s]),
+                    "end_ts": int(ts[e]),
+                    "period": period,
+                }
+            )
+        print(f"   🔍 {col}: найдено {len(ts)} значений -1 в {len(starts)} сериях")
+    return runs
 
 
 def recalculate_ema_for_table(table: str, timeframe: str, symbol: str = "BTCUSDT"):
     """Пересчитывает EMA = -1 для конкретной таблицы"""
-    print(f"\n🔄 Пересчет EMA = -1 в {table} ({timeframe})...")
+    print(f"\n🔄 Пересчет EMA = -1 в {table} ({timeframe}) для {symbol}...")
 
     tf_sec = TIMEFRAMES_CONFIG[timeframe]["interval_sec"]
-    total_recalculated = 0
-
-    for period in EMA_PERIODS:
-        col = f"ema{period}"
-
-        # Проверяем, есть ли колонка
-        with sqlite3.connect(DB_PATH) as conn:
-            cursor = conn.cursor()
-            cursor.execute(f"PRAGMA table_info({table})")
-            columns = [row[1] for row in cursor.fetchall()]
 
-            if col not in columns:
-                print(f"   ⏭ Колонка {col} не существует")
-                continue
+    with sqlite3.connect(DB_PATH) as conn:
+        # Проверяем, какие колонки есть
+        available = existing_specs(conn, table, [("ema", p) for p in EMA_PERIODS])
+
+        periods = []
+        for period in EMA_PERIODS:
+            if ("ema", period) in available:
+                periods.append(period)
+            else:
+                print(f"   ⏭ Колонка ema{period} не существует")
+        if not periods:
+            return 0
 
         # Находим строки с -1
-        df_minus_one = find_minus_one_rows(table, period)
-
+        df_minus_one = find_minus_one_rows(conn, table, symbol, periods)
         if df_minus_one.empty:
-            print(f"   ✅ {col}: нет значений -1")
-            continue
-
-        print(f"   🔍 {col}: найдено {len(df_minus_one)} значений -1")
-
-        # Для каждой строки с -1 берем окно данных и пересчитываем
-        recalculated_count = 0
-
-        with sqlite3.connect(DB_PATH) as conn:
-            for idx, row in df_minus_one.iterrows():
-                timestamp = row["timestamp"]
-
-                # Берем окно данных для расчета EMA
-                window_query = f"""
-                SELECT * FROM {table} 
-                WHERE symbol = ? 
-                AND timestamp <= ? 
-                ORDER BY timestamp DESC 
-                LIMIT {period * 2}  -- Берем больше данных для надежности
-                """
-
-                window_df = pd.read_sql_query(
-                    window_query, conn, params=(symbol, timestamp)
-                )
-
-                if len(window_df) < period:
-                    print(
-                        f"      ⚠ {col} {timestamp}: недостаточно данных ({len(window_df)} < {period})"
-                    )
-                    continue
-
-                # Сортируем по возрастанию timestamp
-                window_df = window_df.sort_values("timestamp")
-
-                # Валидируем данные
-                is_valid, reason = validate_for_indicator(window_df, period, tf_sec)
-
-                if not is_valid:
-                    print(f"      ⚠ {col} {timestamp}: {reason}")
-                    continue
-
-                # Рассчитываем EMA
-                import pandas_ta as ta
-
-                ema_series = ta.ema(window_df["close"], length=period)
-
-                if pd.isna(ema_series.iloc[-1]):
-                    print(f"      ⚠ {col} {timestamp}: EMA не рассчиталась")
-                    continue
-
-                # Обновляем значение в БД
-                cursor = conn.cursor()
-                cursor.execute(
-                    f"UPDATE {table} SET {col} = ? WHERE symbol = ? AND timestamp = ?",
-                    (float(ema_series.iloc[-1]), symbol, timestamp),
-                )
-
-                recalculated_count += 1
-                print(f"      ✅ {col} {timestamp}: {ema_series.iloc[-1]:.2f}")
-
-            conn.commit()
-
-        total_recalculated += recalculated_count
-        print(
-            f"   📊 {col}: пересчитано {recalculated_count}/{len(df_minus_one)} значений"
+            print("   ✅ Нет значений -1")
+            return 0
+
+        runs = group_minus_one_runs(df_minus_one, periods, tf_sec)
+
+        # Каждое окно: одна загрузка с прогревом, один векторный пересчёт, одна пакетная запись
+        total_recalculated = EzDIM.fix_gaps(runs, tf_sec, symbol, timeframe, conn)
+        conn.commit()
+
+    # Буфер realtime-загрузчика перечитает исправленные значения из БД
+    if total_recalculated:
+        invalidate_ring(
+            symbol,
+            timeframe,
+            min(run["start_ts"] for run in runs),
+            max(run["end_ts"] for run in runs),
         )
 
     print(f"   🎯 Итого пересчитано: {total_recalculated} значений")
@@ -139,26 +130,35 @@ def recalculate_ema_for_table(table: str, timeframe: str, symbol: str = "BTCUSDT
 
 def main():
     """Главная функция"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Пересчет EMA = -1")
+    parser.add_argument("--symbol", default="BTCUSDT", help="Символ для обработки")
+    parser.add_argument("--timeframe", help="Конкретный таймфрейм")
+    args = parser.parse_args()
+
+    timeframes = [args.timeframe] if args.timeframe else list(TIMEFRAMES_CONFIG)
+
     print("🚀 Пересчет EMA = -1 с новой валидацией")
     print("=" * 50)
 
     total_recalculated = 0
 
-    for timeframe in TIMEFRAMES_CONFIG:
+    for timeframe in timeframes:
         table = f"candles_{timeframe}"
 
         # Проверяем, существует ли таблица
         with sqlite3.connect(DB_PATH) as conn:
             cursor = conn.cursor()
             cursor.execute(
-                "SELECT name FROM sqlite_master WHERE type='table' AND name = ?",
+                "SELECT name FROM sqlite_master WHERE type IN ('table', 'view') AND name = ?",
                 (table,),
             )
             if not cursor.fetchone():
                 print(f"⏭ Таблица {table} не существует")
                 continue
 
-        recalculated = recalculate_ema_for_table(table, timeframe)
+        recalculated = recalculate_ema_for_table(table, timeframe, args.symbol)
         total_recalculated += recalculated
 
     print("\n" + "=" * 50)
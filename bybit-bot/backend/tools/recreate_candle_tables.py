@@ -1,31 +1,25 @@
 import sqlite3
+import sys
 from pathlib import Path
 
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from backend.core.storage.schema import candle_table_ddl
+
 # Исправленный путь к базе данных
 DB_PATH = Path(__file__).resolve().parent.parent.parent / "db" / "market_data.sqlite"
 
 # Список таймфреймов
 timeframes = ["1m", "5m", "30m", "1h", "4h", "6h", "12h", "1d", "1w"]
 
-# Базовая структура таблицы
-table_template = """
-DROP TABLE IF EXISTS candles_{tf};
-CREATE TABLE candles_{tf} (
-    symbol TEXT NOT NULL,
-    timestamp INTEGER NOT NULL,
-    timestamp_ms INTEGER,
-    timestamp_ns INTEGER,
-    open REAL,
-    high REAL,
-    low REAL,
-    close REAL,
-    volume REAL,
-    PRIMARY KEY (symbol, timestamp)
-);
-"""
-
-# Генерация полного SQL
-sql = "\n".join([table_template.format(tf=tf) for tf in timeframes])
+# Базовая структура таблицы: кластеризация по (symbol, timestamp), WITHOUT ROWID
+sql = "\n".join(
+    f"DROP TABLE IF EXISTS candles_{tf};\n"
+    f"{candle_table_ddl(f'candles_{tf}', if_not_exists=False)};"
+    for tf in timeframes
+)
 
 
 def recreate_tables():
@@ -1,8 +1,15 @@
 import sqlite3
 import os
 import re
+import sys
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.normpath(os.path.join(SCRIPT_DIR, "..", ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from backend.core.storage.schema import rebuild_candle_table
+
 DB_PATH = os.path.normpath(
     os.path.join(SCRIPT_DIR, "..", "..", "db", "market_data.sqlite")
 )
@@ -32,32 +39,14 @@ def get_table_columns(conn, table_name):
 
 def recreate_table_without_unused_emas(conn, table_name, allowed_ema_columns):
     print(f"🔧 Rebuilding table: {table_name}")
-    cursor = conn.cursor()
 
     existing_cols = get_table_columns(conn, table_name)
     base_cols = [col for col in existing_cols if not col.startswith("ema")]
     valid_emas = [col for col in existing_cols if col in allowed_ema_columns]
     columns_to_keep = base_cols + valid_emas
 
-    def get_column_def(col):
-        if col == "timestamp":
-            return f"{col} INTEGER PRIMARY KEY"
-        elif col == "timestamp_ns":
-            return f"{col} INTEGER"
-        else:
-            return f"{col} REAL"
-
-    column_defs = ",\n    ".join(get_column_def(col) for col in columns_to_keep)
-    tmp_table = f"{table_name}_tmp"
-
-    cursor.execute(f"DROP TABLE IF EXISTS {tmp_table}")
-    cursor.execute(f"CREATE TABLE {tmp_table} (\n    {column_defs}\n)")
-    col_list = ", ".join(columns_to_keep)
-    cursor.execute(
-        f"INSERT INTO {tmp_table} ({col_list}) SELECT {col_list} FROM {table_name}"
-    )
-    cursor.execute(f"DROP TABLE {table_name}")
-    cursor.execute(f"ALTER TABLE {tmp_table} RENAME TO {table_name}")
+    # Ключ (symbol, timestamp) WITHOUT ROWID и типы колонок сохраняются
+    rebuild_candle_table(conn, table_name, columns_to_keep)
     conn.commit()
 
 
@@ -6,6 +6,9 @@ show_data_ranges.py
 - Самая ранняя и поздняя свеча (timestamp + дата)
 - Пропуски в данных (если есть)
 - Покрытие данных в процентах
+Архивные месяцы из Parquet (cold_tier.py) учитываются вместе с SQLite.
+Если индекс покрытия построен (core/storage/coverage.py), отчёт строится
+по нему: без прохода по таблице и чтения Parquet.
 """
 
 import sys
@@ -22,7 +25,18 @@ if str(BASE_DIR) not in sys.path:
 PROJECT_ROOT = BASE_DIR.parent  # bybit-bot/
 DB_PATH = PROJECT_ROOT / "db" / "market_data.sqlite"
 
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
 from config.timeframes_config import TIMEFRAMES_CONFIG
+from backend.core.data.gaps import gap_candles, iter_gaps
+from backend.core.storage.cold_tier import cold_bounds
+from backend.core.storage.coverage import (
+    coverage_ready,
+    coverage_stats,
+    coverage_symbols,
+    missing_ranges,
+)
 
 
 def format_timestamp(ts):
@@ -32,11 +46,54 @@ def format_timestamp(ts):
     return f"{ts} ({datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')})"
 
 
+def describe_gap(gap_start, gap_end, interval_sec):
+    return {
+        "start": gap_start,
+        "end": gap_end,
+        "duration_candles": gap_candles(gap_start, gap_end, interval_sec),
+        "start_date": datetime.fromtimestamp(gap_start).strftime("%Y-%m-%d %H:%M"),
+        "end_date": datetime.fromtimestamp(gap_end).strftime("%Y-%m-%d %H:%M"),
+    }
+
+
+def analyze_coverage(conn, table_name, tf):
+    """Анализ по индексу покрытия: поиск по ключу, проход только по участкам"""
+    interval_sec = TIMEFRAMES_CONFIG[tf]["interval_sec"]
+    results = []
+    for symbol in coverage_symbols(conn, tf):
+        stats = coverage_stats(conn, symbol, tf)
+        gaps = [
+            describe_gap(gap_start, gap_end, interval_sec)
+            for gap_start, gap_end in missing_ranges(
+                conn, symbol, tf, stats["earliest"], stats["latest"]
+            )
+        ]
+        results.append(
+            {
+                "symbol": symbol,
+                "total_records": stats["candles"],
+                "earliest": stats["earliest"],
+                "latest": stats["latest"],
+                "expected_records": stats["expected"],
+                "missing": stats["missing"],
+                "coverage": stats["coverage"],
+                "gaps": gaps,
+            }
+        )
+    if not results:
+        return {"table": table_name, "status": "empty", "records": 0, "symbols": []}
+    return {"table": table_name, "status": "has_data", "results": results}
+
+
 def analyze_table(table_name, tf_config):
     """Анализирует конкретную таблицу свечей"""
     conn = sqlite3.connect(DB_PATH)
 
     try:
+        tf = table_name.replace("candles_", "")
+        if tf in TIMEFRAMES_CONFIG and coverage_ready(conn, tf):
+            return analyze_coverage(conn, table_name, tf)
+
         # Базовая статистика
         query_stats = f"""
         SELECT 
@@ -61,6 +118,13 @@ def analyze_table(table_name, tf_config):
             earliest = row["earliest"]
             latest = row["latest"]
 
+            # Архивные месяцы в Parquet (холодный уровень)
+            cold_start, cold_end, cold_rows = cold_bounds(conn, table_name, symbol)
+            if cold_rows:
+                total += cold_rows
+                earliest = min(earliest, cold_start)
+                latest = max(latest, cold_end)
+
             # Анализ пропусков
             interval_sec = tf_config["interval_sec"]
             expected_records = (
@@ -71,36 +135,13 @@ def analyze_table(table_name, tf_config):
             coverage = (total / expected_records * 100) if expected_records > 0 else 0
             missing = expected_records - total
 
-            # Поиск пропусков в данных
-            gaps_query = f"""
-            SELECT timestamp FROM {table_name} 
-            WHERE symbol = '{symbol}' 
-            ORDER BY timestamp
-            """
-            timestamps_df = pd.read_sql_query(gaps_query, conn)
-            gaps = []
-
-            if len(timestamps_df) > 1:
-                timestamps = timestamps_df["timestamp"].tolist()
-                for i in range(1, len(timestamps)):
-                    expected_next = timestamps[i - 1] + interval_sec
-                    if timestamps[i] > expected_next:
-                        gap_start = expected_next
-                        gap_end = timestamps[i] - interval_sec
-                        gap_duration = (gap_end - gap_start) // interval_sec + 1
-                        gaps.append(
-                            {
-                                "start": gap_start,
-                                "end": gap_end,
-                                "duration_candles": gap_duration,
-                                "start_date": datetime.fromtimestamp(
-                                    gap_start
-                                ).strftime("%Y-%m-%d %H:%M"),
-                                "end_date": datetime.fromtimestamp(gap_end).strftime(
-                                    "%Y-%m-%d %H:%M"
-                                ),
-                            }
-                        )
+            # Поиск пропусков на стороне SQLite (только границы пропусков)
+            gaps = [
+                describe_gap(gap_start, gap_end, interval_sec)
+                for _, gap_start, gap_end in iter_gaps(
+                    conn, table_name, interval_sec, symbol
+                )
+            ]
 
             results.append(
                 {
@@ -135,7 +176,8 @@ def main():
     cursor.execute(
         """
         SELECT name FROM sqlite_master 
-        WHERE type='table' AND name LIKE 'candles_%'
+        WHERE type IN ('table', 'view') AND name LIKE 'candles_%'
+          AND name NOT LIKE '%_wide'
         ORDER BY name
     """
     )
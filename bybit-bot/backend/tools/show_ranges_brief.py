@@ -3,7 +3,9 @@
 show_ranges_brief.py
 
 Краткий просмотр диапазонов данных в таблицах свечей
-Показывает только основную информацию без детального анализа пропусков
+Показывает только основную информацию без детального анализа пропусков.
+Если индекс покрытия построен (core/storage/coverage.py), итоги берутся
+из него без прохода по таблице (вместе с архивными месяцами Parquet).
 """
 
 import sys
@@ -16,6 +18,12 @@ BASE_DIR = Path(__file__).resolve().parents[1]  # backend/
 PROJECT_ROOT = BASE_DIR.parent  # bybit-bot/
 DB_PATH = PROJECT_ROOT / "db" / "market_data.sqlite"
 
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from backend.config.timeframes_config import TIMEFRAMES_CONFIG
+from backend.core.storage.coverage import coverage_ready, coverage_totals
+
 
 def main():
     print("📊 КРАТКИЙ ОБЗОР ДАННЫХ В БД")
@@ -28,7 +36,8 @@ def main():
     cursor.execute(
         """
         SELECT name FROM sqlite_master 
-        WHERE type='table' AND name LIKE 'candles_%'
+        WHERE type IN ('table', 'view') AND name LIKE 'candles_%'
+          AND name NOT LIKE '%_wide'
         ORDER BY name
     """
     )
@@ -51,19 +60,20 @@ def main():
         tf = table.replace("candles_", "")
 
         try:
-            cursor.execute(
-                f"""
-                SELECT 
-                    COUNT(*) as total,
-                    MIN(timestamp) as earliest,
-                    MAX(timestamp) as latest
-                FROM {table}
-                WHERE timestamp > 0
-            """
-            )
-
-            result = cursor.fetchone()
-            total, earliest, latest = result
+            if tf in TIMEFRAMES_CONFIG and coverage_ready(conn, tf):
+                total, earliest, latest = coverage_totals(conn, tf)
+            else:
+                cursor.execute(
+                    f"""
+                    SELECT 
+                        COUNT(*) as total,
+                        MIN(timestamp) as earliest,
+                        MAX(timestamp) as latest
+                    FROM {table}
+                    WHERE timestamp > 0
+                """
+                )
+                total, earliest, latest = cursor.fetchone()
 
             if total == 0:
                 print(f"{tf:<12} {'0':<10} {'(пусто)':<20} {'(пусто)':<20} {'0':<8}")
@@ -6,11 +6,16 @@
 # 2. Добавляет недостающие столбцы `ema_<period>` в таблицы (из config/ema_periods.txt)
 # 3. Удаляет лишние ema-столбцы, которых нет в актуальном списке
 # 4. Добавляет поле timestamp_ns в таблицы candles_*
+# 5. Добавляет столбцы остальных индикаторов реестра (rsi14, ...)
+# Для таймфреймов с узким хранилищем indicators_<tf> колонки не меняются:
+# удаляются только строки индикаторов, которых больше нет в конфиге,
+# и пересоздаётся представление candles_<tf>_wide
 #
 # 🧩 Используемые файлы:
 # - db/market_data.sqlite (основная база данных)
 # - config/timeframes_config.py (таймфреймы)
 # - config/ema_periods.txt (список EMA периодов)
+# - config/<indicator>_periods.txt (периоды остальных индикаторов, например rsi_periods.txt)
 #
 # ✅ Использование:
 # python tools/sync_timeframes_and_emas.py
@@ -20,8 +25,17 @@ import sys
 from pathlib import Path
 
 sys.path.append(str(Path(__file__).resolve().parents[1]))
+sys.path.append(str(Path(__file__).resolve().parents[2]))
 import sqlite3
 from config.timeframes_config import TIMEFRAMES_CONFIG
+from backend.core.indicators.registry import CONFIGURED_INDICATORS, spec_columns
+from backend.core.storage.indicator_store import (
+    catalog_columns,
+    delete_indicators,
+    has_store,
+    refresh_wide_view,
+)
+from backend.core.storage.schema import candle_table_ddl, rebuild_candle_table
 
 BASE_DIR = Path(__file__).resolve().parents[1]  # backend/
 PROJECT_ROOT = BASE_DIR.parent  # bybit-bot/
@@ -36,20 +50,7 @@ def load_ema_periods():
 
 def ensure_table_exists(cursor, tf):
     table_name = f"candles_{tf}"
-    cursor.execute(
-        f"""
-        CREATE TABLE IF NOT EXISTS {table_name} (
-            symbol TEXT NOT NULL,
-            timestamp INTEGER PRIMARY KEY,
-            timestamp_ns INTEGER NOT NULL,
-            open REAL,
-            high REAL,
-            low REAL,
-            close REAL,
-            volume REAL
-        )
-    """
-    )
+    cursor.execute(candle_table_ddl(table_name))
 
 
 def add_timestamp_ns_column(cursor, tf):
@@ -90,24 +91,38 @@ def sync_ema_columns(cursor, tf, ema_periods):
         _drop_columns(cursor, table, extra_cols)
 
 
+def sync_indicator_columns(cursor, tf):
+    """Добавляет столбцы не-EMA индикаторов из реестра (лишние не удаляет)"""
+    table = f"candles_{tf}"
+    cursor.execute(f"PRAGMA table_info({table})")
+    existing_columns = {row[1] for row in cursor.fetchall()}
+
+    specs = [spec for spec in CONFIGURED_INDICATORS if spec[0] != "ema"]
+    for col in spec_columns(specs):
+        if col not in existing_columns:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {col} REAL")
+            print(f"  [+] Добавлен столбец {col} в {table}")
+
+
+def sync_store_indicators(cursor, tf, ema_periods):
+    """Узкое хранилище: удаляет значения индикаторов, которых нет в конфиге"""
+    conn = cursor.connection
+    non_ema = [spec for spec in CONFIGURED_INDICATORS if spec[0] != "ema"]
+    configured = [f"ema{p}" for p in ema_periods] + spec_columns(non_ema)
+
+    stale = [col for col in catalog_columns(conn) if col not in configured]
+    if stale:
+        deleted = delete_indicators(conn, tf, stale)
+        print(f"  [-] indicators_{tf}: удалено {deleted} значений ({', '.join(stale)})")
+    refresh_wide_view(conn, tf, configured)
+
+
 def _drop_columns(cursor, table, drop_cols):
     cursor.execute(f"PRAGMA table_info({table})")
-    cols_info = cursor.fetchall()
-    cols_to_keep = [col[1] for col in cols_info if col[1] not in drop_cols]
-
-    cols_def = ", ".join(
-        f"{col[1]} {col[2]}" for col in cols_info if col[1] in cols_to_keep
-    )
-    cols_str = ", ".join(cols_to_keep)
-
-    tmp_table = f"{table}_tmp"
-
-    cursor.execute(f"CREATE TABLE {tmp_table} ({cols_def})")
-    cursor.execute(
-        f"INSERT INTO {tmp_table} ({cols_str}) SELECT {cols_str} FROM {table}"
-    )
-    cursor.execute(f"DROP TABLE {table}")
-    cursor.execute(f"ALTER TABLE {tmp_table} RENAME TO {table}")
+    cols_to_keep = [col[1] for col in cursor.fetchall() if col[1] not in drop_cols]
+
+    # Пересоздание сохраняет ключ (symbol, timestamp) WITHOUT ROWID
+    rebuild_candle_table(cursor.connection, table, cols_to_keep)
     print(f"  [-] Удалены лишние колонки: {', '.join(drop_cols)}")
 
 
@@ -122,11 +137,15 @@ def main():
         print(f"\n[>] Обработка таймфрейма: {tf}")
         ensure_table_exists(cursor, tf)
         add_timestamp_ns_column(cursor, tf)
+        if has_store(conn, tf):
+            sync_store_indicators(cursor, tf, ema_periods)
+            continue
         sync_ema_columns(cursor, tf, ema_periods)
+        sync_indicator_columns(cursor, tf)
 
     conn.commit()
     conn.close()
-    print("\n[✓] Синхронизация таблиц и EMA-колонок завершена.")
+    print("\n[✓] Синхронизация таблиц и колонок индикаторов завершена.")
 
 
 if __name__ == "__main__":